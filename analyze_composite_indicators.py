@@ -6,6 +6,8 @@ import geopandas as gpd
 import pandas as pd
 import numpy as np
 
+from indicators import evaluate, evaluate_composites, required_columns
+
 # Cargar datos crudos con todas las columnas
 INPUT_FILE = 'Cartografia_censo2024_Pais.gpkg'
 print(f"Cargando {INPUT_FILE}...")
@@ -31,48 +33,37 @@ gdf = gdf[gdf['REGION'].astype(str).str.contains('METROPOLITANA', case=False, na
 print(f"Registros RM: {len(gdf)}")
 
 # ============================================
-# AGREGAR A NIVEL COMUNAL
+# INDICADORES A EXPLORAR (definidos en indicators.INDICADORES)
 # ============================================
-# Definir todas las columnas numéricas relevantes
-numeric_cols = [
-    # Universos
-    'n_per', 'n_hog', 'n_vp',
-    # Demografía
-    'n_hombres', 'n_mujeres',
-    'n_edad_0_5', 'n_edad_6_13', 'n_edad_14_17', 'n_edad_18_24', 
-    'n_edad_25_44', 'n_edad_45_59', 'n_edad_60_mas',
-    'n_inmigrantes',
-    # Estado Civil
-    'n_estcivcon_casado', 'n_estcivcon_conviviente', 'n_estcivcon_conv_civil',
-    'n_estcivcon_anul_sep_div', 'n_estcivcon_viudo', 'n_estcivcon_soltero',
-    # Educación
-    'n_cine_primaria', 'n_cine_secundaria', 'n_cine_terciaria_maestria_doctorado',
-    'n_analfabet',
-    # Trabajo
-    'n_ocupado', 'n_desocupado', 'n_fuera_fuerza_trabajo',
-    'n_cise_rec_independientes', 'n_cise_rec_dependientes',
-    # Transporte
-    'n_transporte_auto', 'n_transporte_publico', 'n_transporte_camina', 
-    'n_transporte_bicicleta', 'n_transporte_motocicleta',
-    # Hogares
-    'n_hog_unipersonales', 'n_hog_60', 'n_hog_menores', 'n_jefatura_mujer',
-    # Tenencia Vivienda
-    'n_tenencia_propia_pagada', 'n_tenencia_propia_pagandose',
-    'n_tenencia_arrendada_contrato', 'n_tenencia_arrendada_sin_contrato',
-    'n_tenencia_cedida_trabajo', 'n_tenencia_cedida_familiar', 'n_tenencia_otro',
-    # Tipo Vivienda
-    'n_tipo_viv_casa', 'n_tipo_viv_depto', 'n_tipo_viv_mediagua', 'n_tipo_viv_pieza',
-    # Calidad Vivienda
-    'n_viv_hacinadas', 'n_viv_irrecuperables', 'n_deficit_cuantitativo',
-    # Servicios
-    'n_serv_compu', 'n_internet',
-    # Combustible
-    'n_comb_cocina_gas', 'n_comb_cocina_lena', 'n_comb_calefaccion_lena',
-    # Agua y Saneamiento
-    'n_fuente_agua_publica', 'n_fuente_agua_pozo', 'n_fuente_agua_camion', 'n_fuente_agua_rio',
-    'n_serv_hig_alc_dentro', 'n_serv_hig_fosa', 'n_serv_hig_no_tiene',
+# Columnas de analisis_correlaciones_rm.csv (salida regenerada, no versionada) que cambiaron
+# al pasar al registro:
+#   pct_ninos -> pct_infancia, pct_hog_unipersonal -> pct_alone, pct_propia_pagandose -> pct_hipotecados,
+#   pct_sin_agua_red -> pct_deficit_agua, pct_hacinamiento -> pct_hacinamiento_vp,
+#   pct_divorciado -> pct_ex, pct_bicicleta -> pct_ciclistas
+#   pct_soltero: el denominador pasó de n_per al total con estado civil declarado (como en los mapas)
+PCT_ANALISIS = [
+    # --- VIVIENDA ---
+    'pct_cedida_familiar', 'pct_arrendada_sin_contrato', 'pct_propia_pagada', 'pct_hipotecados',
+    'pct_mediagua', 'pct_hacinamiento_vp', 'pct_viv_irrecuperable', 'pct_deficit_cuanti',
+    # --- SERVICIOS BÁSICOS ---
+    'pct_deficit_agua', 'pct_sin_alcantarillado', 'pct_internet',
+    # --- DEMOGRAFÍA ---
+    'pct_inmigrantes', 'pct_adulto_mayor', 'pct_infancia', 'pct_jefa_hogar', 'pct_alone',
+    # --- EDUCACIÓN / TRABAJO ---
+    'pct_profesional', 'pct_analfabeto', 'pct_desocupado', 'pct_independiente',
+    # --- ESTADO CIVIL ---
+    'pct_ex', 'pct_soltero', 'pct_viudo',
+    # --- TRANSPORTE ---
+    'pct_auto', 'pct_transporte_publico', 'pct_ciclistas', 'pct_camina',
 ]
 
+# ============================================
+# AGREGAR A NIVEL COMUNAL
+# ============================================
+# Columnas crudas que necesitan los indicadores
+numeric_cols = ['n_per', 'n_hog', 'n_vp'] + required_columns(PCT_ANALISIS)
+numeric_cols = list(dict.fromkeys(numeric_cols))
+
 # Filtrar columnas que existen
 numeric_cols = [c for c in numeric_cols if c in gdf.columns]
 print(f"Columnas numéricas disponibles: {len(numeric_cols)}")
@@ -80,54 +71,13 @@ print(f"Columnas numéricas disponibles: {len(numeric_cols)}")
 # Agregar por comuna
 stats = gdf.groupby('COMUNA')[numeric_cols].sum().reset_index()
 
-# Evitar división por cero
-stats['n_per'] = stats['n_per'].replace(0, np.nan)
-stats['n_hog'] = stats['n_hog'].replace(0, np.nan)
-stats['n_vp'] = stats['n_vp'].replace(0, np.nan)
-
 # ============================================
 # CALCULAR TODOS LOS PORCENTAJES
 # ============================================
 print("\nCalculando indicadores porcentuales...")
 
-# --- VIVIENDA ---
-stats['pct_cedida_familiar'] = (stats['n_tenencia_cedida_familiar'] / stats['n_hog']) * 100
-stats['pct_arrendada_sin_contrato'] = (stats['n_tenencia_arrendada_sin_contrato'] / stats['n_hog']) * 100
-stats['pct_propia_pagada'] = (stats['n_tenencia_propia_pagada'] / stats['n_hog']) * 100
-stats['pct_propia_pagandose'] = (stats['n_tenencia_propia_pagandose'] / stats['n_hog']) * 100
-stats['pct_mediagua'] = (stats['n_tipo_viv_mediagua'] / stats['n_vp']) * 100
-stats['pct_hacinamiento'] = (stats['n_viv_hacinadas'] / stats['n_vp']) * 100
-stats['pct_viv_irrecuperable'] = (stats['n_viv_irrecuperables'] / stats['n_vp']) * 100
-stats['pct_deficit_cuanti'] = (stats['n_deficit_cuantitativo'] / stats['n_vp']) * 100
-
-# --- SERVICIOS BÁSICOS ---
-stats['pct_sin_agua_red'] = ((stats['n_fuente_agua_pozo'] + stats['n_fuente_agua_camion'] + stats['n_fuente_agua_rio']) / stats['n_vp']) * 100
-stats['pct_sin_alcantarillado'] = ((stats['n_serv_hig_fosa'] + stats.get('n_serv_hig_no_tiene', 0)) / stats['n_vp']) * 100
-stats['pct_internet'] = (stats['n_internet'] / stats['n_hog']) * 100
-
-# --- DEMOGRAFÍA ---
-stats['pct_inmigrantes'] = (stats['n_inmigrantes'] / stats['n_per']) * 100
-stats['pct_adulto_mayor'] = (stats['n_edad_60_mas'] / stats['n_per']) * 100
-stats['pct_ninos'] = ((stats['n_edad_0_5'] + stats['n_edad_6_13']) / stats['n_per']) * 100
-stats['pct_jefa_hogar'] = (stats['n_jefatura_mujer'] / stats['n_hog']) * 100
-stats['pct_hog_unipersonal'] = (stats['n_hog_unipersonales'] / stats['n_hog']) * 100
-
-# --- EDUCACIÓN / TRABAJO ---
-stats['pct_profesional'] = (stats['n_cine_terciaria_maestria_doctorado'] / stats['n_per']) * 100
-stats['pct_analfabeto'] = (stats['n_analfabet'] / stats['n_per']) * 100
-stats['pct_desocupado'] = (stats['n_desocupado'] / (stats['n_ocupado'] + stats['n_desocupado'])) * 100
-stats['pct_independiente'] = (stats['n_cise_rec_independientes'] / stats['n_per']) * 100
-
-# --- ESTADO CIVIL ---
-stats['pct_divorciado'] = (stats['n_estcivcon_anul_sep_div'] / stats['n_per']) * 100
-stats['pct_soltero'] = (stats['n_estcivcon_soltero'] / stats['n_per']) * 100
-stats['pct_viudo'] = (stats['n_estcivcon_viudo'] / stats['n_per']) * 100
-
-# --- TRANSPORTE ---
-stats['pct_auto'] = (stats['n_transporte_auto'] / stats['n_per']) * 100
-stats['pct_transporte_publico'] = (stats['n_transporte_publico'] / stats['n_per']) * 100
-stats['pct_bicicleta'] = (stats['n_transporte_bicicleta'] / stats['n_per']) * 100
-stats['pct_camina'] = (stats['n_transporte_camina'] / stats['n_per']) * 100
+# Suma de conteos por comuna -> porcentaje (denominador 0 -> NaN)
+stats = pd.concat([stats, evaluate(stats, PCT_ANALISIS)], axis=1)
 
 # ============================================
 # ANÁLISIS: CORRELACIONES CON VIVIENDA CEDIDA
@@ -165,7 +115,7 @@ comunas_vulnerables = ['LO ESPEJO', 'LA PINTANA', 'SAN RAMÓN', 'CERRO NAVIA', '
 comunas_acomodadas = ['VITACURA', 'LAS CONDES', 'LO BARNECHEA', 'PROVIDENCIA', 'LA REINA']
 
 vars_clave = [
-    'pct_cedida_familiar', 'pct_hacinamiento', 'pct_viv_irrecuperable',
+    'pct_cedida_familiar', 'pct_hacinamiento_vp', 'pct_viv_irrecuperable',
     'pct_mediagua', 'pct_profesional', 'pct_internet', 'pct_propia_pagada',
     'pct_arrendada_sin_contrato', 'pct_desocupado', 'pct_analfabeto'
 ]
@@ -194,33 +144,26 @@ print("\n" + "="*60)
 print(" PROPUESTA: INDICADORES COMPUESTOS")
 print("="*60)
 
-# 1. ÍNDICE DE PRECARIEDAD HABITACIONAL
-# Combina: hacinamiento + vivienda irrecuperable + mediagua + arrendada sin contrato + cedida familiar
-stats['idx_precariedad_hab'] = (
-    stats['pct_hacinamiento'] * 0.25 +
-    stats['pct_viv_irrecuperable'] * 0.25 +
-    stats['pct_mediagua'] * 0.20 +
-    stats['pct_arrendada_sin_contrato'] * 0.15 +
-    stats['pct_cedida_familiar'] * 0.15
-)
-
-# 2. ÍNDICE DE VULNERABILIDAD SOCIAL
-# Combina: desempleo + analfabetismo + sin internet + jefatura femenina (proxy monoparental)
-stats['idx_vulnerabilidad'] = (
-    stats['pct_desocupado'].fillna(0) * 0.30 +
-    stats['pct_analfabeto'] * 0.25 +
-    (100 - stats['pct_internet']) * 0.25 +  # Inverso: sin internet
-    stats['pct_jefa_hogar'] * 0.20
-)
-
-# 3. ÍNDICE DE PRIVILEGIO
-# Combina: educación terciaria + internet + vivienda propia pagada + auto
-stats['idx_privilegio'] = (
-    stats['pct_profesional'] * 0.30 +
-    stats['pct_internet'] * 0.20 +
-    stats['pct_propia_pagada'] * 0.30 +
-    stats['pct_auto'] * 0.20
-)
+# Misma estructura que indicators.COMPUESTOS (componente -> peso), evaluada con el
+# mismo motor como promedio ponderado de porcentajes.
+PROPUESTAS = {
+    # 1. ÍNDICE DE PRECARIEDAD HABITACIONAL
+    # Combina: hacinamiento + vivienda irrecuperable + mediagua + arrendada sin contrato + cedida familiar
+    'idx_precariedad_hab': {'componentes': {
+        'pct_hacinamiento_vp': 0.25, 'pct_viv_irrecuperable': 0.25, 'pct_mediagua': 0.20,
+        'pct_arrendada_sin_contrato': 0.15, 'pct_cedida_familiar': 0.15}},
+    # 2. ÍNDICE DE VULNERABILIDAD SOCIAL
+    # Combina: desempleo + analfabetismo + sin internet + jefatura femenina (proxy monoparental)
+    'idx_vulnerabilidad': {'componentes': {
+        'pct_desocupado': 0.30, 'pct_analfabeto': 0.25,
+        'pct_sin_internet': 0.25,  # Inverso: sin internet
+        'pct_jefa_hogar': 0.20}},
+    # 3. ÍNDICE DE PRIVILEGIO
+    # Combina: educación terciaria + internet + vivienda propia pagada + auto
+    'idx_privilegio': {'componentes': {
+        'pct_profesional': 0.30, 'pct_internet': 0.20, 'pct_propia_pagada': 0.30, 'pct_auto': 0.20}},
+}
+stats = pd.concat([stats, evaluate_composites(stats, method='promedio', registry=PROPUESTAS)], axis=1)
 
 # Mostrar ranking
 print("\n🏚️ TOP 10 PRECARIEDAD HABITACIONAL:")
@@ -0,0 +1,339 @@
+"""
+Autocorrelación espacial a escala de manzana: Moran global y LISA (hot spots) con inferencia por permutaciones.
+
+Pesos espaciales (una vez por tipo, cacheados en CSR dentro del caché columnar, se invalidan con él):
+  knn    k vecinos más cercanos por centroide (default; las manzanas están separadas por calles,
+         así que la contigüidad estricta deja muchas islas)
+  queen  polígonos a distancia <= tolerancia (0 = que se toquen)
+  rook   polígonos que comparten borde (largo común >= ROOK_MIN_SHARED, con la misma tolerancia)
+Los pares candidatos salen del índice espacial (spatial_index.py); los pesos se estandarizan por fila.
+
+Inferencia:
+  - Moran global: permutaciones completas de la variable, en bloques, como producto W @ Z
+  - LISA: permutación condicional (el valor de la manzana fijo, vecinos al azar entre las demás).
+    Una misma matriz de muestras (permutaciones x k) sirve para todas las manzanas; cada bloque de
+    manzanas se evalúa con una sola operación vectorizada. Opcionalmente en paralelo (--jobs).
+  ~50k manzanas x 999 permutaciones: segundos.
+
+Uso:
+    python autocorrelation.py idx_privilegio
+    python autocorrelation.py pct_internet --pesos queen --tolerancia 15 --jobs 4
+    python autocorrelation.py idx_precariedad_hab --comuna "PUENTE ALTO" --mapa --csv lisa.csv
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+from columnar_cache import SOURCE_FILE, ensure_cache
+
+PESOS_DIR = '_pesos'
+TIPOS_PESOS = ('knn', 'queen', 'rook')
+DEFAULT_K = 8
+ROOK_MIN_SHARED = 1.0        # metros de borde común para considerar contigüidad rook
+PERMUTATIONS = 999
+SIGNIFICANCE = 0.05
+CHUNK_CELLS = 4_000_000      # manzanas x permutaciones x vecinos por bloque vectorizado
+SEED = 12345
+
+# Cuadrantes de Moran (z de la manzana vs. rezago espacial)
+CLUSTERS = {0: 'No significativo', 1: 'Alto-Alto', 2: 'Bajo-Alto', 3: 'Bajo-Bajo', 4: 'Alto-Bajo'}
+
+_WEIGHTS = {}
+
+
+# === Pesos espaciales ===
+
+def _knn_pairs(geoms, k):
+    import shapely
+    from scipy.spatial import cKDTree
+
+    xy = shapely.get_coordinates(shapely.centroid(geoms))
+    k = min(k, len(xy) - 1)
+    _, nbrs = cKDTree(xy).query(xy, k=k + 1)
+    rows = np.repeat(np.arange(len(xy)), k + 1)
+    cols = nbrs.ravel()
+    # Se descarta la propia manzana (normalmente la primera; con centroides repetidos, cualquiera)
+    keep = cols != rows
+    rows, cols = rows[keep], cols[keep]
+    first_k = np.r_[0, np.cumsum(np.bincount(rows, minlength=len(xy)))[:-1]]
+    rank = np.arange(len(rows)) - first_k[rows]
+    return rows[rank < k], cols[rank < k]
+
+
+def _contiguity_pairs(index, geoms, rook, tolerance):
+    import shapely
+
+    b = shapely.bounds(geoms)
+    q, items = index.tree.query(b + np.array([-tolerance, -tolerance, tolerance, tolerance]))
+    pairs = q < items
+    a, c = q[pairs], items[pairs]
+    if tolerance > 0:
+        hit = shapely.dwithin(geoms[a], geoms[c], tolerance)
+    else:
+        hit = shapely.intersects(geoms[a], geoms[c])
+    a, c = a[hit], c[hit]
+    if rook:
+        shared = shapely.intersection(shapely.boundary(geoms[a]),
+                                      shapely.buffer(shapely.boundary(geoms[c]), max(tolerance, 1e-6)))
+        keep = shapely.length(shared) >= ROOK_MIN_SHARED + 2 * tolerance
+        a, c = a[keep], c[keep]
+    return np.r_[a, c], np.r_[c, a]
+
+
+def spatial_weights(tipo='knn', k=DEFAULT_K, tolerancia=0.0, source=SOURCE_FILE):
+    """
+    Matriz binaria de vecindad (scipy CSR) sobre todas las manzanas del índice espacial, en su orden.
+    Retorna (W, MANZENT). Cacheada en disco (CSR) y por proceso.
+    """
+    import scipy.sparse as sp
+    from spatial_index import load_index
+
+    if tipo not in TIPOS_PESOS:
+        raise ValueError(f"Tipo de pesos desconocido: {tipo}. Opciones: {TIPOS_PESOS}")
+    param = f"k{k}" if tipo == 'knn' else f"t{tolerancia:g}"
+    path = os.path.join(ensure_cache(source), PESOS_DIR, f"{tipo}_{param}.npz")
+    if path in _WEIGHTS:
+        return _WEIGHTS[path]
+
+    index = load_index(source)
+    n = len(index.ids)
+    if os.path.exists(path):
+        with np.load(path) as data:
+            W = sp.csr_matrix((np.ones(len(data['indices']), dtype=np.float64), data['indices'], data['indptr']),
+                              shape=(n, n))
+    else:
+        geoms = index.geometries(np.arange(n))
+        if tipo == 'knn':
+            rows, cols = _knn_pairs(geoms, k)
+        else:
+            rows, cols = _contiguity_pairs(index, geoms, tipo == 'rook', tolerancia)
+        W = sp.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(n, n))
+        W.sum_duplicates()
+        W.data[:] = 1.0
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        np.savez(path, indptr=W.indptr, indices=W.indices)
+        card = np.diff(W.indptr)
+        print(f"  Pesos {tipo} ({param}): {n:,} manzanas, {W.nnz:,} vínculos, "
+              f"vecinos promedio {card.mean():.1f}, islas {(card == 0).sum():,}")
+    _WEIGHTS[path] = (W, index.ids)
+    return _WEIGHTS[path]
+
+
+def row_standardize(W):
+    """Pesos por fila que suman 1 (islas quedan en 0)"""
+    card = np.diff(W.indptr)
+    W = W.copy()
+    W.data = 1.0 / np.repeat(np.maximum(card, 1), card)
+    return W
+
+
+def subset_weights(W, keep):
+    """Submatriz de las manzanas con valor válido, re-estandarizada"""
+    return row_standardize(W[keep][:, keep].tocsr())
+
+
+# === Moran global ===
+
+def moran_global(y, W, permutations=PERMUTATIONS, seed=SEED):
+    """Moran's I con W estandarizada por fila, pseudo p-valor por permutaciones (en bloques)"""
+    n = len(y)
+    z = y - y.mean()
+    zz = z @ z
+    s0 = W.sum()
+    I = n / s0 * (z @ (W @ z)) / zz
+    rng = np.random.default_rng(seed)
+    sims = np.empty(permutations)
+    block = max(1, CHUNK_CELLS // max(n, 1))
+    for start in range(0, permutations, block):
+        p = min(block, permutations - start)
+        Zp = rng.permuted(np.broadcast_to(z, (p, n)), axis=1).T       # n x p
+        sims[start:start + p] = n / s0 * np.einsum('ij,ij->j', Zp, W @ Zp) / zz
+    larger = int((sims >= I).sum())
+    if permutations - larger < larger:
+        larger = permutations - larger
+    return {
+        'I': float(I), 'EI': -1.0 / (n - 1), 'p_sim': (larger + 1) / (permutations + 1),
+        'z_sim': float((I - sims.mean()) / sims.std()) if sims.std() > 0 else np.nan, 'n': n,
+    }
+
+
+# === LISA ===
+
+def padded_weights(W):
+    """Pesos de cada fila en una matriz densa n x k_max (rellena con 0) para las permutaciones"""
+    card = np.diff(W.indptr)
+    k_max = int(card.max()) if len(card) else 0
+    Wd = np.zeros((W.shape[0], max(k_max, 1)))
+    rows = np.repeat(np.arange(W.shape[0]), card)
+    Wd[rows, np.arange(W.nnz) - W.indptr[rows]] = W.data
+    return Wd, card
+
+
+def _lisa_block(rows, z, Wd, samples, Is, scale):
+    """Cuántas permutaciones condicionales igualan o superan el I local observado, para un bloque de filas"""
+    # Muestras de 0..n-2: saltando la propia manzana se obtienen vecinos entre las otras n-1
+    S = samples[None, :, :] + (samples[None, :, :] >= rows[:, None, None])
+    lag = np.einsum('cpk,ck->cp', z[S], Wd[rows])
+    Ip = scale * z[rows, None] * lag
+    return rows, (Ip >= Is[rows, None]).sum(axis=1)
+
+
+_worker = {}
+
+
+def _init_lisa_worker(z, Wd, samples, Is, scale):
+    _worker.update(z=z, Wd=Wd, samples=samples, Is=Is, scale=scale)
+
+
+def _lisa_block_worker(rows):
+    w = _worker
+    return _lisa_block(rows, w['z'], w['Wd'], w['samples'], w['Is'], w['scale'])
+
+
+def lisa(y, W, permutations=PERMUTATIONS, seed=SEED, n_jobs=1, significance=SIGNIFICANCE):
+    """
+    Moran local por manzana con permutación condicional.
+    Retorna DataFrame (I_local, p_sim, cuadrante, cluster) en el orden de y.
+    """
+    n = len(y)
+    z = (y - y.mean()) / y.std()
+    lag = W @ z
+    scale = (n - 1) / (z @ z)
+    Is = scale * z * lag
+    Wd, card = padded_weights(W)
+
+    # Misma matriz de muestras sin reemplazo para todas las manzanas (permutaciones x k_max)
+    rng = np.random.default_rng(seed)
+    k_max = Wd.shape[1]
+    samples = np.stack([rng.choice(n - 1, size=k_max, replace=False) for _ in range(permutations)])
+    samples = samples.astype(np.int32 if n < 2**31 else np.int64)
+
+    block = max(1, CHUNK_CELLS // (permutations * k_max))
+    blocks = [np.arange(s, min(s + block, n)) for s in range(0, n, block)]
+    larger = np.zeros(n, dtype=np.int64)
+    if n_jobs <= 1:
+        for rows in blocks:
+            _, counts = _lisa_block(rows, z, Wd, samples, Is, scale)
+            larger[rows] = counts
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        import multiprocessing
+        ctx = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=n_jobs, mp_context=ctx, initializer=_init_lisa_worker,
+                                 initargs=(z, Wd, samples, Is, scale)) as pool:
+            for rows, counts in pool.map(_lisa_block_worker, blocks):
+                larger[rows] = counts
+
+    larger = np.where(permutations - larger < larger, permutations - larger, larger)
+    p_sim = (larger + 1) / (permutations + 1)
+    p_sim = np.where(card > 0, p_sim, np.nan)
+    quadrant = np.select([(z > 0) & (lag > 0), (z <= 0) & (lag > 0), (z <= 0) & (lag <= 0)], [1, 2, 3], 4)
+    cluster = np.where(p_sim <= significance, quadrant, 0)
+    return pd.DataFrame({'I_local': Is, 'p_sim': p_sim, 'cuadrante': quadrant, 'cluster': cluster})
+
+
+# === Análisis de una columna ===
+
+def analyze(column, tipo='knn', k=DEFAULT_K, tolerancia=0.0, comunas=None, permutations=PERMUTATIONS,
+            n_jobs=1, significance=SIGNIFICANCE, seed=SEED, source=SOURCE_FILE):
+    """
+    Moran global + LISA de una columna idx_*/pct_* sobre las manzanas (opcionalmente algunas comunas).
+    Manzanas sin valor se excluyen y los pesos se re-estandarizan. Retorna (global, DataFrame por manzana).
+    """
+    from spatial_index import load_index
+
+    W, ids = spatial_weights(tipo, k=k, tolerancia=tolerancia, source=source)
+    attrs = load_index(source).attributes([column, 'COMUNA'], source)
+    if column not in attrs:
+        raise KeyError(f"La columna '{column}' no existe en el caché columnar")
+    y = attrs[column].astype(np.float64)
+    keep = np.isfinite(y)
+    if comunas is not None:
+        keep &= np.isin(attrs['COMUNA'].astype(str), list(comunas))
+    Wk = subset_weights(W, keep)
+    yk = y[keep]
+    if Wk.nnz == 0:
+        raise ValueError(f"Pesos {tipo} sin vínculos entre las manzanas elegidas "
+                         "(¿tolerancia muy chica? las manzanas están separadas por calles)")
+
+    result = moran_global(yk, Wk, permutations, seed)
+    local = lisa(yk, Wk, permutations, seed, n_jobs, significance)
+    local.insert(0, 'MANZENT', ids[keep])
+    local.insert(1, 'COMUNA', attrs['COMUNA'][keep])
+    local.insert(2, column, yk)
+    local['cluster_nombre'] = local['cluster'].map(CLUSTERS)
+    return result, local
+
+
+def print_summary(column, result, local):
+    print(f"\nMoran global de {column}: I = {result['I']:.4f} (E[I] = {result['EI']:.5f}), "
+          f"p = {result['p_sim']:.4f}, z = {result['z_sim']:.2f}, n = {result['n']:,}")
+    counts = local['cluster_nombre'].value_counts()
+    print("Clusters LISA:")
+    for name in CLUSTERS.values():
+        print(f"  {name:17} {counts.get(name, 0):>8,}")
+    hot = local[local['cluster'] == 1].groupby('COMUNA', observed=True).size().sort_values(ascending=False)
+    if len(hot):
+        print("Comunas con más manzanas Alto-Alto: " + ", ".join(f"{c} ({n})" for c, n in hot.head(5).items()))
+
+
+def plot_clusters(local, column, comuna=None, source=SOURCE_FILE):
+    """Mapa de clusters LISA (geometría de render) con la paleta de generate_maps"""
+    import matplotlib.pyplot as plt
+    import generate_maps as gm
+    from columnar_cache import load_indicators
+    from render_geometry import RENDER_COL
+
+    gm.setup_plot()
+    comunas = [comuna] if comuna else None
+    gdf = load_indicators(columns=['MANZENT'], comunas=comunas, geometry=RENDER_COL, source=source)
+    gdf = gdf.merge(local[['MANZENT', 'cluster']], on='MANZENT', how='left')
+    gdf['cluster'] = gdf['cluster'].fillna(0).astype(int)
+    colors = {0: '#202030', 1: gm.CYBER_MAGENTA, 2: gm.CYBER_PURPLE, 3: gm.CYBER_CYAN, 4: gm.CYBER_YELLOW}
+
+    fig, ax = plt.subplots(figsize=gm.FIG_SIZE)
+    ax.set_facecolor(gm.BACKGROUND_COLOR)
+    for code, color in colors.items():
+        part = gdf[gdf['cluster'] == code]
+        if len(part):
+            part.plot(ax=ax, color=color, edgecolor='none', linewidth=0.0, label=CLUSTERS[code])
+    ax.set_axis_off()
+    ax.set_aspect('equal')
+    ax.legend(loc='lower left', fontsize=5, frameon=False, labelcolor=gm.TEXT_COLOR)
+    fig.text(0.5, 0.93, f"HOT SPOTS: {column}", ha='center', fontsize=12, fontweight='bold', color=gm.TEXT_COLOR)
+    fig.text(0.5, 0.89, comuna or 'Región Metropolitana', ha='center', fontsize=10, color=gm.TEXT_COLOR)
+    os.makedirs(gm.OUTPUT_DIR, exist_ok=True)
+    path = os.path.join(gm.OUTPUT_DIR, f"{column}_LISA_{(comuna or 'RM').replace(' ', '_')}.png")
+    fig.savefig(path, dpi=gm.DPI, facecolor=gm.BACKGROUND_COLOR)
+    plt.close(fig)
+    print(f"  Mapa LISA -> {path}")
+    return path
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+    parser = argparse.ArgumentParser(description="Moran global y LISA (hot spots) por manzana")
+    parser.add_argument('columna', help="Columna idx_*/pct_* del caché columnar")
+    parser.add_argument('--pesos', choices=TIPOS_PESOS, default='knn')
+    parser.add_argument('--k', type=int, default=DEFAULT_K, help="Vecinos para knn")
+    parser.add_argument('--tolerancia', type=float, default=0.0, help="Distancia (m) para queen/rook")
+    parser.add_argument('--comuna', default=None, help="Restringir a una comuna")
+    parser.add_argument('--permutaciones', type=int, default=PERMUTATIONS)
+    parser.add_argument('--jobs', type=int, default=1)
+    parser.add_argument('--mapa', action='store_true', help="Guardar mapa de clusters")
+    parser.add_argument('--csv', default=None, help="Exportar resultados por manzana")
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    result, local = analyze(args.columna, args.pesos, k=args.k, tolerancia=args.tolerancia,
+                            comunas=[args.comuna] if args.comuna else None,
+                            permutations=args.permutaciones, n_jobs=args.jobs)
+    print_summary(args.columna, result, local)
+    print(f"({time.perf_counter() - t0:.1f}s)")
+    if args.csv:
+        local.to_csv(args.csv, index=False)
+        print(f"✅ LISA por manzana -> {args.csv}")
+    if args.mapa:
+        plot_clusters(local, args.columna, args.comuna)
@@ -0,0 +1,422 @@
+"""
+Mapas base (teselas raster XYZ) bajo los coropletas, sin red en el momento del render.
+
+generate_commune_map proyecta a EPSG:3857 para poner un mapa base, pero pedir teselas en vivo
+por cada mapa es lento e imposible en nodos sin red. Aquí las teselas salen de una fuente local
+y de un caché en disco:
+  - fuente: MBTiles raster (.mbtiles), directorio XYZ ({z}/{x}/{y}.png) o URL http(s) con
+    {z}/{x}/{y} (un servidor de la red interna o el servidor de prueba de este módulo)
+  - caché en disco LRU con límite de tamaño (cache/teselas_base/<fuente>/, también es un XYZ)
+  - caché en memoria de teselas decodificadas; el mosaico de cada mapa se arma desde ahí
+  - prefetch: a partir de la extensión de cada comuna (la misma que usa generate_commune_map) se
+    calcula el zoom y EXACTAMENTE las teselas que necesita cada mapa, y se descargan al caché
+
+Uso:
+    python basemap.py --servir --sintetico --puerto 8001                 # servidor local de prueba
+    python basemap.py --prefetch --fuente "http://127.0.0.1:8001/{z}/{x}/{y}.png"
+    python basemap.py --prefetch --fuente basemap.mbtiles --comuna ÑUÑOA --comuna MAIPÚ
+    python generate_maps.py --basemap basemap.mbtiles    # o la URL; sin red basta el caché
+"""
+import hashlib
+import io
+import math
+import os
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from columnar_cache import CACHE_DIR
+from generate_maps import BACKGROUND_COLOR, BASEMAP_SOURCE, DPI, FIG_SIZE, INPUT_FILE
+from render_geometry import MAP_MARGIN, RENDER_COL
+from vector_tiles import HALF_WORLD
+
+TILE_CACHE_DIR = os.path.join(CACHE_DIR, 'teselas_base')
+CACHE_MAX_MB = 512          # Límite del caché en disco (por fuente); se desalojan las menos usadas
+MEMORY_TILES = 512          # Teselas decodificadas en memoria por proceso
+TILE_SIZE = 256
+MIN_ZOOM = 0
+MAX_ZOOM = 18
+HTTP_TIMEOUT = 10
+SERVER_PORT = 8001
+
+_PROVIDERS = {}
+
+
+def _tile_bytes_to_rgb(data):
+    from PIL import Image
+    image = Image.open(io.BytesIO(data)).convert('RGB')
+    if image.size != (TILE_SIZE, TILE_SIZE):
+        image = image.resize((TILE_SIZE, TILE_SIZE), Image.BILINEAR)
+    return np.asarray(image)
+
+
+# --- Fuentes -------------------------------------------------------------------------------------
+
+class MBTilesSource:
+    """MBTiles raster (filas TMS)"""
+
+    def __init__(self, path):
+        import sqlite3
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"No existe {path}")
+        self.con = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+
+    def get(self, z, x, y):
+        row = self.con.execute("SELECT tile_data FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+                               (z, x, (1 << z) - 1 - y)).fetchone()
+        return row[0] if row else None
+
+
+class XYZSource:
+    """Directorio {z}/{x}/{y}.<ext>"""
+
+    EXTENSIONS = ('png', 'jpg', 'jpeg', 'webp')
+
+    def __init__(self, root):
+        if not os.path.isdir(root):
+            raise FileNotFoundError(f"No existe el directorio {root}")
+        self.root = root
+
+    def get(self, z, x, y):
+        for ext in self.EXTENSIONS:
+            path = os.path.join(self.root, str(z), str(x), f"{y}.{ext}")
+            if os.path.exists(path):
+                with open(path, 'rb') as f:
+                    return f.read()
+        return None
+
+
+class HTTPSource:
+    """Plantilla http(s)://.../{z}/{x}/{y}.png; 404/204 -> sin tesela"""
+
+    def __init__(self, template):
+        self.template = template
+
+    def get(self, z, x, y):
+        from urllib.error import HTTPError
+        from urllib.request import Request, urlopen
+        request = Request(self.template.format(z=z, x=x, y=y), headers={'User-Agent': 'censo2024-basemap'})
+        try:
+            with urlopen(request, timeout=HTTP_TIMEOUT) as response:
+                return response.read() if response.status == 200 else None
+        except HTTPError as e:
+            if e.code == 404:
+                return None
+            raise
+
+
+def open_source(spec):
+    """Fuente según la especificación: URL, .mbtiles o directorio XYZ"""
+    if spec.startswith(('http://', 'https://')):
+        return HTTPSource(spec)
+    if spec.endswith('.mbtiles'):
+        return MBTilesSource(spec)
+    return XYZSource(spec)
+
+
+# --- Caché en disco (LRU) ------------------------------------------------------------------------
+
+class TileCache:
+    """
+    Teselas como archivos <root>/{z}/{x}/{y}.tile. El orden LRU es el mtime (se toca en cada
+    lectura); al superar max_bytes se borran las menos usadas.
+    """
+
+    def __init__(self, root, max_bytes=CACHE_MAX_MB * 2 ** 20):
+        self.root = root
+        self.max_bytes = max_bytes
+        entries = []
+        for folder, _, files in os.walk(root):
+            for name in files:
+                if name.endswith('.tile'):
+                    path = os.path.join(folder, name)
+                    stat = os.stat(path)
+                    entries.append((stat.st_mtime, path, stat.st_size))
+        self._entries = OrderedDict((path, size) for _, path, size in sorted(entries))
+        self.total = sum(self._entries.values())
+
+    def _path(self, z, x, y):
+        return os.path.join(self.root, str(z), str(x), f"{y}.tile")
+
+    def __contains__(self, key):
+        return self._path(*key) in self._entries
+
+    def get(self, z, x, y):
+        path = self._path(z, x, y)
+        if path not in self._entries:
+            return None
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:      # Borrada por otro proceso
+            self.total -= self._entries.pop(path)
+            return None
+        os.utime(path)
+        self._entries.move_to_end(path)
+        return data
+
+    def put(self, z, x, y, data):
+        path = self._path(z, x, y)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+        self.total += len(data) - self._entries.pop(path, 0)
+        self._entries[path] = len(data)
+        self._evict()
+
+    def _evict(self):
+        while self.total > self.max_bytes and len(self._entries) > 1:
+            path, size = self._entries.popitem(last=False)
+            self.total -= size
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+# --- Proveedor: disco -> fuente, con teselas decodificadas en memoria ------------------------------
+
+class TileProvider:
+    """
+    Teselas de una fuente con caché en disco y en memoria. Si la fuente no está disponible (sin
+    red, archivo ausente) se sirve solo desde el caché; las teselas faltantes quedan con el fondo.
+    """
+
+    def __init__(self, spec=BASEMAP_SOURCE, cache_dir=TILE_CACHE_DIR, max_mb=CACHE_MAX_MB, memory_tiles=MEMORY_TILES):
+        self.spec = spec
+        key = hashlib.blake2b(spec.encode('utf-8'), digest_size=6).hexdigest()
+        self.cache = TileCache(os.path.join(cache_dir, key), max_mb * 2 ** 20)
+        self.memory_tiles = memory_tiles
+        self._memory = OrderedDict()
+        self._source = None
+        self._source_error = None
+        self.stats = {'memoria': 0, 'disco': 0, 'fuente': 0, 'faltantes': 0}
+
+    @property
+    def source(self):
+        if self._source is None and self._source_error is None:
+            try:
+                self._source = open_source(self.spec)
+            except OSError as e:
+                self._source_error = e
+                print(f"  Mapa base: fuente no disponible ({e}); solo caché en disco")
+        return self._source
+
+    def tile_bytes(self, z, x, y):
+        """Bytes de la tesela (caché en disco, si no la fuente y se guarda); None si no existe"""
+        data = self.cache.get(z, x, y)
+        if data is not None:
+            self.stats['disco'] += 1
+            return data
+        if self.source is None:
+            return None
+        try:
+            data = self.source.get(z, x, y)
+        except OSError as e:
+            print(f"  Mapa base: error leyendo {z}/{x}/{y} ({e}); se usa solo el caché")
+            self._source, self._source_error = None, e
+            return None
+        if data is not None:
+            self.stats['fuente'] += 1
+            self.cache.put(z, x, y, data)
+        return data
+
+    def tile(self, z, x, y):
+        """Tesela decodificada (TILE_SIZE x TILE_SIZE x 3, uint8) o None"""
+        key = (z, x, y)
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            self.stats['memoria'] += 1
+            return self._memory[key]
+        data = self.tile_bytes(z, x, y)
+        if data is None:
+            self.stats['faltantes'] += 1
+            return None
+        rgb = _tile_bytes_to_rgb(data)
+        self._memory[key] = rgb
+        if len(self._memory) > self.memory_tiles:
+            self._memory.popitem(last=False)
+        return rgb
+
+    def mosaic(self, extent, zoom):
+        """(imagen RGB, (izq, der, abajo, arriba) en EPSG:3857) con las teselas que cubren extent"""
+        from matplotlib.colors import to_rgb
+        x0, y0, x1, y1 = tile_span(extent, zoom)
+        image = np.empty(((y1 - y0 + 1) * TILE_SIZE, (x1 - x0 + 1) * TILE_SIZE, 3), dtype=np.uint8)
+        image[:] = np.rint(np.array(to_rgb(BACKGROUND_COLOR)) * 255)
+        for x in range(x0, x1 + 1):
+            for y in range(y0, y1 + 1):
+                rgb = self.tile(zoom, x, y)
+                if rgb is not None:
+                    image[(y - y0) * TILE_SIZE:(y - y0 + 1) * TILE_SIZE,
+                          (x - x0) * TILE_SIZE:(x - x0 + 1) * TILE_SIZE] = rgb
+        span = 2 * HALF_WORLD / (1 << zoom)
+        bounds = (-HALF_WORLD + x0 * span, -HALF_WORLD + (x1 + 1) * span,
+                  HALF_WORLD - (y1 + 1) * span, HALF_WORLD - y0 * span)
+        return image, bounds
+
+
+def get_provider(spec=BASEMAP_SOURCE):
+    """Proveedor por proceso (los trabajadores de render reciben solo la especificación)"""
+    if spec not in _PROVIDERS:
+        _PROVIDERS[spec] = TileProvider(spec)
+    return _PROVIDERS[spec]
+
+
+# --- Geometría de teselas ------------------------------------------------------------------------
+
+def map_extent(bounds):
+    """Extensión visible del mapa comunal: bounds + MAP_MARGIN por lado (igual que generate_commune_map)"""
+    minx, miny, maxx, maxy = bounds
+    dx, dy = (maxx - minx) * MAP_MARGIN, (maxy - miny) * MAP_MARGIN
+    return (minx - dx, miny - dy, maxx + dx, maxy + dy)
+
+
+def map_zoom(extent):
+    """
+    Zoom cuya resolución iguala o supera la del mapa: el eje (subplot por defecto, aspecto igual)
+    ocupa min(ancho / dx, alto / dy) pixeles por metro a FIG_SIZE x DPI.
+    """
+    import matplotlib as mpl
+    rc = mpl.rcParams
+    width = (rc['figure.subplot.right'] - rc['figure.subplot.left']) * FIG_SIZE[0] * DPI
+    height = (rc['figure.subplot.top'] - rc['figure.subplot.bottom']) * FIG_SIZE[1] * DPI
+    minx, miny, maxx, maxy = extent
+    px_per_m = min(width / max(maxx - minx, 1e-9), height / max(maxy - miny, 1e-9))
+    zoom = math.ceil(math.log2(2 * HALF_WORLD * px_per_m / TILE_SIZE))
+    return int(min(max(zoom, MIN_ZOOM), MAX_ZOOM))
+
+
+def tile_span(extent, zoom):
+    """(x0, y0, x1, y1) inclusivo, y hacia abajo, de las teselas que tocan extent"""
+    n = 1 << zoom
+    scale = n / (2 * HALF_WORLD)
+    minx, miny, maxx, maxy = extent
+    clip = lambda v: min(max(int(math.floor(v)), 0), n - 1)
+    return (clip((minx + HALF_WORLD) * scale), clip((HALF_WORLD - maxy) * scale),
+            clip((maxx + HALF_WORLD) * scale), clip((HALF_WORLD - miny) * scale))
+
+
+def required_tiles(extent, zoom=None):
+    """Teselas (z, x, y) que necesita un mapa con esta extensión"""
+    zoom = map_zoom(extent) if zoom is None else zoom
+    x0, y0, x1, y1 = tile_span(extent, zoom)
+    return [(zoom, x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1)]
+
+
+def add_basemap(ax, spec=BASEMAP_SOURCE, extent=None):
+    """Dibuja el mosaico bajo los datos (zorder 0) sin cambiar los límites del eje"""
+    if extent is None:
+        (minx, maxx), (miny, maxy) = ax.get_xlim(), ax.get_ylim()
+        extent = (minx, miny, maxx, maxy)
+    image, bounds = get_provider(spec).mosaic(extent, map_zoom(extent))
+    xlim, ylim = ax.get_xlim(), ax.get_ylim()
+    ax.imshow(image, extent=bounds, origin='upper', interpolation='bilinear', zorder=0)
+    ax.set_xlim(xlim)
+    ax.set_ylim(ylim)
+
+
+# --- Prefetch ------------------------------------------------------------------------------------
+
+def commune_extents(communes=None, source=INPUT_FILE):
+    """{comuna: extensión del mapa en EPSG:3857} desde la geometría de render del caché columnar"""
+    from columnar_cache import load_indicators
+    gdf = load_indicators(columns=['COMUNA', 'REGION'], comunas=communes, geometry=RENDER_COL, source=source)
+    if communes is None:
+        gdf = gdf[gdf['REGION'].astype(str).str.contains('METROPOLITANA', case=False, na=False)]
+    bounds = gdf.geometry.bounds.groupby(gdf['COMUNA'].to_numpy()).agg(
+        {'minx': 'min', 'miny': 'min', 'maxx': 'max', 'maxy': 'max'})
+    return {c: map_extent(tuple(row)) for c, row in zip(bounds.index, bounds.to_numpy())}
+
+
+def prefetch(spec=BASEMAP_SOURCE, communes=None, source=INPUT_FILE):
+    """Descarga al caché en disco las teselas de cada mapa comunal. Retorna {comuna: [(z, x, y), ...]}"""
+    provider = get_provider(spec)
+    plan = {c: required_tiles(extent) for c, extent in commune_extents(communes, source).items()}
+    unique = sorted({t for tiles in plan.values() for t in tiles})
+    cached = sum(1 for t in unique if t in provider.cache)
+    t0 = time.perf_counter()
+    missing = [t for t in unique if provider.tile_bytes(*t) is None]
+    for commune, tiles in plan.items():
+        print(f"  {commune:<24} z{tiles[0][0]:<3} {len(tiles):>4} teselas")
+    print(f"{len(plan)} mapas: {len(unique)} teselas distintas ({cached} ya en caché, "
+          f"{provider.stats['fuente']} descargadas, {len(missing)} sin datos en la fuente) "
+          f"en {time.perf_counter() - t0:.1f}s; caché {provider.cache.total / 2 ** 20:.1f} MB "
+          f"en {provider.cache.root}")
+    return plan
+
+
+# --- Servidor de prueba --------------------------------------------------------------------------
+
+def synthetic_tile(z, x, y):
+    """Tesela PNG oscura con grilla y etiqueta z/x/y (reemplazo de un proveedor real en pruebas)"""
+    from PIL import Image, ImageDraw
+    image = Image.new('RGB', (TILE_SIZE, TILE_SIZE), '#0b0d17')
+    draw = ImageDraw.Draw(image)
+    for i in range(0, TILE_SIZE, 32):
+        draw.line([(i, 0), (i, TILE_SIZE)], fill='#151a2b')
+        draw.line([(0, i), (TILE_SIZE, i)], fill='#151a2b')
+    draw.rectangle([0, 0, TILE_SIZE - 1, TILE_SIZE - 1], outline='#232a42')
+    draw.text((6, 6), f"{z}/{x}/{y}", fill='#3a4466')
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def serve(spec=None, port=SERVER_PORT, synthetic=False):
+    """Servidor HTTP local /{z}/{x}/{y}.png desde un MBTiles/XYZ, o teselas sintéticas"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    source = None if synthetic else open_source(spec)
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            parts = self.path.split('?')[0].strip('/').split('/')
+            data = None
+            if len(parts) == 3 and '.' in parts[2]:
+                try:
+                    z, x, y = int(parts[0]), int(parts[1]), int(parts[2].split('.')[0])
+                except ValueError:
+                    z = None
+                if z is not None and 0 <= x < (1 << z) and 0 <= y < (1 << z):
+                    data = synthetic_tile(z, x, y) if synthetic else source.get(z, x, y)
+            self.send_response(200 if data else 404)
+            self.send_header('Content-Type', 'image/png')
+            self.send_header('Content-Length', str(len(data or b'')))
+            self.end_headers()
+            self.wfile.write(data or b'')
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+    print(f"Sirviendo teselas {'sintéticas' if synthetic else spec} en "
+          f"http://127.0.0.1:{port}/{{z}}/{{x}}/{{y}}.png (Ctrl+C para salir)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Mapas base offline: caché de teselas, prefetch y servidor de prueba")
+    parser.add_argument('--fuente', default=BASEMAP_SOURCE, help="MBTiles, directorio XYZ o URL con {z}/{x}/{y}")
+    parser.add_argument('--prefetch', action='store_true', help="Descargar al caché las teselas de cada mapa comunal")
+    parser.add_argument('--comuna', action='append', help="Limitar el prefetch a estas comunas (repetible)")
+    parser.add_argument('--servir', action='store_true', help="Servidor HTTP local de teselas")
+    parser.add_argument('--sintetico', action='store_true', help="Con --servir: teselas sintéticas (pruebas)")
+    parser.add_argument('--puerto', type=int, default=SERVER_PORT)
+    args = parser.parse_args()
+
+    if args.servir:
+        serve(args.fuente, args.puerto, synthetic=args.sintetico)
+    elif args.prefetch:
+        prefetch(args.fuente, args.comuna)
+    else:
+        parser.print_help()
@@ -0,0 +1,261 @@
+"""
+Benchmark por etapas del pipeline sobre un censo sintético (synthetic_census.py).
+
+Etapas (en orden, cada una usa el resultado de la anterior):
+  lectura           read_layer_pushdown con el filtro RM (como process_data)
+  indicadores       compute_indicators: nulos, pct_* y compuestos Z-Score
+  escritura_gpkg    GPKG de salida
+  geometria_render  EPSG:3857 simplificada (build_render_geometry)
+  agregacion        jerarquía territorial completa + registro + compuestos (como generate_maps.main)
+  fisher_jenks      clasificación de las manzanas (modo auto, sin caché)
+  mapa_comunal      generate_commune_map de la comuna con más manzanas
+  infografia        generate_infographic del ranking comunal
+
+Por etapa se registra tiempo, memoria máxima (RSS) y filas/s. Además se mide, en un intérprete
+nuevo (python -X importtime), cuánto tarda en importarse cada script que expone censo.py y cuáles
+de sus dependencias directas pesan más. Los resultados van a un JSON (bench_results/) con el
+commit y las versiones, para seguir regresiones entre commits.
+
+Uso:
+    python benchmark.py --filas 10000 100000
+    python benchmark.py --filas 2000000 --etapas lectura indicadores agregacion
+    python benchmark.py --filas 10000 --comparar bench_results/anterior.json
+    python benchmark.py --importacion        # solo tiempos de importación
+"""
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+
+from instrumentation import peak_rss_mb, reset_peak_rss
+
+RESULTS_DIR = 'bench_results'
+DEFAULT_ROWS = [10_000, 100_000]
+ETAPAS = ['lectura', 'indicadores', 'escritura_gpkg', 'geometria_render', 'agregacion',
+          'fisher_jenks', 'mapa_comunal', 'infografia']
+INDICADOR = 'idx_privilegio'
+# Módulos de los subcomandos de censo.py (+ el lanzador): lo que se paga antes de empezar a trabajar
+IMPORT_MODULES = ['censo', 'insights', 'drilldown', 'inspect_gpkg', 'catalog', 'benchmark', 'process_census_data',
+                  'generate_maps']
+IMPORT_REPEAT = 3      # mínimo de N intérpretes (el primero puede incluir compilar .pyc)
+IMPORT_TOP = 3         # dependencias directas más caras que se reportan
+
+
+def _environment():
+    import numpy as np
+    import pandas as pd
+    import geopandas as gpd
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        'commit': commit or None,
+        'fecha': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'plataforma': platform.platform(),
+        'cpus': os.cpu_count(),
+        'versiones': {'numpy': np.__version__, 'pandas': pd.__version__, 'geopandas': gpd.__version__},
+    }
+
+
+def _stages(path, workdir):
+    """Lista de (etapa, función) sobre un estado compartido; cada función retorna filas procesadas"""
+    import numpy as np
+    import process_census_data as etl
+    import generate_maps as gm
+    from classification import classify
+    from geography import aggregate_hierarchy
+    from indicators import COMPUESTOS, INDICADORES
+    from render_geometry import build_render_geometry
+
+    state = {}
+
+    def lectura():
+        gdf, rows, _ = etl.read_layer_pushdown(path, etl.LAYER_NAME, columns=etl.required_columns(),
+                                               where=etl.RM_WHERE)
+        state['gdf'] = gdf
+        return rows
+
+    def indicadores():
+        state['gdf'], _ = etl.compute_indicators(state['gdf'])
+        return len(state['gdf'])
+
+    def escritura_gpkg():
+        gdf = state['gdf']
+        cols = [c for c in etl.KEEP_COLS + etl.COLS_EXTRA if c in gdf.columns]
+        gdf[cols].to_file(os.path.join(workdir, 'salida.gpkg'), driver='GPKG')
+        return len(gdf)
+
+    def geometria_render():
+        render, _ = build_render_geometry(state['gdf'])
+        state['render'] = state['gdf'][['COMUNA', INDICADOR]].set_geometry(render)
+        return len(render)
+
+    def agregacion():
+        # Mismo camino que generate_maps.main: todos los niveles territoriales en un barrido + registro
+        gdf = state['gdf']
+        niveles = aggregate_hierarchy(gdf, list(INDICADORES), composites=COMPUESTOS)
+        state['stats'] = niveles['comuna'].fillna(0).reset_index()
+        return len(gdf)
+
+    def fisher_jenks():
+        values = state['gdf'][INDICADOR].to_numpy()
+        state['bins'] = classify(values, k=5, mode='auto', use_cache=False)['bins']
+        return int(np.isfinite(values).sum())
+
+    def mapa_comunal():
+        render = state['render']
+        commune = render['COMUNA'].value_counts().idxmax()
+        gm.generate_commune_map(render, commune, INDICADOR, 'Benchmark', 'bench', bins=state['bins'])
+        return int((render['COMUNA'] == commune).sum())
+
+    def infografia():
+        gm.generate_infographic(state['stats'], INDICADOR, 'Benchmark', 'bench', 'Benchmark', 'Gran Santiago')
+        return len(state['stats'])
+
+    return [('lectura', lectura), ('indicadores', indicadores), ('escritura_gpkg', escritura_gpkg),
+            ('geometria_render', geometria_render), ('agregacion', agregacion), ('fisher_jenks', fisher_jenks),
+            ('mapa_comunal', mapa_comunal), ('infografia', infografia)]
+
+
+def run_benchmark(n_rows, etapas=None, seed=None):
+    """Corre las etapas sobre un censo sintético de n_rows manzanas. Retorna {etapa: métricas}"""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import generate_maps as gm
+    from synthetic_census import SEED, synthetic_file
+
+    path = synthetic_file(n_rows, seed=seed or SEED)
+    etapas = etapas or ETAPAS
+    results = {}
+    with tempfile.TemporaryDirectory(prefix='bench_') as workdir:
+        gm.OUTPUT_DIR = workdir
+        gm.setup_plot()
+        for name, fn in _stages(path, workdir):
+            # Las etapas dependen de las anteriores: se ejecutan todas, pero solo se reportan las pedidas
+            reset_peak_rss()
+            t0 = time.perf_counter()
+            rows = fn()
+            secs = time.perf_counter() - t0
+            plt.close('all')
+            if name not in etapas:
+                continue
+            results[name] = {
+                'segundos': round(secs, 4),
+                'rss_pico_mb': None if peak_rss_mb() is None else round(peak_rss_mb(), 1),
+                'filas': int(rows),
+                'filas_por_s': round(rows / secs, 1) if secs > 0 else None,
+            }
+            rss = results[name]['rss_pico_mb']
+            print(f"  {name:17} {secs:9.3f}s {rss if rss is not None else float('nan'):9.1f} MB "
+                  f"{rows:>10,} filas {results[name]['filas_por_s'] or 0:>14,.0f} filas/s")
+    return results
+
+
+def _parse_importtime(stderr, module):
+    """(µs acumulados del módulo, {dependencia directa: µs}) desde la salida de -X importtime"""
+    total, deps = None, {}
+    for line in stderr.splitlines():
+        parts = line.split('|')
+        if not line.startswith('import time:') or len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        name = parts[2]
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 0:
+            # Los hijos se imprimen antes que el padre: lo acumulado hasta aquí era de otro módulo (site)
+            if name.strip() == module:
+                total = int(parts[1])
+                break
+            deps = {}
+        elif depth == 1:
+            deps[name.strip()] = int(parts[1])
+    return total, deps
+
+
+def import_times(modules=IMPORT_MODULES, repeat=IMPORT_REPEAT, top=IMPORT_TOP):
+    """ms de importación de cada módulo en un intérprete nuevo y sus dependencias directas más caras"""
+    import sys
+    here = os.path.dirname(os.path.abspath(__file__))
+    results = {}
+    for module in modules:
+        best, deps = None, {}
+        for _ in range(repeat):
+            proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                                  capture_output=True, text=True, cwd=here)
+            total, run_deps = _parse_importtime(proc.stderr, module)
+            if total is None:
+                print(f"  {module:20} no se pudo importar: {proc.stderr.strip().splitlines()[-1:]}")
+                break
+            if best is None or total < best:
+                best, deps = total, run_deps
+        if best is None:
+            continue
+        heavy = sorted(deps.items(), key=lambda kv: kv[1], reverse=True)[:top]
+        results[module] = {'ms': round(best / 1000, 1),
+                           'dependencias_ms': {name: round(us / 1000, 1) for name, us in heavy}}
+        print(f"  {module:20} {best / 1000:8.1f} ms   "
+              + ", ".join(f"{name} {us / 1000:.0f}" for name, us in heavy))
+    return results
+
+
+def compare(current, previous_path):
+    """Imprime la razón de tiempos respecto de un JSON anterior (>1 = más lento)"""
+    with open(previous_path, encoding='utf-8') as f:
+        previous = json.load(f)
+    prev_runs = {r['filas']: r['etapas'] for r in previous['corridas']}
+    print(f"\nComparación con {previous_path} (commit {previous.get('commit')}):")
+    for run in current['corridas']:
+        prev = prev_runs.get(run['filas'])
+        if not prev: continue
+        for name, m in run['etapas'].items():
+            if name in prev and prev[name]['segundos']:
+                ratio = m['segundos'] / prev[name]['segundos']
+                flag = '  <-- regresión' if ratio > 1.2 else ''
+                print(f"  {run['filas']:>9,} {name:17} {prev[name]['segundos']:8.3f}s -> "
+                      f"{m['segundos']:8.3f}s ({ratio:5.2f}x){flag}")
+    prev_imports = previous.get('importacion', {})
+    for module, m in current.get('importacion', {}).items():
+        if module in prev_imports and prev_imports[module]['ms']:
+            ratio = m['ms'] / prev_imports[module]['ms']
+            flag = '  <-- regresión' if ratio > 1.2 else ''
+            print(f"  {'import':>9} {module:20} {prev_imports[module]['ms']:7.1f}ms -> "
+                  f"{m['ms']:7.1f}ms ({ratio:5.2f}x){flag}")
+
+
+def main(rows=None, etapas=None, output=None, previous=None, solo_importacion=False):
+    report = _environment()
+    print("\n=== Tiempos de importación (python -X importtime) ===")
+    report['importacion'] = import_times()
+    report['corridas'] = []
+    for n in [] if solo_importacion else rows or DEFAULT_ROWS:
+        print(f"\n=== Benchmark: {n:,} manzanas sintéticas ===")
+        report['corridas'].append({'filas': n, 'etapas': run_benchmark(n, etapas)})
+
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"bench_{report['commit'] or 'local'}_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=1)
+    print(f"\n✅ Resultados en {output}")
+    if previous:
+        compare(report, previous)
+    return report
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Benchmark por etapas sobre un censo sintético")
+    parser.add_argument('--filas', type=int, nargs='+', default=DEFAULT_ROWS,
+                        help="Tamaños del censo sintético (ej. 10000 100000 2000000)")
+    parser.add_argument('--etapas', nargs='+', choices=ETAPAS, default=None, help="Etapas a reportar (default: todas)")
+    parser.add_argument('--salida', default=None, help="Ruta del JSON de resultados")
+    parser.add_argument('--comparar', default=None, help="JSON de una corrida anterior para comparar tiempos")
+    parser.add_argument('--importacion', action='store_true',
+                        help="Solo medir tiempos de importación (sin censo sintético)")
+    args = parser.parse_args()
+    main(args.filas, args.etapas, args.salida, args.comparar, solo_importacion=args.importacion)
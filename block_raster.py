@@ -0,0 +1,332 @@
+"""
+Índice rasterizado de manzanas: recolorear cualquier indicador sin volver a rasterizar polígonos.
+
+generate_commune_map pasa miles de polígonos por matplotlib en cada indicador, aunque la geometría
+es siempre la misma. Aquí cada comuna (y la región completa) se rasteriza UNA vez a la resolución
+de salida (FIG_SIZE x DPI, mismos ejes y márgenes que generate_commune_map):
+  - imagen de IDs: cada pixel -> posición de la manzana que lo cubre (-1 = fondo)
+  - cobertura: fracción del pixel cubierta (antialiasing), 0-255
+y se guarda en el caché columnar (_raster/<ancho>x<alto>/<comuna>.npz, se invalida con él).
+
+Dibujar un indicador es entonces un lookup NumPy manzana -> color de clase, mezclado sobre el fondo
+con alpha x cobertura, más dos capas de texto RGBA precalculadas: el marco del indicador (título,
+descripción, leyenda, fuente, logo; una por indicador) y el nombre de la comuna (una por comuna).
+
+Uso:
+    python block_raster.py --construir                 # rasteriza todas las comunas de la RM + región
+    python block_raster.py --bench --comunas 10        # matplotlib vs lookup, ms por mapa
+"""
+import os
+import time
+
+import numpy as np
+
+from columnar_cache import ensure_cache, load_indicators
+from generate_maps import (BACKGROUND_COLOR, DPI, FIG_SIZE, ID_COL, INPUT_FILE, NEON_CMAP, OUTPUT_DIR,
+                           commune_geometry)
+from render_geometry import MAP_MARGIN, RENDER_COL
+
+RASTER_DIR = '_raster'
+RASTER_FIELDS = ('ids', 'index', 'coverage', 'bounds')
+REGION = 'REGIÓN METROPOLITANA'   # Clave y subtítulo del raster de la región completa
+MAP_ALPHA = 0.7                   # Mismo alpha que generate_commune_map
+K_CLASSES = 5
+PNG_COMPRESS_LEVEL = 1
+
+_RASTERS = {}
+_LAYERS = {}
+
+
+class BlockRaster:
+    """Pixeles cubiertos por manzanas (posición plana, manzana, peso = MAP_ALPHA x cobertura)"""
+
+    def __init__(self, ids, index, coverage, bounds):
+        self.ids = ids                                   # MANZENT en el orden de las posiciones
+        self.bounds = tuple(bounds)                      # total_bounds de las manzanas (EPSG:3857)
+        self.shape = index.shape
+        flat = index.ravel()
+        self.pixels = np.flatnonzero(flat >= 0)
+        self.blocks = flat[self.pixels]
+        self.weights = (coverage.ravel()[self.pixels] * (MAP_ALPHA / 255)).astype(np.float32)
+
+    def colorize(self, block_rgb, background):
+        """
+        Imagen RGB (uint8, plana): fondo + color de cada manzana ponderado por alpha x cobertura.
+        background: un color (3,) o una imagen plana (pixeles, 3), ej. el mapa base.
+        """
+        h, w = self.shape
+        image = np.empty((h * w, 3), dtype=np.uint8)
+        image[:] = np.rint(background)
+        base = background if background.ndim == 1 else background[self.pixels]
+        blend = base + (block_rgb[self.blocks] - base) * self.weights[:, None]
+        image[self.pixels] = np.rint(blend)
+        return image
+
+
+def _map_figure(bounds):
+    """Figura + ejes con el mismo layout que generate_commune_map (límites con margen, aspecto igual)"""
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    fig = Figure(figsize=FIG_SIZE, dpi=DPI, facecolor='black')
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot(111)
+    minx, miny, maxx, maxy = bounds
+    margin_x, margin_y = (maxx - minx) * MAP_MARGIN, (maxy - miny) * MAP_MARGIN
+    ax.set_xlim(minx - margin_x, maxx + margin_x)
+    ax.set_ylim(miny - margin_y, maxy + margin_y)
+    ax.set_aspect('equal')
+    ax.set_axis_off()
+    return fig, ax
+
+
+def _fill_edges(index, coverage):
+    """Pixeles de borde con cobertura parcial pero centro fuera de todo polígono: toman la manzana vecina"""
+    missing = (index < 0) & (coverage > 0)
+    for dy, dx in ((0, 1), (0, -1), (1, 0), (-1, 0), (1, 1), (1, -1), (-1, 1), (-1, -1)):
+        if not missing.any():
+            break
+        neighbor = np.roll(index, (dy, dx), axis=(0, 1))
+        take = missing & (neighbor >= 0)
+        index[take] = neighbor[take]
+        missing &= ~take
+    return index
+
+
+def rasterize(gdf):
+    """
+    Rasteriza las manzanas de gdf (geometría de render) a la resolución de salida.
+    Retorna (index int32, coverage uint8): dos pasadas Agg, IDs codificados en RGB sin
+    antialiasing y cobertura en blanco con antialiasing.
+    """
+    if len(gdf) >= 2 ** 24 - 1:
+        raise ValueError(f"Demasiadas manzanas para codificar en RGB: {len(gdf):,}")
+    fig, ax = _map_figure(gdf.total_bounds)
+    codes = np.arange(1, len(gdf) + 1)
+    colors = np.column_stack([(codes >> 16) & 255, (codes >> 8) & 255, codes & 255]) / 255
+    gdf.geometry.plot(ax=ax, color=colors, edgecolor='none', linewidth=0.0, antialiased=False)
+    fig.canvas.draw()
+    rgba = np.asarray(fig.canvas.buffer_rgba())
+    index = ((rgba[..., 0].astype(np.int32) << 16) | (rgba[..., 1].astype(np.int32) << 8) | rgba[..., 2]) - 1
+
+    for collection in ax.collections:
+        collection.set_facecolor('white')
+        collection.set_antialiased(True)
+    fig.canvas.draw()
+    coverage = np.asarray(fig.canvas.buffer_rgba())[..., 0].copy()
+    return _fill_edges(index, coverage), coverage
+
+
+def _region_blocks(source=INPUT_FILE):
+    gdf = load_indicators(columns=[ID_COL, 'REGION'], geometry=RENDER_COL, source=source)
+    gdf = gdf[gdf['REGION'].astype(str).str.contains('METROPOLITANA', case=False, na=False)]
+    return gdf[[ID_COL, 'geometry']].reset_index(drop=True)
+
+
+def commune_raster(commune, source=INPUT_FILE):
+    """Raster de IDs de una comuna (o de la región con commune=REGION). Cacheado en disco y por proceso"""
+    width, height = int(round(FIG_SIZE[0] * DPI)), int(round(FIG_SIZE[1] * DPI))
+    path = os.path.join(ensure_cache(source), RASTER_DIR, f"{width}x{height}", f"{commune}.npz")
+    if path in _RASTERS:
+        return _RASTERS[path]
+
+    stored = None
+    if os.path.exists(path):
+        with np.load(path, allow_pickle=False) as data:
+            if set(RASTER_FIELDS) <= set(data.files):     # Archivos de versiones previas: se reconstruyen
+                stored = [data[name] for name in RASTER_FIELDS]
+    if stored is not None:
+        ids, index, coverage, bounds = stored
+    else:
+        t0 = time.perf_counter()
+        if commune == REGION:
+            gdf = _region_blocks(source)
+        else:
+            gdf = commune_geometry(commune, source).reset_index()
+        index, coverage = rasterize(gdf)
+        ids = gdf[ID_COL].astype(str).to_numpy(dtype=str)
+        bounds = gdf.total_bounds
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        np.savez_compressed(path, ids=ids, index=index, coverage=coverage, bounds=bounds)
+        print(f"  Raster {commune}: {len(ids):,} manzanas, {(index >= 0).sum():,} pixeles "
+              f"({time.perf_counter() - t0:.2f}s)")
+    _RASTERS[path] = BlockRaster(ids, index, coverage, bounds)
+    return _RASTERS[path]
+
+
+def class_colors(values, bins):
+    """
+    Color RGB (0-255) por manzana con la misma regla que geopandas scheme='UserDefined': clase
+    mapclassify y color NEON_CMAP(i / (n_clases - 1)). NaN -> NaN (sin color).
+    """
+    import mapclassify
+    valid = ~np.isnan(values)
+    binning = mapclassify.classify(values[valid], 'UserDefined', bins=list(bins), k=K_CLASSES)
+    n = len(binning.bins)
+    palette = NEON_CMAP(np.arange(n) / (n - 1) if n > 1 else np.zeros(1))[:, :3] * 255
+    rgb = np.full((len(values), 3), np.nan, dtype=np.float32)
+    rgb[valid] = palette[binning.find_bin(values[valid])]
+    return rgb
+
+
+def _text_layer(draw):
+    """Capa RGBA transparente a la resolución de salida, guardada solo en los pixeles no vacíos"""
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    fig = Figure(figsize=FIG_SIZE, dpi=DPI, facecolor=(0, 0, 0, 0))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot(111)
+    ax.set_axis_off()
+    draw(fig, ax)
+    fig.canvas.draw()
+    rgba = np.asarray(fig.canvas.buffer_rgba()).reshape(-1, 4)
+    pixels = np.flatnonzero(rgba[:, 3])
+    alpha = rgba[pixels, 3:4].astype(np.float32) / 255
+    return pixels, rgba[pixels, :3].astype(np.float32), alpha
+
+
+def frame_layer(title, description, bins):
+    """Título, descripción, leyenda, fuente y logo: una capa por indicador (compartida por sus comunas)"""
+    from generate_maps import draw_map_frame
+    key = ('marco', title, description, tuple(bins))
+    if key not in _LAYERS:
+        _LAYERS[key] = _text_layer(lambda fig, ax: draw_map_frame(fig, ax, title, description, bins))
+    return _LAYERS[key]
+
+
+def subtitle_layer(commune):
+    """Nombre de la comuna: una capa por comuna (compartida por todos los indicadores)"""
+    from generate_maps import draw_map_subtitle
+    key = ('subtitulo', commune)
+    if key not in _LAYERS:
+        _LAYERS[key] = _text_layer(lambda fig, ax: draw_map_subtitle(fig, commune))
+    return _LAYERS[key]
+
+
+def basemap_background(raster, spec):
+    """Mapa base de la comuna como imagen plana (pixeles, 3), dibujado una vez con el layout del mapa"""
+    from basemap import add_basemap
+    from matplotlib.colors import to_rgb
+    key = ('mapa_base', raster.bounds, spec)
+    if key not in _LAYERS:
+        fig, ax = _map_figure(raster.bounds)
+        fig.set_facecolor(to_rgb(BACKGROUND_COLOR))
+        add_basemap(ax, spec)
+        fig.canvas.draw()
+        _LAYERS[key] = np.asarray(fig.canvas.buffer_rgba())[..., :3].reshape(-1, 3).astype(np.float32)
+    return _LAYERS[key]
+
+
+def _composite(image, layer):
+    """Mezcla 'over' de una capa de texto sobre la imagen plana (solo sus pixeles)"""
+    pixels, rgb, alpha = layer
+    image[pixels] = np.rint(image[pixels] * (1 - alpha) + rgb * alpha)
+
+
+def render_commune_map(values, commune_name, column, title, filename, description="", bins=None, basemap=None,
+                       source=INPUT_FILE):
+    """
+    Mapa comunal equivalente a generate_commune_map a partir del raster de IDs: lookup manzana -> color
+    de clase + capas de texto cacheadas. values: DataFrame con MANZENT y la columna; basemap: fuente de
+    teselas del mapa base (basemap.py), que se compone una vez por comuna. Retorna la ruta.
+    """
+    from PIL import Image
+    from classification import fisher_jenks_bins
+    from matplotlib.colors import to_rgb
+
+    raster = commune_raster(commune_name, source)
+    series = values.set_index(ID_COL)[column]
+    series.index = series.index.astype(str)
+    block_values = series.reindex(raster.ids).to_numpy(dtype=float)
+    if bins is None:
+        bins = fisher_jenks_bins(series, k=K_CLASSES, indicator=column, geography=commune_name)
+
+    background = np.array(to_rgb(BACKGROUND_COLOR), dtype=np.float32) * 255
+    block_rgb = class_colors(block_values, bins)
+    no_value = np.isnan(block_rgb[:, 0])                  # Sin valor: no se pinta (peso 0)
+    block_rgb[no_value] = background
+    image = raster.colorize(block_rgb, basemap_background(raster, basemap) if basemap else background)
+    _composite(image, frame_layer(title, description, bins))
+    _composite(image, subtitle_layer(commune_name))
+
+    if not os.path.exists(OUTPUT_DIR): os.makedirs(OUTPUT_DIR)
+    out_path = os.path.join(OUTPUT_DIR, f"{filename}_{commune_name}.png")
+    Image.fromarray(image.reshape(*raster.shape, 3)).save(out_path, dpi=(DPI, DPI), compress_level=PNG_COMPRESS_LEVEL)
+    return out_path
+
+
+def build_all(source=INPUT_FILE):
+    """Rasteriza todas las comunas de la RM y la región completa"""
+    df = load_indicators(columns=['COMUNA', 'REGION'], source=source)
+    communes = sorted(df.loc[df['REGION'].astype(str).str.contains('METROPOLITANA', case=False, na=False),
+                             'COMUNA'].unique())
+    t0 = time.perf_counter()
+    for commune in communes + [REGION]:
+        commune_raster(commune, source)
+    print(f"{len(communes)} comunas + región rasterizadas en {time.perf_counter() - t0:.1f}s")
+
+
+def bench(n_communes=10, column='idx_privilegio', source=INPUT_FILE):
+    """
+    ms por mapa comunal: generate_commune_map (matplotlib) vs lookup sobre el raster (en caché).
+    Los PNG van a un directorio temporal y los bins no pasan por el caché de clasificación.
+    """
+    import tempfile
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import generate_maps as gm
+    from classification import fisher_jenks_bins
+    from generate_maps import commune_blocks, generate_commune_map, setup_plot
+
+    global OUTPUT_DIR
+    setup_plot()
+    df = load_indicators(columns=[ID_COL, 'COMUNA', column], source=source)
+    df[column] = df[column].fillna(0)
+    communes = sorted(df['COMUNA'].unique())[:n_communes]
+    bins = fisher_jenks_bins(df[column], k=K_CLASSES, indicator=column, use_cache=False)
+    by_commune = {c: df.loc[df['COMUNA'] == c, [ID_COL, 'COMUNA', column]] for c in communes}
+
+    t0 = time.perf_counter()
+    for c in communes:
+        commune_raster(c, source)
+    build = time.perf_counter() - t0
+
+    results = {}
+    saved_dirs = OUTPUT_DIR, gm.OUTPUT_DIR
+    with tempfile.TemporaryDirectory(prefix='bench_') as workdir:
+        OUTPUT_DIR = gm.OUTPUT_DIR = workdir
+        try:
+            for label in ('matplotlib', 'raster'):
+                t0 = time.perf_counter()
+                for c in communes:
+                    if label == 'matplotlib':
+                        generate_commune_map(commune_blocks(by_commune[c], c, source), c, column, "Bench",
+                                             'bench_vector', "Descripción de prueba", bins=bins)
+                        plt.close('all')
+                    else:
+                        render_commune_map(by_commune[c], c, column, "Bench", 'bench_raster',
+                                           "Descripción de prueba", bins=bins, source=source)
+                results[label] = (time.perf_counter() - t0) / len(communes)
+        finally:
+            OUTPUT_DIR, gm.OUTPUT_DIR = saved_dirs
+
+    print(f"  {len(communes)} comunas, indicador {column} (raster construido/cargado en {build:.2f}s):")
+    for label, secs in results.items():
+        print(f"    {label:<12} {secs * 1000:8.1f} ms por mapa")
+    print(f"    speedup: {results['matplotlib'] / results['raster']:.1f}x")
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Índice rasterizado de manzanas (recoloreo por lookup)")
+    parser.add_argument('--construir', action='store_true', help="Rasterizar todas las comunas de la RM + región")
+    parser.add_argument('--bench', action='store_true', help="matplotlib vs raster, ms por mapa")
+    parser.add_argument('--comunas', type=int, default=10, help="Comunas del benchmark")
+    parser.add_argument('--indicador', default='idx_privilegio')
+    args = parser.parse_args()
+
+    if args.construir:
+        build_all()
+    if args.bench:
+        bench(args.comunas, args.indicador)
@@ -0,0 +1,230 @@
+"""
+Catálogo de esquema y perfil de columnas del GPKG del INE (Cartografia_censo2024_Pais.gpkg).
+
+Un solo pase en streaming por capa (lotes Arrow del driver, sin leer geometrías) registra:
+  - nombre y tipo Arrow de cada columna
+  - nulos por columna (en las n_* son los valores suprimidos por el INE) y filas con alguna supresión
+  - mínimo / máximo / suma de las columnas numéricas
+  - filas por REGION
+
+El resultado es un JSON chico en cache/catalogo/<hash del archivo>.json: el hash se memoiza por
+(ruta, tamaño, mtime) en columnar_cache.file_hash, así que consultar el catálogo de un archivo ya
+perfilado toma milisegundos y un GPKG nuevo o modificado se perfila de nuevo.
+
+El pipeline valida contra el catálogo las columnas crudas que pide (validate_columns) y se detiene
+si falta alguna, en vez de que el driver la omita en silencio y los indicadores la cuenten como 0.
+Sin catálogo para el archivo, la validación usa solo el esquema de la capa (pyogrio.read_info).
+
+    from catalog import load_catalog, validate_columns
+    load_catalog()['capas']['Manzanas_CPV24']['filas_por_region']
+    validate_columns(['n_per', 'n_hog'], layer='Manzanas_CPV24')
+
+Uso:
+    python catalog.py                                  # perfila (o lee) el catálogo y lo resume
+    python catalog.py otro.gpkg --capas Manzanas_CPV24 --forzar
+    python catalog.py --columna n_internet             # perfil de una columna en cada capa
+"""
+import json
+import os
+import time
+
+from columnar_cache import CACHE_DIR, file_hash
+
+SOURCE_FILE = 'Cartografia_censo2024_Pais.gpkg'
+CATALOG_LAYERS = ('Manzanas_CPV24', 'Entidades_CPV24')
+CATALOG_DIR = os.path.join(CACHE_DIR, 'catalogo')
+CATALOG_VERSION = 1            # formato del JSON (si cambia, los catálogos viejos se rehacen)
+REGION_COL = 'REGION'
+SUPPRESSED_PREFIX = 'n_'       # conteos con supresión estadística del INE (nulo = suprimido)
+BATCH_SIZE = 65536
+
+_CATALOGS = {}
+
+
+def _number(value):
+    """Escalar Arrow -> int/float JSON (None para nulos y NaN)"""
+    value = value.as_py()
+    if value is None or value != value:
+        return None
+    return value
+
+
+def profile_layer(path, layer, batch_size=BATCH_SIZE):
+    """Perfil de una capa en un pase por lotes Arrow, sin geometría"""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    from pyogrio.raw import open_arrow
+
+    t0 = time.perf_counter()
+    rows, suppressed_rows, regions = 0, 0, {}
+    with open_arrow(path, layer=layer, read_geometry=False, batch_size=batch_size,
+                    use_pyarrow=True) as (meta, reader):
+        schema = reader.schema
+        columns = {f.name: {'tipo': str(f.type), 'nulos': 0} for f in schema}
+        numeric = [f.name for f in schema if pa.types.is_integer(f.type) or pa.types.is_floating(f.type)
+                   or pa.types.is_boolean(f.type)]
+        for name in numeric:
+            columns[name].update({'min': None, 'max': None, 'suma': 0})
+        counts = [f.name for f in schema if f.name.startswith(SUPPRESSED_PREFIX)]
+
+        for batch in reader:
+            rows += batch.num_rows
+            for i, name in enumerate(batch.schema.names):
+                columns[name]['nulos'] += batch.column(i).null_count
+            for name in numeric:
+                values = batch.column(name)
+                if values.null_count == len(values):
+                    continue
+                if pa.types.is_boolean(values.type):
+                    values = values.cast(pa.uint8())
+                stats = columns[name]
+                lo_hi = pc.min_max(values)
+                lo, hi = _number(lo_hi['min']), _number(lo_hi['max'])
+                if lo is not None:
+                    stats['min'] = lo if stats['min'] is None else min(stats['min'], lo)
+                    stats['max'] = hi if stats['max'] is None else max(stats['max'], hi)
+                stats['suma'] += _number(pc.sum(values)) or 0
+            # Filas con al menos un conteo suprimido (solo se combinan las columnas con nulos)
+            masks = [pc.is_null(batch.column(c)) for c in counts if batch.column(c).null_count]
+            if masks:
+                mask = masks[0]
+                for m in masks[1:]:
+                    mask = pc.or_(mask, m)
+                suppressed_rows += pc.sum(mask).as_py() or 0
+            if REGION_COL in columns:
+                for item in pc.value_counts(batch.column(REGION_COL)).to_pylist():
+                    key = item['values'] if item['values'] is not None else ''
+                    regions[key] = regions.get(key, 0) + item['counts']
+
+    return {
+        'filas': rows,
+        'filas_con_supresion': suppressed_rows,
+        'crs': meta.get('crs'),
+        'tipo_geometria': meta.get('geometry_type'),
+        'columnas': columns,
+        'filas_por_region': dict(sorted(regions.items())),
+        'segundos': round(time.perf_counter() - t0, 2),
+    }
+
+
+def catalog_path(key):
+    return os.path.join(CATALOG_DIR, f"{key}.json")
+
+
+def build_catalog(path=SOURCE_FILE, layers=CATALOG_LAYERS, batch_size=BATCH_SIZE):
+    """Perfila las capas presentes del archivo y escribe el catálogo. Retorna el catálogo"""
+    import pyogrio
+
+    key = file_hash(path)
+    available = {name for name, _ in pyogrio.list_layers(path)}
+    catalog = {
+        'version': CATALOG_VERSION,
+        'archivo': os.path.abspath(path),
+        'hash': key,
+        'bytes': os.path.getsize(path),
+        'fecha': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'capas': {},
+    }
+    for layer in layers:
+        if layer not in available:
+            print(f"  (capa {layer} ausente en {path})")
+            continue
+        print(f"  Perfilando {layer}...")
+        catalog['capas'][layer] = profile_layer(path, layer, batch_size=batch_size)
+
+    os.makedirs(CATALOG_DIR, exist_ok=True)
+    tmp = catalog_path(key) + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(catalog, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, catalog_path(key))
+    _CATALOGS[key] = catalog
+    return catalog
+
+
+def load_catalog(path=SOURCE_FILE, build=True):
+    """Catálogo del archivo (memoria -> JSON por hash -> nuevo perfil si build). None si no hay"""
+    key = file_hash(path)
+    if key in _CATALOGS:
+        return _CATALOGS[key]
+    sidecar = catalog_path(key)
+    if os.path.exists(sidecar):
+        with open(sidecar, encoding='utf-8') as f:
+            catalog = json.load(f)
+        if catalog.get('version') == CATALOG_VERSION:
+            _CATALOGS[key] = catalog
+            return catalog
+    return build_catalog(path) if build else None
+
+
+def layer_columns(path=SOURCE_FILE, layer=CATALOG_LAYERS[0]):
+    """
+    {columna: perfil} de una capa: del catálogo si la perfiló, si no solo el esquema
+    (pyogrio.read_info, perfiles vacíos). KeyError si la capa no existe.
+    """
+    catalog = load_catalog(path, build=False)
+    if catalog is not None and layer in catalog['capas']:
+        return catalog['capas'][layer]['columnas']
+
+    import pyogrio
+    if layer not in {name for name, _ in pyogrio.list_layers(path)}:
+        raise KeyError(f"La capa '{layer}' no existe en {path}")
+    return {name: {} for name in pyogrio.read_info(path, layer=layer)['fields']}
+
+
+def validate_columns(columns, layer=CATALOG_LAYERS[0], path=SOURCE_FILE):
+    """
+    Verifica que la capa tenga todas las columnas pedidas. KeyError con la lista de faltantes;
+    las columnas presentes pero nulas en todas las filas se advierten (también terminarían en 0).
+    """
+    profiles = layer_columns(path, layer)
+    missing = [c for c in dict.fromkeys(columns) if c not in profiles]
+    if missing:
+        raise KeyError(f"Faltan {len(missing)} columnas en {path}:{layer}: {', '.join(missing)}")
+    catalog = _CATALOGS.get(file_hash(path))
+    if catalog is not None and layer in catalog['capas']:
+        rows = catalog['capas'][layer]['filas']
+        empty = [c for c in columns if rows and profiles[c].get('nulos') == rows]
+        if empty:
+            print(f"  ⚠️ {layer}: columnas sin ningún valor (todas suprimidas/nulas): {', '.join(empty)}")
+    return profiles
+
+
+def print_catalog(catalog, column=None):
+    print(f"\nCatálogo de {catalog['archivo']} ({catalog['bytes'] / 1e6:,.0f} MB, hash {catalog['hash']})")
+    for layer, info in catalog['capas'].items():
+        cols = info['columnas']
+        print(f"\n=== {layer}: {info['filas']:,} filas, {len(cols)} columnas "
+              f"({info['segundos']:.1f}s de perfil) ===")
+        if column:
+            print(f"  {column}: {cols.get(column, 'no existe')}")
+            continue
+        print(f"  Filas con algún conteo suprimido: {info['filas_con_supresion']:,}")
+        with_nulls = sorted(((p['nulos'], c) for c, p in cols.items() if p['nulos']), reverse=True)
+        if with_nulls:
+            print(f"  Columnas con nulos: {len(with_nulls)} (más nulos: "
+                  + ", ".join(f"{c} {n:,}" for n, c in with_nulls[:5]) + ")")
+        if info['filas_por_region']:
+            print("  Filas por región:")
+            for region, n in info['filas_por_region'].items():
+                print(f"    {region or '(sin región)':50} {n:>9,}")
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+    parser = argparse.ArgumentParser(description="Catálogo de esquema y perfil de columnas del GPKG del INE")
+    parser.add_argument('archivo', nargs='?', default=SOURCE_FILE, help=f"GPKG a perfilar (default: {SOURCE_FILE})")
+    parser.add_argument('--capas', nargs='+', default=list(CATALOG_LAYERS), help="Capas a perfilar")
+    parser.add_argument('--forzar', action='store_true', help="Rehacer el perfil aunque exista el catálogo")
+    parser.add_argument('--columna', default=None, help="Mostrar solo el perfil de esta columna")
+    args = parser.parse_args()
+    if not os.path.exists(args.archivo):
+        print(f"No existe {args.archivo}")
+        sys.exit(1)
+
+    t0 = time.perf_counter()
+    catalog = load_catalog(args.archivo, build=False)
+    if args.forzar or catalog is None or any(c not in catalog['capas'] for c in args.capas):
+        catalog = build_catalog(args.archivo, layers=args.capas)
+    print_catalog(catalog, column=args.columna)
+    print(f"\n({time.perf_counter() - t0:.2f}s) -> {catalog_path(catalog['hash'])}")
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Punto de entrada único: `censo <subcomando> [opciones del script]`.
+
+El lanzador solo importa la biblioteca estándar. Cada subcomando ejecuta el script
+correspondiente (runpy, como `python script.py ...`), así que geopandas / matplotlib se cargan
+únicamente en los subcomandos que los usan: `censo insights` no paga los ~0.5 s de importar el
+stack de mapas, y lee las tablas comunales ya cacheadas junto al caché columnar
+(geography.hierarchy_tables). Las opciones después del subcomando se pasan tal cual al script:
+
+    python censo.py insights internet            # < 0.5 s con el caché tibio
+    python censo.py maps --jobs 4 --raster
+    python censo.py process --incremental
+    python censo.py drilldown pct_ex --comuna ÑUÑOA
+    python censo.py inspect
+    python censo.py catalog --columna n_internet
+    python censo.py bench --importacion          # tiempos de importación (-X importtime)
+    python censo.py maps --help                  # ayuda del script
+
+Con un alias (`alias censo='python /ruta/censo.py'`) queda `censo insights internet`.
+"""
+import os
+import runpy
+import sys
+
+# subcomando -> (módulo, descripción)
+SUBCOMANDOS = {
+    'process': ('process_census_data', "ETL: cálculo de indicadores por manzana (GPKG + caché columnar)"),
+    'maps': ('generate_maps', "Mapas comunales e infografías para Instagram"),
+    'insights': ('insights', "Mejor / peor comuna y brecha por área metropolitana"),
+    'inspect': ('inspect_gpkg', "Columnas de la capa de manzanas del GPKG del INE"),
+    'catalog': ('catalog', "Catálogo de esquema y perfil de columnas del GPKG (JSON por hash)"),
+    'drilldown': ('drilldown', "Drill-down comunal de un indicador"),
+    'bench': ('benchmark', "Benchmark por etapas y tiempos de importación"),
+}
+
+
+def usage():
+    lines = ["uso: censo <subcomando> [opciones]", "", "subcomandos:"]
+    lines += [f"  {name:10} {desc}" for name, (_, desc) in SUBCOMANDOS.items()]
+    lines += ["", "`censo <subcomando> --help` muestra las opciones de cada uno."]
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if not argv or argv[0] in ('-h', '--help'):
+        print(usage())
+        return 0
+    name, rest = argv[0], argv[1:]
+    if name not in SUBCOMANDOS:
+        print(f"Subcomando desconocido: {name}\n\n{usage()}", file=sys.stderr)
+        return 2
+
+    module = SUBCOMANDOS[name][0]
+    # Los scripts viven junto al lanzador: funciona aunque se invoque desde otro directorio
+    here = os.path.dirname(os.path.abspath(__file__))
+    if here not in sys.path:
+        sys.path.insert(0, here)
+    sys.argv = [module] + rest
+    # alter_sys: el script queda como __main__ mientras corre (los pools 'spawn' lo reimportan por nombre)
+    try:
+        runpy.run_module(module, run_name='__main__', alter_sys=True)
+    except SystemExit as e:
+        return e.code
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
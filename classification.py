@@ -0,0 +1,194 @@
+"""
+Clasificación Fisher-Jenks con caché persistente.
+
+Fisher-Jenks exacto es cuadrático en la cantidad de valores: sirve para las ~52 comunas,
+pero no para clasificar manzanas de toda la región (ni del país). Este módulo ofrece:
+  - modo 'exacto'   -> mapclassify.FisherJenks sobre todos los valores
+  - modo 'muestreo' -> Fisher-Jenks sobre una muestra reproducible (estilo FisherJenksSampled),
+                       reportando el GVF (goodness of variance fit) sobre TODOS los datos
+  - modo 'auto'     -> exacto hasta SAMPLE_SIZE valores, muestreo por sobre eso
+  - caché en disco de los bins por (indicador, geografía, k, modo, hash de los datos): al cambiar
+    los datos se reemplaza la entrada anterior y se conservan las CLASS_CACHE_MAX más recientes
+
+Así main(), la leyenda y los mapas comunales reutilizan los mismos cortes en vez de recalcularlos.
+
+Uso:
+    python classification.py idx_privilegio --nivel manzana --modo muestreo --comparar
+"""
+import contextlib
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from columnar_cache import CACHE_DIR
+
+CLASS_CACHE = os.path.join(CACHE_DIR, 'clasificacion.json')
+CLASS_CACHE_MAX = 512    # Entradas (indicador x geografía x k x modo); se descartan las más antiguas
+DEFAULT_K = 5
+SAMPLE_SIZE = 5000
+SAMPLE_SEED = 2024
+
+
+def data_hash(values):
+    """Hash del contenido numérico (orden incluido) de un vector"""
+    arr = np.ascontiguousarray(values, dtype=np.float64)
+    return hashlib.blake2b(arr.tobytes(), digest_size=12).hexdigest()
+
+
+def goodness_of_variance_fit(values, bins):
+    """GVF = 1 - SDCM / SDAM (1 = clases perfectamente homogéneas)"""
+    values = np.asarray(values, dtype=np.float64)
+    sdam = ((values - values.mean()) ** 2).sum()
+    if sdam == 0:
+        return 1.0
+    classes = np.searchsorted(np.asarray(bins, dtype=np.float64), values, side='left')
+    classes = np.minimum(classes, len(bins) - 1)
+    counts = np.bincount(classes, minlength=len(bins))
+    sums = np.bincount(classes, weights=values, minlength=len(bins))
+    means = np.divide(sums, counts, out=np.zeros_like(sums), where=counts > 0)
+    sdcm = ((values - means[classes]) ** 2).sum()
+    return float(1 - sdcm / sdam)
+
+
+def _exact_bins(values, k):
+    import mapclassify
+    return np.asarray(mapclassify.FisherJenks(values, k=k).bins, dtype=np.float64)
+
+
+def _sampled_bins(values, k, sample_size, seed=SAMPLE_SEED):
+    """Fisher-Jenks sobre una muestra reproducible que siempre incluye el mínimo y el máximo"""
+    rng = np.random.default_rng(seed)
+    sample = rng.choice(values, size=min(sample_size, len(values)), replace=False)
+    sample = np.concatenate([sample, [values.min(), values.max()]])
+    bins = _exact_bins(sample, k)
+    bins[-1] = values.max()
+    return bins
+
+
+def _load_cache():
+    if not os.path.exists(CLASS_CACHE):
+        return {}
+    try:
+        with open(CLASS_CACHE, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+@contextlib.contextmanager
+def _cache_lock():
+    """Lock exclusivo entre procesos (flock) alrededor del leer-modificar-escribir del caché"""
+    try:
+        import fcntl
+    except ImportError:          # Sin flock (Windows): el reemplazo atómico evita archivos corruptos
+        yield
+        return
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with open(f"{CLASS_CACHE}.lock", 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _store_cache(key, entry):
+    # Varios procesos de render pueden escribir: lock + reemplazo atómico
+    with _cache_lock():
+        cache = _load_cache()
+        if entry.get('indicador') is not None:
+            # Misma clasificación sobre otros datos: la entrada anterior quedó obsoleta
+            series = key.rsplit('|', 1)[0]
+            cache = {k: v for k, v in cache.items() if k.rsplit('|', 1)[0] != series}
+        cache.pop(key, None)
+        cache[key] = entry
+        for old in list(cache)[:max(0, len(cache) - CLASS_CACHE_MAX)]:
+            del cache[old]
+        tmp = f"{CLASS_CACHE}.{os.getpid()}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(cache, f, ensure_ascii=False, indent=1)
+        os.replace(tmp, CLASS_CACHE)
+
+
+def classify(values, k=DEFAULT_K, mode='auto', sample_size=SAMPLE_SIZE,
+             indicator=None, geography=None, use_cache=True, compare_exact=False):
+    """
+    Bins Fisher-Jenks (límites superiores) de un vector. Retorna un dict:
+      bins, k, modo, n, gvf (sobre todos los datos) y, si compare_exact, gvf_exacto.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    values = values[np.isfinite(values)]
+    if values.size == 0:
+        return None
+    k = int(min(k, len(np.unique(values))))
+    if mode == 'auto':
+        mode = 'exacto' if values.size <= sample_size else 'muestreo'
+
+    key = f"{indicator}|{geography}|k={k}|{mode}|{sample_size if mode == 'muestreo' else ''}|{data_hash(values)}"
+    if use_cache:
+        entry = _load_cache().get(key)
+        if entry is not None and (not compare_exact or 'gvf_exacto' in entry):
+            entry['bins'] = np.asarray(entry['bins'])
+            return entry
+
+    if mode == 'exacto':
+        bins = _exact_bins(values, k)
+    elif mode == 'muestreo':
+        bins = _sampled_bins(values, k, sample_size)
+    else:
+        raise ValueError(f"Modo de clasificación desconocido: {mode}")
+
+    entry = {
+        'indicador': indicator, 'geografia': geography,
+        'bins': bins, 'k': k, 'modo': mode, 'n': int(values.size),
+        'gvf': goodness_of_variance_fit(values, bins),
+    }
+    if compare_exact:
+        entry['gvf_exacto'] = (entry['gvf'] if mode == 'exacto'
+                               else goodness_of_variance_fit(values, _exact_bins(values, k)))
+
+    if use_cache:
+        _store_cache(key, dict(entry, bins=[float(b) for b in bins]))
+    return entry
+
+
+def fisher_jenks_bins(values, k=DEFAULT_K, mode='auto', indicator=None, geography=None, **kwargs):
+    """Atajo: solo los bins (o None si no hay datos)"""
+    result = classify(values, k=k, mode=mode, indicator=indicator, geography=geography, **kwargs)
+    return None if result is None else result['bins']
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+    from columnar_cache import load_indicators
+    from indicators import aggregate, evaluate
+
+    parser = argparse.ArgumentParser(description="Clasificación Fisher-Jenks (exacta / muestreada) con caché")
+    parser.add_argument('indicador', help="Columna idx_*/pct_* del caché o indicador del registro")
+    parser.add_argument('--nivel', choices=['manzana', 'comuna'], default='manzana')
+    parser.add_argument('--modo', choices=['auto', 'exacto', 'muestreo'], default='auto')
+    parser.add_argument('--k', type=int, default=DEFAULT_K)
+    parser.add_argument('--muestra', type=int, default=SAMPLE_SIZE, help="Tamaño de muestra del modo muestreo")
+    parser.add_argument('--comparar', action='store_true', help="Calcular también el GVF del Fisher-Jenks exacto")
+    parser.add_argument('--sin-cache', action='store_true')
+    args = parser.parse_args()
+
+    df = load_indicators()
+    if args.nivel == 'comuna':
+        values = aggregate(df, 'COMUNA', [args.indicador])[args.indicador]
+    elif args.indicador in df.columns:
+        values = df[args.indicador]
+    else:
+        values = evaluate(df, [args.indicador])[args.indicador]
+
+    t0 = time.perf_counter()
+    res = classify(values, k=args.k, mode=args.modo, sample_size=args.muestra, indicator=args.indicador,
+                   geography=f"RM_{args.nivel}", use_cache=not args.sin_cache, compare_exact=args.comparar)
+    print(f"{args.indicador} ({args.nivel}, n={res['n']}, modo={res['modo']}) en {time.perf_counter() - t0:.2f}s")
+    print(f"  Bins: {np.round(res['bins'], 2).tolist()}")
+    print(f"  GVF:  {res['gvf']:.4f}")
+    if 'gvf_exacto' in res:
+        print(f"  GVF exacto: {res['gvf_exacto']:.4f} (diferencia {res['gvf_exacto'] - res['gvf']:+.4f})")
@@ -0,0 +1,218 @@
+"""
+Caché columnar (Parquet particionado por COMUNA) de Manzanas_Indicadores.gpkg
+
+El GPKG sigue siendo el producto oficial, pero re-parsearlo (con todas sus geometrías)
+en cada script es lo más caro de los análisis. Este módulo mantiene una copia columnar:
+  - Una partición Hive por COMUNA (cache/manzanas_<clave>/COMUNA=.../*.parquet)
+  - Geometría en WKB en su propia columna 'geometry' (solo se decodifica si se pide)
+  - Geometría de render (EPSG:3857 simplificada, ver render_geometry.py) en 'geom_render'
+  - Máscaras de supresión del INE (compact.pack_rows) en 'suprimidos', si el ETL las entregó
+  - Lectura memory-mapped, solo de las columnas y comunas solicitadas
+
+La clave del caché es un hash del archivo fuente + el código de procesamiento, así que
+un caché obsoleto se reconstruye solo la próxima vez que alguien lo lea.
+"""
+import hashlib
+import json
+import os
+import shutil
+
+SOURCE_FILE = 'Manzanas_Indicadores.gpkg'
+CACHE_DIR = 'cache'
+CACHE_PREFIX = 'manzanas_'
+GEOMETRY_COL = 'geometry'
+PARTITION_COL = 'COMUNA'
+
+# Código que define el contenido del caché (si cambia, el caché se invalida)
+CODE_FILES = ['process_census_data.py', 'columnar_cache.py', 'render_geometry.py', 'compact.py']
+
+_HASH_INDEX = os.path.join(CACHE_DIR, 'hashes.json')
+_CHUNK = 8 * 1024 * 1024
+
+
+def file_hash(path):
+    """
+    Hash blake2b del contenido completo de un archivo.
+    Se memoiza en cache/hashes.json por (ruta, tamaño, mtime) para no releer
+    archivos de varios GB cuando no han cambiado.
+    """
+    stat = os.stat(path)
+    stamp = f"{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}"
+
+    index = {}
+    if os.path.exists(_HASH_INDEX):
+        try:
+            with open(_HASH_INDEX, encoding='utf-8') as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            index = {}
+    if stamp in index:
+        return index[stamp]
+
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_CHUNK), b''):
+            h.update(chunk)
+    digest = h.hexdigest()
+
+    # Descartar entradas viejas del mismo archivo
+    prefix = f"{os.path.abspath(path)}|"
+    index = {k: v for k, v in index.items() if not k.startswith(prefix)}
+    index[stamp] = digest
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with open(_HASH_INDEX, 'w', encoding='utf-8') as f:
+        json.dump(index, f, indent=1)
+    return digest
+
+
+def cache_key(source=SOURCE_FILE):
+    """Clave del caché: hash del archivo fuente + hash del código de procesamiento"""
+    h = hashlib.blake2b(digest_size=8)
+    h.update(file_hash(source).encode())
+    here = os.path.dirname(os.path.abspath(__file__))
+    for name in CODE_FILES:
+        path = os.path.join(here, name)
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                h.update(f.read())
+    return h.hexdigest()
+
+
+def cache_path(key):
+    return os.path.join(CACHE_DIR, f"{CACHE_PREFIX}{key}")
+
+
+def write_cache(gdf, source=SOURCE_FILE, extra_geometries=None, suppressed=None):
+    """
+    Escribe el caché columnar de un GeoDataFrame ya procesado.
+    extra_geometries: {nombre: GeoSeries} geometrías adicionales (WKB, cada una con su CRS).
+    suppressed: máscaras de supresión de compact_frame, alineadas con las filas de gdf (None = desconocidas).
+    Retorna la ruta del dataset.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    import shapely
+
+    from compact import SUPPRESSED_COL, pack_rows
+
+    key = cache_key(source)
+    root = cache_path(key)
+    tmp_root = root + '.tmp'
+    if os.path.exists(tmp_root): shutil.rmtree(tmp_root)
+
+    geom_name = gdf.geometry.name
+    df = gdf.drop(columns=[geom_name])
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    wkb = shapely.to_wkb(gdf.geometry.values, hex=False)
+    table = table.append_column(GEOMETRY_COL, pa.array(wkb, type=pa.binary()))
+    geometry_columns = {GEOMETRY_COL: gdf.crs.to_string() if gdf.crs is not None else None}
+    for name, geoms in (extra_geometries or {}).items():
+        wkb = shapely.to_wkb(geoms.values, hex=False)
+        table = table.append_column(name, pa.array(wkb, type=pa.binary()))
+        geometry_columns[name] = geoms.crs.to_string() if geoms.crs is not None else None
+    suppressed_columns = None
+    if suppressed is not None:
+        suppressed_columns, bits = pack_rows(suppressed, len(gdf))
+        if bits is not None:
+            table = table.append_column(SUPPRESSED_COL, bits)
+
+    pq.write_to_dataset(table, tmp_root, partition_cols=[PARTITION_COL])
+
+    meta = {
+        'key': key,
+        'source': os.path.abspath(source),
+        'crs': geometry_columns[GEOMETRY_COL],
+        'geometry_columns': geometry_columns,
+        'rows': len(gdf),
+        'columns': list(df.columns),
+        'suppressed_columns': suppressed_columns,
+    }
+    with open(os.path.join(tmp_root, '_meta.json'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=1)
+
+    # Reemplazo atómico y limpieza de cachés obsoletos
+    if os.path.exists(root): shutil.rmtree(root)
+    os.replace(tmp_root, root)
+    for name in os.listdir(CACHE_DIR):
+        path = os.path.join(CACHE_DIR, name)
+        if name.startswith(CACHE_PREFIX) and path != root and os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+
+    print(f"  Caché columnar escrito: {root} ({len(gdf)} manzanas)")
+    return root
+
+
+def ensure_cache(source=SOURCE_FILE):
+    """Retorna la ruta de un caché vigente, reconstruyéndolo desde el GPKG si está obsoleto"""
+    root = cache_path(cache_key(source))
+    if os.path.exists(os.path.join(root, '_meta.json')):
+        return root
+
+    import geopandas as gpd
+    from render_geometry import RENDER_COL, build_render_geometry
+    print(f"  Caché columnar ausente u obsoleto. Reconstruyendo desde {source}...")
+    gdf = gpd.read_file(source)
+    gdf = gdf.loc[:, ~gdf.columns.duplicated()]
+    render, _ = build_render_geometry(gdf)
+    return write_cache(gdf, source=source, extra_geometries={RENDER_COL: render})
+
+
+def cache_meta(source=SOURCE_FILE):
+    with open(os.path.join(ensure_cache(source), '_meta.json'), encoding='utf-8') as f:
+        return json.load(f)
+
+
+def load_indicators(columns=None, comunas=None, geometry=False, source=SOURCE_FILE, suppressed=False):
+    """
+    Carga manzanas desde el caché columnar.
+
+    columns:    lista de columnas a leer (None = todas). Columnas inexistentes se ignoran.
+    comunas:    lista de comunas (solo se leen esas particiones). None = todas.
+    geometry:   si True retorna GeoDataFrame decodificando el WKB; si False, DataFrame tabular.
+                Un nombre de columna (ej. 'geom_render') usa esa geometría en su CRS.
+    suppressed: si True retorna (df, máscaras) con las máscaras de supresión de las filas leídas
+                ({columna n_*: bits empaquetados}, ver compact.suppressed_mask). KeyError si el caché
+                no las tiene (reconstruido desde el GPKG, que no las guarda).
+    """
+    import pyarrow.parquet as pq
+
+    from compact import SUPPRESSED_COL, unpack_rows
+
+    root = ensure_cache(source)
+    with open(os.path.join(root, '_meta.json'), encoding='utf-8') as f:
+        meta = json.load(f)
+
+    available = meta['columns']
+    if columns is None:
+        cols = list(available)
+    else:
+        cols = [c for c in dict.fromkeys(columns) if c in available]
+    geom_col = GEOMETRY_COL if geometry is True else geometry
+    geometry_columns = meta.get('geometry_columns', {GEOMETRY_COL: meta['crs']})
+    if geom_col and geom_col not in geometry_columns:
+        raise KeyError(f"El caché no tiene la geometría '{geom_col}'")
+    if geom_col:
+        cols.append(geom_col)
+    if suppressed:
+        suppressed_columns = meta.get('suppressed_columns')
+        if suppressed_columns is None:
+            raise KeyError("El caché no tiene máscaras de supresión: regenerarlo con process_census_data.py")
+        if suppressed_columns:
+            cols.append(SUPPRESSED_COL)
+
+    filters = [(PARTITION_COL, 'in', list(comunas))] if comunas is not None else None
+    table = pq.read_table(root, columns=cols, filters=filters, memory_map=True,
+                          partitioning='hive')
+    masks = {}
+    if SUPPRESSED_COL in table.column_names:
+        masks = unpack_rows(table.column(SUPPRESSED_COL), suppressed_columns)
+        table = table.drop_columns([SUPPRESSED_COL])
+    df = table.to_pandas()
+    if PARTITION_COL in df.columns:
+        df[PARTITION_COL] = df[PARTITION_COL].astype(str)
+
+    if geom_col:
+        import geopandas as gpd
+        geoms = gpd.GeoSeries.from_wkb(df.pop(geom_col), crs=geometry_columns[geom_col])
+        df = gpd.GeoDataFrame(df, geometry=geoms.rename(GEOMETRY_COL))
+    return (df, masks) if suppressed else df
@@ -0,0 +1,150 @@
+"""
+Esquema compacto de tipos para las tablas de manzanas.
+
+GDAL entrega cada n_* como float64 (o int64) y los identificadores como objetos str; luego
+fillna(0) hace otra copia completa. Aquí, en un solo pase por columna:
+  - n_*  -> el entero sin signo más chico que alcanza (uint8/16/32), con los valores suprimidos
+            por el INE (NaN) en 0 y registrados en una máscara de validez aparte (1 bit por celda,
+            solo para las columnas que tienen supresiones). process_data guarda las máscaras en el
+            caché columnar y en la tabla base (pack_rows); load_indicators(suppressed=True) las devuelve
+  - COMUNA, REGION, PROVINCIA, CUT -> pandas Categorical
+  - los indicadores por manzana se calculan en float32 (ver process_census_data.INDICATOR_DTYPE)
+
+El reporte mide memoria tabular (DataFrame.memory_usage deep, sin geometría), no el RSS del proceso.
+
+Uso:
+    python compact.py Manzanas_Indicadores.gpkg                           # reporte de memoria
+    python compact.py Cartografia_censo2024_Pais.gpkg --capa Manzanas_CPV24  # nacional, por lotes
+"""
+import numpy as np
+import pandas as pd
+
+COUNT_PREFIX = 'n_'
+SUPPRESSED_COL = 'suprimidos'   # columna con las máscaras empaquetadas por fila (caché columnar / tabla base)
+CATEGORICAL_COLS = ['COMUNA', 'REGION', 'PROVINCIA', 'CUT']
+UINT_TYPES = [np.uint8, np.uint16, np.uint32, np.uint64]
+
+
+def smallest_uint(max_value):
+    for dtype in UINT_TYPES:
+        if max_value <= np.iinfo(dtype).max:
+            return dtype
+    raise OverflowError(f"Conteo fuera de rango: {max_value}")
+
+
+def compact_counts(df, columns=None):
+    """
+    Convierte las columnas n_* (en el lugar) al entero sin signo más chico.
+    Retorna {columna: bits empaquetados} con la máscara de supresión de las columnas que tenían NaN.
+    Columnas con valores negativos o no enteros quedan en float32.
+    """
+    columns = columns or [c for c in df.columns if c.startswith(COUNT_PREFIX)]
+    suppressed = {}
+    for col in columns:
+        values = df[col].to_numpy()
+        if values.dtype.kind == 'u':
+            continue
+        values = values.astype(np.float64, copy=False)
+        mask = np.isnan(values)
+        if mask.any():
+            suppressed[col] = np.packbits(mask)
+            values = np.where(mask, 0.0, values)
+        if values.size and (values.min() < 0 or not np.array_equal(values, np.floor(values))):
+            df[col] = values.astype(np.float32)
+            continue
+        df[col] = values.astype(smallest_uint(values.max() if values.size else 0))
+    return suppressed
+
+
+def suppressed_mask(suppressed, col, n_rows):
+    """Máscara booleana de supresión de una columna (todo False si no tenía supresiones)"""
+    if col not in suppressed:
+        return np.zeros(n_rows, dtype=bool)
+    return np.unpackbits(suppressed[col], count=n_rows).astype(bool)
+
+
+def pack_rows(suppressed, n_rows):
+    """
+    Máscaras por columna -> (columnas, arreglo Arrow fixed_size_binary con los bits de cada fila).
+    Así las máscaras viajan como una columna más y se particionan / filtran junto con sus filas.
+    (columnas, None) si no hay supresiones.
+    """
+    import pyarrow as pa
+
+    columns = sorted(suppressed)
+    if not columns:
+        return columns, None
+    bits = np.column_stack([suppressed_mask(suppressed, c, n_rows) for c in columns])
+    packed = np.packbits(bits, axis=1)
+    return columns, pa.FixedSizeBinaryArray.from_buffers(
+        pa.binary(packed.shape[1]), n_rows, [None, pa.py_buffer(packed.tobytes())])
+
+
+def unpack_rows(array, columns):
+    """Inversa de pack_rows: columna Arrow de bits por fila -> {columna: bits empaquetados}"""
+    import pyarrow as pa
+
+    if isinstance(array, pa.ChunkedArray):
+        array = array.combine_chunks()
+    width = array.type.byte_width
+    rows = np.frombuffer(array.buffers()[1], dtype=np.uint8, count=len(array) * width,
+                         offset=array.offset * width).reshape(len(array), width)
+    bits = np.unpackbits(rows, axis=1, count=len(columns)).astype(bool)
+    return {col: np.packbits(bits[:, i]) for i, col in enumerate(columns) if bits[:, i].any()}
+
+
+def compact_identifiers(df, columns=CATEGORICAL_COLS):
+    """Identificadores repetidos -> Categorical (en el lugar)"""
+    for col in columns:
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype(str).astype('category')
+
+
+def compact_frame(df):
+    """Conteos + identificadores compactos (en el lugar). Retorna las máscaras de supresión"""
+    suppressed = compact_counts(df)
+    compact_identifiers(df)
+    return suppressed
+
+
+def frame_memory_mb(df, suppressed=None):
+    """Memoria tabular (deep) en MB, sin la geometría; incluye las máscaras de supresión"""
+    cols = [c for c in df.columns if c != getattr(df, '_geometry_column_name', None)]
+    total = df[cols].memory_usage(deep=True, index=False).sum()
+    total += sum(bits.nbytes for bits in (suppressed or {}).values())
+    return total / 1e6
+
+
+def print_memory_report(label, before_mb, after_mb):
+    factor = before_mb / after_mb if after_mb else float('inf')
+    print(f"  Memoria {label}: {before_mb:,.1f} MB -> {after_mb:,.1f} MB ({factor:.1f}x menos)")
+
+
+def measure_file(path, layer=None, where=None, batch_size=65536):
+    """
+    Memoria tabular de una capa tal como la entrega GDAL vs compacta, medida lote a lote
+    (sirve para el país completo sin tenerlo en memoria). Retorna (filas, antes_mb, después_mb).
+    """
+    from pyogrio.raw import open_arrow
+
+    rows = before = after = 0.0
+    with open_arrow(path, layer=layer, where=where, batch_size=batch_size, use_pyarrow=True) as (meta, reader):
+        geom_col = meta['geometry_name'] or 'wkb_geometry'
+        for batch in reader:
+            df = batch.to_pandas().drop(columns=[geom_col], errors='ignore')
+            before += frame_memory_mb(df)
+            after += frame_memory_mb(df, compact_frame(df))
+            rows += len(df)
+    return int(rows), before, after
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Reporte de memoria del esquema compacto")
+    parser.add_argument('archivo', help="GPKG a medir")
+    parser.add_argument('--capa', default=None)
+    parser.add_argument('--where', default=None, help="Filtro SQL (ej. \"REGION LIKE '%%METROPOLITANA%%'\")")
+    args = parser.parse_args()
+    rows, before, after = measure_file(args.archivo, layer=args.capa, where=args.where)
+    print(f"{args.archivo} ({rows:,} filas, sin geometría):")
+    print_memory_report("tabular", before, after)
@@ -1,11 +1,11 @@
 
-import geopandas as gpd
-import pandas as pd
+from columnar_cache import load_indicators
 
 INPUT_FILE = 'Manzanas_Indicadores.gpkg'
 
 try:
-    gdf = gpd.read_file(INPUT_FILE)
+    # Tabular: no hace falta decodificar geometrías
+    gdf = load_indicators(source=INPUT_FILE)
     print("Columns:", gdf.columns)
     if 'COMUNA' in gdf.columns:
         print("Unique Comunas (first 20):", sorted(gdf['COMUNA'].unique())[:20])
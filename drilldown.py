@@ -0,0 +1,231 @@
+"""
+Drill-down comunal: qué explica un indicador dentro de cada comuna y hacia dónde se concentra.
+
+Reemplaza a analyze_nunoa_ex.py (ÑUÑOA + pct_ex fijos). Para cualquier indicador objetivo y
+cualquier conjunto de comunas (o todas):
+  - correlaciones    Pearson por comuna contra cada indicador explicativo del registro
+                     (pares válidos por indicador; todas las comunas en una sola reducción agrupada)
+  - decil superior   promedio de cada explicativo en el 10% de manzanas con mayor valor vs el resto
+  - tendencia        centroide (ponderado por población) de las manzanas del decil superior vs el de
+                     la comuna: desplazamiento en metros, rumbo y dirección (N, NE, ..., NO)
+
+Los indicadores salen del registro (indicators.INDICADORES, un pase matricial) + los compuestos
+idx_* precalculados; los que necesitan columnas ausentes del caché se omiten. Con --jobs, las
+comunas se reparten en lotes y cada proceso lee solo sus particiones del caché columnar.
+
+Uso:
+    python drilldown.py pct_ex --comuna ÑUÑOA
+    python drilldown.py idx_privilegio --todas --jobs 4 --csv drilldown
+"""
+import numpy as np
+import pandas as pd
+
+from columnar_cache import SOURCE_FILE, cache_meta, load_indicators
+from geography import grouped_sum
+from indicators import COMPUESTOS, INDICADORES, evaluate, required_columns
+
+TOP_QUANTILE = 0.9
+WEIGHT_COL = 'n_per'          # ponderación de los centroides
+MIN_BLOCKS = 10               # comunas con menos manzanas válidas no se analizan
+DIRECCIONES = ['E', 'NE', 'N', 'NO', 'O', 'SO', 'S', 'SE']
+
+
+def explanatory_indicators(target, available):
+    """Indicadores del registro calculables con las columnas del caché + compuestos presentes"""
+    simples = [name for name in INDICADORES if name != target
+               and all(c in available for c in required_columns([name]))]
+    compuestos = [c for c in COMPUESTOS if c != target and c in available]
+    return simples, compuestos
+
+
+def _indicator_frame(df, target, simples, compuestos):
+    """Objetivo + explicativos por manzana (matriz n x (1 + J))"""
+    names = [target] + simples if target in INDICADORES else simples
+    values = evaluate(df, names)
+    for c in compuestos + ([target] if target not in INDICADORES else []):
+        values[c] = df[c].to_numpy(dtype=np.float64, na_value=np.nan)
+    values[WEIGHT_COL] = df[WEIGHT_COL].to_numpy(dtype=np.float64, na_value=0) if WEIGHT_COL in df else 1.0
+    return values[[target] + simples + compuestos + [WEIGHT_COL]]
+
+
+def grouped_correlations(codes, n_groups, t, X):
+    """
+    Pearson de t contra cada columna de X dentro de cada grupo, con los pares válidos de cada columna.
+    Una sola reducción agrupada de [n, Σt, Σx, Σt², Σx², Σtx]. Retorna (r, n) de forma (grupos x J).
+    """
+    valid = np.isfinite(X) & np.isfinite(t)[:, None]
+    M = valid.astype(np.float64)
+    T = np.where(valid, t[:, None], 0.0)
+    Xv = np.where(valid, X, 0.0)
+    S = grouped_sum(np.hstack([M, T, Xv, T * T, Xv * Xv, T * Xv]), codes, n_groups)
+    n, st, sx, stt, sxx, stx = np.split(S, 6, axis=1)
+    cov = n * stx - st * sx
+    var = (n * stt - st ** 2) * (n * sxx - sx ** 2)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        r = np.where((var > 0) & (n > 2), cov / np.sqrt(np.where(var > 0, var, 1.0)), np.nan)
+    return np.clip(r, -1, 1), n.astype(np.int64)
+
+
+def grouped_means(codes, n_groups, X, mask):
+    """Promedio (ignorando NaN) de cada columna de X por grupo, solo filas con mask"""
+    valid = np.isfinite(X) & mask[:, None]
+    S = grouped_sum(np.hstack([valid.astype(np.float64), np.where(valid, X, 0.0)]), codes, n_groups)
+    n, s = np.split(S, 2, axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(n > 0, s / np.where(n > 0, n, 1), np.nan)
+
+
+def _compass(dx, dy):
+    angle = np.degrees(np.arctan2(dy, dx)) % 360
+    labels = np.array(DIRECCIONES)[np.round(angle / 45).astype(int) % 8]
+    # Rumbo geográfico: 0 = norte, sentido horario
+    return (90 - angle) % 360, labels
+
+
+def drilldown_batch(target, comunas=None, source=SOURCE_FILE):
+    """Correlaciones, decil superior y tendencia para un lote de comunas (una lectura del caché)"""
+    import shapely
+
+    available = cache_meta(source)['columns']
+    if target not in INDICADORES and target not in available:
+        raise KeyError(f"Indicador desconocido: {target}")
+    simples, compuestos = explanatory_indicators(target, available)
+    cols = ['COMUNA', WEIGHT_COL] + required_columns([target] + simples if target in INDICADORES else simples)
+    cols += compuestos + ([target] if target not in INDICADORES else [])
+    gdf = load_indicators(columns=cols, comunas=comunas, geometry=True, source=source)
+    values = _indicator_frame(gdf, target, simples, compuestos)
+
+    codes, labels = pd.factorize(gdf['COMUNA'].astype(str), sort=True)
+    G = len(labels)
+    t = values[target].to_numpy()
+    names = simples + compuestos
+    X = values[names].to_numpy()
+    n_valid = np.bincount(codes[np.isfinite(t)], minlength=G)
+
+    # 1. Correlaciones por comuna (una reducción para todas)
+    r, n = grouped_correlations(codes, G, t, X)
+    corr = pd.DataFrame({
+        'comuna': np.repeat(labels, len(names)), 'indicador': np.tile(names, G),
+        'r': r.ravel(), 'n': n.ravel(),
+    })
+
+    # 2. Decil superior vs resto (umbral por comuna)
+    threshold = pd.Series(t).groupby(codes).quantile(TOP_QUANTILE).reindex(range(G)).to_numpy()
+    top = np.isfinite(t) & (t >= threshold[codes])
+    rest = np.isfinite(t) & ~top
+    top_mean = grouped_means(codes, G, np.column_stack([t, X]), top)
+    rest_mean = grouped_means(codes, G, np.column_stack([t, X]), rest)
+    decile = pd.DataFrame({
+        'comuna': np.repeat(labels, len(names) + 1), 'indicador': np.tile([target] + names, G),
+        'top_10': top_mean.ravel(), 'resto': rest_mean.ravel(),
+    })
+    decile['diferencia'] = decile['top_10'] - decile['resto']
+
+    # 3. Tendencia: centroides ponderados por población (CRS de la capa, en metros)
+    xy = shapely.get_coordinates(shapely.centroid(gdf.geometry.values))
+    w = np.maximum(values[WEIGHT_COL].to_numpy(), 0)
+    w = np.where(w > 0, w, 1e-9)   # manzanas sin población cuentan casi nada, pero definen el centro si son todas
+    allw = grouped_sum(np.column_stack([w, w * xy[:, 0], w * xy[:, 1]]), codes, G)
+    topw = grouped_sum(np.column_stack([w, w * xy[:, 0], w * xy[:, 1]]) * top[:, None], codes, G)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        center = allw[:, 1:] / allw[:, :1]
+        hot = topw[:, 1:] / topw[:, :1]
+    dx, dy = hot[:, 0] - center[:, 0], hot[:, 1] - center[:, 1]
+    bearing, direction = _compass(dx, dy)
+    trend = pd.DataFrame({
+        'comuna': labels, 'manzanas': n_valid, 'umbral_top_10': threshold,
+        'manzanas_top_10': np.bincount(codes[top], minlength=G),
+        'dx_m': dx, 'dy_m': dy, 'distancia_m': np.hypot(dx, dy), 'rumbo': bearing,
+        'direccion': np.where(np.isfinite(dx), direction, None),
+    })
+
+    small = set(labels[n_valid < MIN_BLOCKS])
+    if small:
+        corr = corr[~corr['comuna'].isin(small)]
+        decile = decile[~decile['comuna'].isin(small)]
+        trend = trend[~trend['comuna'].isin(small)]
+    return corr, decile, trend
+
+
+def _batches(comunas, n_jobs, source):
+    """Reparte comunas en lotes de tamaño (en manzanas) parecido, las más grandes primero"""
+    sizes = load_indicators(columns=['COMUNA'], comunas=comunas, source=source)['COMUNA'].value_counts()
+    batches = [[] for _ in range(n_jobs)]
+    loads = np.zeros(n_jobs)
+    for comuna, size in sizes.items():
+        i = int(np.argmin(loads))
+        batches[i].append(comuna)
+        loads[i] += size
+    return [b for b in batches if b]
+
+
+def drilldown(target, comunas=None, n_jobs=1, source=SOURCE_FILE):
+    """Drill-down de uno o varios lotes de comunas. Retorna (correlaciones, decil, tendencia)"""
+    if n_jobs <= 1:
+        return drilldown_batch(target, comunas, source)
+
+    from concurrent.futures import ProcessPoolExecutor
+    import multiprocessing
+    batches = _batches(comunas, n_jobs, source)
+    ctx = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=len(batches), mp_context=ctx) as pool:
+        parts = list(pool.map(drilldown_batch, [target] * len(batches), batches, [source] * len(batches)))
+    return tuple(pd.concat([p[i] for p in parts], ignore_index=True).sort_values('comuna', kind='stable')
+                 .reset_index(drop=True) for i in range(3))
+
+
+def print_commune(target, comuna, corr, decile, trend):
+    c = corr[corr['comuna'] == comuna].set_index('indicador')['r'].sort_values(ascending=False)
+    d = decile[decile['comuna'] == comuna].set_index('indicador')[['top_10', 'resto', 'diferencia']]
+    row = trend[trend['comuna'] == comuna]
+    if row.empty:
+        print(f"\n{comuna}: sin manzanas suficientes")
+        return
+    row = row.iloc[0]
+    print(f"\n=== {comuna}: {target} ({row.manzanas:,} manzanas) ===")
+    print(f"\n--- Correlaciones con {target} ---")
+    print(c.dropna().to_string(float_format=lambda v: f"{v:+.3f}"))
+    print(f"\n--- Decil superior (umbral {row.umbral_top_10:.2f}, {row.manzanas_top_10} manzanas) vs resto ---")
+    print(d.dropna(how='all').to_string(float_format=lambda v: f"{v:.2f}"))
+    if row.direccion is not None:
+        print(f"\nTendencia: el decil superior se concentra hacia el {row.direccion} "
+              f"({row.distancia_m:,.0f} m del centro ponderado, rumbo {row.rumbo:.0f}°)")
+
+
+def print_overview(target, corr, trend):
+    """Resumen de todas las comunas: correlación más fuerte y dirección del decil superior"""
+    strongest = (corr.dropna(subset=['r']).assign(abs_r=lambda x: x['r'].abs())
+                     .sort_values('abs_r', ascending=False).groupby('comuna').head(1).set_index('comuna'))
+    table = trend.set_index('comuna')[['manzanas', 'direccion', 'distancia_m']].join(
+        strongest[['indicador', 'r']].rename(columns={'indicador': 'mas_correlacionado'}))
+    print(f"\n=== Drill-down de {target}: {len(table)} comunas ===")
+    print(table.to_string(float_format=lambda v: f"{v:,.2f}"))
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+    parser = argparse.ArgumentParser(description="Drill-down comunal de un indicador")
+    parser.add_argument('indicador', help="Indicador objetivo (pct_* del registro o idx_*)")
+    parser.add_argument('--comuna', nargs='*', default=None, help="Una o más comunas")
+    parser.add_argument('--todas', action='store_true', help="Todas las comunas")
+    parser.add_argument('--jobs', type=int, default=1, help="Procesos (lotes de comunas)")
+    parser.add_argument('--csv', default=None, metavar='PREFIJO',
+                        help="Exportar PREFIJO_correlaciones.csv, PREFIJO_decil.csv, PREFIJO_tendencia.csv")
+    args = parser.parse_args()
+    if not args.todas and not args.comuna:
+        parser.error("Indicar --comuna o --todas")
+
+    t0 = time.perf_counter()
+    comunas = None if args.todas else args.comuna
+    corr, decile, trend = drilldown(args.indicador, comunas, n_jobs=args.jobs)
+    if args.todas or len(args.comuna) > 3:
+        print_overview(args.indicador, corr, trend)
+    else:
+        for comuna in args.comuna:
+            print_commune(args.indicador, comuna, corr, decile, trend)
+    print(f"\n({time.perf_counter() - t0:.1f}s)")
+    if args.csv:
+        for name, table in (('correlaciones', corr), ('decil', decile), ('tendencia', trend)):
+            table.to_csv(f"{args.csv}_{name}.csv", index=False)
+        print(f"✅ Tablas en {args.csv}_*.csv")
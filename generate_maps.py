@@ -1,17 +1,24 @@
-import geopandas as gpd
 import matplotlib.pyplot as plt
 import matplotlib.patches as mpatches
+import functools
 import os
-from matplotlib.colors import ListedColormap
-import mapclassify
-import seaborn as sns # Para graficos estadisticos bonitos
-import matplotlib.patheffects as path_effects # Para efectos de brillo (Glow)
+from columnar_cache import load_indicators
+from render_geometry import DPI, FIG_SIZE, RENDER_COL
+from classification import fisher_jenks_bins
+from geography import aggregate_hierarchy
+from indicators import COMPUESTOS, evaluate, evaluate_composites, required_columns as indicator_columns
+from instrumentation import add_cli_arguments, configure_from_args, stage, timed
 
 # --- CONFIGURACIÓN ---
 INPUT_FILE = 'Manzanas_Indicadores.gpkg'
 OUTPUT_DIR = 'mapas_finales_instagram'
-DPI = 300
-FIG_SIZE = (3.6, 3.6) # Formato cuadrado para IG (1080x1080 px aprox)
+LOGO_FILE = 'conmapas.png'
+BASEMAP_SOURCE = 'basemap.mbtiles'   # Teselas raster locales (MBTiles, directorio XYZ o URL), ver basemap.py
+ID_COL = 'MANZENT'
+GEOMETRY_CACHE_SIZE = 64     # Comunas con geometría de render en memoria por proceso
+
+# Indicadores simples del registro (indicators.INDICADORES) que se calculan para los mapas
+INDICADORES_MAPA = ['pct_alone', 'pct_ciclistas', 'pct_hipotecados', 'pct_ex', 'pct_soltero', 'pct_hacinamiento']
 
 # Estilo Cyberpunk Dark High Contrast
 BACKGROUND_COLOR = '#050510' # Azul muy oscuro casi negro
@@ -28,6 +35,29 @@ CYBER_PURPLE = '#bc13fe'
 import matplotlib.cm as cm
 NEON_CMAP = cm.viridis
 
+@functools.lru_cache(maxsize=None)
+def load_logo(path=LOGO_FILE):
+    """Logo decodificado (una vez por proceso); None si no existe o no se puede leer"""
+    try:
+        return plt.imread(path) if os.path.exists(path) else None
+    except Exception:
+        return None
+
+@functools.lru_cache(maxsize=GEOMETRY_CACHE_SIZE)
+def commune_geometry(commune, source=INPUT_FILE):
+    """
+    Geometría de render de UNA comuna, indexada por MANZENT. Lee solo la partición COMUNA=<commune>
+    del caché columnar; cacheada por proceso (varios indicadores dibujan la misma comuna).
+    """
+    with stage('geometria', comuna=commune) as st:
+        gdf = load_indicators(columns=[ID_COL], comunas=[commune], geometry=RENDER_COL, source=source)
+        st.set(filas=len(gdf))
+    return gdf.set_index(ID_COL)
+
+def commune_blocks(values, commune, source=INPUT_FILE):
+    """GeoDataFrame de la comuna: geometría (cargada bajo demanda) + valores por manzana (MANZENT)"""
+    return commune_geometry(commune, source).join(values.set_index(ID_COL), how='inner').reset_index()
+
 def setup_plot():
     """Configura el estilo global de matplotlib"""
     plt.style.use('dark_background')
@@ -38,21 +68,15 @@ def setup_plot():
     plt.rcParams['figure.facecolor'] = BACKGROUND_COLOR
     plt.rcParams['text.color'] = TEXT_COLOR
 
-def create_custom_legend(ax, gdf, column, scheme='FisherJenks', k=5, bins=None, context=None):
+def create_custom_legend(ax, gdf, column, scheme='FisherJenks', k=5, bins=None, context=None, geography=None):
     """Crea una leyenda discreta manual y estética"""
     try:
         if bins is None:
             if gdf is None or column is None: return
-            valid_data = gdf[column].dropna()
-            if valid_data.empty: return
-
-            unique_vals = valid_data.nunique()
-            if unique_vals < k: k = unique_vals
-                
-            classifier = mapclassify.FisherJenks(valid_data, k=k)
-            bins = classifier.bins
-        else:
-            k = len(bins)
+            # Bins cacheados (classification.py): mismos cortes que el mapa, sin recalcular
+            bins = fisher_jenks_bins(gdf[column], k=k, indicator=column, geography=geography)
+            if bins is None: return
+        k = len(bins)
 
         patches = []
         # Para leyenda global, 'lower_bound' es implícito del bin anterior.
@@ -114,15 +138,50 @@ def create_custom_legend(ax, gdf, column, scheme='FisherJenks', k=5, bins=None,
     except Exception as e:
         print(f"Error creating legend: {e}")
 
-def generate_commune_map(gdf, commune_name, column, title, filename, description="", bins=None):
+def draw_map_subtitle(fig, commune_name):
+    """Subtítulo del mapa (nombre de la comuna)"""
+    fig.text(0.5, 0.89, commune_name, ha="center", fontsize=13, fontweight='light', color=TEXT_COLOR)
+
+def draw_map_frame(fig, ax, title, description="", bins=None, gdf=None, column=None, geography=None):
+    """Título, descripción, leyenda, fuente y logo del mapa (coordenadas de figura, no dependen de la comuna)"""
+    # Título principal (Ajustado manualmente para centrado visual)
+    fig.text(0.5, 0.93, title.upper(), ha="center", fontsize=15, fontweight='bold', color=TEXT_COLOR)
+
+    # Descripción (MOVIDA ARRIBA para limpiar el footer)
+    if description:
+        fig.text(0.5, 0.85, description, ha="center", fontsize=6, fontweight='normal', color=TEXT_COLOR, alpha=0.7)
+
+    # Leyenda (Footer despejado)
+    if bins is not None:
+         create_custom_legend(ax, None, None, bins=bins, context=title)
+    else:
+         create_custom_legend(ax, gdf, column, context=title, geography=geography)
+
+    # Fuente (Bien abajo)
+    fig.text(0.5, 0.01, "Fuente: INE - Censo 2024 • @conmapas", ha="center", fontsize=4, color=TEXT_COLOR, alpha=0.5)
+
+    # Logo (Opcional, decodificado una vez por proceso)
+    logo = load_logo()
+    if logo is not None:
+        # [left, bottom, width, height]
+        logo_ax = fig.add_axes([0.88, 0.02, 0.1, 0.1], zorder=10)
+        logo_ax.imshow(logo)
+        logo_ax.axis('off')
+
+@timed('mapa_comunal', args=('commune_name', 'column'))
+def generate_commune_map(gdf, commune_name, column, title, filename, description="", bins=None, basemap=None):
     """Genera y guarda el mapa estático con estilo Neon y Basemap"""
     print(f"  -> Generando mapa para {commune_name} ({column})...")
     
-    commune_gdf = gdf[gdf['COMUNA'] == commune_name].copy()
+    commune_gdf = gdf[gdf['COMUNA'] == commune_name]
     if commune_gdf.empty: return
 
-    # CRUCIAL: Convertir a Web Mercator (EPSG:3857) para Contextily
-    commune_gdf_toplot = commune_gdf.to_crs(epsg=3857)
+    # CRUCIAL: Web Mercator (EPSG:3857) para Contextily.
+    # La geometría de render del caché ya viene proyectada y simplificada: sin copia ni reproyección.
+    if commune_gdf.crs is not None and commune_gdf.crs.to_epsg() == 3857:
+        commune_gdf_toplot = commune_gdf
+    else:
+        commune_gdf_toplot = commune_gdf.to_crs(epsg=3857)
 
     fig, ax = plt.subplots(figsize=FIG_SIZE)
     
@@ -133,8 +192,11 @@ def generate_commune_map(gdf, commune_name, column, title, filename, description
     ax.set_xlim(minx - margin_x, maxx + margin_x)
     ax.set_ylim(miny - margin_y, maxy + margin_y)
     
-    # 2. FONDO DARK
+    # 2. FONDO DARK + mapa base opcional (teselas locales / caché en disco, sin red)
     ax.set_facecolor(BACKGROUND_COLOR)
+    if basemap:
+        from basemap import add_basemap
+        add_basemap(ax, basemap, extent=(minx - margin_x, miny - margin_y, maxx + margin_x, maxy + margin_y))
     
     # 3. PLOT DE DATOS (encima del basemap)
     try:
@@ -148,12 +210,11 @@ def generate_commune_map(gdf, commune_name, column, title, filename, description
             'linewidth': 0.0,
         }
         
-        if bins is not None:
-             plot_args['scheme'] = 'UserDefined'
-             plot_args['classification_kwds'] = {'bins': bins}
-        else:
-             plot_args['scheme'] = 'FisherJenks'
-             plot_args['k'] = 5
+        if bins is None:
+             # Fisher-Jenks de la comuna, una vez y cacheado; la leyenda reutiliza estos bins
+             bins = fisher_jenks_bins(commune_gdf_toplot[column], k=5, indicator=column, geography=commune_name)
+        plot_args['scheme'] = 'UserDefined'
+        plot_args['classification_kwds'] = {'bins': bins}
              
         commune_gdf_toplot.plot(**plot_args)
 
@@ -163,41 +224,10 @@ def generate_commune_map(gdf, commune_name, column, title, filename, description
 
     ax.set_aspect('equal')
 
-    # 4. TITULOS Y TEXTOS (Ajustados manualmente para centrado visual)
-    # Título principal
-    plt.text(0.5, 0.93, title.upper(), transform=fig.transFigure, 
-             ha="center", fontsize=15, fontweight='bold', color=TEXT_COLOR)
-    
-    # Subtítulo (Nombre Comuna)
-    plt.text(0.5, 0.89, commune_name, transform=fig.transFigure,
-             ha="center", fontsize=13, fontweight='light', color=TEXT_COLOR)
-
-    # Descripción (MOVIDA ARRIBA para limpiar el footer)
-    if description:
-        plt.text(0.5, 0.85, description, transform=fig.transFigure,
-                 ha="center", fontsize=6, fontweight='normal', color=TEXT_COLOR, alpha=0.7)
-
-    # Leyenda (Footer despejado)
-    if bins is not None:
-         # Hack: pasamos el gdf entero o un dummy con los rangos correctos?
-         create_custom_legend(ax, None, None, bins=bins, context=title)
-    else:
-         create_custom_legend(ax, commune_gdf_toplot, column, context=title)
-
-    # Fuente (Bien abajo)
-    plt.text(0.5, 0.01, "Fuente: INE - Censo 2024 • @conmapas", transform=fig.transFigure,
-             ha="center", fontsize=4, color=TEXT_COLOR, alpha=0.5)
-
-    # Logo (Opcional)
-    try:
-        if os.path.exists('conmapas.png'):
-            logo = plt.imread('conmapas.png')
-            # [left, bottom, width, height]
-            logo_ax = fig.add_axes([0.88, 0.02, 0.1, 0.1], zorder=10)
-            logo_ax.imshow(logo)
-            logo_ax.axis('off')
-    except Exception as e:
-        pass
+    # 4. TITULOS, LEYENDA, FUENTE Y LOGO (coordenadas de figura)
+    draw_map_subtitle(fig, commune_name)
+    draw_map_frame(fig, ax, title, description, bins, gdf=commune_gdf_toplot, column=column,
+                   geography=commune_name)
 
     ax.set_axis_off()
     
@@ -205,14 +235,21 @@ def generate_commune_map(gdf, commune_name, column, title, filename, description
     out_path = os.path.join(OUTPUT_DIR, f"{filename}_{commune_name}.png")
     
     # Guardar SIN bbox_inches='tight' para respetar tamaño fijo y layout
-    plt.savefig(out_path, dpi=DPI, facecolor=BACKGROUND_COLOR) 
-    plt.close()
+    # (fig.savefig: plt.savefig redibuja la figura completa después de guardar)
+    fig.savefig(out_path, dpi=DPI, facecolor=BACKGROUND_COLOR)
+    plt.close(fig)
     print(f"    Guardado: {out_path}")
 
+@timed('infografia', args=('column', 'area_name'))
 def generate_infographic(df, column, title, filename_base, description, area_name):
-    """Genera una infografía estilo 'Dataviz Pro' de 1080x1080"""
+    """
+    Genera una infografía estilo 'Dataviz Pro' de 1080x1080 + elementos individuales y lollipop.
+    Las figuras son plantillas (render_templates.py) que se arman una vez por área y solo
+    actualizan los artistas que dependen de los datos.
+    """
+    from render_templates import render_infographic
     print(f"  -> Generando dashboard Pro para {title}...")
-    
+
     # Filtrar datos validos
     try:
         valid_df = df.dropna(subset=[column]).sort_values(by=column, ascending=False)
@@ -220,322 +257,8 @@ def generate_infographic(df, column, title, filename_base, description, area_nam
     except KeyError:
         return
 
-    # --- CONFIG STYLE ---
-    # Colores más sofisticados
-    BG_COLOR = '#0f111a' # Dark Navy/Black aesthetic
-    ACCENT_COLOR = CYBER_MAGENTA # Mantenemos la identidad pero usada con elegancia
-    SEC_COLOR = CYBER_CYAN
-    TEXT_MAIN = '#ffffff'
-    TEXT_SUB = '#8b9bb4' # Blue-gray for subtitles
-
-    plt.rcParams['font.family'] = 'sans-serif' 
-    plt.rcParams['font.weight'] = 'normal'
-
-    fig = plt.figure(figsize=FIG_SIZE)
-    fig.patch.set_facecolor(BG_COLOR)
-    
-    # GRID LAYOUT MEJORADO
-    # Row 0: Header (15%)
-    # Row 1: Content (Top 7 + Stats) (50%)
-    # Row 2: Distribution (35%)
-    gs = fig.add_gridspec(3, 1, height_ratios=[0.15, 0.50, 0.35], hspace=0.3)
-    
-    # --- 1. HEADER ---
-    ax_header = fig.add_subplot(gs[0, 0])
-    ax_header.axis('off')
-    
-    # Titulo Limpio y Grande
-    ax_header.text(0.5, 0.55, title.upper(), ha='center', va='center', 
-                   color=TEXT_MAIN, fontsize=20, fontweight='bold')
-    
-    # Subtitulo Elegante
-    ax_header.text(0.5, 0.25, description, ha='center', va='center', 
-                   color=SEC_COLOR, fontsize=9, fontweight='medium', alpha=0.9)
-    
-    # Linea separadora sutil
-    ax_header.plot([0.3, 0.7], [0.1, 0.1], color=TEXT_SUB, linewidth=0.5, alpha=0.5)
-
-
-
-    # --- 2. MAIN SECTION ---
-    gs_mid = gs[1].subgridspec(1, 2, width_ratios=[1.3, 0.7], wspace=0.15)
-    
-    # A. TOP 7 RANKING (Horizontal Bar Chart)
-    ax_bars = fig.add_subplot(gs_mid[0])
-    top_7 = valid_df.head(7).iloc[::-1] # Top 7 invertido
-    
-    # Barras Sólidas con Gradiente simulado (Color plano + alpha)
-    bars = ax_bars.barh(top_7['COMUNA'], top_7[column], color=ACCENT_COLOR, alpha=1.0, height=0.5)
-    
-    # Etiquetas de Valor (Clean, sin glow borroso)
-    for bar in bars:
-        width = bar.get_width()
-        ax_bars.text(width + (valid_df[column].max()*0.02), bar.get_y() + bar.get_height()/2 - 0.02, 
-                     f'{width:.1f}%', 
-                     ha='left', va='center', color=TEXT_MAIN, fontsize=10, fontweight='bold', fontfamily='monospace')
-
-    # Etiquetas de Categoría (Comunas)
-    # Las ponemos en el eje Y, asegurando color y tamaño
-    ax_bars.set_yticks(range(len(top_7)))
-    ax_bars.set_yticklabels(top_7['COMUNA'], color=TEXT_MAIN, fontsize=9, fontweight='medium')
-    ax_bars.tick_params(axis='y', length=0, pad=8) # Separacion del texto
-    
-    # Titulo de sección
-    ax_bars.set_title("TOP 7 COMUNAS", color=TEXT_SUB, fontsize=8, loc='left', pad=10, fontweight='bold')
-    
-    # Clean up
-    ax_bars.spines['top'].set_visible(False)
-    ax_bars.spines['right'].set_visible(False)
-    ax_bars.spines['bottom'].set_visible(False) # Sin eje X abajo
-    ax_bars.spines['left'].set_color(TEXT_SUB)
-    ax_bars.spines['left'].set_linewidth(0.5)
-    ax_bars.xaxis.set_visible(False)
-    ax_bars.set_xlim(0, valid_df[column].max() * 1.25) # Margen derecho para números
-
-
-    # B. KPI CARD (Stats)
-    ax_stat = fig.add_subplot(gs_mid[1])
-    ax_stat.axis('off')
-    
-    avg_val = valid_df[column].mean()
-    max_val = valid_df[column].max()
-    
-    # Calculate key points for distribution markers
-    max_row = valid_df.iloc[0]  # Already sorted descending
-    min_row = valid_df.iloc[-1]
-    # Find 2 communes closest to the average
-    valid_df_temp = valid_df.copy()
-    valid_df_temp['_diff_avg'] = abs(valid_df_temp[column] - avg_val)
-    near_avg_rows = valid_df_temp.nsmallest(1, '_diff_avg')
-
-    # Contenedor visual (Linea vertical izquierda)
-    ax_stat.axvline(x=0.1, ymin=0.1, ymax=0.9, color=TEXT_SUB, linewidth=0.5, alpha=0.5)
-    
-    # MAXIMO
-    ax_stat.text(0.2, 0.80, "MÁXIMO", ha='left', color=SEC_COLOR, fontsize=9, fontweight='bold')
-    ax_stat.text(0.2, 0.62, f"{max_val:.1f}%", ha='left', color=TEXT_MAIN, fontsize=26, fontweight='bold', fontfamily='monospace')
-    
-    # PROMEDIO
-    ax_stat.text(0.2, 0.40, "PROMEDIO RM", ha='left', color=TEXT_SUB, fontsize=8, fontweight='bold')
-    ax_stat.text(0.2, 0.25, f"{avg_val:.1f}%", ha='left', color=TEXT_SUB, fontsize=16, fontweight='bold', fontfamily='monospace')
-
-
-    # --- 3. DISTRIBUTION (Footer) ---
-    ax_dist = fig.add_subplot(gs[2, 0])
-    
-    # Clean KDE
-    try:
-        sns.kdeplot(valid_df[column], ax=ax_dist, color=CYBER_GREEN, fill=True, alpha=0.2, linewidth=1.5, clip=(0, 100))
-    except:
-        pass
-
-    # Linea de Promedio
-    ax_dist.axvline(avg_val, color=TEXT_MAIN, linestyle=':', linewidth=1, alpha=0.7)
-    ax_dist.text(avg_val + (valid_df[column].max()*0.02), ax_dist.get_ylim()[1]*0.8, "AVG", color=TEXT_MAIN, fontsize=7)
-
-    # Style Axis
-    ax_dist.set_title("DISTRIBUCIÓN DE CASOS", color=TEXT_SUB, fontsize=8, loc='left', pad=5, fontweight='bold')
-    ax_dist.spines['top'].set_visible(False)
-    ax_dist.spines['right'].set_visible(False)
-    ax_dist.spines['left'].set_visible(False)
-    ax_dist.spines['bottom'].set_color(TEXT_SUB)
-    
-    ax_dist.set_xlim(0, max_val * 1.1) # Limitar eje X al maximo real + 10% margen
-    ax_dist.ticklabel_format(style='plain', axis='x') # Evitar notacion cientifica
-    
-    ax_dist.tick_params(axis='x', colors=TEXT_SUB, labelsize=8)
-    ax_dist.yaxis.set_visible(False)
-    ax_dist.set_xlabel("", color=TEXT_SUB)
-    ax_dist.set_ylabel("")
-
-    # --- KEY POINTS MARKERS ---
-    marker_y = ax_dist.get_ylim()[1] * 0.15  # Position above the x-axis
-    label_y = ax_dist.get_ylim()[1] * 0.30
-    
-    # Max Point (Red) - Bold for hierarchy
-    ax_dist.scatter([max_row[column]], [marker_y], color='#ff4444', s=25, zorder=5, marker='o')
-    ax_dist.text(max_row[column], label_y, max_row['COMUNA'], color='#ff4444', fontsize=6, ha='center', fontweight='bold')
-    
-    # Min Point (Blue)
-    ax_dist.scatter([min_row[column]], [marker_y], color=CYBER_CYAN, s=25, zorder=5, marker='o')
-    ax_dist.text(min_row[column], label_y, min_row['COMUNA'], color=CYBER_CYAN, fontsize=6, ha='center', fontweight='medium')
-    
-    # Near Average Point (Yellow)
-    for _, row in near_avg_rows.iterrows():
-        ax_dist.scatter([row[column]], [marker_y], color=CYBER_YELLOW, s=25, zorder=4, marker='o')
-        ax_dist.text(row[column], label_y, row['COMUNA'], color=CYBER_YELLOW, fontsize=6, ha='center', fontweight='medium')
-
-
-    # --- BRANDING ---
-    plt.text(0.5, 0.03, "FUENTE: INE CENSO 2024 • VISUALIZACIÓN: @CONMAPAS", transform=fig.transFigure,
-             ha="center", fontsize=7, color=TEXT_SUB, alpha=0.6)
-
-    # Padding manual para asegurar bordes limpios
-    plt.subplots_adjust(left=0.15, right=0.90, top=0.92, bottom=0.08)
-
-    # Guardar
-    if not os.path.exists(OUTPUT_DIR): os.makedirs(OUTPUT_DIR)
-    out_path = os.path.join(OUTPUT_DIR, f"{filename_base}_DASH_{area_name.replace(' ','')}.png")
-    
-    plt.savefig(out_path, dpi=DPI, facecolor=BG_COLOR)
-    plt.close()
-    print(f"    Guardado Dash Pro: {out_path}")
-
-    # --- EXPORTAR COMPONENTES INDIVIDUALES (TRANSPARENTE) ---
-    print(f"    Exportando elementos individuales...")
-    
-    # 1. RANKING INDIVIDUAL
-    fig_rank = plt.figure(figsize=(6, 4.5)) # Rectangular optimizado
-    fig_rank.patch.set_alpha(0.0) # Transparente
-    ax_r = fig_rank.add_subplot(111)
-    
-    bars_r = ax_r.barh(top_7['COMUNA'], top_7[column], color=ACCENT_COLOR, alpha=1.0, height=0.5)
-    
-    for bar in bars_r:
-        width = bar.get_width()
-        ax_r.text(width + (valid_df[column].max()*0.02), bar.get_y() + bar.get_height()/2 - 0.02, 
-                     f'{width:.1f}%', 
-                     ha='left', va='center', color=TEXT_MAIN, fontsize=10, fontweight='bold', fontfamily='monospace')
-
-    ax_r.set_yticks(range(len(top_7)))
-    ax_r.set_yticklabels(top_7['COMUNA'], color=TEXT_MAIN, fontsize=9, fontweight='medium')
-    ax_r.tick_params(axis='y', length=0, pad=8)
-    
-    # Titulo descriptivo para contexto (CENTRADO EN LA IMAGEN)
-    # Usamos fig.text en lugar de set_title para centrar respecto al lienzo total, no solo las barras
-    fig_rank.text(0.5, 0.92, f"TOP 7: {title.upper()}", ha='center', va='center', 
-                  color=TEXT_MAIN, fontsize=14, fontweight='bold')
-    
-    fig_rank.text(0.5, 0.85, description, ha='center', va='center', 
-                  color=SEC_COLOR, fontsize=10, fontweight='medium')
-
-    ax_r.spines['top'].set_visible(False)
-    ax_r.spines['right'].set_visible(False)
-    ax_r.spines['bottom'].set_visible(False)
-    ax_r.spines['left'].set_color(TEXT_SUB)
-    ax_r.xaxis.set_visible(False)
-    ax_r.set_xlim(0, valid_df[column].max() * 1.3)
-    ax_r.set_facecolor('none') # Eje transparente
-
-    plt.tight_layout(rect=[0, 0, 1, 0.82]) # Dejar espacio arriba para los titulos
-    path_rank = os.path.join(OUTPUT_DIR, f"{filename_base}_ELEM_RANK.png")
-    plt.savefig(path_rank, dpi=DPI, transparent=True)
-    plt.close()
-
-    # 2. STATS INDIVIDUAL
-    fig_stat = plt.figure(figsize=(4, 3)) # Tarjeta compacta
-    fig_stat.patch.set_alpha(0.0)
-    ax_s = fig_stat.add_subplot(111)
-    ax_s.axis('off')
-    
-    ax_s.text(0.5, 0.85, title.upper(), ha='center', color=TEXT_MAIN, fontsize=14, fontweight='bold')
-    
-    # Card like layout
-    ax_s.text(0.5, 0.65, "MÁXIMO REGIONAL", ha='center', color=SEC_COLOR, fontsize=10, fontweight='bold')
-    ax_s.text(0.5, 0.50, f"{max_val:.1f}%", ha='center', color=TEXT_MAIN, fontsize=40, fontweight='bold', fontfamily='monospace')
-    
-    ax_s.plot([0.3, 0.7], [0.4, 0.4], color=TEXT_SUB, linewidth=1, alpha=0.5)
-
-    ax_s.text(0.5, 0.30, "PROMEDIO RM", ha='center', color=TEXT_SUB, fontsize=10, fontweight='bold')
-    ax_s.text(0.5, 0.15, f"{avg_val:.1f}%", ha='center', color=TEXT_SUB, fontsize=24, fontweight='bold', fontfamily='monospace')
-
-    plt.tight_layout()
-    path_stat = os.path.join(OUTPUT_DIR, f"{filename_base}_ELEM_STATS.png")
-    plt.savefig(path_stat, dpi=DPI, transparent=True)
-    plt.close()
-
-    # 3. DISTRIBUTION INDIVIDUAL
-    fig_dist = plt.figure(figsize=(6, 2.5)) # Panorámico bajito
-    fig_dist.patch.set_alpha(0.0)
-    ax_d = fig_dist.add_subplot(111)
-    
-    try:
-        sns.kdeplot(valid_df[column], ax=ax_d, color=CYBER_GREEN, fill=True, alpha=0.4, linewidth=2, clip=(0, 100))
-    except:
-        pass
-
-    ax_d.axvline(avg_val, color=TEXT_MAIN, linestyle=':', linewidth=1.5, alpha=0.9)
-    ax_d.text(avg_val, ax_d.get_ylim()[1]*0.95, " PROMEDIO", color=TEXT_MAIN, fontsize=8)
-
-    ax_d.set_title(f"DISTRIBUCIÓN: {title.upper()}", color=TEXT_MAIN, fontsize=10, pad=10, fontweight='bold')
-    ax_d.set_facecolor('none')
-    
-    ax_d.spines['top'].set_visible(False)
-    ax_d.spines['right'].set_visible(False)
-    ax_d.spines['left'].set_visible(False)
-    ax_d.spines['bottom'].set_color(TEXT_SUB)
-    
-    ax_d.set_xlim(0, max_val * 1.1) # Limitar eje X al maximo real + 10% margen
-    ax_d.ticklabel_format(style='plain', axis='x') # Evitar notacion cientifica (ese "1" raro)
-    
-    ax_d.tick_params(axis='x', colors=TEXT_MAIN)
-    ax_d.yaxis.set_visible(False)
-    ax_d.set_ylabel("")
-    ax_d.set_xlabel("Porcentaje (%)", color=TEXT_SUB)
-
-    # --- KEY POINTS MARKERS ---
-    marker_y_d = ax_d.get_ylim()[1] * 0.15
-    label_y_d = ax_d.get_ylim()[1] * 0.30
-    
-    # Max Point (Red) - Bold for hierarchy
-    ax_d.scatter([max_row[column]], [marker_y_d], color='#ff4444', s=35, zorder=5, marker='o')
-    ax_d.text(max_row[column], label_y_d, max_row['COMUNA'], color='#ff4444', fontsize=8, ha='center', fontweight='bold')
-    
-    # Min Point (Blue)
-    ax_d.scatter([min_row[column]], [marker_y_d], color=CYBER_CYAN, s=35, zorder=5, marker='o')
-    ax_d.text(min_row[column], label_y_d, min_row['COMUNA'], color=CYBER_CYAN, fontsize=8, ha='center', fontweight='medium')
-    
-    # Near Average Point (Yellow)
-    for _, row in near_avg_rows.iterrows():
-        ax_d.scatter([row[column]], [marker_y_d], color=CYBER_YELLOW, s=35, zorder=4, marker='o')
-        ax_d.text(row[column], label_y_d + (ax_d.get_ylim()[1] * 0.08), row['COMUNA'], color=CYBER_YELLOW, fontsize=8, ha='center', fontweight='medium')
-
-
-    plt.tight_layout()
-    path_dist = os.path.join(OUTPUT_DIR, f"{filename_base}_ELEM_DIST.png")
-    plt.savefig(path_dist, dpi=DPI, transparent=True)
-    plt.close()
-
-    # 4. LOLLIPOP CHART (Todas las comunas)
-    print(f"    Generando Lollipop Chart...")
-    fig_lol = plt.figure(figsize=(6, 8))
-    fig_lol.patch.set_alpha(0.0)
-    ax_lol = fig_lol.add_subplot(111)
-    
-    # Ordenar todas las comunas de menor a mayor
-    all_sorted = valid_df.sort_values(by=column, ascending=True)
-    y_pos = range(len(all_sorted))
-    
-    # Líneas horizontales (lollipop stems)
-    ax_lol.hlines(y=y_pos, xmin=0, xmax=all_sorted[column], color=TEXT_SUB, alpha=0.4, linewidth=1)
-    
-    # Puntos (lollipop heads) - color basado en valor
-    colors = [CYBER_MAGENTA if v == max_val else (CYBER_CYAN if v == all_sorted[column].min() else CYBER_GREEN) for v in all_sorted[column]]
-    ax_lol.scatter(all_sorted[column], y_pos, color=colors, s=40, zorder=3)
-    
-    # Etiquetas de comunas
-    ax_lol.set_yticks(y_pos)
-    ax_lol.set_yticklabels(all_sorted['COMUNA'], fontsize=6, color=TEXT_MAIN)
-    
-    # Línea de promedio
-    ax_lol.axvline(avg_val, color=CYBER_YELLOW, linestyle='--', linewidth=1.5, alpha=0.8, label=f'Promedio: {avg_val:.1f}%')
-    
-    # Estilo
-    ax_lol.set_title(f"RANKING COMUNAS: {title.upper()}", color=TEXT_MAIN, fontsize=11, fontweight='bold', pad=10)
-    ax_lol.set_xlabel("Porcentaje (%)", color=TEXT_SUB, fontsize=9)
-    ax_lol.set_facecolor('none')
-    ax_lol.spines['top'].set_visible(False)
-    ax_lol.spines['right'].set_visible(False)
-    ax_lol.spines['left'].set_color(TEXT_SUB)
-    ax_lol.spines['bottom'].set_color(TEXT_SUB)
-    ax_lol.tick_params(axis='x', colors=TEXT_SUB)
-    ax_lol.tick_params(axis='y', length=0)
-    ax_lol.legend(loc='lower right', fontsize=8, frameon=False, labelcolor=TEXT_MAIN)
-    
-    plt.tight_layout()
-    path_lol = os.path.join(OUTPUT_DIR, f"{filename_base}_LOLLIPOP.png")
-    plt.savefig(path_lol, dpi=DPI, transparent=True)
-    plt.close()
+    paths = render_infographic(valid_df, column, title, filename_base, description, area_name)
+    print(f"    Guardado Dash Pro: {paths['DASH']} (+ elementos individuales y lollipop)")
 
 
 def assign_metro_area(commune):
@@ -544,7 +267,113 @@ def assign_metro_area(commune):
     # clasificamos todo lo resultante como 'Gran Santiago' para el loop de generación.
     return 'Gran Santiago'
 
-def main():
+def build_render_jobs(df, stats, col, title, fname_base, desc, bins, todas_comunas=False, raster=False,
+                      basemap=None):
+    """
+    Lista de trabajos de render de un indicador (comuna × tipo de artefacto).
+    Cada trabajo lleva SOLO los datos que necesita: los valores por manzana de su comuna (la
+    geometría se carga en el proceso que dibuja, ver commune_blocks), o la tabla comunal de su
+    área metropolitana en el caso de la infografía. Con raster=True los mapas se recolorean sobre
+    el índice rasterizado de manzanas (block_raster.py) en vez de pasar los polígonos por matplotlib.
+    basemap: fuente de teselas del mapa base (basemap.py); cada proceso arma su proveedor.
+    """
+    jobs = []
+    for area in stats['AREA_METRO'].unique():
+        df_area = stats[stats['AREA_METRO'] == area]
+        if df_area.empty: continue
+        area_tag = area.replace(' ','')
+
+        # Caso "Alto" (Máximo valor) + opcionalmente todas las comunas del área
+        max_commune = df_area.loc[df_area[col].idxmax(), 'COMUNA']
+        targets = [(max_commune, f"{fname_base}_MAX_{area_tag}")]
+        if todas_comunas:
+            targets += [(c, f"{fname_base}_COMUNA_{area_tag}") for c in sorted(df_area['COMUNA'])]
+
+        for commune, fname in targets:
+            values = df.loc[df['COMUNA'] == commune, [ID_COL, 'COMUNA', col]]
+            if values.empty: continue
+            jobs.append({
+                'tipo': 'mapa', 'nombre': f"{fname}_{commune}", 'costo': len(values),
+                'valores': values, 'raster': raster,
+                'args': (commune, col, title, fname, desc),
+                'kwargs': {'bins': bins, 'basemap': basemap},
+            })
+
+        # --- GENERAR INFOGRAFÍA (SOLO UNA POR ÁREA/INDICADOR) ---
+        # Usamos el dataframe 'df_area' que contiene las estadísticas de todas las comunas del área
+        jobs.append({
+            'tipo': 'infografia', 'nombre': f"{fname_base}_DASH_{area_tag}", 'costo': 0,
+            'args': (df_area[['COMUNA', col]].copy(), col, title, fname_base, desc, area),
+            'kwargs': {},
+        })
+    return jobs
+
+def _init_render_worker():
+    """Cada proceso trabajador tiene su propio estado de matplotlib (backend sin GUI)"""
+    import matplotlib
+    matplotlib.use('Agg')
+    setup_plot()
+
+def _render_job(job):
+    """Ejecuta un trabajo de render y retorna (nombre, tipo, segundos, error)"""
+    import time
+    t0 = time.perf_counter()
+    error = None
+    try:
+        if job['tipo'] == 'mapa' and job['raster']:
+            from block_raster import render_commune_map
+            render_commune_map(job['valores'], *job['args'], **job['kwargs'])
+        elif job['tipo'] == 'mapa':
+            gdf = commune_blocks(job['valores'], job['args'][0])
+            generate_commune_map(gdf, *job['args'], **job['kwargs'])
+        else:
+            generate_infographic(*job['args'], **job['kwargs'])
+    except Exception as e:
+        error = str(e)
+    finally:
+        plt.close('all')
+    return job['nombre'], job['tipo'], time.perf_counter() - t0, error
+
+def run_render_jobs(jobs, n_jobs=1):
+    """
+    Ejecuta los trabajos de render. Con n_jobs > 1 usa un pool de procesos (contexto 'spawn',
+    igual en Windows y Linux); los trabajos más pesados (comunas con más manzanas) van primero.
+    """
+    import time
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    import multiprocessing
+
+    jobs = sorted(jobs, key=lambda j: (-j['costo'], j['nombre']))
+    print(f"Renderizando {len(jobs)} artefactos con {n_jobs} proceso(s)...")
+    t0 = time.perf_counter()
+    timings = []
+
+    def report(result):
+        nombre, tipo, secs, error = result
+        timings.append(result)
+        if error:
+            print(f"  [{tipo}] {nombre}: ERROR ({error})")
+        else:
+            print(f"  [{tipo}] {nombre}: {secs:.2f}s")
+
+    if n_jobs <= 1:
+        for job in jobs:
+            report(_render_job(job))
+    else:
+        ctx = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=n_jobs, mp_context=ctx,
+                                 initializer=_init_render_worker) as pool:
+            futures = [pool.submit(_render_job, job) for job in jobs]
+            for future in as_completed(futures):
+                report(future.result())
+
+    wall = time.perf_counter() - t0
+    cpu = sum(t[2] for t in timings)
+    print(f"Render total: {wall:.1f}s de pared, {cpu:.1f}s de CPU sumada ({len(timings)} trabajos)")
+    return timings
+
+@timed('generate_maps', args=('n_jobs', 'todas_comunas', 'raster', 'basemap'))
+def main(n_jobs=1, todas_comunas=False, raster=False, basemap=None):
     setup_plot()
     print(f"Cargando datos: {INPUT_FILE}...")
     
@@ -553,19 +382,26 @@ def main():
         print(f"ERROR: No se encuentra el archivo '{INPUT_FILE}'. Verifica la ruta.")
         return
 
-    gdf = gpd.read_file(INPUT_FILE)
+    # Fase 1: lectura TABULAR desde el caché columnar (se reconstruye solo si el GPKG cambió), solo
+    # las columnas del ranking y la clasificación. La geometría de render se lee después, por comuna
+    # y solo para las comunas que se dibujan (commune_geometry, en el proceso que renderiza).
+    columnas = ([ID_COL, 'DISTRITO', 'COMUNA', 'PROVINCIA', 'REGION', 'n_hog', 'n_per'] + list(COMPUESTOS)
+                + indicator_columns(INDICADORES_MAPA, composites=COMPUESTOS))
+    with stage('carga') as st:
+        df = load_indicators(columns=columnas, source=INPUT_FILE)
+        st.set(filas=len(df))
     
     # Limpieza de duplicados por si acaso
-    gdf = gdf.loc[:,~gdf.columns.duplicated()]
-    print(f"  Columnas cargadas: {len(gdf.columns)}")
+    df = df.loc[:,~df.columns.duplicated()]
+    print(f"  Columnas cargadas: {len(df.columns)}")
     
     # --- FILTRO REGION METROPOLITANA ---
     # Filtrar por substring para evitar problemas de encoding exacto
-    if 'REGION' in gdf.columns:
+    if 'REGION' in df.columns:
         print("Filtrando solo REGIÓN METROPOLITANA...")
         # Normalizar y buscar 'METROPOLITANA'
-        gdf = gdf[gdf['REGION'].astype(str).str.contains('METROPOLITANA', case=False, na=False)].copy()
-        print(f"Registros en RM: {len(gdf)}")
+        df = df[df['REGION'].astype(str).str.contains('METROPOLITANA', case=False, na=False)].copy()
+        print(f"Registros en RM: {len(df)}")
     else:
         print("ERROR: No se encontró columna REGION.")
         return
@@ -593,96 +429,41 @@ def main():
         ('pct_hacinamiento', 'Dormitorio Compartido 🛏️', 'dormitorio_compartido', 'Porcentaje de viviendas con hacinamiento', 'n_viv_hacinadas', 'n_vp_ocupada'),
     ]
     
-    # Check para agua (Legacy, se puede ignorar si no se usa)
-    cols_agua = ['n_fuente_agua_camion', 'n_fuente_agua_rio', 'n_fuente_agua_pozo']
-    has_agua_cols = all(c in gdf.columns for c in cols_agua)
-
     print("Calculando estadísticas metropolitanas...")
-    if 'COMUNA' not in gdf.columns:
+    if 'COMUNA' not in df.columns:
         print("ERROR: Falta columna COMUNA en el archivo.")
         return
 
     # 0. CALCULAR INDICADORES EN GDF (NIVEL MANZANA) PARA EL PLOT
-    # Esto faltaba y por eso fallaba el ploteo ("Fallback to continuous...")
+    # Definiciones únicas en indicators.INDICADORES (un solo pase matricial)
     print("  Calculando indicadores a nivel manzana...")
-    if 'n_hog_unipersonales' in gdf and 'n_hog' in gdf:
-        gdf['pct_alone'] = (gdf['n_hog_unipersonales'] / gdf['n_hog']) * 100
-    
-    if 'n_transporte_bicicleta' in gdf and 'n_per' in gdf:
-        gdf['pct_ciclistas'] = (gdf['n_transporte_bicicleta'] / gdf['n_per']) * 100
-        
-    if 'n_tenencia_propia_pagandose' in gdf and 'n_hog' in gdf:
-        gdf['pct_hipotecados'] = (gdf['n_tenencia_propia_pagandose'] / gdf['n_hog']) * 100
-        
-    if 'n_estcivcon_anul_sep_div' in gdf and 'n_per' in gdf:
-        gdf['pct_ex'] = (gdf['n_estcivcon_anul_sep_div'] / gdf['n_per']) * 100
-    
-    if 'n_tenencia_cedida_familiar' in gdf and 'n_hog' in gdf:
-         # Eliminamos pct_hotel_mama
-         pass
-    
-    # Solteros (Aún Sin Anillo) - nivel manzana (Denominador corregido: Suma Status Civil)
-    # Si no tenemos todas las columnas de estado civil, usamos n_per como fallback (aunque es imperfecto)
-    civ_cols = ['n_estcivcon_casado', 'n_estcivcon_conviviente', 'n_estcivcon_conv_civil', 
-                'n_estcivcon_anul_sep_div', 'n_estcivcon_viudo', 'n_estcivcon_soltero']
-    
-    if all(c in gdf.columns for c in civ_cols):
-        denom_civ = gdf[civ_cols].sum(axis=1).replace(0, 1) # Evitar div por cero
-        gdf['pct_soltero'] = (gdf['n_estcivcon_soltero'] / denom_civ) * 100
-    elif 'n_estcivcon_soltero' in gdf and 'n_per' in gdf:
-         gdf['pct_soltero'] = (gdf['n_estcivcon_soltero'] / gdf['n_per']) * 100
-
-    # Hacinamiento (Dormitorio Compartido) - nivel manzana (Denominador: n_vp_ocupada)
-    if 'n_viv_hacinadas' in gdf:
-        if 'n_vp_ocupada' in gdf:
-             denom_viv = gdf['n_vp_ocupada'].replace(0, 1)
-        elif 'n_vp' in gdf:
-             denom_viv = gdf['n_vp'].replace(0, 1) # Fallback
-        else: denom_viv = 1
-        
-        gdf['pct_hacinamiento'] = (gdf['n_viv_hacinadas'] / denom_viv) * 100
+    pcts_manzana = evaluate(df, INDICADORES_MAPA, nan_as_zero=True)
+    for c in INDICADORES_MAPA:
+        df[c] = pcts_manzana[c]
     
     # Rellenar indices compuestos si vienen nulos (ya calculados en process)
-    if 'idx_precariedad_hab' in gdf.columns:
-        gdf['idx_precariedad_hab'] = gdf['idx_precariedad_hab'].fillna(0)
-    if 'idx_vulnerabilidad_soc' in gdf.columns:
-        gdf['idx_vulnerabilidad_soc'] = gdf['idx_vulnerabilidad_soc'].fillna(0)
-    if 'idx_privilegio' in gdf.columns:
-        gdf['idx_privilegio'] = gdf['idx_privilegio'].fillna(0)
+    if 'idx_precariedad_hab' in df.columns:
+        df['idx_precariedad_hab'] = df['idx_precariedad_hab'].fillna(0)
+    if 'idx_vulnerabilidad_soc' in df.columns:
+        df['idx_vulnerabilidad_soc'] = df['idx_vulnerabilidad_soc'].fillna(0)
+    if 'idx_privilegio' in df.columns:
+        df['idx_privilegio'] = df['idx_privilegio'].fillna(0)
     
     # Rellenar NaNs con 0 para evitar huecos en el mapa
     for col, _, _, _, _, _ in indicadores_config:
-        if col in gdf.columns:
-            gdf[col] = gdf[col].fillna(0)
+        if col in df.columns:
+            df[col] = df[col].fillna(0)
 
     # 1. Agrupar sumarizando (Para ranking comunal)
-    # Lista exhaustiva de componentes para Z-Score
-    agg_cols = ['n_hog', 'n_per', 'n_vp', 'n_hog_unipersonales', 'n_transporte_bicicleta', 
-                'n_tenencia_propia_pagandose', 'n_estcivcon_anul_sep_div', 
-                # Precariedad
-                'n_viv_hacinadas', 'n_hog_allegados', 'n_viv_irrecuperables', 'n_tipo_viv_mediagua',
-                'n_mat_paredes_precarios', 'n_mat_techo_precarios', 'n_mat_piso_tierra',
-                'n_tenencia_arrendada_sin_contrato', 'n_tenencia_cedida_familiar',
-                'n_fuente_agua_pozo', 'n_fuente_agua_camion', 'n_serv_hig_no_tiene',
-                # Vulnerabilidad
-                'n_desocupado', 'n_ocupado', 'n_analfabet', 'n_jefatura_mujer', 'n_internet',
-                # Privilegio
-                'n_cine_terciaria_maestria_doctorado', 'n_transporte_auto', 'n_tenencia_propia_pagada',
-                'n_serv_internet_fija', 'n_serv_compu', 
-                'n_dormitorios_4', 'n_dormitorios_5', 'n_dormitorios_6_o_mas',
-                # Soltería (todas las columnas de estado civil para denominador correcto)
-                'n_estcivcon_soltero', 'n_estcivcon_casado', 'n_estcivcon_conviviente',
-                'n_estcivcon_conv_civil', 'n_estcivcon_viudo',
-                # Hacinamiento (n_viv_hacinadas ya está arriba en Precariedad, no duplicar)
-                # Viviendas Ocupadas
-                'n_vp_ocupada'
-                ]
-    
-    # IMPORTANTE: Asegurar que no hay duplicados en agg_cols
+    # Solo las columnas crudas que usan los indicadores y compuestos del registro
+    agg_cols = ['n_hog', 'n_per'] + indicator_columns(INDICADORES_MAPA, composites=COMPUESTOS)
     agg_cols = list(dict.fromkeys(agg_cols))  # Preserva orden, elimina duplicados
-    agg_cols = [c for c in agg_cols if c in gdf.columns]
+    agg_cols = [c for c in agg_cols if c in df.columns]
     
-    stats_raw = gdf.groupby(['COMUNA'])[agg_cols].sum().reset_index()
+    # Sumas por nivel territorial en un solo barrido (geography.aggregate_hierarchy); se usa el comunal
+    with stage('agregacion', filas=len(df)):
+        niveles = aggregate_hierarchy(df, INDICADORES_MAPA, composites=COMPUESTOS)
+        stats_raw = niveles['comuna'].reset_index()[['COMUNA'] + agg_cols]
     
     # 2. Asignar Área Metro
     stats_raw['AREA_METRO'] = stats_raw['COMUNA'].apply(assign_metro_area)
@@ -699,140 +480,21 @@ def main():
         return
 
     # 3. Calcular porcentajes (NIVEL COMUNA - Para el Ranking)
-    if 'n_hog_unipersonales' in stats and 'n_hog' in stats:
-        stats['pct_alone'] = (stats['n_hog_unipersonales'] / stats['n_hog']) * 100
-
-    if 'n_transporte_bicicleta' in stats and 'n_per' in stats: 
-        stats['pct_ciclistas'] = (stats['n_transporte_bicicleta'] / stats['n_per']) * 100
-
-    if 'n_tenencia_propia_pagandose' in stats and 'n_hog' in stats:
-        stats['pct_hipotecados'] = (stats['n_tenencia_propia_pagandose'] / stats['n_hog']) * 100
-
-    if 'n_estcivcon_anul_sep_div' in stats and 'n_per' in stats:
-        stats['pct_ex'] = (stats['n_estcivcon_anul_sep_div'] / stats['n_per']) * 100
-
-    # Solteros (Aún Sin Anillo)
-    civ_cols_agg = ['n_estcivcon_casado', 'n_estcivcon_conviviente', 'n_estcivcon_conv_civil', 
-                    'n_estcivcon_anul_sep_div', 'n_estcivcon_viudo', 'n_estcivcon_soltero']
-    
-    if all(c in stats for c in civ_cols_agg):
-         denom_civ_agg = stats[civ_cols_agg].sum(axis=1).replace(0, 1)
-         stats['pct_soltero'] = (stats['n_estcivcon_soltero'] / denom_civ_agg) * 100
-    elif 'n_estcivcon_soltero' in stats and 'n_per' in stats:
-        stats['pct_soltero'] = (stats['n_estcivcon_soltero'] / stats['n_per']) * 100
-
-    # Hacinamiento (Dormitorio Compartido)
-    if 'n_viv_hacinadas' in stats:
-        if 'n_vp_ocupada' in stats: denom_viv_agg = stats['n_vp_ocupada'].replace(0, 1)
-        elif 'n_vp' in stats: denom_viv_agg = stats['n_vp'].replace(0, 1)
-        else: denom_viv_agg = 1
-        
-        # Usamos .values para asegurar que no intente alinear índices si hay duplicados
-        val_numer = stats['n_viv_hacinadas']
-        val_denom = denom_viv_agg if isinstance(denom_viv_agg, (int, float)) else denom_viv_agg
-        
-        # Si es serie, asegurar tipos
-        if hasattr(val_denom, 'values'):
-             stats['pct_hacinamiento'] = (val_numer.values / val_denom.values) * 100
-        else:
-             stats['pct_hacinamiento'] = (val_numer / val_denom) * 100
-
-    # RECALCULO DE ÍNDICES COMPUESTOS A NIVEL COMUNAL (Z-SCORES) --
-    
-    # Helper seguro calculo
-    def calc_pct_stats(num, den):
-        if num in stats and den in stats:
-             return (stats[num] / stats[den].replace(0, 1)) * 100
-        return 0 # Si no existe, asume 0
-    
-    def z_score_stats(series):
-        std = series.std()
-        if std == 0: return series * 0
-        return (series - series.mean()) / std
-
-    # --- Precariedad Habitacional ---
-    p_hacinamiento = calc_pct_stats('n_viv_hacinadas', 'n_vp')
-    p_allegamiento = calc_pct_stats('n_hog_allegados', 'n_hog')
-    p_irrecuperable = calc_pct_stats('n_viv_irrecuperables', 'n_vp')
-    p_mediagua = calc_pct_stats('n_tipo_viv_mediagua', 'n_vp')
-    
-    # Materialidad Sumada
-    # Asegurar que existan (cols_extra)
-    mat_sum = 0
-    for c in ['n_mat_paredes_precarios', 'n_mat_techo_precarios', 'n_mat_piso_tierra']:
-        if c in stats: mat_sum += calc_pct_stats(c, 'n_vp')
-    p_mat_precari = mat_sum
-    
-    p_sin_contrato = calc_pct_stats('n_tenencia_arrendada_sin_contrato', 'n_hog')
-    p_cedida = calc_pct_stats('n_tenencia_cedida_familiar', 'n_hog')
-    
-    san_sum = 0
-    for c in ['n_serv_hig_no_tiene', 'n_fuente_agua_camion']:
-        if c in stats: san_sum += calc_pct_stats(c, 'n_vp')
-    p_saneamiento = san_sum
-
-    # --- Helper MinMax ---
-    def minmax_scale(series):
-        if series.max() == series.min(): return series * 0
-        return ((series - series.min()) / (series.max() - series.min())) * 100
+    # Mismas definiciones que a nivel manzana, sobre los conteos sumados (ponderado correcto)
+    pcts_comuna = evaluate(stats, INDICADORES_MAPA, nan_as_zero=True)
+    for c in INDICADORES_MAPA:
+        stats[c] = pcts_comuna[c]
 
     # ÍNDICES COMPUESTOS: Promedio simple de porcentajes reales (no MinMax relativo)
     # Esto evita que el máximo siempre sea 100% y muestra valores interpretables
-    
-    stats['idx_precariedad_hab'] = (
-        p_hacinamiento + p_allegamiento +
-        p_irrecuperable + p_mediagua +
-        p_mat_precari + p_saneamiento +
-        p_sin_contrato + p_cedida
-    ) / 8.0
-
-    # --- Vulnerabilidad Social ---
-    p_analfabeto = calc_pct_stats('n_analfabet', 'n_per')
-    p_jefa = calc_pct_stats('n_jefatura_mujer', 'n_hog')
-    
-    if 'n_ocupado' in stats and 'n_desocupado' in stats:
-        fl = stats['n_ocupado'] + stats['n_desocupado']
-        p_desempleo = (stats['n_desocupado'] / fl.replace(0, 1)) * 100
-    else: p_desempleo = 0 # Series 0
-        
-    if 'n_internet' in stats and 'n_hog' in stats:
-        pct_internet = (stats['n_internet'] / stats['n_hog'].replace(0,1)) * 100
-        p_sin_internet = 100 - pct_internet
-    else: p_sin_internet = 0
-        
-    stats['idx_vulnerabilidad_soc'] = (
-        p_desempleo + p_analfabeto + 
-        p_sin_internet + p_jefa
-    ) / 4.0
-
-    # --- Privilegio ---
-    p_profesional = calc_pct_stats('n_cine_terciaria_maestria_doctorado', 'n_per')
-    p_propia_pagada = calc_pct_stats('n_tenencia_propia_pagada', 'n_hog')
-    p_auto = calc_pct_stats('n_transporte_auto', 'n_per')
-    p_int_fija = calc_pct_stats('n_serv_internet_fija', 'n_hog')
-    p_computador = calc_pct_stats('n_serv_compu', 'n_hog')
-    
-    esp_sum = 0
-    for c in ['n_dormitorios_4', 'n_dormitorios_5', 'n_dormitorios_6_o_mas']:
-        if c in stats: esp_sum += calc_pct_stats(c, 'n_vp')
-    p_espacio = esp_sum
-
-    stats['idx_privilegio'] = (
-        p_profesional +
-        p_propia_pagada +
-        p_auto +
-        p_int_fija +
-        p_computador +
-        p_espacio
-    ) / 6.0
-
-
-
-
+    compuestos_comuna = evaluate_composites(stats, method='promedio')
+    for c in compuestos_comuna.columns:
+        stats[c] = compuestos_comuna[c]
 
     print(f"Comunas analizadas (raw): {len(stats)}")
     
     # 4. Loop Generación
+    jobs = []
     for col, title, fname_base, desc, _, _ in indicadores_config:
         if col not in stats.columns: 
             print(f"Saltando {col} (no existe en datos)")
@@ -858,32 +520,36 @@ def main():
         # 4.2 CÁLCULO DE LEYENDA GLOBAL (Unified Legend)
         # Usamos todos los valores válidos del dataset (ya filtrado por Urbano)
         try:
-            global_classifier = mapclassify.FisherJenks(valid_data_for_bins, k=5)
-            global_bins = global_classifier.bins
+            # Cacheado por indicador + geografía + hash de datos (classification.py)
+            with stage('clasificacion', indicador=col):
+                global_bins = fisher_jenks_bins(valid_data_for_bins, k=5, indicator=col, geography='RM_comunas')
             print(f"  Bins Globales para {col}: {global_bins}")
         except Exception as e:
             print(f"  Error calculando bins globales: {e}")
             global_bins = None
 
-        for area in stats['AREA_METRO'].unique():
-            df_area = stats[stats['AREA_METRO'] == area]
-            if df_area.empty: continue
-            
-            # Caso "Alto" (Máximo valor) - SOLO ESTE
-            try:
-                max_row = df_area.loc[df_area[col].idxmax()]
-                fname_max = f"{fname_base}_MAX_{area.replace(' ','')}"
-                # Pasamos 'global_bins'
-                generate_commune_map(gdf, max_row['COMUNA'], col, title, fname_max, desc, bins=global_bins)
-                
-                # --- GENERAR INFOGRAFÍA (SOLO UNA POR ÁREA/INDICADOR) ---
-                # Usamos el dataframe 'df_area' que contiene las estadísticas de todas las comunas del área
-                generate_infographic(df_area, col, title, fname_base, desc, area)
-
-            except Exception as e:
-                print(f"Error generando max para {area}: {e}")
+        # 4.3 Planificación de renders (comuna × tipo de artefacto) para este indicador
+        jobs += build_render_jobs(df, stats, col, title, fname_base, desc, global_bins,
+                                  todas_comunas=todas_comunas, raster=raster, basemap=basemap)
+
+    # 5. Ejecución (serial o en pool de procesos)
+    with stage('render', trabajos=len(jobs), procesos=n_jobs):
+        run_render_jobs(jobs, n_jobs=n_jobs)
 
     print("¡Generación finalizada con éxito!")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    import argparse
+    parser = argparse.ArgumentParser(description="Mapas e infografías Censo 2024 (RM)")
+    parser.add_argument('--jobs', type=int, default=1,
+                        help="Procesos de render en paralelo (default: 1, serial)")
+    parser.add_argument('--todas-comunas', action='store_true',
+                        help="Renderizar el mapa de TODAS las comunas por indicador (no solo la máxima)")
+    parser.add_argument('--raster', action='store_true',
+                        help="Mapas comunales recoloreando el índice rasterizado de manzanas (block_raster.py)")
+    parser.add_argument('--basemap', nargs='?', const=BASEMAP_SOURCE, default=None, metavar='FUENTE',
+                        help=f"Mapa base bajo los datos: MBTiles, directorio XYZ o URL (default: {BASEMAP_SOURCE})")
+    add_cli_arguments(parser)
+    args = parser.parse_args()
+    configure_from_args(args)
+    main(n_jobs=args.jobs, todas_comunas=args.todas_comunas, raster=args.raster, basemap=args.basemap)
\ No newline at end of file
@@ -0,0 +1,215 @@
+"""
+Geografía: asignación de comunas a áreas metropolitanas y agregación por jerarquía territorial.
+
+Reemplaza la comparación de strings fila a fila (assign_metro_area + .apply) por una
+tabla de búsqueda precalculada que produce un Categorical en una sola operación.
+
+Jerarquía (manzana -> distrito -> comuna -> provincia -> región, y comuna -> área metropolitana):
+un código entero por nivel calculado una vez, sumas de todos los niveles en un solo barrido
+(np.add.reduceat sobre códigos ordenados) e indicadores derivados de numeradores/denominadores
+sumados. hierarchy_tables() deja cada nivel como tabla cacheada:
+
+    tablas = hierarchy_tables()
+    tablas['region']                                           # ranking regional
+    drill_down(tablas, 'comuna', 'ÑUÑOA', hacia='distrito')    # bajar de nivel sin groupby
+    load_indicators(comunas=['ÑUÑOA'])                         # y a manzanas, desde el caché columnar
+"""
+import pandas as pd
+
+from columnar_cache import SOURCE_FILE
+
+AREAS_METRO = {
+    'Gran Santiago': [
+        'SANTIAGO', 'CERRILLOS', 'CERRO NAVIA', 'CONCHALÍ', 'EL BOSQUE', 'ESTACIÓN CENTRAL', 'HUECHURABA', 'INDEPENDENCIA',
+        'LA CISTERNA', 'LA FLORIDA', 'LA GRANJA', 'LA PINTANA', 'LA REINA', 'LAS CONDES', 'LO BARNECHEA', 'LO ESPEJO',
+        'LO PRADO', 'MACUL', 'MAIPÚ', 'ÑUÑOA', 'PEDRO AGUIRRE CERDA', 'PEÑALOLÉN', 'PROVIDENCIA', 'PUDAHUEL', 'QUILICURA',
+        'QUINTA NORMAL', 'RECOLETA', 'RENCA', 'SAN JOAQUÍN', 'SAN MIGUEL', 'SAN RAMÓN', 'VITACURA', 'PUENTE ALTO', 'SAN BERNARDO'
+    ],
+    'Gran Valparaíso': ['VALPARAISO', 'VIÑA DEL MAR', 'CONCÓN', 'QUILPUÉ', 'VILLA ALEMANA'],
+    'Gran Concepción': [
+        'CONCEPCIÓN', 'TALCAHUANO', 'CHIGUAYANTE', 'SAN PEDRO DE LA PAZ', 'HUALPÉN', 'PENCO', 'TOMÉ', 'CORONEL', 'LOTA', 'HUALQUI'
+    ],
+}
+
+# Comuna (normalizada) -> área metropolitana
+COMUNA_A_AREA = {c: area for area, comunas in AREAS_METRO.items() for c in comunas}
+
+
+def metro_areas(comunas):
+    """Categorical de área metropolitana para una serie de comunas (NaN si no pertenece a ninguna)"""
+    comunas = pd.Series(comunas)
+    # Normalizamos solo los valores únicos (52 comunas), no las filas
+    uniques = pd.unique(comunas)
+    lookup = {c: COMUNA_A_AREA.get(str(c).upper().strip()) for c in uniques}
+    return pd.Categorical(comunas.map(lookup), categories=list(AREAS_METRO))
+
+
+# === Jerarquía territorial ===
+# manzana -> distrito -> comuna -> provincia -> región, y comuna -> área metropolitana.
+# Cada nivel se agrega desde su nivel hijo: (nivel, hijo, columna de etiqueta)
+NIVELES = [
+    ('distrito', 'manzana', 'DISTRITO'),
+    ('comuna', 'distrito', 'COMUNA'),
+    ('provincia', 'comuna', 'PROVINCIA'),
+    ('region', 'provincia', 'REGION'),
+    ('area_metro', 'comuna', 'AREA_METRO'),
+]
+ID_MANZANA = 'MANZENT'
+# Sin columna DISTRITO, el distrito censal sale del prefijo del MANZENT (CUT 5 dígitos + distrito 2)
+DISTRITO_PREFIX = 7
+JERARQUIA_DIR = '_jerarquia'   # dentro del caché columnar: se invalida con él
+
+
+def district_labels(df):
+    """Etiqueta única de distrito censal por manzana (CUT + distrito)"""
+    if 'DISTRITO' in df.columns and 'CUT' in df.columns:
+        cut = df['CUT'].astype(str).str.strip()
+        return (cut + '-' + df['DISTRITO'].astype(str).str.strip().str.zfill(2)).to_numpy()
+    return df[ID_MANZANA].astype(str).str[:DISTRITO_PREFIX].to_numpy()
+
+
+def hierarchy_codes(df):
+    """
+    Códigos enteros por nivel, calculados una vez.
+    Retorna {nivel: (codigos_de_las_filas_del_hijo, etiquetas)}: los códigos de un nivel indexan
+    los grupos de su nivel hijo (para 'distrito', las filas). -1 = sin grupo (ej. comuna fuera de
+    un área metropolitana).
+    """
+    import numpy as np
+
+    labels_by_row = {
+        'distrito': district_labels(df),
+        'comuna': df['COMUNA'].astype(str).to_numpy(),
+        'provincia': df['PROVINCIA'].astype(str).to_numpy() if 'PROVINCIA' in df.columns else None,
+        'region': df['REGION'].astype(str).to_numpy() if 'REGION' in df.columns else None,
+    }
+    row_codes = {'manzana': np.arange(len(df))}
+    codes = {}
+    for nivel, hijo, _ in NIVELES:
+        if hijo not in row_codes:
+            continue
+        if nivel == 'area_metro':
+            areas = metro_areas(codes['comuna'][1])
+            codes[nivel] = (np.asarray(areas.codes, dtype=np.int64), pd.Index(areas.categories))
+            continue
+        if labels_by_row[nivel] is None:
+            continue
+        row_code, labels = pd.factorize(labels_by_row[nivel], sort=True)
+        row_codes[nivel] = row_code
+        # Código del padre para cada grupo del hijo (niveles anidados: basta una fila por grupo)
+        parent = np.empty(row_codes[hijo].max() + 1 if len(df) else 0, dtype=np.int64)
+        parent[row_codes[hijo]] = row_code
+        codes[nivel] = (parent, pd.Index(labels))
+    return codes
+
+
+def grouped_sum(X, codes, n_groups):
+    """Suma de filas por grupo con np.add.reduceat sobre los códigos ordenados (-1 se descarta)"""
+    import numpy as np
+
+    keep = codes >= 0
+    order = np.argsort(codes, kind='stable')[np.count_nonzero(~keep):]
+    sorted_codes = codes[order]
+    out = np.zeros((n_groups, X.shape[1]), dtype=X.dtype)
+    if len(order):
+        starts = np.flatnonzero(np.r_[True, np.diff(sorted_codes) != 0])
+        out[sorted_codes[starts]] = np.add.reduceat(X[order], starts, axis=0)
+    return out
+
+
+def aggregate_hierarchy(df, names=None, composites=None, composite_method='promedio'):
+    """
+    Conteos sumados + indicadores ponderados para todos los niveles en un solo barrido:
+    las filas se reducen una vez a distritos y cada nivel superior se reduce desde la tabla
+    (pequeña) de su hijo. Los indicadores se derivan de numeradores/denominadores sumados.
+    Retorna {nivel: DataFrame indexado por etiqueta, con 'manzanas', las etiquetas de sus
+    ancestros, los conteos n_* y los indicadores}.
+    """
+    import numpy as np
+    from indicators import COMPUESTOS, INDICADORES, column_matrix, compile_registry, evaluate_composites
+    from indicators import numerators_denominators, ratios, required_columns
+
+    names = list(INDICADORES) if names is None else list(names)
+    composites = list(COMPUESTOS) if composites is None else list(composites)
+    cols = required_columns(names, composites=composites)
+    plan = compile_registry(names)
+    plan_idx = [cols.index(c) for c in plan['cols']]
+    codes = hierarchy_codes(df)
+
+    # Una columna extra de unos: cantidad de manzanas por grupo
+    X = np.hstack([column_matrix(df, cols), np.ones((len(df), 1))])
+    sums = {'manzana': X}
+    tables = {}
+    for nivel, hijo, label_col in NIVELES:
+        if nivel not in codes:
+            continue
+        parent, labels = codes[nivel]
+        S = grouped_sum(sums[hijo], parent, len(labels))
+        sums[nivel] = S
+        table = pd.DataFrame(S[:, :-1], index=pd.Index(labels, name=label_col), columns=cols)
+        table.insert(0, 'manzanas', S[:, -1].astype(np.int64))
+        N, D = numerators_denominators(S[:, plan_idx], plan)
+        table[plan['names']] = ratios(N, D, plan)
+        if composites:
+            table = table.join(evaluate_composites(table, composites, method=composite_method))
+        # Áreas metropolitanas sin manzanas en los datos (ej. solo RM) no aparecen
+        tables[nivel] = table[table['manzanas'] > 0]
+
+    # Etiquetas de todos los ancestros en cada tabla (para filtrar al bajar de nivel)
+    for nivel, table in tables.items():
+        group_codes = {nivel: np.arange(len(table))}
+        position = 1
+        for padre, hijo, label_col in NIVELES:
+            if hijo not in group_codes or padre not in codes:
+                continue
+            parent, labels = codes[padre]
+            child = group_codes[hijo]
+            group_codes[padre] = np.where(child >= 0, parent[np.maximum(child, 0)], -1)
+            values = labels.to_numpy(dtype=object)[np.maximum(group_codes[padre], 0)]
+            table.insert(position, label_col, np.where(group_codes[padre] >= 0, values, None))
+            position += 1
+    return tables
+
+
+_TABLES = {}
+
+
+def hierarchy_tables(names=None, composites=None, source=SOURCE_FILE):
+    """
+    Tablas de todos los niveles, cacheadas en memoria (por proceso) y en disco junto al caché
+    columnar (se invalidan cuando cambia el GPKG). Solo la primera llamada lee manzanas.
+    """
+    import hashlib
+    import json
+    import os
+    from columnar_cache import cache_key, cache_path, load_indicators
+    from indicators import COMPUESTOS, INDICADORES, required_columns
+
+    names = list(INDICADORES) if names is None else list(names)
+    composites = list(COMPUESTOS) if composites is None else list(composites)
+    key = cache_key(source)
+    spec = hashlib.blake2b(json.dumps([names, composites]).encode(), digest_size=6).hexdigest()
+    memo = (key, spec)
+    if memo in _TABLES:
+        return _TABLES[memo]
+
+    folder = os.path.join(cache_path(key), JERARQUIA_DIR, spec)
+    files = {nivel: os.path.join(folder, f"{nivel}.parquet") for nivel, _, _ in NIVELES}
+    if os.path.isdir(folder):
+        tables = {nivel: pd.read_parquet(path) for nivel, path in files.items() if os.path.exists(path)}
+    else:
+        cols = [ID_MANZANA, 'CUT', 'DISTRITO', 'COMUNA', 'PROVINCIA', 'REGION']
+        df = load_indicators(columns=cols + required_columns(names, composites=composites), source=source)
+        tables = aggregate_hierarchy(df, names, composites)
+        os.makedirs(folder, exist_ok=True)
+        for nivel, table in tables.items():
+            table.to_parquet(files[nivel])
+    _TABLES[memo] = tables
+    return tables
+
+
+def drill_down(tables, nivel, etiqueta, hacia):
+    """Filas del nivel 'hacia' contenidas en 'etiqueta' del nivel superior (ej. comuna -> distritos)"""
+    label_col = {n: col for n, _, col in NIVELES}[nivel]
+    table = tables[hacia]
+    return table[table[label_col] == etiqueta]
@@ -0,0 +1,323 @@
+"""
+Recalculo incremental de indicadores cuando solo cambian sus definiciones.
+
+process_data() deja, además del GPKG y el caché columnar:
+  - cache/base_rm.parquet         tabla base RM ya filtrada y compacta (n_* + identificadores, sin geometría,
+                                  con las máscaras de supresión del INE)
+  - cache/indicadores_manifest.json  hash de la definición de cada columna pct_*/idx_* de la salida
+
+Con eso, `python process_census_data.py --incremental` (o `python incremental.py`):
+  1. compara el hash de cada definición del registro con el manifiesto
+  2. recalcula SOLO las columnas cambiadas (o nuevas) sobre la tabla base
+  3. reescribe solo esas columnas: UPDATE sobre el GPKG (SQLite) y en cada partición del caché columnar
+
+Cambiar un peso de idx_privilegio toma segundos en vez de un ETL completo. Si un indicador nuevo
+necesita columnas crudas que la base no tiene, la base se vuelve a leer (sin reescribir geometrías).
+"""
+import hashlib
+import json
+import os
+import shutil
+import time
+
+from columnar_cache import CACHE_DIR, CACHE_PREFIX, cache_key, cache_path, file_hash
+from indicators import COMPUESTOS, INDICADORES
+
+BASE_FILE = os.path.join(CACHE_DIR, 'base_rm.parquet')
+MANIFEST_FILE = os.path.join(CACHE_DIR, 'indicadores_manifest.json')
+COMPOSITE_METHOD = 'zscore'
+ID_COL = 'MANZENT'
+DERIVED_PREFIXES = ('pct_', 'idx_')
+
+
+def _digest(obj):
+    text = json.dumps(obj, sort_keys=True, ensure_ascii=False)
+    return hashlib.blake2b(text.encode(), digest_size=8).hexdigest()
+
+
+def _indicator_definition(name):
+    d = INDICADORES[name]
+    return {'num': d['num'], 'den': d['den'], 'complemento': bool(d.get('complemento'))}
+
+
+def definition_hashes(simples, composites=None, method=COMPOSITE_METHOD):
+    """Hash por columna de salida: su definición y la de todo lo que usa (componentes, pesos, método)"""
+    composites = list(COMPUESTOS) if composites is None else list(composites)
+    hashes = {name: _digest(_indicator_definition(name)) for name in simples}
+    for comp in composites:
+        spec = COMPUESTOS[comp]
+        hashes[comp] = _digest({
+            'metodo': method,
+            'componentes': {c: [w, _indicator_definition(c)] for c, w in spec['componentes'].items()},
+        })
+    return hashes
+
+
+def base_key(source, where):
+    """La base depende del archivo fuente y del filtro, no de las definiciones"""
+    return _digest({'fuente': file_hash(source), 'where': where})
+
+
+# === Tabla base ===
+
+def save_base(df, source, where, requested, suppressed=None):
+    """
+    Guarda la tabla base (sin geometría ni columnas derivadas) con su clave en los metadatos Parquet.
+    requested: columnas pedidas al driver; las que la capa no tenga cuentan como 0 (igual que el ETL).
+    suppressed: máscaras de supresión de compact_frame, alineadas con las filas de df.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    from compact import SUPPRESSED_COL, pack_rows
+
+    geom = getattr(df, '_geometry_column_name', None)
+    cols = [c for c in df.columns if c != geom and not c.startswith(DERIVED_PREFIXES)]
+    table = pa.Table.from_pandas(df[cols], preserve_index=False)
+    suppressed_columns, bits = pack_rows(suppressed or {}, len(df))
+    if bits is not None:
+        table = table.append_column(SUPPRESSED_COL, bits)
+    meta = dict(table.schema.metadata or {})
+    meta[b'censo_base_key'] = base_key(source, where).encode()
+    meta[b'censo_base_pedidas'] = json.dumps(list(requested)).encode()
+    meta[b'censo_base_suprimidas'] = json.dumps(suppressed_columns).encode()
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp = BASE_FILE + '.tmp'
+    pq.write_table(table.replace_schema_metadata(meta), tmp)
+    os.replace(tmp, BASE_FILE)
+
+
+def load_base(source, where, columns, suppressed=False):
+    """
+    Tabla base vigente con las columnas pedidas, o None si falta / está obsoleta / le faltan columnas.
+    suppressed: si True retorna (df, máscaras de supresión) como columnar_cache.load_indicators.
+    """
+    import pyarrow.parquet as pq
+    from compact import SUPPRESSED_COL, unpack_rows
+
+    if not os.path.exists(BASE_FILE):
+        return None
+    schema = pq.read_schema(BASE_FILE)
+    meta = schema.metadata or {}
+    requested = set(json.loads(meta.get(b'censo_base_pedidas', b'[]')))
+    if meta.get(b'censo_base_key', b'').decode() != base_key(source, where):
+        return None
+    if any(c not in requested and c not in schema.names for c in columns):
+        return None
+    cols = [c for c in dict.fromkeys(columns) if c in schema.names and c != SUPPRESSED_COL]
+    if not suppressed:
+        return pq.read_table(BASE_FILE, columns=cols).to_pandas()
+    if SUPPRESSED_COL in schema.names:
+        cols.append(SUPPRESSED_COL)
+    table = pq.read_table(BASE_FILE, columns=cols)
+    masks = {}
+    if SUPPRESSED_COL in table.column_names:
+        masks = unpack_rows(table.column(SUPPRESSED_COL), json.loads(meta[b'censo_base_suprimidas']))
+        table = table.drop_columns([SUPPRESSED_COL])
+    return table.to_pandas(), masks
+
+
+def build_base():
+    """Relee la capa con filtro RM y las columnas crudas actuales (sin geometría) y la compacta"""
+    import pandas as pd
+    import process_census_data as etl
+    from compact import compact_frame
+
+    print(f"  Releyendo base RM desde {etl.INPUT_FILE} (columnas crudas nuevas)...")
+    requested = etl.required_columns()
+    etl.check_columns([etl.LAYER_NAME])
+    gdf, _, _ = etl.read_layer_pushdown(etl.INPUT_FILE, etl.LAYER_NAME, columns=requested, where=etl.RM_WHERE)
+    df = pd.DataFrame(gdf.drop(columns=[gdf.geometry.name]))
+    df = df[df['REGION'].astype(str).str.contains('METROPOLITANA', case=False, na=False)].reset_index(drop=True)
+    suprimidos = compact_frame(df)
+    save_base(df, etl.INPUT_FILE, etl.RM_WHERE, requested, suppressed=suprimidos)
+    return df
+
+
+# === Manifiesto ===
+
+def load_manifest():
+    if not os.path.exists(MANIFEST_FILE):
+        return None
+    with open(MANIFEST_FILE, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_manifest(hashes, source, where, output):
+    manifest = {'base': base_key(source, where), 'salida': os.path.abspath(output), 'columnas': hashes}
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with open(MANIFEST_FILE, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+
+
+def changed_columns(hashes, manifest, source, where):
+    """Columnas cuyo hash difiere del manifiesto (todas si la base cambió)"""
+    if manifest is None or manifest.get('base') != base_key(source, where):
+        return list(hashes)
+    previous = manifest.get('columnas', {})
+    return [c for c, h in hashes.items() if previous.get(c) != h]
+
+
+# === Reescritura de columnas ===
+
+# Funciones que GDAL registra y que usan los triggers del R-tree del GPKG. Solo se ejecutan si cambia
+# la geometría o el fid, lo que aquí nunca ocurre, pero SQLite exige que existan al preparar el UPDATE.
+_RTREE_FUNCTIONS = ['ST_IsEmpty', 'ST_MinX', 'ST_MaxX', 'ST_MinY', 'ST_MaxY']
+
+
+def _geometry_untouched(*_):
+    raise RuntimeError("El recálculo incremental no debe modificar geometrías")
+
+
+def _sqlite_type(values):
+    return 'REAL' if values.dtype.kind == 'f' else 'INTEGER'
+
+
+def update_gpkg_columns(path, ids, values):
+    """
+    UPDATE de columnas en el GPKG (SQLite), alineando por MANZENT vía fid. Crea las columnas nuevas.
+    values: DataFrame con las columnas a escribir, en el orden de ids.
+    """
+    import sqlite3
+    import numpy as np
+    import pandas as pd
+    import pyogrio
+
+    layer = pyogrio.list_layers(path)[0][0]
+    fids = pyogrio.read_dataframe(path, layer=layer, columns=[ID_COL], read_geometry=False,
+                                  fid_as_index=True)
+    fid_by_id = pd.Series(fids.index.to_numpy(), index=fids[ID_COL].astype(str).to_numpy())
+    fid = fid_by_id.reindex(pd.Index(ids).astype(str)).to_numpy()
+    ok = ~pd.isna(fid)
+
+    con = sqlite3.connect(path)
+    for name in _RTREE_FUNCTIONS:
+        con.create_function(name, 1, _geometry_untouched)
+    try:
+        existing = {row[1] for row in con.execute(f'PRAGMA table_info("{layer}")')}
+        for col in values.columns:
+            if col not in existing:
+                con.execute(f'ALTER TABLE "{layer}" ADD COLUMN "{col}" {_sqlite_type(values[col])}')
+        sets = ', '.join(f'"{c}" = ?' for c in values.columns)
+        data = values.to_numpy(dtype=np.float64)[ok]
+        rows = [tuple(None if v != v else float(v) for v in row) + (int(f),) for row, f in zip(data, fid[ok])]
+        con.executemany(f'UPDATE "{layer}" SET {sets} WHERE fid = ?', rows)
+        con.commit()
+    finally:
+        con.close()
+    return int(ok.sum())
+
+
+def _current_cache_root(rows):
+    """Caché columnar existente (write_cache deja uno solo) con la misma cantidad de filas"""
+    if not os.path.isdir(CACHE_DIR):
+        return None
+    for name in os.listdir(CACHE_DIR):
+        root = os.path.join(CACHE_DIR, name)
+        meta_path = os.path.join(root, '_meta.json')
+        if name.startswith(CACHE_PREFIX) and not name.endswith('.tmp') and os.path.exists(meta_path):
+            with open(meta_path, encoding='utf-8') as f:
+                if json.load(f).get('rows') == rows:
+                    return root
+    return None
+
+
+def update_cache_columns(root, ids, values, source):
+    """Reemplaza/agrega columnas en cada partición del caché columnar y lo re-indexa con la nueva clave"""
+    import glob
+    import pandas as pd
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    from columnar_cache import PARTITION_COL
+    from geography import JERARQUIA_DIR
+
+    # Las tablas por nivel territorial derivan de las columnas que cambian: se recalculan al pedirlas
+    shutil.rmtree(os.path.join(root, JERARQUIA_DIR), ignore_errors=True)
+    lookup = values.set_axis(pd.Index(ids).astype(str))
+    for part in glob.glob(os.path.join(root, f'{PARTITION_COL}=*', '*.parquet')):
+        table = pq.read_table(part)
+        part_ids = pd.Index(table.column(ID_COL).to_pandas().astype(str))
+        new = lookup.reindex(part_ids)
+        for col in values.columns:
+            arr = pa.array(new[col].to_numpy(), type=pa.from_numpy_dtype(values[col].dtype))
+            if col in table.column_names:
+                table = table.set_column(table.column_names.index(col), col, arr)
+            else:
+                table = table.append_column(col, arr)
+        pq.write_table(table, part)
+
+    meta_path = os.path.join(root, '_meta.json')
+    with open(meta_path, encoding='utf-8') as f:
+        meta = json.load(f)
+    meta['columns'] += [c for c in values.columns if c not in meta['columns']]
+    meta['key'] = cache_key(source)
+    with open(meta_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=1)
+    new_root = cache_path(meta['key'])
+    if new_root != root:
+        os.replace(root, new_root)
+    return new_root
+
+
+# === Orquestación ===
+
+def update_indicators(force=None):
+    """
+    Recalcula solo las columnas de indicadores cuya definición cambió.
+    force: lista de columnas a recalcular igual. Retorna la lista de columnas reescritas.
+    """
+    import pandas as pd
+    import process_census_data as etl
+    from indicators import evaluate, evaluate_composites, required_columns
+
+    t0 = time.perf_counter()
+    source, where, output = etl.INPUT_FILE, etl.RM_WHERE, etl.OUTPUT_FILE
+    manifest = load_manifest()
+    if manifest is None or not os.path.exists(output):
+        print("Sin manifiesto o salida previa: corriendo el ETL completo...")
+        etl.process_data()
+        return None
+
+    hashes = definition_hashes(etl.INDICADORES_SIMPLES)
+    changed = changed_columns(hashes, manifest, source, where)
+    changed += [c for c in (force or []) if c in hashes and c not in changed]
+    if not changed:
+        print("Definiciones sin cambios: nada que recalcular.")
+        return []
+    print(f"Columnas a recalcular: {changed}")
+
+    simples = [c for c in changed if c in INDICADORES]
+    composites = [c for c in changed if c in COMPUESTOS]
+    needed = [ID_COL] + required_columns(simples, composites=composites)
+    base = load_base(source, where, needed)
+    if base is None:
+        base = build_base()
+
+    values = pd.DataFrame(index=base.index)
+    if simples:
+        values = values.join(evaluate(base, simples, dtype=etl.INDICATOR_DTYPE))
+    if composites:
+        values = values.join(evaluate_composites(base, composites, method=COMPOSITE_METHOD)
+                             .astype(etl.INDICATOR_DTYPE))
+    ids = base[ID_COL].to_numpy()
+
+    root = _current_cache_root(len(base))
+    n = update_gpkg_columns(output, ids, values[changed])
+    print(f"  GPKG: {len(changed)} columna(s) actualizadas en {n} manzanas")
+    if root:
+        root = update_cache_columns(root, ids, values[changed], output)
+        print(f"  Caché columnar actualizado: {root}")
+    else:
+        print("  Sin caché columnar vigente: se reconstruirá en la próxima lectura")
+
+    save_manifest(hashes, source, where, output)
+    print(f"¡Recalculo incremental listo en {time.perf_counter() - t0:.1f}s!")
+    return changed
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Recalcula solo los indicadores cuya definición cambió")
+    parser.add_argument('--forzar', nargs='*', default=None, help="Columnas a recalcular aunque no cambien")
+    args = parser.parse_args()
+    update_indicators(force=args.forzar)
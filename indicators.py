@@ -0,0 +1,398 @@
+"""
+Registro único de indicadores del Censo 2024 y motor de evaluación vectorizado.
+
+Cada indicador se define UNA vez:
+    'pct_x': {'num': [columnas n_* sumadas], 'den': [columnas n_* sumadas], 'signo': +1/-1, ...}
+  - num/den: listas de columnas crudas (se suman). pct = num / den * 100
+  - signo: +1 si "más es mejor", -1 si "más es peor" (para rankings mejor/peor)
+  - complemento: True para 100 - pct (ej. % SIN internet)
+
+Los índices compuestos declaran sus componentes y pesos en COMPUESTOS.
+
+El motor compila el registro a dos matrices de coeficientes (columnas crudas -> numeradores
+únicos, columnas crudas -> denominadores únicos) y evalúa todo en un solo paso NumPy sobre
+una matriz contigua de las columnas n_*. Numeradores/denominadores compartidos por varios
+indicadores se calculan una sola vez, y como son sumas, se pueden agregar a cualquier nivel
+(comuna, provincia, ...) antes de dividir: el promedio ponderado correcto.
+
+Agregar un indicador = agregar una entrada al registro.
+"""
+import numpy as np
+import pandas as pd
+
+MAYOR_ES_MEJOR = 1
+MAYOR_ES_PEOR = -1
+
+INDICADORES = {
+    # --- DEMOGRAFÍA ---
+    'pct_adulto_mayor':  {'num': ['n_edad_60_mas'], 'den': ['n_per'], 'signo': MAYOR_ES_PEOR,
+                          'desc': 'Población de 60 años o más'},
+    'pct_infancia':      {'num': ['n_edad_0_5', 'n_edad_6_13'], 'den': ['n_per'], 'signo': MAYOR_ES_MEJOR,
+                          'desc': 'Población de 0 a 13 años'},
+    'pct_edad_25_44':    {'num': ['n_edad_25_44'], 'den': ['n_per'], 'signo': MAYOR_ES_MEJOR,
+                          'desc': 'Población de 25 a 44 años'},
+    'pct_edad_45_59':    {'num': ['n_edad_45_59'], 'den': ['n_per'], 'signo': MAYOR_ES_MEJOR,
+                          'desc': 'Población de 45 a 59 años'},
+    'pct_inmigrantes':   {'num': ['n_inmigrantes'], 'den': ['n_per'], 'signo': MAYOR_ES_MEJOR,
+                          'desc': 'Población inmigrante'},
+    'pct_jefa_hogar':    {'num': ['n_jefatura_mujer'], 'den': ['n_hog'], 'signo': MAYOR_ES_PEOR,
+                          'desc': 'Hogares con jefatura femenina'},
+    'pct_alone':         {'num': ['n_hog_unipersonales'], 'den': ['n_hog'], 'signo': MAYOR_ES_PEOR,
+                          'desc': 'Hogares unipersonales'},
+
+    # --- ESTADO CIVIL ---
+    'pct_soltero':       {'num': ['n_estcivcon_soltero'],
+                          'den': ['n_estcivcon_casado', 'n_estcivcon_conviviente', 'n_estcivcon_conv_civil',
+                                  'n_estcivcon_anul_sep_div', 'n_estcivcon_viudo', 'n_estcivcon_soltero'],
+                          'signo': MAYOR_ES_PEOR,
+                          'desc': 'Personas solteras sobre el total con estado civil declarado'},
+    'pct_ex':            {'num': ['n_estcivcon_anul_sep_div'], 'den': ['n_per'], 'signo': MAYOR_ES_PEOR,
+                          'desc': 'Personas anuladas, separadas o divorciadas'},
+    'pct_viudo':         {'num': ['n_estcivcon_viudo'], 'den': ['n_per'], 'signo': MAYOR_ES_PEOR,
+                          'desc': 'Personas viudas'},
+
+    # --- VIVIENDA ---
+    'pct_hacinamiento':  {'num': ['n_viv_hacinadas'], 'den': ['n_vp_ocupada'], 'signo': MAYOR_ES_PEOR,
+                          'desc': 'Viviendas ocupadas con hacinamiento'},
+    'pct_hacinamiento_vp': {'num': ['n_viv_hacinadas'], 'den': ['n_vp'], 'signo': MAYOR_ES_PEOR,
+                          'desc': 'Viviendas con hacinamiento (sobre viviendas particulares)'},
+    'pct_allegamiento':  {'num': ['n_hog_allegados'], 'den': ['n_hog'], 'signo': MAYOR_ES_PEOR,
+                          'desc': 'Hogares allegados'},
+    'pct_viv_irrecuperable': {'num': ['n_viv_irrecuperables'], 'den': ['n_vp'], 'signo': MAYOR_ES_PEOR,
+                          'desc': 'Viviendas irrecuperables'},
+    'pct_mediagua':      {'num': ['n_tipo_viv_mediagua'], 'den': ['n_vp'], 'signo': MAYOR_ES_PEOR,
+                          'desc': 'Viviendas tipo mediagua'},
+    'pct_depto':         {'num': ['n_tipo_viv_depto'], 'den': ['n_hog'], 'signo': MAYOR_ES_MEJOR,
+                          'desc': 'Departamentos por hogar'},
+    'pct_mat_precario':  {'num': ['n_mat_paredes_precarios', 'n_mat_techo_precarios', 'n_mat_piso_tierra'],
+                          'den': ['n_vp'], 'signo': MAYOR_ES_PEOR,
+                          'desc': 'Materialidad precaria (paredes, techo, piso de tierra)'},
+    'pct_deficit_cuanti': {'num': ['n_deficit_cuantitativo'], 'den': ['n_vp'], 'signo': MAYOR_ES_PEOR,
+                          'desc': 'Déficit habitacional cuantitativo'},
+    'pct_espacio':       {'num': ['n_dormitorios_4', 'n_dormitorios_5', 'n_dormitorios_6_o_mas'],
+                          'den': ['n_vp'], 'signo': MAYOR_ES_MEJOR,
+                          'desc': 'Viviendas con 4 o más dormitorios'},
+
+    # --- TENENCIA ---
+    'pct_arrendada_sin_contrato': {'num': ['n_tenencia_arrendada_sin_contrato'], 'den': ['n_hog'],
+                          'signo': MAYOR_ES_PEOR, 'desc': 'Hogares arrendando sin contrato'},
+    'pct_cedida_familiar': {'num': ['n_tenencia_cedida_familiar'], 'den': ['n_hog'], 'signo': MAYOR_ES_PEOR,
+                          'desc': 'Viviendas cedidas por un familiar'},
+    'pct_propia_pagada': {'num': ['n_tenencia_propia_pagada'], 'den': ['n_hog'], 'signo': MAYOR_ES_MEJOR,
+                          'desc': 'Vivienda propia pagada'},
+    'pct_hipotecados':   {'num': ['n_tenencia_propia_pagandose'], 'den': ['n_hog'], 'signo': MAYOR_ES_PEOR,
+                          'desc': 'Vivienda propia pagándose'},
+    'pct_arriendo':      {'num': ['n_tenencia_arrendada_contrato', 'n_tenencia_arrendada_sin_contrato'],
+                          'den': ['n_hog'], 'signo': MAYOR_ES_PEOR, 'desc': 'Hogares arrendatarios'},
+    'pct_propietario':   {'num': ['n_tenencia_propia_pagada', 'n_tenencia_propia_pagandose'],
+                          'den': ['n_hog'], 'signo': MAYOR_ES_MEJOR, 'desc': 'Hogares propietarios'},
+
+    # --- SERVICIOS BÁSICOS ---
+    'pct_deficit_agua':  {'num': ['n_fuente_agua_camion', 'n_fuente_agua_rio', 'n_fuente_agua_pozo'],
+                          'den': ['n_vp'], 'signo': MAYOR_ES_PEOR,
+                          'desc': 'Viviendas sin red pública de agua (camión, río, pozo)'},
+    'pct_saneamiento':   {'num': ['n_serv_hig_no_tiene', 'n_fuente_agua_camion'], 'den': ['n_vp'],
+                          'signo': MAYOR_ES_PEOR, 'desc': 'Sin servicio higiénico o con agua de camión'},
+    'pct_sin_alcantarillado': {'num': ['n_serv_hig_fosa', 'n_serv_hig_no_tiene'], 'den': ['n_vp'],
+                          'signo': MAYOR_ES_PEOR, 'desc': 'Viviendas sin alcantarillado'},
+    'pct_lena':          {'num': ['n_comb_calefaccion_lena'], 'den': ['n_vp'], 'signo': MAYOR_ES_PEOR,
+                          'desc': 'Calefacción a leña'},
+
+    # --- CONECTIVIDAD ---
+    'pct_internet':      {'num': ['n_internet'], 'den': ['n_hog'], 'signo': MAYOR_ES_MEJOR,
+                          'desc': 'Hogares con internet'},
+    'pct_sin_internet':  {'num': ['n_internet'], 'den': ['n_hog'], 'complemento': True,
+                          'signo': MAYOR_ES_PEOR, 'desc': 'Hogares sin internet (brecha digital)'},
+    'pct_internet_fija': {'num': ['n_serv_internet_fija'], 'den': ['n_hog'], 'signo': MAYOR_ES_MEJOR,
+                          'desc': 'Hogares con internet fija'},
+    'pct_computador':    {'num': ['n_serv_compu'], 'den': ['n_hog'], 'signo': MAYOR_ES_MEJOR,
+                          'desc': 'Hogares con computador'},
+
+    # --- EDUCACIÓN / TRABAJO ---
+    'pct_profesional':   {'num': ['n_cine_terciaria_maestria_doctorado'], 'den': ['n_per'],
+                          'signo': MAYOR_ES_MEJOR, 'desc': 'Educación terciaria, maestría o doctorado'},
+    'pct_analfabeto':    {'num': ['n_analfabet'], 'den': ['n_per'], 'signo': MAYOR_ES_PEOR,
+                          'desc': 'Población analfabeta'},
+    'pct_desocupado':    {'num': ['n_desocupado'], 'den': ['n_ocupado', 'n_desocupado'], 'signo': MAYOR_ES_PEOR,
+                          'desc': 'Desocupados sobre la fuerza de trabajo'},
+    'pct_independiente': {'num': ['n_cise_rec_independientes'], 'den': ['n_per'], 'signo': MAYOR_ES_MEJOR,
+                          'desc': 'Trabajadores independientes'},
+
+    # --- TRANSPORTE ---
+    'pct_auto':          {'num': ['n_transporte_auto'], 'den': ['n_per'], 'signo': MAYOR_ES_MEJOR,
+                          'desc': 'Viajes en auto'},
+    'pct_transporte_publico': {'num': ['n_transporte_publico'], 'den': ['n_per'], 'signo': MAYOR_ES_MEJOR,
+                          'desc': 'Viajes en transporte público'},
+    'pct_ciclistas':     {'num': ['n_transporte_bicicleta'], 'den': ['n_per'], 'signo': MAYOR_ES_MEJOR,
+                          'desc': 'Viajes en bicicleta'},
+    'pct_camina':        {'num': ['n_transporte_camina'], 'den': ['n_per'], 'signo': MAYOR_ES_MEJOR,
+                          'desc': 'Viajes a pie'},
+}
+
+# Índices compuestos: componente -> peso. Metodología (ver README):
+#   'zscore'   -> promedio ponderado de Z-Scores de cada componente, escalado 0-100 (Min-Max)
+#   'promedio' -> promedio ponderado de los porcentajes (valores interpretables, nivel comunal)
+COMPUESTOS = {
+    'idx_precariedad_hab': {
+        'componentes': {
+            'pct_hacinamiento_vp': 1.0, 'pct_allegamiento': 1.0,
+            'pct_viv_irrecuperable': 1.0, 'pct_mediagua': 1.0,
+            'pct_mat_precario': 1.0, 'pct_saneamiento': 1.0,
+            'pct_arrendada_sin_contrato': 1.0, 'pct_cedida_familiar': 1.0,
+        },
+        'signo': MAYOR_ES_PEOR,
+        'desc': 'Hacinamiento, Allegamiento, Calidad Viv., Saneamiento, Tenencia Inf.',
+    },
+    'idx_vulnerabilidad_soc': {
+        'componentes': {
+            'pct_desocupado': 1.0, 'pct_analfabeto': 1.0,
+            'pct_sin_internet': 1.0, 'pct_jefa_hogar': 1.0,
+        },
+        'signo': MAYOR_ES_PEOR,
+        'desc': 'Desempleo, Analfabetismo, Brecha Digital, Jefatura Fem.',
+    },
+    'idx_privilegio': {
+        'componentes': {
+            'pct_profesional': 1.0, 'pct_propia_pagada': 1.0, 'pct_auto': 1.0,
+            'pct_internet_fija': 1.0, 'pct_computador': 1.0, 'pct_espacio': 1.0,
+        },
+        'signo': MAYOR_ES_MEJOR,
+        'desc': 'Educ. Sup., Auto, Casa Pagada, Internet Fija, Computador, Espacio',
+    },
+}
+
+
+def compile_registry(names=None, registry=INDICADORES):
+    """
+    Compila los indicadores pedidos a un plan de evaluación:
+      cols      -> columnas crudas necesarias (orden de la matriz X)
+      A_num     -> (len(cols), n_num) coeficientes de numeradores únicos
+      A_den     -> (len(cols), n_den) coeficientes de denominadores únicos
+      num_idx / den_idx -> numerador/denominador de cada indicador
+      complemento -> máscara de indicadores 100 - pct
+    """
+    names = list(registry) if names is None else list(names)
+    missing = [n for n in names if n not in registry]
+    if missing:
+        raise KeyError(f"Indicadores no registrados: {missing}")
+
+    cols, nums, dens = [], [], []
+    num_idx, den_idx = [], []
+    for name in names:
+        spec = registry[name]
+        for c in spec['num'] + spec['den']:
+            if c not in cols: cols.append(c)
+        num_key = tuple(sorted(spec['num']))
+        den_key = tuple(sorted(spec['den']))
+        if num_key not in nums: nums.append(num_key)
+        if den_key not in dens: dens.append(den_key)
+        num_idx.append(nums.index(num_key))
+        den_idx.append(dens.index(den_key))
+
+    pos = {c: i for i, c in enumerate(cols)}
+    A_num = np.zeros((len(cols), len(nums)))
+    for j, key in enumerate(nums):
+        A_num[[pos[c] for c in key], j] = 1.0
+    A_den = np.zeros((len(cols), len(dens)))
+    for j, key in enumerate(dens):
+        A_den[[pos[c] for c in key], j] = 1.0
+
+    return {
+        'names': names,
+        'cols': cols,
+        'A_num': A_num,
+        'A_den': A_den,
+        'num_idx': np.array(num_idx, dtype=np.intp),
+        'den_idx': np.array(den_idx, dtype=np.intp),
+        'complemento': np.array([bool(registry[n].get('complemento')) for n in names]),
+    }
+
+
+def required_columns(names=None, composites=()):
+    """Columnas crudas n_* necesarias para evaluar indicadores y compuestos"""
+    names = list(names or [])
+    for comp in composites:
+        names += [c for c in COMPUESTOS[comp]['componentes'] if c not in names]
+    return compile_registry(names)['cols']
+
+
+def column_matrix(df, cols, dtype=np.float64):
+    """Matriz contigua (filas x columnas) de conteos; nulos y columnas ausentes -> 0"""
+    X = np.zeros((len(df), len(cols)), dtype=dtype)
+    for j, c in enumerate(cols):
+        if c in df.columns:
+            X[:, j] = df[c].to_numpy(dtype=dtype, na_value=0)
+    return X
+
+
+def numerators_denominators(X, plan):
+    """Un solo paso matricial: todos los numeradores y denominadores únicos"""
+    dtype = X.dtype
+    N = X @ plan['A_num'].astype(dtype, copy=False)
+    D = X @ plan['A_den'].astype(dtype, copy=False)
+    return N, D
+
+
+def ratios(N, D, plan, nan_as_zero=False):
+    """
+    Porcentajes a partir de numeradores/denominadores (de manzana o ya agregados).
+    Denominador 0 -> NaN (o 0 si nan_as_zero, convención de los Z-Scores).
+    """
+    num = N[:, plan['num_idx']]
+    den = D[:, plan['den_idx']]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        P = np.where(den > 0, num / den, np.nan) * 100
+    if nan_as_zero:
+        P = np.nan_to_num(P, nan=0.0)
+    comp = plan['complemento']
+    if comp.any():
+        P[:, comp] = 100 - P[:, comp]
+    return P
+
+
+def evaluate(df, names=None, dtype=np.float64, nan_as_zero=False):
+    """Evalúa indicadores del registro sobre un DataFrame de conteos (manzanas o agregados)"""
+    plan = compile_registry(names)
+    X = column_matrix(df, plan['cols'], dtype=dtype)
+    N, D = numerators_denominators(X, plan)
+    P = ratios(N, D, plan, nan_as_zero=nan_as_zero)
+    return pd.DataFrame(P, index=df.index, columns=plan['names'])
+
+
+def aggregate(df, by, names=None, dtype=np.float64, nan_as_zero=False):
+    """
+    Indicadores a nivel agregado (promedio ponderado correcto).
+    Suma los numeradores/denominadores únicos por grupo y recién entonces divide.
+    Las filas sin etiqueta de grupo (nulos) se descartan.
+    """
+    from geography import grouped_sum
+
+    plan = compile_registry(names)
+    X = column_matrix(df, plan['cols'], dtype=dtype)
+    N, D = numerators_denominators(X, plan)
+    codes, groups = pd.factorize(df[by], sort=True)
+    ND = grouped_sum(np.hstack([N, D]), codes, len(groups))
+    P = ratios(ND[:, :N.shape[1]], ND[:, N.shape[1]:], plan, nan_as_zero=nan_as_zero)
+    return pd.DataFrame(P, index=pd.Index(groups, name=by), columns=plan['names'])
+
+
+def _zscore_matrix(P, mean=None, std=None):
+    """
+    Z-Score por columna (ddof=1, como pandas). Columnas constantes -> 0.
+    mean/std pueden venir ya calculados (ej. momentos acumulados en streaming), por fila o por columna.
+    """
+    if mean is None:
+        mean = P.mean(axis=0)
+        std = P.std(axis=0, ddof=1) if len(P) > 1 else np.zeros(P.shape[1])
+    safe = np.where(std > 0, std, 1.0)
+    return np.where(std > 0, (P - mean) / safe, 0.0)
+
+
+def minmax_scale(M, lo, hi):
+    """Escala 0-100 con mínimo/máximo dados (por columna o por fila). Rango nulo -> 0"""
+    span = hi - lo
+    return np.where(span > 0, (M - lo) / np.where(span > 0, span, 1.0), 0.0) * 100
+
+
+def _minmax_matrix(M):
+    """Escala 0-100 por columna. Columnas constantes -> 0"""
+    return minmax_scale(M, M.min(axis=0), M.max(axis=0))
+
+
+def group_range(M, codes, n_groups):
+    """Mínimo y máximo de cada columna por grupo (matrices grupos x columnas)"""
+    lo = np.full((n_groups, M.shape[1]), np.inf)
+    hi = np.full((n_groups, M.shape[1]), -np.inf)
+    np.minimum.at(lo, codes, M)
+    np.maximum.at(hi, codes, M)
+    return lo, hi
+
+
+def composite_weights(composites=None, registry=COMPUESTOS):
+    """Componentes (orden) y matriz de pesos (componentes x compuestos)"""
+    composites = list(registry) if composites is None else list(composites)
+    components = []
+    for comp in composites:
+        components += [c for c in registry[comp]['componentes'] if c not in components]
+    W = np.zeros((len(components), len(composites)))
+    for j, comp in enumerate(composites):
+        for c, w in registry[comp]['componentes'].items():
+            W[components.index(c), j] = w
+    return composites, components, W
+
+
+def evaluate_composites(df, composites=None, method='zscore', dtype=np.float64, registry=COMPUESTOS):
+    """
+    Índices compuestos en un pase: todos los componentes en una matriz, Z-Score (o no)
+    por columna y combinación lineal con la matriz de pesos.
+    """
+    composites, components, W = composite_weights(composites, registry)
+    P = evaluate(df, components, dtype=dtype, nan_as_zero=True).to_numpy()
+    W = W.astype(P.dtype)
+    wsum = W.sum(axis=0)
+    if method == 'zscore':
+        M = _minmax_matrix(composite_scores(P, W))
+    elif method == 'promedio':
+        M = (P @ W) / wsum
+    else:
+        raise ValueError(f"Método desconocido: {method}")
+    return pd.DataFrame(M, index=df.index, columns=composites)
+
+
+def composite_scores(P, W, mean=None, std=None):
+    """Promedio ponderado de Z-Scores de los componentes, antes del escalado 0-100"""
+    W = W.astype(P.dtype)
+    return (_zscore_matrix(P, mean, std) @ W) / W.sum(axis=0)
+
+
+class ComponentMoments:
+    """
+    Acumula count, suma y suma de cuadrados de cada componente por grupo (región o país),
+    lote a lote. Es todo lo que necesitan los Z-Scores: la media y la desviación (ddof=1)
+    salen de los momentos sin volver a tener el país completo en memoria.
+    """
+
+    def __init__(self, n_components):
+        self.n_components = n_components
+        self.groups = {}
+        self.count = np.zeros(0, dtype=np.int64)
+        self.total = np.zeros((0, n_components))
+        self.sumsq = np.zeros((0, n_components))
+
+    def codes(self, keys):
+        """Código entero de cada fila, registrando grupos nuevos"""
+        codes, uniques = pd.factorize(pd.Series(keys), sort=False)
+        for key in uniques:
+            if key not in self.groups:
+                self.groups[key] = len(self.groups)
+        grow = len(self.groups) - len(self.count)
+        if grow:
+            self.count = np.r_[self.count, np.zeros(grow, dtype=np.int64)]
+            self.total = np.vstack([self.total, np.zeros((grow, self.n_components))])
+            self.sumsq = np.vstack([self.sumsq, np.zeros((grow, self.n_components))])
+        remap = np.array([self.groups[k] for k in uniques], dtype=np.int64)
+        return remap[codes]
+
+    def update(self, P, keys):
+        codes = self.codes(keys)
+        n = len(self.groups)
+        self.count += np.bincount(codes, minlength=n)
+        for j in range(self.n_components):
+            self.total[:, j] += np.bincount(codes, weights=P[:, j], minlength=n)
+            self.sumsq[:, j] += np.bincount(codes, weights=P[:, j] ** 2, minlength=n)
+        return codes
+
+    def merge(self, other):
+        """Suma los momentos de otro acumulador (ej. calculado en otro proceso)"""
+        codes = self.codes(list(other.groups))
+        self.count[codes] += other.count
+        self.total[codes] += other.total
+        self.sumsq[codes] += other.sumsq
+
+    def mean_std(self):
+        """(media, desviación ddof=1) por grupo: matrices grupos x componentes"""
+        n = self.count[:, None].astype(np.float64)
+        mean = self.total / np.maximum(n, 1)
+        var = (self.sumsq - self.total * mean) / np.maximum(n - 1, 1)
+        std = np.where(n > 1, np.sqrt(np.maximum(var, 0.0)), 0.0)
+        return mean, std
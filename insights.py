@@ -0,0 +1,139 @@
+"""
+Insights comunales por área metropolitana (mejor / peor / brecha) en un solo pase.
+
+Reemplaza a analyze_insights.py, analyze_water_insights.py, analyze_migration_insights.py y
+analyze_overcrowding_insights.py: se leen una sola vez las columnas n_* necesarias (sin geometría)
+desde el caché columnar, se hace UNA reducción agrupada por comuna para todos los indicadores
+pedidos (geography.hierarchy_tables, que además la deja cacheada) y se imprime/exporta cada insight desde esa tabla.
+
+Agregar un insight = agregar una entrada a INSIGHTS (el indicador debe existir en el registro).
+
+Uso:
+    python insights.py                       # todos
+    python insights.py internet agua         # algunos
+    python insights.py --csv insights.csv    # exportar tabla
+"""
+import sys
+
+import pandas as pd
+
+from geography import AREAS_METRO, hierarchy_tables
+from indicators import INDICADORES, MAYOR_ES_MEJOR
+
+# Configuración
+INPUT_FILE = 'Manzanas_Indicadores.gpkg'
+
+# 'mejor'/'peor' se deducen del signo del indicador en el registro
+INSIGHTS = {
+    'internet': {
+        'indicador': 'pct_internet',
+        'titulo': ' 🚨 INSIGHTS: BRECHA DIGITAL (INTERNET) 🚨',
+        'mejor': '✅ Mejor Conectividad:',
+        'peor': '❌ Peor Conectividad: ',
+        'brecha': ('⚠️ Brecha Digital:    ', 'puntos de diferencia'),
+        'decimales': 1,
+    },
+    'agua': {
+        'indicador': 'pct_deficit_agua',
+        'titulo': ' 💧 INSIGHTS: CRISIS HÍDRICA (DÉFICIT) 💧',
+        'mejor': '✅ Mejor Acceso (0% Déficit es ideal):',
+        'peor': '❌ Mayor Déficit:                     ',
+        'brecha': None,
+        'decimales': 2,
+    },
+    'migracion': {
+        'indicador': 'pct_inmigrantes',
+        'titulo': ' 🌎 INSIGHTS: POBLACIÓN MIGRANTE 🌎',
+        'mejor': '⬆️ Mayor concentración:',
+        'peor': '⬇️ Menor concentración:',
+        'brecha': ('🔄 Diferencia:         ', 'pts'),
+        'decimales': 1,
+    },
+    'hacinamiento': {
+        'indicador': 'pct_hacinamiento_vp',
+        'titulo': ' 🏠 INSIGHTS: HACINAMIENTO CRÍTICO 🏠',
+        'mejor': '✅ Menor Hacinamiento:',
+        'peor': '❌ Mayor Hacinamiento:',
+        'brecha': ('⚠️ Diferencia:        ', 'pts'),
+        'decimales': 1,
+    },
+}
+
+
+def commune_table(indicadores, source=INPUT_FILE):
+    """Tabla comunal de todos los indicadores pedidos (nivel 'comuna' de la jerarquía, cacheado)"""
+    return hierarchy_tables(indicadores, composites=[], source=source)['comuna'].reset_index()
+
+
+def compute_insights(stats, names):
+    """Mejor / peor / brecha por área metropolitana para cada insight"""
+    rows = []
+    for name in names:
+        cfg = INSIGHTS[name]
+        col = cfg['indicador']
+        signo = INDICADORES[col]['signo']
+        valid = stats.dropna(subset=[col, 'AREA_METRO'])
+        for area, df in valid.groupby('AREA_METRO', observed=True, sort=False):
+            hi = df.loc[df[col].idxmax()]
+            lo = df.loc[df[col].idxmin()]
+            best, worst = (hi, lo) if signo == MAYOR_ES_MEJOR else (lo, hi)
+            rows.append({
+                'insight': name, 'indicador': col, 'area': area,
+                'mejor_comuna': best['COMUNA'], 'mejor_valor': best[col],
+                'peor_comuna': worst['COMUNA'], 'peor_valor': worst[col],
+                'brecha': abs(hi[col] - lo[col]),
+            })
+    return pd.DataFrame(rows)
+
+
+def print_insights(result, names):
+    for name in names:
+        cfg = INSIGHTS[name]
+        d = cfg['decimales']
+        print("\n" + "="*40)
+        print(cfg['titulo'])
+        print("="*40 + "\n")
+        block = result[result['insight'] == name]
+        for area in AREAS_METRO:
+            row = block[block['area'] == area]
+            if row.empty: continue
+            row = row.iloc[0]
+            print(f"📍 {area.upper()}")
+            print(f"   {cfg['mejor']} {row.mejor_comuna} ({row.mejor_valor:.{d}f}%)")
+            print(f"   {cfg['peor']} {row.peor_comuna} ({row.peor_valor:.{d}f}%)")
+            if cfg['brecha']:
+                label, unit = cfg['brecha']
+                print(f"   {label} {row.brecha:.{d}f} {unit}")
+            print("-" * 30)
+
+
+def main(names=None, csv_path=None, source=INPUT_FILE):
+    names = list(names or INSIGHTS)
+    unknown = [n for n in names if n not in INSIGHTS]
+    if unknown:
+        print(f"Insights desconocidos: {unknown}. Disponibles: {list(INSIGHTS)}")
+        return None
+
+    print(f"Cargando datos para insights: {', '.join(names)}...")
+    try:
+        stats = commune_table([INSIGHTS[n]['indicador'] for n in names], source=source)
+    except Exception as e:
+        print(f"Error cargando datos: {e}")
+        return None
+
+    result = compute_insights(stats, names)
+    print_insights(result, names)
+    if csv_path:
+        result.to_csv(csv_path, index=False)
+        print(f"\n✅ Insights exportados a '{csv_path}'")
+    return result
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Insights comunales por área metropolitana")
+    parser.add_argument('insights', nargs='*', help=f"Insights a calcular (default: todos): {', '.join(INSIGHTS)}")
+    parser.add_argument('--csv', default=None, help="Exportar la tabla de insights a CSV")
+    args = parser.parse_args()
+    if main(args.insights, csv_path=args.csv) is None:
+        sys.exit(1)
@@ -1,11 +1,10 @@
-import geopandas as gpd
-import pandas as pd
-
 # Configuración
 INPUT_FILE = 'Cartografia_censo2024_Pais.gpkg'
 LAYER_NAME = 'Manzanas_CPV24'
 
 def inspect_columns():
+    import geopandas as gpd
+
     print(f"Inspeccionando capa: {LAYER_NAME} en {INPUT_FILE}...")
     try:
         # Leemos solo 1 fila para ver las columnas
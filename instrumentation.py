@@ -0,0 +1,338 @@
+"""
+Instrumentación por etapa del pipeline (tiempos + memoria máxima).
+
+    from instrumentation import stage, timed
+
+    with stage('lectura', capa=layer):
+        ...
+
+    @timed('mapa_comunal', args=('commune_name', 'column'))
+    def generate_commune_map(...): ...
+
+Desactivada por defecto: stage() retorna un contexto nulo compartido y timed() llama directo
+a la función, así que puede quedar en el código de producción. Se activa con --traza en los
+scripts (ver add_cli_arguments) o con variables de entorno (que heredan los procesos de render):
+
+    CENSO_TRACE=traza.jsonl          una línea JSON por etapa (todos los procesos agregan al mismo archivo)
+    CENSO_TRACE_CHROME=traza.json    al terminar, la traza en formato Chrome (chrome://tracing, Perfetto)
+    CENSO_PROFILE=indicadores        perfil de UNA etapa -> perfil_<etapa>_<pid>.prof (o .html)
+    CENSO_PROFILER=cprofile          o 'pyinstrument' (opcional, si está instalado)
+
+Uso:
+    python instrumentation.py traza.jsonl                     # resumen por etapa
+    python instrumentation.py traza.jsonl --chrome traza.json # convertir a Chrome trace
+"""
+import atexit
+import functools
+import json
+import os
+import sys
+import threading
+import time
+
+ENV_TRACE = 'CENSO_TRACE'
+ENV_CHROME = 'CENSO_TRACE_CHROME'
+ENV_PROFILE = 'CENSO_PROFILE'
+ENV_PROFILER = 'CENSO_PROFILER'
+ENV_OWNER = 'CENSO_TRACE_OWNER'   # PID que escribe la traza Chrome al salir
+
+_enabled = False
+_trace_path = None
+_profile_stage = None
+_profiler = 'cprofile'
+_local = threading.local()
+_lock = threading.Lock()
+
+
+# === Memoria ===
+
+def reset_peak_rss():
+    """Reinicia el high-water mark de RSS (Linux: /proc/self/clear_refs). Retorna False si no se puede"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def _proc_status(field):
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(field):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def peak_rss_mb():
+    """Memoria residente máxima del proceso (MB). VmHWM si existe, si no ru_maxrss; None sin ninguno (Windows)"""
+    peak = _proc_status('VmHWM:')
+    if peak is not None:
+        return peak
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1024 / 1024 if sys.platform == 'darwin' else rss / 1024
+
+
+def rss_mb():
+    """Memoria residente actual (MB); en plataformas sin /proc, la máxima (None si no se puede medir)"""
+    rss = _proc_status('VmRSS:')
+    return rss if rss is not None else peak_rss_mb()
+
+
+def _round_mb(value):
+    return None if value is None else round(value, 1)
+
+
+# === Configuración ===
+
+def enable(trace=None, chrome=None, profile_stage=None, profiler=None, fresh=False):
+    """
+    Activa la instrumentación en este proceso y en los que lance (vía variables de entorno).
+    trace: archivo JSON lines (default 'traza.jsonl'); chrome: traza Chrome a escribir al salir.
+    fresh: vaciar la traza (solo el proceso principal; los hijos siempre agregan).
+    """
+    global _enabled, _trace_path, _profile_stage, _profiler
+    _trace_path = os.path.abspath(trace or os.environ.get(ENV_TRACE) or 'traza.jsonl')
+    os.environ[ENV_TRACE] = _trace_path
+    if fresh and os.path.exists(_trace_path):
+        os.remove(_trace_path)
+    if chrome:
+        os.environ[ENV_CHROME] = os.path.abspath(chrome)
+        os.environ[ENV_OWNER] = str(os.getpid())
+    if profile_stage:
+        os.environ[ENV_PROFILE] = profile_stage
+    if profiler:
+        os.environ[ENV_PROFILER] = profiler
+    _profile_stage = os.environ.get(ENV_PROFILE)
+    _profiler = os.environ.get(ENV_PROFILER, 'cprofile')
+    _enabled = True
+    reset_peak_rss()
+
+
+def enabled():
+    return _enabled
+
+
+def add_cli_arguments(parser):
+    """Agrega --traza / --chrome-trace / --perfil / --perfilador a un argparse"""
+    group = parser.add_argument_group('instrumentación')
+    group.add_argument('--traza', nargs='?', const='traza.jsonl', default=None,
+                       help="Registrar tiempos y memoria por etapa en JSON lines (default: traza.jsonl)")
+    group.add_argument('--chrome-trace', default=None, help="Escribir además una traza Chrome (implica --traza)")
+    group.add_argument('--perfil', default=None, metavar='ETAPA', help="Perfilar una etapa (implica --traza)")
+    group.add_argument('--perfilador', choices=['cprofile', 'pyinstrument'], default='cprofile')
+
+
+def configure_from_args(args):
+    if args.traza or args.chrome_trace or args.perfil:
+        enable(trace=args.traza, chrome=args.chrome_trace, profile_stage=args.perfil, profiler=args.perfilador,
+               fresh=True)
+        print(f"Instrumentación activa -> {_trace_path}")
+
+
+# === Etapas ===
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+
+_NULL = _NullStage()
+
+
+class _Stage:
+    __slots__ = ('name', 'attrs', 't0', 'wall0', 'peak', 'parent', 'profiler')
+
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = attrs
+
+    def set(self, **attrs):
+        """Agregar atributos a la etapa en curso (ej. filas leídas)"""
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        stack = _stack()
+        # El pico de memoria de las etapas abiertas se acumula antes de reiniciar el contador
+        hwm = peak_rss_mb()
+        if hwm is not None:
+            for open_stage in stack:
+                open_stage.peak = max(open_stage.peak, hwm)
+        reset_peak_rss()
+        self.peak = 0.0
+        self.parent = stack[-1].name if stack else None
+        stack.append(self)
+        self.profiler = _start_profiler() if _profile_stage == self.name else None
+        self.wall0 = time.time()
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        secs = time.perf_counter() - self.t0
+        if self.profiler is not None:
+            _stop_profiler(self.profiler, self.name)
+        stack = _stack()
+        stack.pop()
+        hwm = peak_rss_mb()
+        if hwm is not None:
+            self.peak = max(self.peak, hwm)
+            for open_stage in stack:
+                open_stage.peak = max(open_stage.peak, self.peak)
+        record = {
+            'etapa': self.name, 'padre': self.parent, 'inicio': self.wall0, 'segundos': round(secs, 6),
+            'rss_mb': _round_mb(rss_mb()), 'rss_pico_mb': None if hwm is None else round(self.peak, 1),
+            'pid': os.getpid(), 'tid': threading.get_ident(),
+        }
+        if exc_type is not None:
+            record['error'] = exc_type.__name__
+        record.update(self.attrs)
+        _emit(record)
+        return False
+
+
+def _stack():
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+def _emit(record):
+    line = json.dumps(record, ensure_ascii=False, default=str) + '\n'
+    with _lock:
+        # Append de una línea corta: seguro entre procesos en la práctica (O_APPEND)
+        with open(_trace_path, 'a', encoding='utf-8') as f:
+            f.write(line)
+
+
+def stage(name, **attrs):
+    """Context manager de una etapa. Sin instrumentación activa es un contexto nulo"""
+    if not _enabled:
+        return _NULL
+    return _Stage(name, attrs)
+
+
+def timed(name=None, args=()):
+    """Decorador: registra cada llamada como etapa. args: parámetros a copiar como atributos"""
+    def decorator(fn):
+        stage_name = name or fn.__name__
+        signature = None
+
+        @functools.wraps(fn)
+        def wrapper(*a, **kw):
+            if not _enabled:
+                return fn(*a, **kw)
+            attrs = {}
+            if args:
+                nonlocal signature
+                if signature is None:
+                    import inspect
+                    signature = inspect.signature(fn)
+                bound = signature.bind_partial(*a, **kw).arguments
+                attrs = {k: bound[k] for k in args if k in bound}
+            with _Stage(stage_name, attrs):
+                return fn(*a, **kw)
+        return wrapper
+    return decorator
+
+
+# === Perfiles ===
+
+def _start_profiler():
+    if _profiler == 'pyinstrument':
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            print("  pyinstrument no está instalado; usando cProfile")
+        else:
+            profiler = Profiler()
+            profiler.start()
+            return profiler
+    import cProfile
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+
+def _stop_profiler(profiler, name):
+    base = f"perfil_{name}_{os.getpid()}"
+    if hasattr(profiler, 'output_html'):
+        profiler.stop()
+        path = base + '.html'
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(profiler.output_html())
+    else:
+        profiler.disable()
+        path = base + '.prof'
+        profiler.dump_stats(path)
+    print(f"  Perfil de '{name}' -> {path}")
+
+
+# === Salidas ===
+
+def read_trace(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def to_chrome_trace(records, path):
+    """Eventos 'X' (duración) por etapa; un track por proceso/hilo"""
+    events = []
+    for r in records:
+        extra = {k: v for k, v in r.items() if k not in ('etapa', 'inicio', 'segundos', 'pid', 'tid')}
+        events.append({'name': r['etapa'], 'ph': 'X', 'ts': r['inicio'] * 1e6, 'dur': r['segundos'] * 1e6,
+                       'pid': r['pid'], 'tid': r['tid'] % 2**31, 'args': extra})
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f, ensure_ascii=False)
+    return path
+
+
+def summarize(records):
+    """Tabla por etapa: llamadas, tiempo total, máximo y memoria máxima"""
+    import pandas as pd
+    df = pd.DataFrame(records)
+    return (df.groupby('etapa')
+              .agg(llamadas=('segundos', 'size'), total_s=('segundos', 'sum'),
+                   max_s=('segundos', 'max'), rss_pico_mb=('rss_pico_mb', 'max'))
+              .sort_values('total_s', ascending=False))
+
+
+def _write_chrome_at_exit():
+    chrome = os.environ.get(ENV_CHROME)
+    if _enabled and chrome and os.environ.get(ENV_OWNER) == str(os.getpid()) and os.path.exists(_trace_path):
+        to_chrome_trace(read_trace(_trace_path), chrome)
+        print(f"Traza Chrome -> {chrome}")
+
+
+atexit.register(_write_chrome_at_exit)
+
+# Procesos hijos (pool de render 'spawn') heredan la configuración por entorno
+if os.environ.get(ENV_TRACE):
+    enable()
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Resumen / conversión de trazas por etapa")
+    parser.add_argument('traza', help="Archivo JSON lines")
+    parser.add_argument('--chrome', default=None, help="Convertir a traza Chrome")
+    args = parser.parse_args()
+    records = read_trace(args.traza)
+    print(summarize(records).to_string())
+    if args.chrome:
+        print(f"Traza Chrome -> {to_chrome_trace(records, args.chrome)}")
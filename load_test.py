@@ -0,0 +1,158 @@
+"""
+Prueba de carga de query_api.py: N solicitudes repartidas en C conexiones keep-alive concurrentes
+(asyncio, solo biblioteca estándar). Reporta latencias p50 / p90 / p99 y throughput, total y por
+endpoint, y los aciertos del caché LRU del servidor.
+
+La mezcla de URLs se arma consultando al servidor (/indicadores, /comunas, /estado): consultas por
+comuna, rankings por área metropolitana, distribuciones y bboxes al azar dentro de la extensión.
+--distintas acota cuántas URLs distintas se generan (menos URLs -> más aciertos de caché).
+
+Uso:
+    python query_api.py --puerto 8080 &
+    python load_test.py --url http://127.0.0.1:8080 --solicitudes 5000 --concurrencia 32
+    python load_test.py --iniciar --solicitudes 20000 --distintas 100000   # levanta el servidor
+"""
+import asyncio
+import json
+import time
+from urllib.parse import quote, urlsplit
+
+import numpy as np
+
+from query_api import PORT
+
+URL = f'http://127.0.0.1:{PORT}'
+REQUESTS = 5000
+CONCURRENCY = 32
+DISTINCT = 500
+BBOX_SIZE = 600.0        # Lado de los bbox al azar (unidades del CRS de la capa)
+
+
+async def _get(reader, writer, host, path):
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}\r\n\r\n".encode('utf-8'))
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.strip().lower() == 'content-length':
+            length = int(value)
+    return status, await reader.readexactly(length)
+
+
+async def _fetch_json(host, port, path):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        _, body = await _get(reader, writer, host, path)
+        return json.loads(body)
+    finally:
+        writer.close()
+
+
+async def build_urls(host, port, n, distinct=DISTINCT, seed=0):
+    """Mezcla de consultas a partir de lo que el servidor expone"""
+    indicators = await _fetch_json(host, port, '/indicadores')
+    communes = (await _fetch_json(host, port, '/comunas'))['comunas']
+    status = await _fetch_json(host, port, '/estado')
+    rng = np.random.default_rng(seed)
+    minx, miny, maxx, maxy = status['extension']
+    areas = sorted({c['area_metro'] for c in communes if c['area_metro']})
+
+    def one(kind):
+        ind = quote(str(rng.choice(indicators['indicadores'])))
+        block_ind = quote(str(rng.choice(indicators['por_manzana'])))
+        comuna = quote(str(rng.choice([c['comuna'] for c in communes])))
+        if kind == 'comuna':
+            return f"/comuna/{comuna}?indicadores={ind}"
+        if kind == 'ranking':
+            area = f"&area={quote(str(rng.choice(areas)))}" if areas else ''
+            return f"/ranking/{ind}?n=7{area}"
+        if kind == 'distribucion':
+            return f"/distribucion/{block_ind}?comuna={comuna}&bins=20"
+        x, y = rng.uniform(minx, maxx - BBOX_SIZE), rng.uniform(miny, maxy - BBOX_SIZE)
+        return f"/manzanas?bbox={x:.0f},{y:.0f},{x + BBOX_SIZE:.0f},{y + BBOX_SIZE:.0f}&indicadores={block_ind}"
+
+    kinds = ['comuna', 'ranking', 'distribucion', 'manzanas']
+    pool = [one(kinds[i % len(kinds)]) for i in range(distinct)]
+    return [pool[i] for i in rng.integers(0, len(pool), n)]
+
+
+async def run(url=URL, n=REQUESTS, concurrency=CONCURRENCY, distinct=DISTINCT, seed=0):
+    split = urlsplit(url)
+    host, port = split.hostname, split.port or 80
+    urls = await build_urls(host, port, n, distinct, seed)
+    latencies = np.zeros(len(urls))
+    statuses = np.zeros(len(urls), dtype=int)
+    queue = iter(range(len(urls)))
+
+    async def worker():
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            for i in queue:
+                t0 = time.perf_counter()
+                statuses[i], _ = await _get(reader, writer, host, urls[i])
+                latencies[i] = time.perf_counter() - t0
+        finally:
+            writer.close()
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - t0
+    status = await _fetch_json(host, port, '/estado')
+    return urls, latencies, statuses, elapsed, status['cache']
+
+
+def print_report(urls, latencies, statuses, elapsed, cache):
+    ms = latencies * 1000
+    kinds = np.array([u.strip('/').split('/')[0].split('?')[0] for u in urls])
+    print(f"\n{len(urls):,} solicitudes en {elapsed:.2f}s -> {len(urls) / elapsed:,.0f} sol/s "
+          f"({(statuses != 200).sum()} con error)")
+    print(f"{'endpoint':<14} {'n':>7} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for kind in ['(todas)'] + sorted(set(kinds)):
+        sel = ms if kind == '(todas)' else ms[kinds == kind]
+        p50, p90, p99 = np.percentile(sel, [50, 90, 99])
+        print(f"{kind:<14} {len(sel):>7,} {p50:>8.2f} {p90:>8.2f} {p99:>8.2f} {sel.max():>8.2f}")
+    print(f"Caché LRU del servidor: {cache['aciertos']:,} aciertos, {cache['fallos']:,} fallos, "
+          f"{cache['entradas']:,} entradas")
+
+
+def _start_server(port):
+    """Levanta query_api.py en un subproceso y espera a que acepte conexiones"""
+    import socket
+    import subprocess
+    import sys
+    proc = subprocess.Popen([sys.executable, 'query_api.py', '--puerto', str(port)])
+    deadline = time.time() + 300
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return proc
+        except OSError:
+            if proc.poll() is not None:
+                raise RuntimeError("query_api.py terminó antes de aceptar conexiones")
+            time.sleep(0.2)
+    proc.terminate()
+    raise TimeoutError("query_api.py no respondió a tiempo")
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Prueba de carga de la API de consultas (p50 / p99)")
+    parser.add_argument('--url', default=URL)
+    parser.add_argument('--solicitudes', type=int, default=REQUESTS)
+    parser.add_argument('--concurrencia', type=int, default=CONCURRENCY)
+    parser.add_argument('--distintas', type=int, default=DISTINCT, help="URLs distintas en la mezcla")
+    parser.add_argument('--iniciar', action='store_true', help="Levantar query_api.py en un subproceso")
+    parser.add_argument('--semilla', type=int, default=0)
+    args = parser.parse_args()
+
+    server = _start_server(urlsplit(args.url).port or PORT) if args.iniciar else None
+    try:
+        print_report(*asyncio.run(run(args.url, args.solicitudes, args.concurrencia, args.distintas, args.semilla)))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
@@ -1,18 +1,176 @@
 import geopandas as gpd
 import pandas as pd
 import numpy as np
+import argparse
 import os
+import shutil
+
+from columnar_cache import write_cache
+from compact import compact_frame, frame_memory_mb, print_memory_report
+from incremental import MANIFEST_FILE, definition_hashes, save_base, save_manifest, update_indicators
+from instrumentation import add_cli_arguments, configure_from_args, peak_rss_mb, stage, timed
+from render_geometry import RENDER_COL, build_render_geometry, print_vertex_report
+from spatial_index import build_index
+from vector_tiles import TILES_FILE, export_tiles
+from indicators import (COMPUESTOS, ComponentMoments, composite_scores, composite_weights, evaluate,
+                        evaluate_composites, group_range, minmax_scale, required_columns as indicator_columns)
 
 # Configuración
 INPUT_FILE = 'Cartografia_censo2024_Pais.gpkg'
 OUTPUT_FILE = 'Manzanas_Indicadores.gpkg'
 LAYER_NAME = 'Manzanas_CPV24' # O el nombre correcto de la capa de manzanas
 
-def process_data():
-    print(f"Leyendo archivo: {INPUT_FILE}...")
+# Modo de ingesta:
+#   'pushdown' -> el filtro RM (SQL where), la proyección de columnas y el bbox opcional se envían
+#                 al driver GDAL, leyendo en lotes Arrow. Solo se materializan manzanas RM.
+#   'completo' -> camino original: se lee el país completo con todas las columnas y se filtra en pandas.
+INGEST_MODE = 'pushdown'
+ARROW_BATCH_SIZE = 65536
+RM_WHERE = "MZ_BASE_CENSO = 1 AND REGION LIKE '%METROPOLITANA%'"
+
+# Modo streaming nacional (--nacional): lotes Arrow de tamaño fijo, memoria acotada por el lote
+STREAM_OUTPUT_FILE = 'Manzanas_Indicadores_Pais.gpkg'
+STREAM_STAGING_DIR = os.path.join('cache', 'streaming')
+NACIONAL_WHERE = "MZ_BASE_CENSO = 1"
+# 'regional' -> Z-Scores dentro de cada región (misma metodología "local" que la RM)
+# 'nacional' -> un solo universo de referencia para todo el país
+STANDARDIZATION = 'regional'
+
+# Modo paralelo por región (--nacional --por-region): una tarea por región + la capa rural
+RURAL_LAYER = 'Entidades_CPV24'
+PARTITION_DIR = os.path.join('cache', 'regiones')
+
+# Indicadores por manzana en float32 (conteos exactos hasta 2^24); los Z-Scores se acumulan en float64
+INDICATOR_DTYPE = np.float32
+
+# Indicadores simples (demografía, calidad de vida, conectividad) exportados por manzana
+INDICADORES_SIMPLES = [
+    'pct_adulto_mayor', 'pct_infancia', 'pct_inmigrantes',
+    'pct_hacinamiento', 'pct_deficit_agua', 'pct_lena', 'pct_internet',
+]
+
+COLS_EXTRA = [
+     'n_hog_allegados', 'n_nucleos_hacinados_allegados',
+     'n_mat_paredes_precarios', 'n_serv_internet_fija', 'n_serv_compu',
+     'n_dormitorios_4', 'n_dormitorios_5', 'n_dormitorios_6_o_mas'
+]
+
+# Columnas de salida para el mapa ligero
+# IMPORTANTE: Incluimos las columnas 'n_...' raw para poder recalcular 
+# promedios ponderados por comuna en el script de visualización.
+KEEP_COLS = [
+    'MANZENT', 'CUT', 'REGION', 'PROVINCIA', 'COMUNA', 'AREA_C',  # Identificadores
+    'geometry', 'MZ_BASE_CENSO',                        # Geometria y filtro
+    'n_per', 'n_vp', 'n_hog',                           # Universos
+    'n_vp_ocupada',                                     # Viviendas ocupadas (para hacinamiento correcto)
+    'pct_adulto_mayor', 'pct_infancia', 'pct_inmigrantes', 
+    'pct_hacinamiento', 'pct_deficit_agua', 'pct_lena', 
+    'pct_internet',
+    # Variables base para ponderación
+    'n_internet', 'n_viv_hacinadas', 'n_inmigrantes',
+    'n_fuente_agua_camion', 'n_fuente_agua_rio', 'n_fuente_agua_pozo',
+    'n_hog_unipersonales', # Para indicador Forever Alone
+    'n_transporte_bicicleta', # Para Ciclistas Furiosos
+    'n_tenencia_propia_pagandose', # Para Hipotecados
+    'n_estcivcon_anul_sep_div', # Para Club de los Ex
+    'n_cise_rec_independientes', # Para Mente de Tiburón
+    # Estado Civil Completo (para "Aún Sin Anillo" con denominador correcto)
+    'n_estcivcon_soltero', 'n_estcivcon_casado', 'n_estcivcon_conviviente', 
+    'n_estcivcon_conv_civil', 'n_estcivcon_viudo',
+    # Componentes de indices compuestos (para agregación)
+    'n_viv_irrecuperables', 'n_tipo_viv_mediagua', 
+    'n_tenencia_arrendada_sin_contrato', 'n_tenencia_cedida_familiar',
+    'n_desocupado', 'n_ocupado', 'n_analfabet', 'n_jefatura_mujer',
+    'n_cine_terciaria_maestria_doctorado', 'n_transporte_auto', 'n_tenencia_propia_pagada', # Para Privilegio
+    # Índices Pre-calculados (Z-Scores)
+    'idx_precariedad_hab', 'idx_vulnerabilidad_soc', 'idx_privilegio'
+]
+
+def required_columns():
+    """Columnas crudas que el pipeline realmente usa (proyección para el driver)"""
+    cols = KEEP_COLS + COLS_EXTRA + indicator_columns(INDICADORES_SIMPLES, composites=COMPUESTOS)
+    # Excluimos columnas derivadas y la geometría (el driver la entrega aparte)
+    cols = [c for c in cols if not c.startswith(('pct_', 'idx_')) and c != 'geometry']
+    return list(dict.fromkeys(cols))
+
+def check_columns(layers, path=INPUT_FILE):
+    """
+    Falla antes de leer si a alguna capa le faltan columnas crudas requeridas (catálogo, ver catalog.py):
+    el driver omite en silencio las columnas pedidas que no existen y el registro las contaría como 0.
+    """
+    from catalog import validate_columns
+    with stage('validacion_esquema', capas=len(layers)):
+        for layer in layers:
+            validate_columns(required_columns(), layer=layer, path=path)
+
+def read_layer_pushdown(path, layer, columns=None, where=None, bbox=None, batch_size=ARROW_BATCH_SIZE):
+    """
+    Lee una capa enviando filtro, proyección y bbox al driver, en lotes Arrow.
+    Retorna (GeoDataFrame, filas_leidas, bytes_decodificados).
+    """
+    import pyarrow as pa
+    from pyogrio.raw import open_arrow
+
+    batches = []
+    rows_read = 0
+    bytes_decoded = 0
+    with open_arrow(path, layer=layer, columns=columns, where=where, bbox=bbox,
+                    batch_size=batch_size, use_pyarrow=True) as (meta, reader):
+        geom_col = meta['geometry_name'] or 'wkb_geometry'
+        for batch in reader:
+            rows_read += batch.num_rows
+            bytes_decoded += batch.nbytes
+            batches.append(batch)
+        table = pa.Table.from_batches(batches, schema=reader.schema)
+
+    df = table.to_pandas()
+    geometry = gpd.GeoSeries.from_wkb(df.pop(geom_col), crs=meta['crs']).rename('geometry')
+    gdf = gpd.GeoDataFrame(df, geometry=geometry)
+    return gdf, rows_read, bytes_decoded
+
+def compute_indicators(gdf):
+    """
+    Esquema compacto (n_* enteros sin signo, identificadores categóricos; suprimidos -> 0 con máscara),
+    indicadores simples y compuestos (Z-Score sobre las filas recibidas). Modifica gdf.
+    Retorna (gdf, máscaras de supresión por columna).
+    """
+    with stage('compactacion', filas=len(gdf)):
+        before = frame_memory_mb(gdf)
+        suprimidos = compact_frame(gdf)
+        print_memory_report("tabular", before, frame_memory_mb(gdf, suprimidos))
+
+    # 3. Cálculo de Indicadores (definiciones en indicators.INDICADORES)
+    print("Calculando indicadores...")
+    # Denominador 0 -> NaN (Null en el GPKG, 'Sin Datos')
+    with stage('indicadores', filas=len(gdf)):
+        simples = evaluate(gdf, INDICADORES_SIMPLES, dtype=INDICATOR_DTYPE)
+        for c in INDICADORES_SIMPLES:
+            gdf[c] = simples[c]
+
+    # ==================================================
+    # 4. INDICADORES COMPUESTOS ROBUSTOS (Z-SCORES)
+    # ==================================================
+    print("Calculando indicadores compuestos con Normalización Z-Score...")
+    
+    # 4.1 Las variables crudas de cada componente salen del registro (indicators.COMPUESTOS).
+    # Valores nulos (suprimidos) cuentan como 0; las columnas ausentes se rechazan antes de leer (check_columns).
+
+    # 4.2 Porcentajes de cada componente (denominador 0 -> 0 para no romper el Z-score),
+    # Z-Score sobre la RM (promedio regional = 0), promedio ponderado por índice y
+    # escalado 0-100 (Min-Max) para legibilidad. Todo en un solo pase matricial.
+    with stage('zscore', filas=len(gdf)):
+        compuestos = evaluate_composites(gdf, method='zscore')
+        for c in compuestos.columns:
+            gdf[c] = compuestos[c].astype(INDICATOR_DTYPE)
+    return gdf, suprimidos
+
+@timed('process_data', args=('ingest',))
+def process_data(ingest=INGEST_MODE, bbox=None, tiles=False, n_jobs=None):
+    print(f"Leyendo archivo: {INPUT_FILE} (modo de ingesta: {ingest})...")
     
     # SOLO MANZANAS (URBANO) - Entidades rurales distorsionan visualización
     layers = ['Manzanas_CPV24'] 
+    check_columns(layers)
     gdfs = []
     
     for layer in layers:
@@ -22,9 +180,19 @@ def process_data():
             # Asumimos que amblas capas tienen MZ_BASE_CENSO o equivalente para filtrar validez
             # En entidades a veces todas son validas, pero aplicamos el filtro por consistencia si existe la columna
             # Si falla, leemos todo y concatenamos.
-            temp_gdf = gpd.read_file(INPUT_FILE, layer=layer)
-            if 'MZ_BASE_CENSO' in temp_gdf.columns:
-                 temp_gdf = temp_gdf[temp_gdf['MZ_BASE_CENSO'] == 1]
+            with stage('lectura', capa=layer, modo=ingest) as st:
+                if ingest == 'pushdown':
+                    # Filtro RM + MZ_BASE_CENSO, proyección y bbox resueltos por el driver
+                    temp_gdf, rows_read, bytes_decoded = read_layer_pushdown(
+                        INPUT_FILE, layer, columns=required_columns(), where=RM_WHERE, bbox=bbox)
+                else:
+                    temp_gdf = gpd.read_file(INPUT_FILE, layer=layer, bbox=bbox)
+                    rows_read = len(temp_gdf)
+                    bytes_decoded = int(temp_gdf.memory_usage(deep=True).sum())
+                    if 'MZ_BASE_CENSO' in temp_gdf.columns:
+                         temp_gdf = temp_gdf[temp_gdf['MZ_BASE_CENSO'] == 1]
+                st.set(filas=rows_read, bytes=bytes_decoded)
+            print(f"    Filas leídas: {rows_read} | Bytes decodificados: {bytes_decoded / 1e6:.1f} MB")
             gdfs.append(temp_gdf)
         except Exception as e:
             print(f"    Error leyendo {layer}: {e}")
@@ -35,13 +203,14 @@ def process_data():
 
     print("Procesando capa urbana (Manzanas)...")
     gdf = pd.concat(gdfs, ignore_index=True)
-    print(f"Total registros cargados (Nacional): {len(gdf)}")
+    print(f"Total registros cargados ({'RM' if ingest == 'pushdown' else 'Nacional'}): {len(gdf)}")
 
     # === 1.5 FILTRO ESTRICTO REGIÓN METROPOLITANA ===
     # Para que los Z-Scores sean locales y metodológicamente relevantes
     print("Filtrando solo REGIÓN METROPOLITANA para análisis relativo local...")
     # Aseguramos que sea string y buscamos 'METROPOLITANA' o codigo '13' (si aplica)
-    gdf = gdf[gdf['REGION'].astype(str).str.contains('METROPOLITANA', case=False, na=False)].copy()
+    with stage('filtro_rm', filas=len(gdf)):
+        gdf = gdf[gdf['REGION'].astype(str).str.contains('METROPOLITANA', case=False, na=False)].copy()
     print(f"Registros en RM: {len(gdf)}")
     
     if gdf.empty:
@@ -54,203 +223,24 @@ def process_data():
     # Para el mapa, asumiremos 0 para poder pintar, o mantendremos NaN si el indicador resulta inválido.
     # Vamos a llenar con 0 las columnas n_ antes de calcular.
     
-    n_cols = [c for c in gdf.columns if c.startswith('n_')]
-    gdf[n_cols] = gdf[n_cols].fillna(0)
-
-    # 3. Cálculo de Indicadores
-    print("Calculando indicadores...")
-
-    # Evitar division por cero
-    # n_per (personas) y n_vp (viviendas particulares) son los denominadores principales
-    gdf['n_per'] = gdf['n_per'].replace(0, np.nan) 
-    gdf['n_vp'] = gdf['n_vp'].replace(0, np.nan)
-    gdf['n_hog'] = gdf['n_hog'].replace(0, np.nan)
-
-    # --- DEMOGRAFÍA ---
-    # Índice de Envejecimiento: (60+ / Total) * 100
-    gdf['pct_adulto_mayor'] = (gdf['n_edad_60_mas'] / gdf['n_per']) * 100
-    
-    # Dependencia Juvenil (0-14 aprox, aqui 0-13 segun columnas): ((0-5 + 6-13) / Total) * 100
-    gdf['pct_infancia'] = ((gdf['n_edad_0_5'] + gdf['n_edad_6_13']) / gdf['n_per']) * 100
-    
-    # Inmigración
-    gdf['pct_inmigrantes'] = (gdf['n_inmigrantes'] / gdf['n_per']) * 100
-    
-    # --- CALIDAD DE VIDA ---
-    # Hacinamiento
-    gdf['pct_hacinamiento'] = (gdf['n_viv_hacinadas'] / gdf['n_vp']) * 100
-    
-    # Déficit Hídrico (Sin red pública: camión + río + pozo)
-    # Ajustar nombres de columnas segun lo visto en el output anterior del usuario
-    gdf['pct_deficit_agua'] = ((gdf['n_fuente_agua_camion'] + gdf['n_fuente_agua_rio'] + gdf['n_fuente_agua_pozo']) / gdf['n_vp']) * 100
-
-    # Calefacción a Leña (Contaminación)
-    gdf['pct_lena'] = (gdf['n_comb_calefaccion_lena'] / gdf['n_vp']) * 100
+    gdf, suprimidos = compute_indicators(gdf)
+    print(f"Columnas con valores suprimidos (-> 0): {len(suprimidos)}")
 
-    # --- CONECTIVIDAD ---
-    # Internet Fijo (Brecha Digital)
-    # Usamos n_internet (que parece ser el total con internet) sobre n_hog (hogares)
-    gdf['pct_internet'] = (gdf['n_internet'] / gdf['n_hog']) * 100
+    # Tabla base (RM filtrada y compacta, sin geometría) para el recálculo incremental (--incremental).
+    # Con bbox la salida es un recorte: no sirve de base y se invalida el manifiesto.
+    incremental = ingest == 'pushdown' and bbox is None
+    if incremental:
+        with stage('tabla_base', filas=len(gdf)):
+            save_base(gdf, INPUT_FILE, RM_WHERE, required_columns(), suppressed=suprimidos)
+    elif os.path.exists(MANIFEST_FILE):
+        os.remove(MANIFEST_FILE)
 
-    # ==================================================
-    # 4. INDICADORES COMPUESTOS ROBUSTOS (Z-SCORES)
-    # ==================================================
-    print("Calculando indicadores compuestos con Normalización Z-Score...")
-    
-    # 4.1 Definir variables crudas necesarias
-    vars_raw = [
-        # Universos
-        'n_vp', 'n_hog', 'n_per',
-        # Precariedad Dimensión 1: Hacinamiento/Allegamiento
-        'n_viv_hacinadas', 'n_hog_allegados', 'n_nucleos_hacinados_allegados', 
-        # Precariedad Dimensión 2: Materialidad
-        'n_viv_irrecuperables', 'n_tipo_viv_mediagua', 
-        'n_mat_paredes_precarios', 'n_mat_techo_precarios', 'n_mat_piso_tierra',
-        # Precariedad Dimensión 3: Tenencia/Formalidad
-        'n_tenencia_arrendada_sin_contrato', 'n_tenencia_cedida_familiar',
-        # Precariedad Dimensión 4: Saneamiento/Agua
-        'n_fuente_agua_pozo', 'n_fuente_agua_camion', 'n_fuente_agua_rio',
-        'n_serv_hig_fosa', 'n_serv_hig_no_tiene',
-        
-        # Vulnerabilidad
-        'n_desocupado', 'n_ocupado', 'n_analfabet', 'n_jefatura_mujer', 
-        'n_internet', # Brecha digital
-        
-        # Privilegio
-        'n_cine_terciaria_maestria_doctorado', 
-        'n_transporte_auto', 
-        'n_tenencia_propia_pagada',
-        'n_serv_internet_fija', 'n_serv_compu', # Calidad Conectividad
-        'n_dormitorios_4', 'n_dormitorios_5', 'n_dormitorios_6_o_mas' # Espacio
-    ]
-    
-    # Rellenar Nulos en variables crudas
-    for c in vars_raw:
-        if c not in gdf.columns:
-            gdf[c] = 0 # Fallback si no existe la columna
-        else:
-            gdf[c] = gdf[c].fillna(0)
-
-    # 4.2 Helper para porcentajes seguros
-    def calc_pct(num_col, den_col):
-        # Si denominador es 0, retorna 0 (no NaN para no romper Z-score)
-        return (gdf[num_col] / gdf[den_col].replace(0, np.nan)).fillna(0) * 100
-
-    # 4.3 Calcular Variables Intermedias (Porcentajes)
-    # PRECARIEDAD
-    p_hacinamiento  = calc_pct('n_viv_hacinadas', 'n_vp')
-    p_allegamiento  = calc_pct('n_hog_allegados', 'n_hog')
-    p_irrecup       = calc_pct('n_viv_irrecuperables', 'n_vp')
-    p_mediagua      = calc_pct('n_tipo_viv_mediagua', 'n_vp')
-    p_mat_precari   = calc_pct('n_mat_paredes_precarios', 'n_vp') + calc_pct('n_mat_techo_precarios', 'n_vp') + calc_pct('n_mat_piso_tierra', 'n_vp')
-    p_sin_contrato  = calc_pct('n_tenencia_arrendada_sin_contrato', 'n_hog')
-    p_cedida        = calc_pct('n_tenencia_cedida_familiar', 'n_hog')
-    p_saneamiento   = calc_pct('n_serv_hig_no_tiene', 'n_vp') + calc_pct('n_fuente_agua_camion', 'n_vp') # Fosas, NoTiene, Camion
-
-    # VULNERABILIDAD
-    fuerza_lab = gdf['n_ocupado'] + gdf['n_desocupado']
-    p_desempleo     = (gdf['n_desocupado'] / fuerza_lab.replace(0, np.nan)).fillna(0) * 100
-    p_analfabet     = calc_pct('n_analfabet', 'n_per')
-    p_jefa          = calc_pct('n_jefatura_mujer', 'n_hog')
-    p_sin_internet  = 100 - calc_pct('n_internet', 'n_hog')
-
-    # PRIVILEGIO ("Cuestiona tus privilegios")
-    p_profesional   = calc_pct('n_cine_terciaria_maestria_doctorado', 'n_per')
-    p_propia_pagada = calc_pct('n_tenencia_propia_pagada', 'n_hog')
-    p_auto          = calc_pct('n_transporte_auto', 'n_per')
-    p_int_fija      = calc_pct('n_serv_internet_fija', 'n_hog') # Internet de Alta Calidad
-    p_computador    = calc_pct('n_serv_compu', 'n_hog')
-    # Espacio (Casas grandes): 4+ dormitorios
-    p_espacio       = calc_pct('n_dormitorios_4', 'n_vp') + calc_pct('n_dormitorios_5', 'n_vp') + calc_pct('n_dormitorios_6_o_mas', 'n_vp')
-
-    # 4.4 Normalización Z-Score (Estandarización)
-    # Z = (x - mean) / std.
-    # Esto centra las variables en 0 (promedio regional RM) y escala por desviación.
-    def z_score(series):
-        std = series.std()
-        if std == 0: return series * 0
-        return (series - series.mean()) / std
-
-    # --- A. ÍNDICE DE PRECARIEDAD HABITACIONAL ROBUSTO ---
-    # Promedio de Z-Scores de dimensiones negativas
-    z_precariedad = (
-        z_score(p_hacinamiento) + 
-        z_score(p_allegamiento) + 
-        z_score(p_irrecup) + 
-        z_score(p_mat_precari) +
-        z_score(p_saneamiento) +
-        z_score(p_sin_contrato) + 
-        z_score(p_cedida) # Cedida contextualizada
-    ) / 7.0 
-    
-    # 4.6 SCALING 0-100 (Min-Max) para legibilidad
-    def minmax_scale(series):
-        if series.max() == series.min(): return series * 0
-        return ((series - series.min()) / (series.max() - series.min())) * 100
-
-    gdf['idx_precariedad_hab'] = minmax_scale(z_precariedad)
-
-    # --- B. ÍNDICE DE VULNERABILIDAD SOCIAL ROBUSTO ---
-    z_vulnerabilidad = (
-        z_score(p_desempleo) +
-        z_score(p_analfabet) +
-        z_score(p_sin_internet) +
-        z_score(p_jefa)
-    ) / 4.0
-    gdf['idx_vulnerabilidad_soc'] = minmax_scale(z_vulnerabilidad)
-
-    # --- C. ÍNDICE DE PRIVILEGIO ROBUSTO ("Cuestiona tus privilegios") ---
-    # Promedio de Z-Scores de dimensiones positivas
-    z_privilegio = (
-        z_score(p_profesional) +
-        z_score(p_propia_pagada) +
-        z_score(p_auto) +
-        z_score(p_int_fija) +
-        z_score(p_computador) +
-        z_score(p_espacio)
-    ) / 6.0
-    gdf['idx_privilegio'] = minmax_scale(z_privilegio)
-    
-    # 4.5 Limpieza
-    cols_extra = [
-         'n_hog_allegados', 'n_nucleos_hacinados_allegados',
-         'n_mat_paredes_precarios', 'n_serv_internet_fija', 'n_serv_compu',
-         'n_dormitorios_4', 'n_dormitorios_5', 'n_dormitorios_6_o_mas'
-    ]
     # Check existence before adding to keep_cols inside the list comp
-    available_extra = [c for c in cols_extra if c in gdf.columns]
+    available_extra = [c for c in COLS_EXTRA if c in gdf.columns]
 
     # 4. Limpieza Final y Exportación
-    # Seleccionamos solo columnas relevantes para el mapa ligero
-    # IMPORTANTE: Incluimos las columnas 'n_...' raw para poder recalcular 
-    # promedios ponderados por comuna en el script de visualización.
-    keep_cols = [
-        'MANZENT', 'CUT', 'REGION', 'PROVINCIA', 'COMUNA', 'AREA_C',  # Identificadores
-        'geometry', 'MZ_BASE_CENSO',                        # Geometria y filtro
-        'n_per', 'n_vp', 'n_hog',                           # Universos
-        'n_vp_ocupada',                                     # Viviendas ocupadas (para hacinamiento correcto)
-        'pct_adulto_mayor', 'pct_infancia', 'pct_inmigrantes', 
-        'pct_hacinamiento', 'pct_deficit_agua', 'pct_lena', 
-        'pct_internet',
-        # Variables base para ponderación
-        'n_internet', 'n_viv_hacinadas', 'n_inmigrantes',
-        'n_fuente_agua_camion', 'n_fuente_agua_rio', 'n_fuente_agua_pozo',
-        'n_hog_unipersonales', # Para indicador Forever Alone
-        'n_transporte_bicicleta', # Para Ciclistas Furiosos
-        'n_tenencia_propia_pagandose', # Para Hipotecados
-        'n_estcivcon_anul_sep_div', # Para Club de los Ex
-        'n_cise_rec_independientes', # Para Mente de Tiburón
-        # Estado Civil Completo (para "Aún Sin Anillo" con denominador correcto)
-        'n_estcivcon_soltero', 'n_estcivcon_casado', 'n_estcivcon_conviviente', 
-        'n_estcivcon_conv_civil', 'n_estcivcon_viudo',
-        # Componentes de indices compuestos (para agregación)
-        'n_viv_irrecuperables', 'n_tipo_viv_mediagua', 
-        'n_tenencia_arrendada_sin_contrato', 'n_tenencia_cedida_familiar',
-        'n_desocupado', 'n_ocupado', 'n_analfabet', 'n_jefatura_mujer',
-        'n_cine_terciaria_maestria_doctorado', 'n_transporte_auto', 'n_tenencia_propia_pagada', # Para Privilegio
-        # Índices Pre-calculados (Z-Scores)
-        'idx_precariedad_hab', 'idx_vulnerabilidad_soc', 'idx_privilegio'
-    ] + available_extra
+    # Seleccionamos solo columnas relevantes para el mapa ligero (KEEP_COLS)
+    keep_cols = KEEP_COLS + available_extra
     
     # Filtrar solo columnas que existen (por si acaso algun ID geogrfico tiene otro nombre)
     final_cols = [c for c in keep_cols if c in gdf.columns]
@@ -261,10 +251,338 @@ def process_data():
     # output_gdf = output_gdf.fillna(-9999) # Opcional
 
     print(f"Guardando {OUTPUT_FILE}...")
-    output_gdf.to_file(OUTPUT_FILE, driver='GPKG')
+    with stage('escritura_gpkg', filas=len(output_gdf)):
+        output_gdf.to_file(OUTPUT_FILE, driver='GPKG')
+
+    # Caché columnar para los scripts de análisis/visualización (lectura selectiva sin geometría)
+    # + geometría de render: EPSG:3857 simplificada al tamaño de pixel de cada mapa comunal
+    print("Escribiendo caché columnar (Parquet por COMUNA)...")
+    with stage('geometria_render', filas=len(output_gdf)):
+        render, vertex_report = build_render_geometry(output_gdf)
+    print_vertex_report(vertex_report)
+    with stage('cache_columnar', filas=len(output_gdf)):
+        write_cache(output_gdf, source=OUTPUT_FILE, extra_geometries={RENDER_COL: render},
+                    suppressed=suprimidos)
+    # Índice espacial (R-tree empaquetado) para consultas punto / radio / polígono
+    with stage('indice_espacial', filas=len(output_gdf)):
+        build_index(output_gdf, source=OUTPUT_FILE)
+    # Pirámide de teselas vectoriales (MVT) para el visor interactivo, desde el caché recién escrito
+    if tiles:
+        with stage('teselas_vectoriales', filas=len(output_gdf)):
+            export_tiles(TILES_FILE, source=OUTPUT_FILE, n_jobs=n_jobs)
+    if incremental:
+        save_manifest(definition_hashes(INDICADORES_SIMPLES), INPUT_FILE, RM_WHERE, OUTPUT_FILE)
     
     print("¡Proceso completado con éxito!")
     print(f"Archivo generado: {os.path.abspath(OUTPUT_FILE)}")
 
+def standardization_keys(df, standardize):
+    """Grupo de referencia de los Z-Scores para cada fila"""
+    if standardize == 'regional':
+        keys = df['REGION'].astype(str)
+    elif standardize == 'nacional':
+        keys = pd.Series('PAIS', index=df.index)
+    else:
+        raise ValueError(f"Estandarización desconocida: {standardize}")
+    if 'CAPA' in df.columns:
+        # Manzanas y entidades rurales son universos de referencia separados
+        keys = df['CAPA'].astype(str) + '|' + keys
+    return keys.to_numpy()
+
+@timed('process_data_streaming', args=('standardize', 'batch_size'))
+def process_data_streaming(standardize=STANDARDIZATION, batch_size=ARROW_BATCH_SIZE,
+                           where=NACIONAL_WHERE, output=STREAM_OUTPUT_FILE):
+    """
+    ETL nacional en streaming. La memoria queda acotada por el tamaño del lote, no por el país.
+
+    Pase 1 (lotes Arrow del driver): porcentajes por manzana al vuelo, acumulación de
+             count / suma / suma de cuadrados de cada componente por grupo (región o país)
+             y escritura del lote a una partición Parquet intermedia (geometría en WKB, sin decodificar).
+    Pase 2 (liviano, solo columnas de componentes): Z-Scores con los momentos acumulados,
+             promedio ponderado y mínimo/máximo por grupo para el escalado 0-100.
+    Pase 3: escalado Min-Max y escritura incremental (append) al GPKG de salida, lote a lote.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    from pyogrio.raw import open_arrow
+
+    composites, components, W = composite_weights()
+    comp_cols = [f"__{c}" for c in components]
+    moments = ComponentMoments(len(components))
+    out_cols = [c for c in dict.fromkeys(KEEP_COLS + COLS_EXTRA) if not c.startswith('idx_')]
+
+    if os.path.exists(STREAM_STAGING_DIR): shutil.rmtree(STREAM_STAGING_DIR)
+    os.makedirs(STREAM_STAGING_DIR)
+
+    check_columns([LAYER_NAME])
+
+    # === PASE 1: indicadores por lote + momentos ===
+    print(f"Streaming {INPUT_FILE} (lotes de {batch_size} manzanas, Z-Scores {standardize})...")
+    parts = []
+    rows = 0
+    peak_mb = 0.0
+    with open_arrow(INPUT_FILE, layer=LAYER_NAME, columns=required_columns(), where=where,
+                    batch_size=batch_size, use_pyarrow=True) as (meta, reader):
+        geom_col = meta['geometry_name'] or 'wkb_geometry'
+        crs = meta['crs']
+        for batch in reader:
+            if batch.num_rows == 0: continue
+            with stage('lote', filas=batch.num_rows):
+                df = batch.to_pandas().rename(columns={geom_col: 'geometry'})
+                compact_frame(df)
+
+                simples = evaluate(df, INDICADORES_SIMPLES, dtype=INDICATOR_DTYPE)
+                for c in INDICADORES_SIMPLES:
+                    df[c] = simples[c]
+                P = evaluate(df, components, nan_as_zero=True).to_numpy()
+                moments.update(P, standardization_keys(df, standardize))
+
+                out = df[[c for c in out_cols if c in df.columns]].copy()
+                out[comp_cols] = P
+                part = os.path.join(STREAM_STAGING_DIR, f"part_{len(parts):05d}.parquet")
+                pq.write_table(pa.Table.from_pandas(out, preserve_index=False), part)
+                parts.append(part)
+                rows += len(df)
+                print(f"  Lote {len(parts)}: {rows} manzanas procesadas")
+            # Con --traza cada etapa 'lote' reinicia el high-water mark: se acumula el máximo por lote
+            peak_mb = max(peak_mb, peak_rss_mb() or 0)
+
+    if not parts:
+        print("CRITICAL: El filtro no dejó manzanas.")
+        return
+
+    mean, std = moments.mean_std()
+    print(f"  Grupos de estandarización: {len(moments.groups)}")
+
+    # === PASE 2: Z-Scores con los momentos + rango por grupo (solo columnas de componentes) ===
+    print("Calculando rango de los índices compuestos...")
+    n_groups = len(moments.groups)
+    lo = np.full((n_groups, len(composites)), np.inf)
+    hi = np.full((n_groups, len(composites)), -np.inf)
+
+    def raw_scores(df):
+        codes = moments.codes(standardization_keys(df, standardize))
+        P = df[comp_cols].to_numpy()
+        return codes, composite_scores(P, W, mean[codes], std[codes])
+
+    for part in parts:
+        codes, S = raw_scores(pq.read_table(part, columns=['REGION'] + comp_cols).to_pandas())
+        p_lo, p_hi = group_range(S, codes, n_groups)
+        lo, hi = np.minimum(lo, p_lo), np.maximum(hi, p_hi)
+
+    # === PASE 3: escalado 0-100 y escritura incremental ===
+    print(f"Guardando {output} (incremental)...")
+    if os.path.exists(output): os.remove(output)
+    for i, part in enumerate(parts):
+        df = pq.read_table(part).to_pandas()
+        codes, S = raw_scores(df)
+        df[composites] = minmax_scale(S, lo[codes], hi[codes]).astype(INDICATOR_DTYPE)
+        df = df.drop(columns=comp_cols)
+        final_cols = [c for c in KEEP_COLS + COLS_EXTRA if c in df.columns and c != 'geometry']
+        gdf = gpd.GeoDataFrame(df[final_cols], geometry=gpd.GeoSeries.from_wkb(df['geometry'], crs=crs))
+        gdf.to_file(output, driver='GPKG', mode='w' if i == 0 else 'a')
+
+    shutil.rmtree(STREAM_STAGING_DIR, ignore_errors=True)
+    peak_mb = max(peak_mb, peak_rss_mb() or 0)
+    memory = f"{peak_mb:.0f} MB" if peak_rss_mb() is not None else "no disponible"
+    print(f"¡Proceso completado! {rows} manzanas | Memoria máxima: {memory}")
+    print(f"Archivo generado: {os.path.abspath(output)}")
+
+def sql_quote(value):
+    return "'" + str(value).replace("'", "''") + "'"
+
+def list_regions(path=INPUT_FILE, layer=LAYER_NAME, where=NACIONAL_WHERE):
+    """Regiones presentes en la capa (consulta SQL al GPKG, sin leer geometrías)"""
+    import pyogrio
+    df = pyogrio.read_dataframe(path, sql=f"SELECT DISTINCT REGION FROM {layer} WHERE {where}",
+                                read_geometry=False)
+    return sorted(df['REGION'].dropna().astype(str))
+
+def build_region_tasks(standardize=STANDARDIZATION, include_rural=True):
+    """Una tarea por región de manzanas + una tarea para la capa de entidades rurales"""
+    tasks = [{'nombre': region, 'capa': LAYER_NAME,
+              'where': f"{NACIONAL_WHERE} AND REGION = {sql_quote(region)}"}
+             for region in list_regions()]
+    if include_rural:
+        tasks.append({'nombre': 'Entidades rurales', 'capa': RURAL_LAYER, 'where': NACIONAL_WHERE})
+    for i, task in enumerate(tasks):
+        task['parte'] = os.path.join(PARTITION_DIR, f"part_{i:02d}.parquet")
+        task['estandarizar'] = standardize
+    return tasks
+
+def _etl_region(task):
+    """
+    Tarea de un proceso: lee su región (filtro en el driver), calcula pct_* y los porcentajes de
+    componentes, y escribe su partición GeoParquet. Con estandarización regional calcula además
+    los Z-Scores locales y deja el índice sin escalar; el escalado 0-100 se aplica al unir.
+    Retorna (nombre, filas, segundos, momentos, rango) o el error.
+    """
+    import time
+    t0 = time.perf_counter()
+    try:
+        with stage('etl_region', region=task['nombre'], capa=task['capa']):
+            composites, components, W = composite_weights()
+            gdf, _, _ = read_layer_pushdown(INPUT_FILE, task['capa'], columns=required_columns(),
+                                            where=task['where'])
+            compact_frame(gdf)
+            gdf['CAPA'] = task['capa']
+
+            simples = evaluate(gdf, INDICADORES_SIMPLES, dtype=INDICATOR_DTYPE)
+            for c in INDICADORES_SIMPLES:
+                gdf[c] = simples[c]
+            P = evaluate(gdf, components, nan_as_zero=True).to_numpy()
+            moments = ComponentMoments(len(components))
+            codes = moments.update(P, standardization_keys(gdf, task['estandarizar']))
+
+            rango = None
+            if task['estandarizar'] == 'regional':
+                mean, std = moments.mean_std()
+                S = composite_scores(P, W, mean[codes], std[codes])
+                gdf[composites] = S
+                rango = dict(zip(moments.groups, zip(*group_range(S, codes, len(moments.groups)))))
+            else:
+                gdf[[f"__{c}" for c in components]] = P
+
+            gdf.to_parquet(task['parte'])
+            return task['nombre'], len(gdf), time.perf_counter() - t0, moments, rango, None
+    except Exception as e:
+        return task['nombre'], 0, time.perf_counter() - t0, None, None, repr(e)
+
+def _score_partition(task, stats):
+    """Segundo paso (estandarización nacional): Z-Scores con los momentos del país"""
+    composites, components, W = composite_weights()
+    comp_cols = [f"__{c}" for c in components]
+    gdf = gpd.read_parquet(task['parte'])
+    if gdf.empty:
+        return {}
+    codes, groups = pd.factorize(pd.Series(standardization_keys(gdf, task['estandarizar'])))
+    mean = np.vstack([stats[g][0] for g in groups])[codes]
+    std = np.vstack([stats[g][1] for g in groups])[codes]
+    S = composite_scores(gdf[comp_cols].to_numpy(), W, mean, std)
+    gdf = gdf.drop(columns=comp_cols)
+    gdf[composites] = S
+    gdf.to_parquet(task['parte'])
+    return dict(zip(groups, zip(*group_range(S, codes, len(groups)))))
+
+def _run_pool(fn, args, n_jobs):
+    """map en un pool de procesos 'spawn' (o en serie con n_jobs=1), en el orden de llegada"""
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    import multiprocessing
+    if n_jobs <= 1:
+        for a in args:
+            yield fn(*a)
+        return
+    ctx = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=n_jobs, mp_context=ctx) as pool:
+        futures = [pool.submit(fn, *a) for a in args]
+        for future in as_completed(futures):
+            yield future.result()
+
+def _merge_ranges(total, rango):
+    for key, (lo, hi) in rango.items():
+        if key in total:
+            total[key] = (np.minimum(total[key][0], lo), np.maximum(total[key][1], hi))
+        else:
+            total[key] = (lo, hi)
+
+@timed('process_data_parallel', args=('standardize', 'n_jobs'))
+def process_data_parallel(standardize=STANDARDIZATION, n_jobs=None, output=STREAM_OUTPUT_FILE,
+                          include_rural=True):
+    """
+    ETL nacional paralelo: cada región (y la capa de entidades rurales) es una tarea independiente
+    en un pool de procesos que lee su porción del GPKG y escribe una partición. Luego se unen
+    las particiones, aplicando el escalado 0-100 por grupo, en el GPKG nacional.
+    """
+    import time
+    n_jobs = n_jobs or os.cpu_count() or 1
+    composites, components, W = composite_weights()
+
+    check_columns([LAYER_NAME] + ([RURAL_LAYER] if include_rural else []))
+    if os.path.exists(PARTITION_DIR): shutil.rmtree(PARTITION_DIR)
+    os.makedirs(PARTITION_DIR)
+    tasks = build_region_tasks(standardize, include_rural=include_rural)
+    print(f"ETL por región: {len(tasks)} tareas con {n_jobs} proceso(s), Z-Scores {standardize}...")
+
+    t0 = time.perf_counter()
+    moments = ComponentMoments(len(components))
+    ranges = {}
+    cpu = 0.0
+    failed = []
+    for nombre, rows, secs, task_moments, rango, error in _run_pool(_etl_region, [(t,) for t in tasks], n_jobs):
+        cpu += secs
+        if error:
+            print(f"  {nombre}: ERROR ({error})")
+            failed.append(nombre)
+            continue
+        print(f"  {nombre}: {rows} filas en {secs:.2f}s")
+        moments.merge(task_moments)
+        if rango: _merge_ranges(ranges, rango)
+    if failed:
+        print(f"CRITICAL: fallaron {len(failed)} tareas: {failed}")
+        return
+
+    if standardize == 'nacional':
+        # Los Z-Scores necesitan los momentos de TODO el país: segundo paso, también en paralelo
+        mean, std = moments.mean_std()
+        stats = {g: (mean[i], std[i]) for g, i in moments.groups.items()}
+        for rango in _run_pool(_score_partition, [(t, stats) for t in tasks], n_jobs):
+            _merge_ranges(ranges, rango)
+    print(f"Particiones: {time.perf_counter() - t0:.1f}s de pared, {cpu:.1f}s de CPU sumada")
+
+    # === Unión: escalado Min-Max por grupo y escritura del GPKG nacional ===
+    print(f"Uniendo particiones en {output}...")
+    if os.path.exists(output): os.remove(output)
+    rows = 0
+    for task in tasks:
+        gdf = gpd.read_parquet(task['parte'])
+        if gdf.empty: continue
+        codes, groups = pd.factorize(pd.Series(standardization_keys(gdf, standardize)))
+        lo = np.vstack([ranges[g][0] for g in groups])[codes]
+        hi = np.vstack([ranges[g][1] for g in groups])[codes]
+        gdf[composites] = minmax_scale(gdf[composites].to_numpy(), lo, hi).astype(INDICATOR_DTYPE)
+        final_cols = [c for c in KEEP_COLS + COLS_EXTRA + ['CAPA'] if c in gdf.columns]
+        gdf[final_cols].to_file(output, driver='GPKG', mode='a' if rows else 'w')
+        rows += len(gdf)
+
+    shutil.rmtree(PARTITION_DIR, ignore_errors=True)
+    print(f"¡Proceso completado! {rows} registros en {time.perf_counter() - t0:.1f}s")
+    print(f"Archivo generado: {os.path.abspath(output)}")
+
+def parse_bbox(value):
+    """Convierte 'minx,miny,maxx,maxy' (en el CRS de la capa) a tupla"""
+    parts = [float(v) for v in value.split(',')]
+    if len(parts) != 4:
+        raise argparse.ArgumentTypeError("bbox debe ser 'minx,miny,maxx,maxy'")
+    return tuple(parts)
+
 if __name__ == "__main__":
-    process_data()
+    parser = argparse.ArgumentParser(description="ETL Censo 2024: cálculo de indicadores por manzana (RM, o país completo con --nacional)")
+    parser.add_argument('--ingest', choices=['pushdown', 'completo'], default=INGEST_MODE,
+                        help="pushdown: filtro/proyección en el driver (default). completo: lectura nacional original.")
+    parser.add_argument('--bbox', type=parse_bbox, default=None,
+                        help="Recorte espacial opcional 'minx,miny,maxx,maxy' en el CRS de la capa")
+    parser.add_argument('--nacional', action='store_true',
+                        help=f"Modo streaming nacional por lotes (salida: {STREAM_OUTPUT_FILE})")
+    parser.add_argument('--estandarizar', choices=['regional', 'nacional'], default=STANDARDIZATION,
+                        help="Universo de los Z-Scores en modo nacional/por región (default: por región)")
+    parser.add_argument('--batch-size', type=int, default=ARROW_BATCH_SIZE, help="Manzanas por lote Arrow")
+    parser.add_argument('--por-region', action='store_true',
+                        help="Modo nacional paralelo: una tarea por región + entidades rurales")
+    parser.add_argument('--jobs', type=int, default=None,
+                        help="Procesos para --por-region / --teselas (default: todos los núcleos)")
+    parser.add_argument('--sin-rurales', action='store_true', help=f"No procesar la capa {RURAL_LAYER}")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Recalcular solo los indicadores cuya definición cambió (requiere una corrida completa previa)")
+    parser.add_argument('--teselas', action='store_true',
+                        help=f"Exportar además la pirámide de teselas vectoriales MVT ({TILES_FILE})")
+    add_cli_arguments(parser)
+    args = parser.parse_args()
+    configure_from_args(args)
+    if args.incremental:
+        update_indicators()
+    elif args.por_region:
+        process_data_parallel(standardize=args.estandarizar, n_jobs=args.jobs, include_rural=not args.sin_rurales)
+    elif args.nacional:
+        process_data_streaming(standardize=args.estandarizar, batch_size=args.batch_size)
+    else:
+        process_data(ingest=args.ingest, bbox=args.bbox, tiles=args.teselas, n_jobs=args.jobs)
@@ -0,0 +1,306 @@
+"""
+API HTTP local de consultas sobre los indicadores procesados (asyncio, solo biblioteca estándar).
+
+Al iniciar se carga todo UNA vez desde el caché columnar (Parquet memory-mapped), no desde el GPKG:
+  - tablas agregadas por comuna y área metropolitana (geography.hierarchy_tables, cacheadas en disco)
+  - indicadores por manzana ordenados por comuna y valor -> cuantiles e histogramas sin ordenar
+    en cada consulta
+  - índice espacial R-tree (spatial_index) + atributos alineados para consultas por bbox
+Las respuestas se guardan en un caché LRU (CACHE_SIZE); lo que no está en caché se calcula en un
+thread del executor para no bloquear el loop, que atiende conexiones keep-alive concurrentes.
+
+Endpoints (GET, JSON):
+    /indicadores                                   indicadores disponibles
+    /comunas                                       comunas y su área metropolitana
+    /comuna/<COMUNA>?indicadores=pct_internet,idx_privilegio
+    /ranking/<indicador>?area=Gran Santiago&n=7&orden=desc     (el top 7 de la infografía)
+    /manzanas?bbox=minx,miny,maxx,maxy&crs=EPSG:4326&indicadores=pct_internet&limite=1000
+    /distribucion/<indicador>?comuna=ÑUÑOA&bins=20&q=0.1,0.5,0.9
+    /estado                                        filas, extensión y aciertos del caché LRU
+
+Uso:
+    python query_api.py --puerto 8080
+    python load_test.py --url http://127.0.0.1:8080 --solicitudes 5000 --concurrencia 32
+"""
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qsl, unquote, urlsplit
+
+import numpy as np
+import pandas as pd
+
+from columnar_cache import SOURCE_FILE, cache_meta, load_indicators
+
+HOST = '127.0.0.1'
+PORT = 8080
+CACHE_SIZE = 4096            # Respuestas en el caché LRU
+DEFAULT_QUANTILES = (0.1, 0.25, 0.5, 0.75, 0.9)
+DEFAULT_BINS = 20
+MAX_BLOCKS = 5000            # Límite de manzanas por respuesta de /manzanas
+ID_COL = 'MANZENT'
+
+STATUS_TEXT = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+               500: 'Internal Server Error'}
+
+
+def _number(value):
+    return None if value is None or (isinstance(value, float) and np.isnan(value)) else round(float(value), 4)
+
+
+def _list(value, cast=str):
+    return [cast(v) for v in value.split(',') if v.strip()] if value else []
+
+
+class QueryStore:
+    """Datos cargados una vez: agregados por nivel, valores por manzana ordenados y el índice espacial"""
+
+    def __init__(self, source=SOURCE_FILE):
+        from geography import hierarchy_tables
+        from indicators import COMPUESTOS, INDICADORES, evaluate, required_columns
+        from spatial_index import load_index
+
+        t0 = time.perf_counter()
+        self.source = source
+        tables = hierarchy_tables(source=source)
+        self.comunas = tables['comuna']
+        self.indicators = [n for n in list(INDICADORES) + list(COMPUESTOS) if n in self.comunas.columns]
+
+        # Manzanas: indicadores simples evaluados desde los conteos; los compuestos tal como se exportaron
+        stored = [c for c in cache_meta(source)['columns'] if c in COMPUESTOS]
+        blocks = load_indicators([ID_COL, 'COMUNA'] + stored + required_columns(list(INDICADORES)), source=source)
+        values = evaluate(blocks, list(INDICADORES))
+        for c in stored:
+            values[c] = blocks[c].to_numpy(dtype=float, na_value=np.nan)
+        self.block_indicators = [n for n in self.indicators if n in values.columns]
+
+        # Por indicador: valores no nulos ordenados por (comuna, valor) + límites de cada comuna
+        codes = pd.Categorical(blocks['COMUNA'].astype(str))
+        self.commune_codes = {c: i for i, c in enumerate(codes.categories)}
+        self.sorted = {}
+        for name in self.block_indicators:
+            v = values[name].to_numpy(dtype=float)
+            valid = ~np.isnan(v)
+            c = codes.codes[valid]
+            order = np.lexsort((v[valid], c))
+            bounds = np.searchsorted(c[order], np.arange(len(codes.categories) + 1))
+            self.sorted[name] = (v[valid][order], bounds, np.sort(v[valid]))
+
+        # Índice espacial con los atributos por manzana ya alineados (lectura concurrente sin escrituras)
+        self.index = load_index(source)
+        self.block_values = {n: values[n].to_numpy() for n in self.block_indicators}
+        pos = pd.Index(blocks[ID_COL].astype(str)).get_indexer(self.index.ids)
+        self.index_rows = pos
+        self.block_commune = blocks['COMUNA'].astype(str).to_numpy()
+        self.rows = len(blocks)
+        self.load_seconds = time.perf_counter() - t0
+
+    # --- Consultas (retornan objetos JSON; KeyError -> 404, ValueError -> 400) ---
+
+    def _check(self, names, pool=None):
+        pool = self.indicators if pool is None else pool
+        unknown = [n for n in names if n not in pool]
+        if unknown:
+            raise KeyError(f"Indicadores desconocidos: {', '.join(unknown)}")
+        return names
+
+    def list_indicators(self):
+        return {'indicadores': self.indicators, 'por_manzana': self.block_indicators}
+
+    def list_communes(self):
+        return {'comunas': [{'comuna': c, 'area_metro': a if isinstance(a, str) else None,
+                             'manzanas': int(m)}
+                            for c, a, m in zip(self.comunas.index, self.comunas['AREA_METRO'],
+                                               self.comunas['manzanas'])]}
+
+    def commune(self, comuna, indicadores=None):
+        if comuna not in self.comunas.index:
+            raise KeyError(f"Comuna desconocida: {comuna}")
+        names = self._check(indicadores or self.indicators)
+        row = self.comunas.loc[comuna]
+        return {'comuna': comuna, 'area_metro': row['AREA_METRO'] if isinstance(row['AREA_METRO'], str) else None,
+                'manzanas': int(row['manzanas']), 'valores': {n: _number(row[n]) for n in names}}
+
+    def ranking(self, indicador, area=None, n=7, orden='desc'):
+        self._check([indicador])
+        table = self.comunas
+        if area is not None:
+            table = table[table['AREA_METRO'] == area]
+            if table.empty:
+                raise KeyError(f"Área metropolitana sin comunas: {area}")
+        col = table[indicador].dropna().sort_values(ascending=orden == 'asc', kind='stable')
+        return {'indicador': indicador, 'area': area, 'orden': orden,
+                'ranking': [{'comuna': c, 'valor': _number(v)} for c, v in col.head(n).items()]}
+
+    def blocks(self, bbox, crs=None, indicadores=None, limite=MAX_BLOCKS):
+        import shapely
+        if len(bbox) != 4:
+            raise ValueError("bbox debe ser 'minx,miny,maxx,maxy'")
+        names = self._check(indicadores or [], self.block_indicators)
+        box = shapely.box(*bbox)
+        if crs is not None:
+            from pyproj import Transformer
+            transformer = Transformer.from_crs(crs, self.index.crs, always_xy=True)
+            box = shapely.transform(box, lambda c: np.column_stack(transformer.transform(c[:, 0], c[:, 1])))
+        items = self.index.intersecting(box)
+        rows = self.index_rows[items]
+        total = int((rows >= 0).sum())
+        limit = max(0, min(limite, MAX_BLOCKS))
+        items, rows = items[rows >= 0][:limit], rows[rows >= 0][:limit]
+        return {'total': total, 'manzanas': [
+            {ID_COL: str(self.index.ids[i]), 'comuna': self.block_commune[r],
+             **{n: _number(self.block_values[n][r]) for n in names}}
+            for i, r in zip(items, rows)]}
+
+    def distribution(self, indicador, comuna=None, bins=DEFAULT_BINS, q=DEFAULT_QUANTILES):
+        self._check([indicador], self.block_indicators)
+        values, bounds, everything = self.sorted[indicador]
+        if comuna is not None:
+            if comuna not in self.commune_codes:
+                raise KeyError(f"Comuna desconocida: {comuna}")
+            k = self.commune_codes[comuna]
+            values = values[bounds[k]:bounds[k + 1]]
+        else:
+            values = everything
+        if not 0 < bins <= 200:
+            raise ValueError("bins debe estar entre 1 y 200")
+        if any(not 0 <= p <= 1 for p in q):
+            raise ValueError("Los cuantiles deben estar entre 0 y 1")
+        if not len(values):
+            return {'indicador': indicador, 'comuna': comuna, 'manzanas': 0}
+        # Arreglo ya ordenado: cuantiles por interpolación lineal directa
+        pos = np.asarray(q, dtype=float) * (len(values) - 1)
+        lo = np.floor(pos).astype(int)
+        hi = np.minimum(lo + 1, len(values) - 1)
+        quantiles = values[lo] + (values[hi] - values[lo]) * (pos - lo)
+        counts, edges = np.histogram(values, bins=bins)
+        return {'indicador': indicador, 'comuna': comuna, 'manzanas': int(len(values)),
+                'media': _number(values.mean()), 'min': _number(values[0]), 'max': _number(values[-1]),
+                'cuantiles': {f"{p:g}": _number(v) for p, v in zip(q, quantiles)},
+                'histograma': {'bordes': [_number(e) for e in edges], 'conteos': counts.tolist()}}
+
+
+class QueryServer:
+    """Servidor HTTP/1.1 mínimo sobre asyncio con caché LRU de respuestas"""
+
+    def __init__(self, store, cache_size=CACHE_SIZE):
+        self.store = store
+        self.cache = OrderedDict()
+        self.cache_size = cache_size
+        self.hits = self.misses = 0
+
+    def route(self, path, query):
+        """(status, objeto JSON) de una ruta; sin estado, así que se puede cachear por (ruta, query)"""
+        s = self.store
+        params = dict(query)
+        parts = [unquote(p) for p in path.strip('/').split('/')]
+        try:
+            if parts == ['indicadores']:
+                return 200, s.list_indicators()
+            if parts == ['comunas']:
+                return 200, s.list_communes()
+            if len(parts) == 2 and parts[0] == 'comuna':
+                return 200, s.commune(parts[1], _list(params.get('indicadores')))
+            if len(parts) == 2 and parts[0] == 'ranking':
+                orden = params.get('orden', 'desc')
+                if orden not in ('asc', 'desc'):
+                    raise ValueError("orden debe ser 'asc' o 'desc'")
+                return 200, s.ranking(parts[1], params.get('area'), int(params.get('n', 7)), orden)
+            if parts == ['manzanas']:
+                return 200, s.blocks(_list(params.get('bbox'), float), params.get('crs'),
+                                     _list(params.get('indicadores')), int(params.get('limite', MAX_BLOCKS)))
+            if len(parts) == 2 and parts[0] == 'distribucion':
+                q = _list(params.get('q'), float) or DEFAULT_QUANTILES
+                return 200, s.distribution(parts[1], params.get('comuna'), int(params.get('bins', DEFAULT_BINS)), q)
+            return 404, {'error': f"Ruta desconocida: {path}"}
+        except KeyError as e:
+            return 404, {'error': e.args[0]}
+        except ValueError as e:
+            return 400, {'error': str(e)}
+
+    def status(self):
+        minx, miny, maxx, maxy = self.store.index.tree.boxes[:, -1]
+        return {'manzanas': self.store.rows, 'carga_s': round(self.store.load_seconds, 3),
+                'crs': self.store.index.crs, 'extension': [float(minx), float(miny), float(maxx), float(maxy)],
+                'cache': {'entradas': len(self.cache), 'aciertos': self.hits, 'fallos': self.misses}}
+
+    async def respond(self, target):
+        split = urlsplit(target)
+        if split.path.rstrip('/') == '/estado':
+            return 200, json.dumps(self.status()).encode('utf-8')
+        key = (split.path, tuple(sorted(parse_qsl(split.query))))
+        body = self.cache.get(key)
+        if body is not None:
+            self.hits += 1
+            self.cache.move_to_end(key)
+            return body
+        self.misses += 1
+        loop = asyncio.get_running_loop()
+        status, payload = await loop.run_in_executor(None, self.route, *key)
+        body = (status, json.dumps(payload, ensure_ascii=False).encode('utf-8'))
+        self.cache[key] = body
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return body
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                headers = {}
+                while True:
+                    header = await reader.readline()
+                    if header in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = header.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                try:
+                    method, target, version = line.decode('latin-1').split()
+                except ValueError:
+                    break
+                if method != 'GET':
+                    status, body = 405, b'{"error": "Solo GET"}'
+                else:
+                    try:
+                        status, body = await self.respond(target)
+                    except Exception as e:
+                        status, body = 500, json.dumps({'error': str(e)}).encode('utf-8')
+                keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                writer.write(f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+                             f"Content-Type: application/json; charset=utf-8\r\n"
+                             f"Content-Length: {len(body)}\r\n"
+                             f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode('latin-1') + body)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(host=HOST, port=PORT, source=SOURCE_FILE, cache_size=CACHE_SIZE):
+    store = QueryStore(source)
+    app = QueryServer(store, cache_size)
+    server = await asyncio.start_server(app.handle, host, port, backlog=1024)
+    print(f"Datos cargados en {store.load_seconds:.2f}s ({store.rows:,} manzanas, {len(store.indicators)} indicadores)")
+    print(f"Sirviendo en http://{host}:{port}/ (Ctrl+C para salir)")
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="API HTTP local de consultas sobre los indicadores procesados")
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--puerto', type=int, default=PORT)
+    parser.add_argument('--cache', type=int, default=CACHE_SIZE, help="Respuestas en el caché LRU")
+    parser.add_argument('--fuente', default=SOURCE_FILE)
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.puerto, args.fuente, args.cache))
+    except KeyboardInterrupt:
+        pass
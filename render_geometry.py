@@ -0,0 +1,123 @@
+"""
+Geometría "lista para renderizar" de las manzanas.
+
+Los mapas se dibujan en Web Mercator (EPSG:3857) a FIG_SIZE × DPI (1080 px). Reproyectar
+cada comuna en cada indicador y dibujar vértices que caen dentro de un mismo pixel es trabajo
+perdido, así que en la etapa de procesamiento guardamos una segunda geometría:
+  - ya proyectada a EPSG:3857
+  - simplificada (preserve_topology=True) con tolerancia de medio pixel del mapa de SU comuna
+
+Uso:
+    python render_geometry.py --reporte      # reducción de vértices y speedup de render por comuna
+"""
+import time
+
+import numpy as np
+
+# Tamaño de salida de los mapas (generate_maps los importa de aquí: el ETL no carga matplotlib)
+DPI = 300
+FIG_SIZE = (3.6, 3.6)    # Formato cuadrado para IG (1080x1080 px aprox)
+RENDER_CRS = 'EPSG:3857'
+RENDER_COL = 'geom_render'
+MAP_MARGIN = 0.1         # Margen que agrega generate_commune_map a cada lado
+AXES_FRACTION = 0.775    # Fracción del ancho de la figura que ocupa el eje del mapa (subplot por defecto)
+PIXEL_FRACTION = 0.5     # Tolerancia = medio pixel
+
+
+def pixel_size(extent, fig_size, dpi):
+    """Tamaño (en unidades del CRS) de un pixel del mapa de una comuna de ancho/alto 'extent'"""
+    pixels = min(fig_size) * dpi * AXES_FRACTION
+    return extent * (1 + 2 * MAP_MARGIN) / pixels
+
+
+def build_render_geometry(gdf, fig_size=None, dpi=None, by='COMUNA'):
+    """
+    Retorna (GeoSeries en EPSG:3857 simplificada, DataFrame de reporte por comuna).
+    La tolerancia se deriva del tamaño de pixel del mapa de cada comuna.
+    """
+    import geopandas as gpd
+    import pandas as pd
+    import shapely
+
+    fig_size = fig_size or FIG_SIZE
+    dpi = dpi or DPI
+
+    projected = gdf.geometry.to_crs(RENDER_CRS)
+    geoms = projected.values
+
+    # Extensión de cada comuna (bounds agregados) -> tolerancia por fila
+    bounds = pd.DataFrame(shapely.bounds(geoms), columns=['minx', 'miny', 'maxx', 'maxy'], index=gdf.index)
+    bounds[by] = gdf[by].values
+    ext = bounds.groupby(by).agg(minx=('minx', 'min'), miny=('miny', 'min'),
+                                 maxx=('maxx', 'max'), maxy=('maxy', 'max'))
+    extent = np.maximum(ext['maxx'] - ext['minx'], ext['maxy'] - ext['miny'])
+    tol_by_commune = pixel_size(extent, fig_size, dpi) * PIXEL_FRACTION
+    tolerance = gdf[by].map(tol_by_commune).to_numpy(dtype=float)
+
+    simplified = shapely.simplify(geoms, tolerance, preserve_topology=True)
+
+    before = shapely.get_num_coordinates(geoms)
+    after = shapely.get_num_coordinates(simplified)
+    report = pd.DataFrame({by: gdf[by].values, 'vertices_orig': before, 'vertices_render': after})
+    report = report.groupby(by).sum()
+    report['tolerancia_m'] = tol_by_commune
+    report['reduccion'] = 1 - report['vertices_render'] / report['vertices_orig'].replace(0, np.nan)
+
+    render = gpd.GeoSeries(simplified, index=gdf.index, crs=RENDER_CRS, name=RENDER_COL)
+    return render, report
+
+
+def print_vertex_report(report):
+    total_before = int(report['vertices_orig'].sum())
+    total_after = int(report['vertices_render'].sum())
+    print(f"  Geometría de render: {total_before:,} -> {total_after:,} vértices "
+          f"({(1 - total_after / max(total_before, 1)) * 100:.1f}% menos)")
+
+
+def report_render_speedup(comunas=None, column='idx_privilegio'):
+    """Compara el tiempo de dibujo por comuna: geometría original reproyectada vs geometría de render"""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    from columnar_cache import load_indicators
+    from generate_maps import NEON_CMAP
+
+    orig = load_indicators(columns=['COMUNA', column], comunas=comunas, geometry=True)
+    rend = load_indicators(columns=['COMUNA', column], comunas=comunas, geometry=RENDER_COL)
+    _, report = build_render_geometry(orig, FIG_SIZE, DPI)
+
+    def draw(gdf):
+        t0 = time.perf_counter()
+        fig, ax = plt.subplots(figsize=FIG_SIZE)
+        gdf.plot(column=column, ax=ax, cmap=NEON_CMAP, edgecolor='none', linewidth=0.0)
+        fig.canvas.draw()
+        plt.close(fig)
+        return time.perf_counter() - t0
+
+    rows = []
+    for commune in sorted(orig['COMUNA'].unique()):
+        o = orig[orig['COMUNA'] == commune]
+        r = rend[rend['COMUNA'] == commune]
+        t_orig = draw(o.copy().to_crs(epsg=3857))   # Camino anterior: copia + reproyección
+        t_rend = draw(r)                            # Camino nuevo: directo
+        rows.append((commune, int(report.loc[commune, 'vertices_orig']),
+                     int(report.loc[commune, 'vertices_render']), t_orig, t_rend))
+
+    print(f"\n{'COMUNA':25} {'VÉRTICES':>19} {'REDUCC.':>8} {'T ORIG':>8} {'T RENDER':>9} {'SPEEDUP':>8}")
+    for commune, vb, va, to, tr in rows:
+        print(f"{commune:25} {vb:>9,}->{va:<9,} {(1 - va / max(vb, 1)) * 100:7.1f}% "
+              f"{to:7.2f}s {tr:8.2f}s {to / max(tr, 1e-9):7.2f}x")
+    return rows
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Geometría de render (EPSG:3857 simplificada)")
+    parser.add_argument('--reporte', action='store_true',
+                        help="Reporte de reducción de vértices y speedup de render por comuna")
+    parser.add_argument('--comunas', nargs='*', default=None, help="Comunas a reportar (default: todas)")
+    args = parser.parse_args()
+    if args.reporte:
+        report_render_speedup(comunas=args.comunas)
+    else:
+        parser.print_help()
@@ -0,0 +1,431 @@
+"""
+Plantillas de render reutilizables para las infografías (dashboard, elementos ELEM_* y lollipop).
+
+Antes cada indicador reconstruía las cinco figuras desde cero (gridspec, textos fijos, spines,
+tight_layout, seaborn) y dibujaba todo dos veces (plt.savefig + draw_idle). Ahora cada tipo de
+artefacto se arma UNA vez por área metropolitana:
+  - el layout estático (fondos, títulos de sección, separadores, spines, fuente) se renderiza
+    una vez con Agg y se guarda como fondo (copy_from_bbox)
+  - por indicador solo se actualizan los artistas que dependen de los datos (set_width, set_text,
+    set_offsets, set_data) y se dibujan sobre el fondo restaurado (draw_artist)
+  - el PNG se escribe directo desde el buffer RGBA (PNG_COMPRESS_LEVEL)
+La densidad es una KDE gaussiana con ancho de banda de Scott calculada con NumPy, igual a la de
+sns.kdeplot por defecto.
+
+Uso:
+    python render_templates.py --bench 20      # plantillas nuevas vs reutilizadas, 20 indicadores
+"""
+import os
+import time
+
+import numpy as np
+
+from generate_maps import CYBER_CYAN, CYBER_GREEN, CYBER_MAGENTA, CYBER_YELLOW, DPI, FIG_SIZE, OUTPUT_DIR
+
+BG_COLOR = '#0f111a'         # Dark Navy/Black aesthetic
+ACCENT_COLOR = CYBER_MAGENTA
+SEC_COLOR = CYBER_CYAN
+TEXT_MAIN = '#ffffff'
+TEXT_SUB = '#8b9bb4'         # Blue-gray for subtitles
+MAX_COLOR = '#ff4444'
+TOP_N = 7
+# zlib nivel 1: el PNG pesa ~20% más pero se codifica varias veces más rápido (Instagram recomprime igual)
+PNG_COMPRESS_LEVEL = 1
+
+# KDE (mismos parámetros que sns.kdeplot(clip=(0, 100)))
+KDE_GRID = 200
+KDE_CUT = 3
+KDE_CLIP = (0, 100)
+
+_TEMPLATES = {}
+
+
+def kde(values, clip=KDE_CLIP, gridsize=KDE_GRID, cut=KDE_CUT):
+    """(x, densidad) gaussiana con ancho de banda de Scott; vacía si no hay varianza"""
+    values = np.asarray(values, dtype=float)
+    if len(values) < 2 or values.std() == 0:
+        return np.empty(0), np.empty(0)
+    bw = values.std(ddof=1) * len(values) ** (-1 / 5)
+    x = np.linspace(max(values.min() - cut * bw, clip[0]), min(values.max() + cut * bw, clip[1]), gridsize)
+    z = (x[:, None] - values[None, :]) / bw
+    density = np.exp(-0.5 * z ** 2).sum(axis=1) / (len(values) * bw * np.sqrt(2 * np.pi))
+    return x, density
+
+
+def _fill_verts(x, y):
+    return [np.column_stack([np.r_[x, x[::-1]], np.r_[y, np.zeros(len(y))]])] if len(x) else [np.empty((0, 2))]
+
+
+def _figure(figsize, transparent=False, facecolor=None):
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    fig = Figure(figsize=figsize, dpi=DPI)
+    FigureCanvasAgg(fig)
+    if transparent:
+        fig.patch.set_alpha(0.0)
+    elif facecolor:
+        fig.patch.set_facecolor(facecolor)
+    return fig
+
+
+def _clean_spines(ax, hide=('top', 'right')):
+    for side in hide:
+        ax.spines[side].set_visible(False)
+
+
+class FigureTemplate:
+    """Figura cuyo layout estático se rasteriza una vez; render() solo redibuja los artistas dinámicos"""
+
+    def __init__(self, fig):
+        self.fig = fig
+        self.dynamic = []
+        self._background = None
+        self.encode_seconds = 0.0    # Tiempo acumulado en la codificación PNG (para --bench)
+
+    def _dynamic(self, *artists):
+        for artist in artists:
+            artist.set_animated(True)
+            self.dynamic.append(artist)
+        return artists[0] if len(artists) == 1 else artists
+
+    def render(self, path):
+        from PIL import Image
+        canvas = self.fig.canvas
+        if self._background is None:
+            canvas.draw()
+            self._background = canvas.copy_from_bbox(self.fig.bbox)
+        else:
+            canvas.restore_region(self._background)
+        for artist in self.dynamic:
+            self.fig.draw_artist(artist)
+        width, height = canvas.get_width_height()
+        t0 = time.perf_counter()
+        Image.frombuffer('RGBA', (width, height), canvas.buffer_rgba(), 'raw', 'RGBA', 0, 1).save(
+            path, dpi=(DPI, DPI), compress_level=PNG_COMPRESS_LEVEL)
+        self.encode_seconds += time.perf_counter() - t0
+
+
+class _TopBars:
+    """Barras horizontales del top 7 + etiquetas de valor y de comuna (dinámicas)"""
+
+    def __init__(self, template, ax, label_size=10):
+        self.ax = ax
+        self.bars = list(ax.barh(range(TOP_N), np.zeros(TOP_N), color=ACCENT_COLOR, alpha=1.0, height=0.5))
+        self.values = [ax.text(0, i - 0.02, '', ha='left', va='center', color=TEXT_MAIN, fontsize=label_size,
+                               fontweight='bold', fontfamily='monospace') for i in range(TOP_N)]
+        ax.set_yticks(range(TOP_N))
+        ax.tick_params(axis='y', length=0, pad=8)
+        template._dynamic(*self.bars, *self.values, ax.yaxis)
+
+    def update(self, top, column, max_val, xlim_factor):
+        k = len(top)
+        for i, (bar, text) in enumerate(zip(self.bars, self.values)):
+            visible = i < k
+            bar.set_visible(visible)
+            text.set_visible(visible)
+            if visible:
+                width = float(top[column].iloc[i])
+                bar.set_width(width)
+                text.set_position((width + max_val * 0.02, i - 0.02))
+                text.set_text(f'{width:.1f}%')
+        self.ax.set_yticks(range(k))
+        self.ax.set_yticklabels(top['COMUNA'], color=TEXT_MAIN, fontsize=9, fontweight='medium')
+        margin = 0.05 * (k - 0.5)
+        self.ax.set_ylim(-0.25 - margin, k - 0.75 + margin)
+        self.ax.set_xlim(0, max_val * xlim_factor)
+
+
+class _Density:
+    """KDE + línea de promedio + marcadores máximo / mínimo / más cercano al promedio (dinámicos)"""
+
+    def __init__(self, template, ax, alpha, linewidth, marker_size, label_size, avg_label, avg_size,
+                 label_offset=0.0):
+        from matplotlib.collections import PolyCollection
+        self.ax = ax
+        self.fill = ax.add_collection(PolyCollection(_fill_verts(np.empty(0), np.empty(0)), facecolor=CYBER_GREEN,
+                                                     alpha=alpha, linewidth=0))
+        self.line, = ax.plot([], [], color=CYBER_GREEN, linewidth=linewidth)
+        self.avg_line = ax.axvline(0, color=TEXT_MAIN, linestyle=':', linewidth=linewidth * 2 / 3,
+                                   alpha=0.7 if linewidth < 2 else 0.9)
+        self.avg_text = ax.text(0, 0, avg_label, color=TEXT_MAIN, fontsize=avg_size)
+        self.avg_shift = avg_label == 'AVG'
+        self.label_offset = label_offset
+        styles = [(MAX_COLOR, 'bold', 5), (CYBER_CYAN, 'medium', 5), (CYBER_YELLOW, 'medium', 4)]
+        self.markers = [ax.scatter([0], [0], color=c, s=marker_size, zorder=z, marker='o') for c, _, z in styles]
+        self.labels = [ax.text(0, 0, '', color=c, fontsize=label_size, ha='center', fontweight=w) for c, w, _ in styles]
+        template._dynamic(self.fill, self.line, self.avg_line, self.avg_text, *self.markers, *self.labels, ax.xaxis)
+
+    def update(self, valid_df, column, avg_val, max_val):
+        values = valid_df[column].to_numpy(dtype=float)
+        x, density = kde(values)
+        self.line.set_data(x, density)
+        self.fill.set_verts(_fill_verts(x, density))
+        ymax = density.max() * 1.05 if len(density) else 1.0
+        self.ax.set_xlim(0, max_val * 1.1)
+        self.ax.set_ylim(0, ymax)
+
+        self.avg_line.set_xdata([avg_val, avg_val])
+        if self.avg_shift:
+            self.avg_text.set_position((avg_val + max_val * 0.02, ymax * 0.8))
+        else:
+            self.avg_text.set_position((avg_val, ymax * 0.95))
+
+        # Máximo, mínimo (ya viene ordenado de mayor a menor) y la comuna más cercana al promedio
+        near = int(np.argmin(np.abs(values - avg_val)))
+        rows = [0, len(values) - 1, near]
+        marker_y, label_y = ymax * 0.15, ymax * 0.30
+        for i, (marker, label, row) in enumerate(zip(self.markers, self.labels, rows)):
+            value = values[row]
+            marker.set_offsets([[value, marker_y]])
+            offset = self.label_offset * ymax if i == 2 else 0.0
+            label.set_position((value, label_y + offset))
+            label.set_text(valid_df['COMUNA'].iloc[row])
+
+
+class Dashboard(FigureTemplate):
+    """Infografía 1080x1080: header, top 7, KPI y distribución"""
+
+    def __init__(self):
+        super().__init__(_figure(FIG_SIZE, facecolor=BG_COLOR))
+        fig = self.fig
+        gs = fig.add_gridspec(3, 1, height_ratios=[0.15, 0.50, 0.35], hspace=0.3)
+
+        ax_header = fig.add_subplot(gs[0, 0])
+        ax_header.axis('off')
+        self.title = self._dynamic(ax_header.text(0.5, 0.55, '', ha='center', va='center', color=TEXT_MAIN,
+                                                  fontsize=20, fontweight='bold'))
+        self.description = self._dynamic(ax_header.text(0.5, 0.25, '', ha='center', va='center', color=SEC_COLOR,
+                                                        fontsize=9, fontweight='medium', alpha=0.9))
+        ax_header.plot([0.3, 0.7], [0.1, 0.1], color=TEXT_SUB, linewidth=0.5, alpha=0.5)
+
+        gs_mid = gs[1].subgridspec(1, 2, width_ratios=[1.3, 0.7], wspace=0.15)
+        ax_bars = fig.add_subplot(gs_mid[0])
+        self.bars = _TopBars(self, ax_bars)
+        ax_bars.set_title("TOP 7 COMUNAS", color=TEXT_SUB, fontsize=8, loc='left', pad=10, fontweight='bold')
+        _clean_spines(ax_bars, ('top', 'right', 'bottom'))
+        ax_bars.spines['left'].set_color(TEXT_SUB)
+        ax_bars.spines['left'].set_linewidth(0.5)
+        ax_bars.xaxis.set_visible(False)
+
+        ax_stat = fig.add_subplot(gs_mid[1])
+        ax_stat.axis('off')
+        ax_stat.axvline(x=0.1, ymin=0.1, ymax=0.9, color=TEXT_SUB, linewidth=0.5, alpha=0.5)
+        ax_stat.text(0.2, 0.80, "MÁXIMO", ha='left', color=SEC_COLOR, fontsize=9, fontweight='bold')
+        self.max_text = self._dynamic(ax_stat.text(0.2, 0.62, '', ha='left', color=TEXT_MAIN, fontsize=26,
+                                                   fontweight='bold', fontfamily='monospace'))
+        ax_stat.text(0.2, 0.40, "PROMEDIO RM", ha='left', color=TEXT_SUB, fontsize=8, fontweight='bold')
+        self.avg_text = self._dynamic(ax_stat.text(0.2, 0.25, '', ha='left', color=TEXT_SUB, fontsize=16,
+                                                   fontweight='bold', fontfamily='monospace'))
+
+        ax_dist = fig.add_subplot(gs[2, 0])
+        self.density = _Density(self, ax_dist, alpha=0.2, linewidth=1.5, marker_size=25, label_size=6,
+                                avg_label="AVG", avg_size=7)
+        ax_dist.set_title("DISTRIBUCIÓN DE CASOS", color=TEXT_SUB, fontsize=8, loc='left', pad=5, fontweight='bold')
+        _clean_spines(ax_dist, ('top', 'right', 'left'))
+        ax_dist.spines['bottom'].set_color(TEXT_SUB)
+        ax_dist.ticklabel_format(style='plain', axis='x')
+        ax_dist.tick_params(axis='x', colors=TEXT_SUB, labelsize=8)
+        ax_dist.yaxis.set_visible(False)
+
+        fig.text(0.5, 0.03, "FUENTE: INE CENSO 2024 • VISUALIZACIÓN: @CONMAPAS", ha="center", fontsize=7,
+                 color=TEXT_SUB, alpha=0.6)
+        fig.subplots_adjust(left=0.15, right=0.90, top=0.92, bottom=0.08)
+
+    def update(self, valid_df, column, title, description):
+        max_val, avg_val = valid_df[column].max(), valid_df[column].mean()
+        self.title.set_text(title.upper())
+        self.description.set_text(description)
+        self.bars.update(valid_df.head(TOP_N).iloc[::-1], column, max_val, 1.25)
+        self.max_text.set_text(f"{max_val:.1f}%")
+        self.avg_text.set_text(f"{avg_val:.1f}%")
+        self.density.update(valid_df, column, avg_val, max_val)
+
+
+class RankElement(FigureTemplate):
+    """ELEM_RANK: top 7 transparente con título centrado en el lienzo"""
+
+    def __init__(self, communes):
+        super().__init__(_figure((6, 4.5), transparent=True))
+        ax = self.fig.add_subplot(111)
+        self.bars = _TopBars(self, ax)
+        self.title = self._dynamic(self.fig.text(0.5, 0.92, '', ha='center', va='center', color=TEXT_MAIN,
+                                                 fontsize=14, fontweight='bold'))
+        self.description = self._dynamic(self.fig.text(0.5, 0.85, '', ha='center', va='center', color=SEC_COLOR,
+                                                       fontsize=10, fontweight='medium'))
+        _clean_spines(ax, ('top', 'right', 'bottom'))
+        ax.spines['left'].set_color(TEXT_SUB)
+        ax.xaxis.set_visible(False)
+        ax.set_facecolor('none')
+        # Layout fijo calculado con los nombres de comuna más largos del área
+        longest = sorted(communes, key=len)[-TOP_N:]
+        ax.set_yticklabels(longest + [''] * (TOP_N - len(longest)), fontsize=9, fontweight='medium')
+        self.fig.tight_layout(rect=[0, 0, 1, 0.82])
+
+    def update(self, valid_df, column, title, description):
+        self.bars.update(valid_df.head(TOP_N).iloc[::-1], column, valid_df[column].max(), 1.3)
+        self.title.set_text(f"TOP 7: {title.upper()}")
+        self.description.set_text(description)
+
+
+class StatsElement(FigureTemplate):
+    """ELEM_STATS: tarjeta de máximo y promedio"""
+
+    def __init__(self):
+        super().__init__(_figure((4, 3), transparent=True))
+        ax = self.fig.add_subplot(111)
+        ax.axis('off')
+        self.title = self._dynamic(ax.text(0.5, 0.85, '', ha='center', color=TEXT_MAIN, fontsize=14, fontweight='bold'))
+        ax.text(0.5, 0.65, "MÁXIMO REGIONAL", ha='center', color=SEC_COLOR, fontsize=10, fontweight='bold')
+        self.max_text = self._dynamic(ax.text(0.5, 0.50, '', ha='center', color=TEXT_MAIN, fontsize=40,
+                                              fontweight='bold', fontfamily='monospace'))
+        ax.plot([0.3, 0.7], [0.4, 0.4], color=TEXT_SUB, linewidth=1, alpha=0.5)
+        ax.text(0.5, 0.30, "PROMEDIO RM", ha='center', color=TEXT_SUB, fontsize=10, fontweight='bold')
+        self.avg_text = self._dynamic(ax.text(0.5, 0.15, '', ha='center', color=TEXT_SUB, fontsize=24,
+                                              fontweight='bold', fontfamily='monospace'))
+        self.fig.tight_layout()
+
+    def update(self, valid_df, column, title, description):
+        self.title.set_text(title.upper())
+        self.max_text.set_text(f"{valid_df[column].max():.1f}%")
+        self.avg_text.set_text(f"{valid_df[column].mean():.1f}%")
+
+
+class DistributionElement(FigureTemplate):
+    """ELEM_DIST: distribución panorámica con marcadores"""
+
+    def __init__(self):
+        super().__init__(_figure((6, 2.5), transparent=True))
+        ax = self.fig.add_subplot(111)
+        self.density = _Density(self, ax, alpha=0.4, linewidth=2, marker_size=35, label_size=8,
+                                avg_label=" PROMEDIO", avg_size=8, label_offset=0.08)
+        self.title = self._dynamic(ax.set_title(' ', color=TEXT_MAIN, fontsize=10, pad=10, fontweight='bold'))
+        ax.set_facecolor('none')
+        _clean_spines(ax, ('top', 'right', 'left'))
+        ax.spines['bottom'].set_color(TEXT_SUB)
+        ax.ticklabel_format(style='plain', axis='x')
+        ax.tick_params(axis='x', colors=TEXT_MAIN)
+        ax.yaxis.set_visible(False)
+        ax.set_xlabel("Porcentaje (%)", color=TEXT_SUB)
+        self.fig.tight_layout()
+
+    def update(self, valid_df, column, title, description):
+        max_val, avg_val = valid_df[column].max(), valid_df[column].mean()
+        self.density.update(valid_df, column, avg_val, max_val)
+        self.title.set_text(f"DISTRIBUCIÓN: {title.upper()}")
+
+
+class Lollipop(FigureTemplate):
+    """LOLLIPOP: todas las comunas del área, de menor a mayor"""
+
+    def __init__(self, communes):
+        from matplotlib.collections import LineCollection
+        super().__init__(_figure((6, 8), transparent=True))
+        ax = self.ax = self.fig.add_subplot(111)
+        n = self.n = len(communes)
+        self.stems = self._dynamic(ax.add_collection(LineCollection([], colors=TEXT_SUB, alpha=0.4, linewidths=1)))
+        self.heads = self._dynamic(ax.scatter(np.zeros(n), np.arange(n), s=40, zorder=3))
+        self.avg_line = self._dynamic(ax.axvline(0, color=CYBER_YELLOW, linestyle='--', linewidth=1.5, alpha=0.8,
+                                                 label='Promedio: 100.0%'))
+        self.title = self._dynamic(ax.set_title(' ', color=TEXT_MAIN, fontsize=11, fontweight='bold', pad=10))
+        ax.set_yticks(range(n))
+        ax.set_yticklabels(communes, fontsize=6, color=TEXT_MAIN)
+        ax.set_xlabel("Porcentaje (%)", color=TEXT_SUB, fontsize=9)
+        ax.set_facecolor('none')
+        _clean_spines(ax)
+        ax.spines['left'].set_color(TEXT_SUB)
+        ax.spines['bottom'].set_color(TEXT_SUB)
+        ax.tick_params(axis='x', colors=TEXT_SUB)
+        ax.tick_params(axis='y', length=0)
+        self.legend = self._dynamic(ax.legend(loc='lower right', fontsize=8, frameon=False, labelcolor=TEXT_MAIN))
+        margin = 0.05 * max(n - 1, 1)
+        ax.set_ylim(-margin, n - 1 + margin)
+        self._dynamic(ax.xaxis, ax.yaxis)
+        self.fig.tight_layout()
+
+    def update(self, valid_df, column, title, description):
+        all_sorted = valid_df.sort_values(by=column, ascending=True)
+        values = all_sorted[column].to_numpy(dtype=float)
+        y = np.arange(len(values))
+        max_val, min_val, avg_val = valid_df[column].max(), values.min(), valid_df[column].mean()
+        self.stems.set_segments([[(0, i), (v, i)] for i, v in zip(y, values)])
+        self.heads.set_offsets(np.column_stack([values, y]))
+        self.heads.set_facecolor([CYBER_MAGENTA if v == max_val else (CYBER_CYAN if v == min_val else CYBER_GREEN)
+                                  for v in values])
+        self.ax.set_yticks(y)
+        self.ax.set_yticklabels(all_sorted['COMUNA'], fontsize=6, color=TEXT_MAIN)
+        self.ax.set_xlim(-0.05 * max_val, max_val * 1.05)
+        self.avg_line.set_xdata([avg_val, avg_val])
+        self.legend.get_texts()[0].set_text(f'Promedio: {avg_val:.1f}%')
+        self.title.set_text(f"RANKING COMUNAS: {title.upper()}")
+
+
+def area_templates(area_name, communes):
+    """Plantillas de un área (una por tipo de artefacto), construidas una vez por proceso"""
+    key = (area_name, tuple(sorted(communes)))
+    if key not in _TEMPLATES:
+        _TEMPLATES[key] = {
+            'DASH': Dashboard(),
+            'ELEM_RANK': RankElement(list(key[1])),
+            'ELEM_STATS': StatsElement(),
+            'ELEM_DIST': DistributionElement(),
+            'LOLLIPOP': Lollipop(list(key[1])),
+        }
+    return _TEMPLATES[key]
+
+
+def render_infographic(valid_df, column, title, filename_base, description, area_name, reuse=True):
+    """Actualiza y guarda los cinco artefactos de un indicador. valid_df: sin nulos, de mayor a menor"""
+    if reuse:
+        templates = area_templates(area_name, valid_df['COMUNA'])
+    else:
+        communes = sorted(valid_df['COMUNA'])
+        templates = {'DASH': Dashboard(), 'ELEM_RANK': RankElement(communes), 'ELEM_STATS': StatsElement(),
+                     'ELEM_DIST': DistributionElement(), 'LOLLIPOP': Lollipop(communes)}
+    if not os.path.exists(OUTPUT_DIR): os.makedirs(OUTPUT_DIR)
+    paths = {}
+    encode_before = sum(t.encode_seconds for t in templates.values())
+    for kind, template in templates.items():
+        template.update(valid_df, column, title, description)
+        suffix = f"DASH_{area_name.replace(' ', '')}" if kind == 'DASH' else kind
+        paths[kind] = os.path.join(OUTPUT_DIR, f"{filename_base}_{suffix}.png")
+        template.render(paths[kind])
+    render_infographic.encode_seconds += sum(t.encode_seconds for t in templates.values()) - encode_before
+    return paths
+
+
+render_infographic.encode_seconds = 0.0
+
+
+def bench(n_indicators=20, n_communes=34, seed=0):
+    """Tiempo por infografía: plantillas construidas por indicador vs reutilizadas"""
+    import pandas as pd
+    rng = np.random.default_rng(seed)
+    communes = [f"COMUNA {i:02d}" for i in range(n_communes)]
+    frames = [pd.DataFrame({'COMUNA': communes, 'valor': rng.gamma(2 + i % 5, 6, n_communes)})
+              .sort_values('valor', ascending=False) for i in range(n_indicators)]
+    results = {}
+    for label, reuse in (('nuevas', False), ('reutilizadas', True)):
+        _TEMPLATES.clear()
+        render_infographic.encode_seconds = 0.0
+        t0 = time.perf_counter()
+        for i, df in enumerate(frames):
+            render_infographic(df, 'valor', f"Indicador {i}", f"bench_{label}", "Descripción de prueba",
+                               'Gran Santiago', reuse=reuse)
+        total = (time.perf_counter() - t0) / n_indicators
+        results[label] = (total, total - render_infographic.encode_seconds / n_indicators)
+    print(f"  {n_indicators} infografías (5 PNG c/u, {n_communes} comunas):")
+    print(f"    {'plantillas':<24} {'total ms':>9} {'sin PNG ms':>11}")
+    for label, (total, draw) in results.items():
+        print(f"    {label:<24} {total * 1000:9.1f} {draw * 1000:11.1f}")
+    print(f"    speedup: {results['nuevas'][0] / results['reutilizadas'][0]:.1f}x total, "
+          f"{results['nuevas'][1] / results['reutilizadas'][1]:.1f}x sin codificar PNG")
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Plantillas de render de infografías")
+    parser.add_argument('--bench', type=int, default=20, metavar='N', help="Indicadores a renderizar")
+    parser.add_argument('--comunas', type=int, default=34)
+    args = parser.parse_args()
+    bench(args.bench, args.comunas)
@@ -0,0 +1,328 @@
+"""
+Índice espacial persistente de manzanas (R-tree empaquetado STR) y consultas punto / radio / polígono.
+
+Se construye una vez al procesar (process_data) dentro del caché columnar, así que se invalida
+con él, y se carga memory-mapped:
+  cache/manzanas_<clave>/_indice/
+      arbol_*.npy        cajas de todos los niveles del árbol + orden de las hojas (np.load mmap)
+      manzanas.arrow     MANZENT + geometría WKB en el CRS de la capa (Arrow IPC, memory-mapped)
+
+El árbol se recorre nivel por nivel para TODAS las consultas a la vez (pares consulta-nodo en
+arreglos NumPy); el test exacto usa los predicados vectorizados de shapely solo sobre los candidatos.
+100k puntos = unas pocas operaciones NumPy por nivel, sin loops Python por punto.
+
+    from spatial_index import blocks_at, blocks_near, blocks_in
+    blocks_at([-70.6], [-33.45], crs='EPSG:4326', columns=['idx_privilegio'])
+    blocks_near(350_000, 6_300_000, 500, columns=['pct_internet'])
+    blocks_in(poligono, columns=['pct_hacinamiento'])
+
+Uso:
+    python spatial_index.py --construir
+    python spatial_index.py punto -70.60 -33.45 --crs EPSG:4326 --columnas idx_privilegio pct_internet
+    python spatial_index.py radio 350000 6300000 500
+    python spatial_index.py --bench 100000
+"""
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from columnar_cache import SOURCE_FILE, ensure_cache, load_indicators
+
+INDEX_DIR = '_indice'
+# Fan-out chico: el recorrido por lotes genera NODE_SIZE pares por candidato y nivel
+NODE_SIZE = 4
+ID_COL = 'MANZENT'
+
+_LOADED = {}
+
+
+# === R-tree empaquetado (Sort-Tile-Recursive) ===
+
+class PackedRTree:
+    """
+    Árbol estático de cajas: hojas ordenadas por STR y niveles superiores de NODE_SIZE hijos.
+    boxes: cajas (4 x nodos: minx, miny, maxx, maxy) de todos los niveles, hojas primero;
+    bounds: inicio de cada nivel.
+    order: para cada hoja, el índice del ítem original.
+    """
+
+    def __init__(self, boxes, bounds, order, node_size=NODE_SIZE):
+        self.boxes = boxes
+        self.bounds = bounds
+        self.order = order
+        self.node_size = node_size
+
+    @classmethod
+    def build(cls, item_boxes, node_size=NODE_SIZE):
+        n = len(item_boxes)
+        cx = (item_boxes[:, 0] + item_boxes[:, 2]) / 2
+        cy = (item_boxes[:, 1] + item_boxes[:, 3]) / 2
+        # STR: franjas verticales de ~sqrt(n/node_size) nodos, ordenadas por y dentro de cada franja
+        n_nodes = max(int(np.ceil(n / node_size)), 1)
+        slice_size = int(np.ceil(np.sqrt(n_nodes))) * node_size
+        rank_x = np.empty(n, dtype=np.int64)
+        rank_x[np.argsort(cx, kind='stable')] = np.arange(n)
+        order = np.lexsort((cy, rank_x // slice_size)).astype(np.int64)
+
+        levels = [item_boxes[order]]
+        while len(levels[-1]) > 1:
+            child = levels[-1]
+            starts = np.arange(0, len(child), node_size)
+            levels.append(np.column_stack([
+                np.minimum.reduceat(child[:, 0], starts), np.minimum.reduceat(child[:, 1], starts),
+                np.maximum.reduceat(child[:, 2], starts), np.maximum.reduceat(child[:, 3], starts),
+            ]))
+        bounds = np.cumsum([0] + [len(level) for level in levels]).astype(np.int64)
+        # Columnas contiguas (4 x nodos): cada comparación lee una sola coordenada
+        boxes = np.ascontiguousarray(np.concatenate(levels).T) if n else np.empty((4, 0))
+        return cls(boxes, bounds, order, node_size)
+
+    def save(self, folder):
+        for name in ('boxes', 'bounds', 'order'):
+            np.save(os.path.join(folder, f"arbol_{name}.npy"), getattr(self, name))
+
+    @classmethod
+    def load(cls, folder, node_size=NODE_SIZE):
+        """Carga memory-mapped: solo se leen las páginas de los nodos que visitan las consultas"""
+        arrays = {name: np.load(os.path.join(folder, f"arbol_{name}.npy"), mmap_mode='r')
+                  for name in ('boxes', 'bounds', 'order')}
+        return cls(arrays['boxes'], np.asarray(arrays['bounds']), arrays['order'], node_size)
+
+    def query(self, qboxes):
+        """
+        Intersección de cajas, vectorizada para todas las consultas.
+        Retorna (indice_consulta, indice_item) de los candidatos.
+        """
+        qboxes = np.atleast_2d(np.asarray(qboxes, dtype=np.float64))
+        qcols = [np.ascontiguousarray(qboxes[:, k]) for k in range(4)]
+        n_levels = len(self.bounds) - 1
+        if n_levels == 0:
+            return np.empty(0, np.int64), np.empty(0, np.int64)
+        q = np.arange(len(qboxes))
+        node = np.zeros(len(qboxes), dtype=np.int64)   # raíz (nivel superior, un solo nodo)
+        q, node = self._filter(q, node, n_levels - 1, qcols)
+        for level in range(n_levels - 2, -1, -1):
+            size = self.bounds[level + 1] - self.bounds[level]
+            child = (node[:, None] * self.node_size + np.arange(self.node_size)).ravel()
+            q = np.repeat(q, self.node_size)
+            valid = child < size
+            q, node = self._filter(q[valid], child[valid], level, qcols)
+        return q, np.asarray(self.order)[node]
+
+    def _filter(self, q, node, level, qcols):
+        """Pares (consulta, nodo) cuyas cajas se tocan; una coordenada a la vez, descartando en cada paso"""
+        pos = node + self.bounds[level]
+        # caja del nodo [minx, miny, maxx, maxy] vs consulta: min_nodo <= max_consulta y max_nodo >= min_consulta
+        for k, qk, le in ((0, 2, True), (2, 0, False), (1, 3, True), (3, 1, False)):
+            box = self.boxes[k][pos]
+            hit = box <= qcols[qk][q] if le else box >= qcols[qk][q]
+            q, node, pos = q[hit], node[hit], pos[hit]
+        return q, node
+
+
+# === Construcción / carga ===
+
+def index_path(source=SOURCE_FILE):
+    return os.path.join(ensure_cache(source), INDEX_DIR)
+
+
+def build_index(gdf=None, source=SOURCE_FILE):
+    """Construye el índice desde un GeoDataFrame (o desde el caché columnar) y lo guarda"""
+    import shutil
+    import pyarrow as pa
+    import shapely
+
+    if gdf is None:
+        gdf = load_indicators(columns=[ID_COL], geometry=True, source=source)
+    folder = index_path(source)
+    tmp = folder + '.tmp'
+    os.makedirs(tmp, exist_ok=True)
+
+    geoms = gdf.geometry.values
+    tree = PackedRTree.build(shapely.bounds(np.asarray(geoms)))
+    tree.save(tmp)
+    table = pa.table({ID_COL: pa.array(gdf[ID_COL].astype(str).to_numpy()),
+                      'wkb': pa.array(shapely.to_wkb(np.asarray(geoms)), type=pa.binary())})
+    with pa.OSFile(os.path.join(tmp, 'manzanas.arrow'), 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    with open(os.path.join(tmp, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump({'crs': gdf.crs.to_string() if gdf.crs is not None else None, 'filas': len(gdf),
+                   'node_size': tree.node_size, 'niveles': len(tree.bounds) - 1}, f, indent=1)
+
+    shutil.rmtree(folder, ignore_errors=True)
+    os.replace(tmp, folder)
+    _LOADED.pop(folder, None)
+    print(f"  Índice espacial: {len(gdf):,} manzanas, {len(tree.bounds) - 1} niveles -> {folder}")
+    return folder
+
+
+class SpatialIndex:
+    """Índice cargado (memory-mapped) + geometrías WKB y MANZENT por ítem"""
+
+    def __init__(self, folder):
+        import pyarrow as pa
+
+        with open(os.path.join(folder, 'meta.json'), encoding='utf-8') as f:
+            self.meta = json.load(f)
+        self.crs = self.meta['crs']
+        self.tree = PackedRTree.load(folder, self.meta['node_size'])
+        self._table = pa.ipc.open_file(pa.memory_map(os.path.join(folder, 'manzanas.arrow'))).read_all()
+        self.ids = self._table.column(ID_COL).to_numpy(zero_copy_only=False)
+        self._attrs = {}
+
+    def geometries(self, items):
+        """Decodifica solo las geometrías pedidas (take sobre el WKB mapeado)"""
+        import shapely
+        wkb = self._table.column('wkb').take(np.asarray(items, dtype=np.int64))
+        return shapely.from_wkb(wkb.to_numpy(zero_copy_only=False))
+
+    def _exact(self, q, items, predicate):
+        """Aplica el predicado exacto una vez por geometría candidata única"""
+        if not len(items):
+            return q, items
+        unique, inverse = np.unique(items, return_inverse=True)
+        geoms = self.geometries(unique)[inverse]
+        keep = predicate(geoms, q)
+        return q[keep], items[keep]
+
+    def locate(self, x, y):
+        """Manzana que contiene cada punto (-1 si ninguna). Puntos en un borde compartido: la primera"""
+        import shapely
+        x, y = np.asarray(x, dtype=np.float64).ravel(), np.asarray(y, dtype=np.float64).ravel()
+        q, items = self.tree.query(np.column_stack([x, y, x, y]))
+        q, items = self._exact(q, items, lambda g, q: shapely.intersects_xy(g, x[q], y[q]))
+        result = np.full(len(x), -1, dtype=np.int64)
+        # Primera coincidencia por punto (q viene agrupado por nivel, no ordenado)
+        first = np.lexsort((items, q))
+        q, items = q[first], items[first]
+        head = np.r_[True, q[1:] != q[:-1]] if len(q) else np.empty(0, bool)
+        result[q[head]] = items[head]
+        return result
+
+    def within(self, x, y, radius):
+        """Pares (punto, manzana) a distancia <= radius (unidades del CRS de la capa)"""
+        import shapely
+        x, y = np.asarray(x, dtype=np.float64).ravel(), np.asarray(y, dtype=np.float64).ravel()
+        r = np.broadcast_to(np.asarray(radius, dtype=np.float64), x.shape)
+        q, items = self.tree.query(np.column_stack([x - r, y - r, x + r, y + r]))
+        return self._exact(q, items, lambda g, q: shapely.dwithin(g, shapely.points(x[q], y[q]), r[q]))
+
+    def intersecting(self, polygon):
+        """Manzanas que intersectan un polígono"""
+        import shapely
+        _, items = self.tree.query([shapely.bounds(polygon)])
+        _, items = self._exact(np.zeros(len(items), dtype=np.int64), items,
+                               lambda g, q: shapely.intersects(g, polygon))
+        return np.sort(items)
+
+    def attributes(self, columns, source=SOURCE_FILE):
+        """Columnas del caché columnar alineadas con los ítems del índice (cacheadas por proceso)"""
+        missing = [c for c in columns if c not in self._attrs]
+        if missing:
+            df = load_indicators(columns=[ID_COL] + missing, source=source)
+            pos = pd.Index(df[ID_COL].astype(str)).get_indexer(self.ids)
+            for c in missing:
+                if c in df.columns:
+                    values = df[c].to_numpy()
+                    self._attrs[c] = np.where(pos >= 0, values[np.maximum(pos, 0)], np.nan) \
+                        if values.dtype.kind in 'fiu' else np.where(pos >= 0, values[np.maximum(pos, 0)], None)
+        return {c: self._attrs[c] for c in columns if c in self._attrs}
+
+
+def load_index(source=SOURCE_FILE):
+    """Índice vigente del caché columnar (se construye si falta). Uno por proceso"""
+    folder = index_path(source)
+    if not os.path.exists(os.path.join(folder, 'meta.json')):
+        build_index(source=source)
+    if folder not in _LOADED:
+        _LOADED[folder] = SpatialIndex(folder)
+    return _LOADED[folder]
+
+
+# === API de consultas ===
+
+def _to_index_crs(x, y, crs, index):
+    if crs is None:
+        return np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+    from pyproj import Transformer
+    transformer = Transformer.from_crs(crs, index.crs, always_xy=True)
+    return transformer.transform(np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64))
+
+
+def _frame(index, items, columns, source, extra=None):
+    df = pd.DataFrame(extra or {})
+    df[ID_COL] = index.ids[items] if len(items) else np.empty(0, dtype=object)
+    for c, values in index.attributes(columns or [], source).items():
+        df[c] = values[items]
+    return df
+
+
+def blocks_at(x, y, columns=None, crs=None, source=SOURCE_FILE):
+    """Manzana que contiene cada punto: DataFrame (punto, MANZENT, columnas); sin manzana -> MANZENT nulo"""
+    index = load_index(source)
+    x, y = _to_index_crs(np.atleast_1d(x), np.atleast_1d(y), crs, index)
+    items = index.locate(x, y)
+    found = items >= 0
+    df = _frame(index, np.maximum(items, 0), columns, source, {'punto': np.arange(len(items))})
+    df.loc[~found, df.columns[1:]] = None
+    return df
+
+
+def blocks_near(x, y, radius, columns=None, crs=None, source=SOURCE_FILE):
+    """Manzanas a menos de radius metros de cada punto: DataFrame (punto, MANZENT, columnas)"""
+    index = load_index(source)
+    x, y = _to_index_crs(np.atleast_1d(x), np.atleast_1d(y), crs, index)
+    q, items = index.within(x, y, radius)
+    order = np.lexsort((items, q))
+    return _frame(index, items[order], columns, source, {'punto': q[order]})
+
+
+def blocks_in(polygon, columns=None, crs=None, source=SOURCE_FILE):
+    """Manzanas que intersectan un polígono (shapely), opcionalmente en otro CRS"""
+    index = load_index(source)
+    if crs is not None:
+        import geopandas as gpd
+        polygon = gpd.GeoSeries([polygon], crs=crs).to_crs(index.crs).iloc[0]
+    return _frame(index, index.intersecting(polygon), columns, source)
+
+
+def bench(n_points, radius=200.0, source=SOURCE_FILE, seed=0):
+    """Tiempos de consultas masivas con puntos al azar dentro de la extensión de las manzanas"""
+    import time
+    index = load_index(source)
+    minx, miny, maxx, maxy = index.tree.boxes[:, -1]
+    rng = np.random.default_rng(seed)
+    x, y = rng.uniform(minx, maxx, n_points), rng.uniform(miny, maxy, n_points)
+    t0 = time.perf_counter()
+    found = index.locate(x, y)
+    t1 = time.perf_counter()
+    q, _ = index.within(x, y, radius)
+    t2 = time.perf_counter()
+    print(f"  {n_points:,} puntos: contención {t1 - t0:.3f}s ({(found >= 0).sum():,} dentro de una manzana), "
+          f"radio {radius:.0f} m {t2 - t1:.3f}s ({len(q):,} pares)")
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Índice espacial de manzanas: consultas punto / radio")
+    parser.add_argument('consulta', nargs='?', choices=['punto', 'radio'])
+    parser.add_argument('coords', nargs='*', type=float, help="x y [radio]")
+    parser.add_argument('--crs', default=None, help="CRS de las coordenadas (default: el de la capa)")
+    parser.add_argument('--columnas', nargs='*', default=['COMUNA', 'idx_privilegio'])
+    parser.add_argument('--construir', action='store_true', help="(Re)construir el índice")
+    parser.add_argument('--bench', type=int, default=None, metavar='N', help="Consultas masivas de N puntos")
+    parser.add_argument('--fuente', default=SOURCE_FILE)
+    args = parser.parse_args()
+
+    if args.construir:
+        build_index(source=args.fuente)
+    if args.bench:
+        bench(args.bench, source=args.fuente)
+    if args.consulta == 'punto':
+        print(blocks_at(args.coords[0], args.coords[1], args.columnas, crs=args.crs, source=args.fuente).to_string())
+    elif args.consulta == 'radio':
+        x, y, r = args.coords[:3]
+        print(blocks_near(x, y, r, args.columnas, crs=args.crs, source=args.fuente).to_string())
@@ -0,0 +1,245 @@
+"""
+Generador de un censo sintético con la forma de Cartografia_censo2024_Pais.gpkg
+
+Permite medir el pipeline sin el archivo del INE (varios GB). Produce manzanas con:
+  - el esquema de cols_entidades.txt (identificadores, n_*, prom_*, SHAPE_*)
+  - las 16 regiones con nombres reales (incluida O'HIGGINS, que ejercita el escape SQL)
+    y comunas reales para las tres áreas metropolitanas; la RM concentra ~40% de las filas
+  - regiones apiladas de norte a sur sin traslaparse, con la RM centrada en Santiago (RM_CENTRO)
+  - polígonos irregulares de tamaño de manzana (~35-130 m, sin traslape, 6-40 vértices) en EPSG:32719
+  - conteos consistentes (n_hog <= n_per, n_vp_ocupada <= n_vp) con variación por comuna
+    y ~2% de manzanas con variables suprimidas (NaN)
+
+Uso:
+    python synthetic_census.py 100000                 # -> cache/bench/censo_sintetico_100000_s2024_v2.gpkg
+    python synthetic_census.py 10000 --salida x.gpkg
+"""
+import ast
+import os
+
+import numpy as np
+
+from geography import AREAS_METRO
+
+SEED = 2024
+SYNTHETIC_VERSION = 2          # En el nombre de los GPKG cacheados: si cambia la generación, se regeneran
+CRS = 'EPSG:32719'             # UTM 19S, metros
+LAYER_NAME = 'Manzanas_CPV24'
+RURAL_LAYER = 'Entidades_CPV24'
+SCHEMA_FILE = 'cols_entidades.txt'
+BENCH_DIR = os.path.join('cache', 'bench')
+CHUNK_ROWS = 250_000           # Generación por bloques para acotar memoria
+
+MIN_VERTICES, MAX_VERTICES = 6, 40
+BLOCK_RADIUS = (30, 50)        # Radio base de cada manzana (m); los vértices llegan hasta 1.3x
+CENTER_JITTER = 10             # Desplazamiento máximo de cada centro por eje (m)
+# Distancia entre centros (m): 2 x radio máximo (65 m) + 2 x jitter -> vecinas sin traslape
+BLOCK_SPACING = 2 * 1.3 * BLOCK_RADIUS[1] + 2 * CENTER_JITTER
+COMUNAS_POR_FILA = 6           # Comunas por fila en la grilla de cada región
+REGION_MIN_HEIGHT = 150_000    # Alto mínimo (m) de la franja norte-sur de cada región
+RM_CODE = 13
+RM_CENTRO = (350_000, 6_300_000)   # Centro de la RM (Santiago) en EPSG:32719
+SUPPRESSED_FRACTION = 0.02
+
+# (código, nombre, fracción de manzanas, comunas)
+REGIONES = [
+    (15, 'DE ARICA Y PARINACOTA', 0.012, None),
+    (1, 'DE TARAPACÁ', 0.02, None),
+    (2, 'DE ANTOFAGASTA', 0.035, None),
+    (3, 'DE ATACAMA', 0.018, None),
+    (4, 'DE COQUIMBO', 0.045, None),
+    (5, 'DE VALPARAÍSO', 0.10, AREAS_METRO['Gran Valparaíso']),
+    (13, 'METROPOLITANA DE SANTIAGO', 0.40, AREAS_METRO['Gran Santiago']),
+    (6, "DEL LIBERTADOR GENERAL BERNARDO O'HIGGINS", 0.05, None),
+    (7, 'DEL MAULE', 0.055, None),
+    (16, 'DE ÑUBLE', 0.025, None),
+    (8, 'DEL BIOBÍO', 0.085, AREAS_METRO['Gran Concepción']),
+    (9, 'DE LA ARAUCANÍA', 0.05, None),
+    (14, 'DE LOS RÍOS', 0.02, None),
+    (10, 'DE LOS LAGOS', 0.045, None),
+    (11, 'DE AYSÉN DEL GENERAL CARLOS IBÁÑEZ DEL CAMPO', 0.006, None),
+    (12, 'DE MAGALLANES Y DE LA ANTÁRTICA CHILENA', 0.009, None),
+]
+COMUNAS_POR_REGION = 12        # Para regiones sin lista de comunas reales
+COMUNAS_POR_PROVINCIA = 6
+
+# Universo de cada variable n_* (por prefijo); el resto se cuenta sobre personas
+UNIVERSO_HOGARES = ('n_hog', 'n_tenencia', 'n_serv_', 'n_fuente_agua', 'n_combustible', 'n_internet',
+                    'n_jefatura', 'n_dormitorios', 'n_nucleos', 'n_basura', 'n_distrib_agua', 'n_sersan')
+UNIVERSO_VIVIENDAS = ('n_viv', 'n_tipo_viv', 'n_mat_', 'n_vp', 'n_deficit')
+
+
+def schema_columns(path=SCHEMA_FILE):
+    """Columnas del esquema INE (lista Python literal en cols_entidades.txt)"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    with open(os.path.join(here, path), encoding='utf-8') as f:
+        return [c for c in ast.literal_eval(f.read()) if c != 'geometry']
+
+
+def _comunas(n_rows, rng):
+    """Asigna región y comuna a cada manzana según las fracciones de REGIONES"""
+    shares = np.array([r[2] for r in REGIONES])
+    per_region = rng.multinomial(n_rows, shares / shares.sum())
+    rows = []
+    for (code, name, _, comunas), n in zip(REGIONES, per_region):
+        if comunas is None:
+            comunas = [f"{name.split()[-1]} {i + 1:02d}" for i in range(COMUNAS_POR_REGION)]
+        weights = rng.dirichlet(np.full(len(comunas), 4.0))
+        counts = rng.multinomial(n, weights)
+        for i, (comuna, k) in enumerate(zip(comunas, counts)):
+            rows.append((code, name, i, comuna, k))
+    return rows
+
+
+def _block_polygons(cx, cy, rng):
+    """Polígonos estrellados irregulares (anillo cerrado automáticamente) alrededor de cada centro"""
+    import shapely
+
+    n = len(cx)
+    m = rng.integers(MIN_VERTICES, MAX_VERTICES + 1, n)
+    ring = np.repeat(np.arange(n), m)
+    pos = np.arange(m.sum()) - np.repeat(np.cumsum(m) - m, m)
+    step = 2 * np.pi / m[ring]
+    theta = pos * step + rng.uniform(-0.35, 0.35, ring.size) * step
+    radius = rng.uniform(*BLOCK_RADIUS, n)
+    aspect = rng.uniform(0.6, 1.0, n)
+    r = radius[ring] * np.clip(1 + 0.12 * rng.standard_normal(ring.size), 0.6, 1.3)
+    coords = np.column_stack([cx[ring] + r * np.cos(theta), cy[ring] + r * aspect[ring] * np.sin(theta)])
+    rings = shapely.linearrings(coords, indices=ring)
+    return shapely.polygons(rings)
+
+
+def _counts(columns, n_per, comuna_codes, n_comunas, rng):
+    """Variables n_* binomiales sobre su universo, con una tasa distinta por comuna"""
+    n_hog = rng.binomial(n_per, 0.34)
+    n_vp = n_hog + rng.binomial(n_hog, 0.06)
+    data = {'n_per': n_per, 'n_hog': n_hog, 'n_vp': n_vp, 'n_vp_ocupada': rng.binomial(n_vp, 0.93)}
+    for col in columns:
+        if col in data or not col.startswith('n_'):
+            continue
+        if col.startswith(UNIVERSO_VIVIENDAS):
+            universe = n_vp
+        elif col.startswith(UNIVERSO_HOGARES):
+            universe = n_hog
+        else:
+            universe = n_per
+        base = rng.beta(1.2, 6.0)
+        rate = np.clip(base * rng.lognormal(0, 0.5, n_comunas), 0, 0.95)[comuna_codes]
+        data[col] = rng.binomial(universe, rate)
+    return data
+
+
+def synthetic_census(n_rows, seed=SEED, columns=None):
+    """GeoDataFrame sintético de n_rows manzanas con el esquema de la capa Manzanas_CPV24"""
+    import geopandas as gpd
+    import pandas as pd
+    import shapely
+
+    rng = np.random.default_rng(seed)
+    columns = columns or schema_columns()
+
+    plan = _comunas(n_rows, rng)
+    region_code = np.repeat([p[0] for p in plan], [p[4] for p in plan])
+    region_name = np.repeat([p[1] for p in plan], [p[4] for p in plan]).astype(object)
+    comuna_idx = np.repeat([p[2] for p in plan], [p[4] for p in plan])
+    comuna_name = np.repeat([p[3] for p in plan], [p[4] for p in plan]).astype(object)
+    comuna_codes, _ = pd.factorize(comuna_name)
+    n_comunas = comuna_codes.max() + 1 if n_rows else 0
+
+    # Centros: cada comuna es una grilla de manzanas en una celda cuadrada de lado `cell`; las regiones
+    # son franjas de norte a sur (sin traslape) y la grilla de la RM queda centrada en RM_CENTRO
+    sizes = [p[4] for p in plan]
+    order = np.arange(n_rows) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+    side = np.ceil(np.sqrt(np.maximum(np.bincount(comuna_codes, minlength=n_comunas), 1)))[comuna_codes]
+    cell = (side.max() + 20) * BLOCK_SPACING
+    rank = {r[0]: i for i, r in enumerate(REGIONES)}
+    region_rank = pd.Series(region_code).map(rank).to_numpy()
+    comunas_region = np.bincount([rank[p[0]] for p in plan], minlength=len(REGIONES))
+    grid_height = np.ceil(comunas_region / COMUNAS_POR_FILA) * cell
+    top = -np.r_[0, np.cumsum(np.maximum(grid_height, REGION_MIN_HEIGHT))[:-1]]
+    rm = rank[RM_CODE]
+    top += RM_CENTRO[1] - (top[rm] - grid_height[rm] / 2)
+    left = RM_CENTRO[0] - min(comunas_region[rm], COMUNAS_POR_FILA) * cell / 2
+    cx = left + (comuna_idx % COMUNAS_POR_FILA) * cell + (order % side) * BLOCK_SPACING
+    cy = top[region_rank] - (comuna_idx // COMUNAS_POR_FILA) * cell - (order // side) * BLOCK_SPACING
+    cx = cx + rng.uniform(-CENTER_JITTER, CENTER_JITTER, n_rows)
+    cy = cy + rng.uniform(-CENTER_JITTER, CENTER_JITTER, n_rows)
+
+    geoms = np.concatenate([_block_polygons(cx[i:i + CHUNK_ROWS], cy[i:i + CHUNK_ROWS], rng)
+                            for i in range(0, n_rows, CHUNK_ROWS)]) if n_rows else np.array([])
+
+    n_per = rng.negative_binomial(3, 3 / (3 + 90), n_rows)
+    data = _counts(columns, n_per, comuna_codes, n_comunas, rng)
+
+    cut = (region_code * 1000 + comuna_idx + 101).astype(str)
+    provincia_idx = comuna_idx // COMUNAS_POR_PROVINCIA
+    distrito = (order // 400 + 1).astype(int)
+    df = pd.DataFrame(data)
+    n_cols = [c for c in df.columns if c != 'n_per']
+    suppressed = rng.random(n_rows) < SUPPRESSED_FRACTION
+    df = df.astype(float)
+    df.loc[suppressed, n_cols] = np.nan
+
+    ids = {
+        'CUT': cut,
+        'COD_REGION': region_code.astype(str),
+        'REGION': region_name,
+        'COD_PROVINCIA': (region_code * 10 + provincia_idx + 1).astype(str),
+        'PROVINCIA': pd.Series(region_name).str.split().str[-1].to_numpy() + ' ' + (provincia_idx + 1).astype(str),
+        'COMUNA': comuna_name,
+        'AREA_C': np.ones(n_rows, dtype=int),
+        'MANZENT': np.char.add(np.char.add(cut, np.char.zfill(distrito.astype(str), 2)),
+                               np.char.zfill(order.astype(str), 9)),
+        'DISTRITO': distrito.astype(str),
+        'COD_DISTRITO': distrito.astype(str),
+        'MZ_BASE_CENSO': (rng.random(n_rows) < 0.95).astype(int),
+        'prom_edad': rng.normal(38, 6, n_rows),
+        'prom_escolaridad18': rng.normal(12, 2, n_rows),
+        'prom_per_hog': rng.normal(2.8, 0.5, n_rows),
+    }
+    for col, values in ids.items():
+        df[col] = values
+    for col in columns:
+        if col not in df.columns:
+            df[col] = '' if not col.startswith(('n_', 'prom_', 'SHAPE')) else 0.0
+
+    gdf = gpd.GeoDataFrame(df[[c for c in columns if c in df.columns]], geometry=geoms, crs=CRS)
+    gdf['SHAPE_Length'] = shapely.length(geoms)
+    gdf['SHAPE_Area'] = shapely.area(geoms)
+    return gdf
+
+
+def write_synthetic_census(path, n_rows, seed=SEED, rural_fraction=0.05):
+    """Escribe un GPKG con las capas Manzanas_CPV24 y Entidades_CPV24 sintéticas"""
+    gdf = synthetic_census(n_rows, seed=seed)
+    if os.path.exists(path): os.remove(path)
+    gdf.to_file(path, layer=LAYER_NAME, driver='GPKG')
+    n_rural = int(n_rows * rural_fraction)
+    if n_rural:
+        synthetic_census(n_rural, seed=seed + 1).to_file(path, layer=RURAL_LAYER, driver='GPKG')
+    return path
+
+
+def synthetic_file(n_rows, seed=SEED):
+    """Ruta de un GPKG sintético de n_rows manzanas (se genera una sola vez y queda en cache/bench/)"""
+    path = os.path.join(BENCH_DIR, f"censo_sintetico_{n_rows}_s{seed}_v{SYNTHETIC_VERSION}.gpkg")
+    if not os.path.exists(path):
+        os.makedirs(BENCH_DIR, exist_ok=True)
+        print(f"  Generando censo sintético de {n_rows:,} manzanas -> {path}...")
+        tmp = path + '.tmp.gpkg'
+        write_synthetic_census(tmp, n_rows, seed=seed)
+        os.replace(tmp, path)
+    return path
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Censo sintético con el esquema de Cartografia_censo2024_Pais.gpkg")
+    parser.add_argument('filas', type=int, help="Cantidad de manzanas (ej. 10000 a 2000000)")
+    parser.add_argument('--semilla', type=int, default=SEED)
+    parser.add_argument('--salida', default=None, help="Ruta del GPKG (default: cache/bench/...)")
+    args = parser.parse_args()
+    if args.salida:
+        print(write_synthetic_census(args.salida, args.filas, seed=args.semilla))
+    else:
+        print(synthetic_file(args.filas, seed=args.semilla))
@@ -0,0 +1,696 @@
+"""
+Pirámide de teselas vectoriales (Mapbox Vector Tiles) de las manzanas con los indicadores idx_* / pct_*.
+
+Un solo artefacto sirve todas las comunas e indicadores en un visor interactivo, en vez de
+cientos de PNG. Se escribe un MBTiles (SQLite, teselas gzip) y, con --pmtiles, su conversión a
+PMTiles (requiere `pip install pmtiles`):
+  - geometría EPSG:3857 desde el caché columnar (la original, no la de render), simplificada por
+    zoom a SIMPLIFY_UNITS unidades de tesela y cuantizada a la grilla de la tesela (EXTENT)
+  - atributos por zoom (ATTRIBUTE_ZOOMS): a zoom bajo solo los índices compuestos; el id de cada
+    feature es MANZENT
+  - el teselado se reparte por rangos de columnas de teselas (x) en un pool 'spawn'; cada proceso
+    carga el caché una sola vez
+  - codificación MVT v2 propia (protobuf escrito a mano y vectorizado con NumPy, sin dependencias)
+
+Uso:
+    python vector_tiles.py                          # -> Manzanas_Indicadores.mbtiles
+    python vector_tiles.py --zoom 9 14 --jobs 4 --pmtiles
+    python vector_tiles.py --servir --puerto 8000   # visor local: http://localhost:8000/
+    python vector_tiles.py --verificar 200          # decodifica una muestra (ida y vuelta del codificador)
+"""
+import gzip
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from columnar_cache import SOURCE_FILE, cache_meta, load_indicators
+
+TILES_FILE = 'Manzanas_Indicadores.mbtiles'
+LAYER_NAME = 'manzanas'
+TILE_CRS = 'EPSG:3857'
+ID_COL = 'MANZENT'
+MIN_ZOOM = 9
+MAX_ZOOM = 15
+EXTENT = 4096            # Unidades por lado de la tesela (MVT)
+BUFFER = 64              # Margen de recorte, en unidades de tesela
+SIMPLIFY_UNITS = 1.0     # Tolerancia de simplificación por zoom, en unidades de tesela
+VALUE_DECIMALS = 1       # Redondeo de los atributos (menos valores distintos por tesela)
+TASKS_PER_JOB = 4
+
+# (zoom mínimo, prefijos / columnas) -> desde ese zoom se incluyen esos atributos
+ATTRIBUTE_ZOOMS = [
+    (MIN_ZOOM, ('idx_', 'COMUNA')),
+    (12, ('idx_', 'COMUNA', 'pct_')),
+]
+
+HALF_WORLD = 20037508.342789244   # Semiperímetro de Web Mercator (m)
+EARTH_RADIUS = 6378137.0
+
+_DATA = {}
+
+
+# --- Protobuf / MVT ---
+
+def _varint(value):
+    out = bytearray()
+    value = int(value)
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _varint_sizes(values):
+    v = np.asarray(values, dtype=np.uint64)
+    sizes = np.ones(len(v), dtype=np.int64)
+    for k in range(1, 10):
+        sizes += v >= np.uint64(1 << (7 * k))
+    return sizes
+
+
+def _varints(values):
+    """Codifica un arreglo de enteros no negativos como varints concatenados. Retorna (bytes, tamaños)"""
+    v = np.asarray(values, dtype=np.uint64)
+    sizes = _varint_sizes(v)
+    width = int(sizes.max()) if len(v) else 1
+    shifts = np.arange(width, dtype=np.uint64) * np.uint64(7)
+    out = ((v[:, None] >> shifts) & np.uint64(0x7F)).astype(np.uint8)
+    more = np.arange(width) < (sizes[:, None] - 1)
+    out[more] |= 0x80
+    return out[np.arange(width) < sizes[:, None]].tobytes(), sizes
+
+
+def _zigzag(values):
+    v = np.asarray(values, dtype=np.int64)
+    return ((v << 1) ^ (v >> 63)).astype(np.uint64)
+
+
+def _field(tag, payload):
+    return _varint(tag) + _varint(len(payload)) + payload
+
+
+def _polygon_commands(parts, part_feature):
+    """
+    Geometría MVT de polígonos (coordenadas enteras de tesela, exteriores con área positiva).
+    parts: Polygons; part_feature: feature al que pertenece cada parte (ordenado).
+    Retorna (bytes, features presentes, inicio, fin) con el rango de bytes de cada feature.
+    """
+    import shapely
+
+    _, coords, (ring_offsets, poly_offsets) = shapely.to_ragged_array(parts)
+    coords = coords.astype(np.int64)
+    n_points = np.diff(ring_offsets) - 1          # Se omite el punto de cierre de cada anillo
+    emitted = np.ones(len(coords), dtype=bool)
+    emitted[ring_offsets[1:] - 1] = False
+    points = coords[emitted]
+
+    ring_feature = np.repeat(part_feature, np.diff(poly_offsets))
+    point_ring = np.repeat(np.arange(len(n_points)), n_points)
+    point_feature = ring_feature[point_ring]
+    # El cursor es relativo al punto anterior y se reinicia en (0, 0) al empezar cada feature
+    delta = np.diff(points, axis=0, prepend=np.zeros((1, 2), dtype=np.int64))
+    first = np.r_[True, point_feature[1:] != point_feature[:-1]]
+    delta[first] = points[first]
+    zz = _zigzag(delta)
+
+    # Por anillo: MoveTo(1) x y, LineTo(n-1) (x y)*(n-1), ClosePath -> 1 + 2 + 1 + 2(n-1) + 1 = 2n+3
+    ring_len = 2 * n_points + 3
+    ring_start = np.r_[0, np.cumsum(ring_len)[:-1]]
+    stream = np.empty(int(ring_len.sum()), dtype=np.uint64)
+    stream[ring_start] = 1 | (1 << 3)
+    stream[ring_start + 3] = (2 | ((n_points - 1) << 3)).astype(np.uint64)
+    stream[ring_start + ring_len - 1] = 7 | (1 << 3)
+    j = np.arange(len(points)) - np.repeat(np.r_[0, np.cumsum(n_points)[:-1]], n_points)
+    pos = ring_start[point_ring] + 2 + 2 * j - (j == 0)
+    stream[pos] = zz[:, 0]
+    stream[pos + 1] = zz[:, 1]
+
+    data, sizes = _varints(stream)
+    byte_end = np.cumsum(sizes)
+    ring_first = np.r_[True, ring_feature[1:] != ring_feature[:-1]]
+    ring_last = np.r_[ring_feature[1:] != ring_feature[:-1], True]
+    starts = byte_end[ring_start[ring_first]] - sizes[ring_start[ring_first]]
+    ends = byte_end[(ring_start + ring_len - 1)[ring_last]]
+    return data, ring_feature[ring_first], starts, ends
+
+
+def _value_table(values):
+    """Valores distintos de una columna en la tesela -> (mensajes Value, cantidad, índice por feature o -1 si es nulo)"""
+    if values.dtype.kind in 'fiu':
+        v = values.astype(np.float32)
+        valid = ~np.isnan(v)
+        uniq, inverse = np.unique(v[valid], return_inverse=True)
+        index = np.full(len(v), -1, dtype=np.int64)
+        index[valid] = inverse
+        messages = np.empty((len(uniq), 7), dtype=np.uint8)
+        messages[:, :3] = (0x22, 0x05, 0x15)         # Layer.values, largo 5, Value.float_value
+        messages[:, 3:] = uniq.astype('<f4').view(np.uint8).reshape(-1, 4)
+        return messages.tobytes(), len(uniq), index
+    v = values.astype(object)
+    valid = ~pd.isna(v)
+    uniq, inverse = np.unique(v[valid].astype(str), return_inverse=True)
+    index = np.full(len(v), -1, dtype=np.int64)
+    index[valid] = inverse
+    return b''.join(_field(0x22, _field(0x0A, s.encode('utf-8'))) for s in uniq), len(uniq), index
+
+
+def encode_tile(parts, part_feature, ids, attributes, layer=LAYER_NAME):
+    """
+    Codifica una tesela MVT v2 con una capa de polígonos.
+    parts / part_feature: Polygons en coordenadas de tesela y el feature (fila de ids/attributes) de cada uno
+    attributes: {columna: arreglo alineado con ids}, en el orden de Layer.keys
+    """
+    geom, features, starts, ends = _polygon_commands(parts, part_feature)
+    if not len(features):
+        return None
+
+    columns = list(attributes)
+    values = []
+    tag_cols = []
+    offset = 0
+    for col in columns:
+        table, n_values, index = _value_table(attributes[col][features])
+        values.append(table)
+        tag_cols.append(np.where(index >= 0, index + offset, -1))
+        offset += n_values
+    if columns:
+        value_idx = np.column_stack(tag_cols)
+        key_idx = np.broadcast_to(np.arange(len(columns)), value_idx.shape)
+        tags = np.stack([key_idx, value_idx], axis=2).reshape(len(features), -1)
+        present = np.repeat(value_idx >= 0, 2, axis=1)
+        tag_bytes, sizes = _varints(tags[present])
+        tag_len = np.zeros(tags.shape, dtype=np.int64)
+        tag_len[present] = sizes
+        tag_end = np.cumsum(tag_len.sum(axis=1))
+    else:
+        tag_bytes, tag_end = b'', np.zeros(len(features), dtype=np.int64)
+    tag_start = np.r_[0, tag_end[:-1]]
+
+    feature_ids = ids[features]
+    out = []
+    for i in range(len(features)):
+        g = geom[starts[i]:ends[i]]
+        t = tag_bytes[tag_start[i]:tag_end[i]]
+        msg = b'\x08' + _varint(feature_ids[i])
+        if t:
+            msg += b'\x12' + _varint(len(t)) + t
+        msg += b'\x18\x03\x22' + _varint(len(g)) + g   # type = POLYGON, geometry
+        out.append(b'\x12' + _varint(len(msg)) + msg)
+
+    body = (b'\x78\x02' + _field(0x0A, layer.encode('utf-8')) + b''.join(out)
+            + b''.join(_field(0x1A, c.encode('utf-8')) for c in columns)
+            + b''.join(values) + b'\x28' + _varint(EXTENT))
+    return _field(0x1A, body)
+
+
+# --- Decodificación (verificación) ---
+
+def _read_varint(buf, i):
+    value = shift = 0
+    while True:
+        b = buf[i]
+        i += 1
+        value |= (b & 0x7F) << shift
+        if b < 0x80:
+            return value, i
+        shift += 7
+
+
+def _message_fields(buf):
+    """(campo, valor) de un mensaje protobuf: varint -> int, length-delimited -> bytes"""
+    i = 0
+    while i < len(buf):
+        key, i = _read_varint(buf, i)
+        field, wire = key >> 3, key & 7
+        if wire == 0:
+            value, i = _read_varint(buf, i)
+        elif wire == 2:
+            n, i = _read_varint(buf, i)
+            value, i = bytes(buf[i:i + n]), i + n
+        elif wire == 5:
+            value, i = bytes(buf[i:i + 4]), i + 4
+        elif wire == 1:
+            value, i = bytes(buf[i:i + 8]), i + 8
+        else:
+            raise ValueError(f"Tipo de campo protobuf inválido: {wire}")
+        yield field, value
+
+
+def _packed(buf):
+    i = 0
+    while i < len(buf):
+        v, i = _read_varint(buf, i)
+        yield v
+
+
+def decode_geometry(buf):
+    """
+    Anillos [(x, y), ...] de la geometría MVT de un polígono (coordenadas de tesela).
+    ValueError si algún anillo no es MoveTo(1) x y, LineTo(n) (x y)*n, ClosePath.
+    """
+    ints = list(_packed(buf))
+    rings, x, y, k = [], 0, 0, 0
+
+    def command(expected, count=None):
+        nonlocal k
+        if k >= len(ints) or ints[k] & 7 != expected or (count is not None and ints[k] >> 3 != count):
+            raise ValueError(f"Anillo {len(rings)}: se esperaba el comando {expected} en la posición {k}")
+        k += 1
+        return ints[k - 1] >> 3
+
+    while k < len(ints):
+        ring = []
+        for cmd in (1, 2):
+            n = command(cmd, 1 if cmd == 1 else None)
+            if k + 2 * n > len(ints):
+                raise ValueError(f"Anillo {len(rings)}: faltan coordenadas")
+            for dx, dy in zip(ints[k:k + 2 * n:2], ints[k + 1:k + 2 * n:2]):
+                x += (dx >> 1) ^ -(dx & 1)
+                y += (dy >> 1) ^ -(dy & 1)
+                ring.append((x, y))
+            k += 2 * n
+        command(7, 1)
+        rings.append(ring)
+    return rings
+
+
+def decode_tile(data):
+    """{capa: [{'id', 'tipo', 'tags', 'geometria'}]} de una tesela MVT (gzip o no); geometría sin decodificar"""
+    if data[:2] == b'\x1f\x8b':
+        data = gzip.decompress(data)
+    layers = {}
+    for field, layer_buf in _message_fields(data):
+        if field != 3:
+            continue
+        name, features = None, []
+        for lf, value in _message_fields(layer_buf):
+            if lf == 1:
+                name = value.decode('utf-8')
+            elif lf == 2:
+                feature = {'id': None, 'tipo': None, 'tags': [], 'geometria': b''}
+                for ff, fv in _message_fields(value):
+                    if ff == 1:
+                        feature['id'] = fv
+                    elif ff == 2:
+                        feature['tags'] = list(_packed(fv))
+                    elif ff == 3:
+                        feature['tipo'] = fv
+                    elif ff == 4:
+                        feature['geometria'] = fv
+                features.append(feature)
+        layers[name] = features
+    return layers
+
+
+def _rings_to_polygons(rings):
+    """Agrupa anillos MVT en polígonos: área positiva (en coordenadas de tesela) = exterior"""
+    import shapely
+    polygons, shell, holes = [], None, []
+    for ring in rings:
+        xs, ys = np.array(ring, dtype=np.float64).T
+        area = 0.5 * np.sum(xs * np.roll(ys, -1) - np.roll(xs, -1) * ys)
+        if area > 0:
+            if shell is not None:
+                polygons.append(shapely.Polygon(shell, holes))
+            shell, holes = ring, []
+        else:
+            holes.append(ring)
+    if shell is not None:
+        polygons.append(shapely.Polygon(shell, holes))
+    return polygons
+
+
+def verify_tiles(path=TILES_FILE, sample=200):
+    """
+    Ida y vuelta del codificador: (1) polígonos conocidos codificados y decodificados deben devolver las
+    mismas coordenadas; (2) una muestra de teselas del MBTiles se decodifica completa (cada anillo con
+    ClosePath, features con geometría y polígonos válidos). Retorna los conteos; ValueError si falla (1).
+    """
+    import sqlite3
+    import shapely
+
+    square = shapely.Polygon([(0, 0), (10, 0), (10, 10), (0, 10)])
+    donut = shapely.Polygon([(20, 20), (60, 20), (60, 60), (20, 60)], [[(30, 30), (30, 50), (50, 50), (50, 30)]])
+    parts = shapely.orient_polygons(np.array([square, donut, square]), exterior_cw=False)
+    tile = encode_tile(parts, np.array([0, 1, 1]), np.array([7, 8]), {})
+    decoded = decode_tile(tile)[LAYER_NAME]
+    if [f['id'] for f in decoded] != [7, 8]:
+        raise ValueError(f"Ida y vuelta: ids {[f['id'] for f in decoded]}")
+    for feature, expected in zip(decoded, ([square], [donut, square])):
+        rings = [[tuple(xy) for xy in np.asarray(r.coords, dtype=np.int64)[:-1].tolist()]
+                 for p in shapely.orient_polygons(np.array(expected), exterior_cw=False)
+                 for r in [p.exterior, *p.interiors]]
+        if decode_geometry(feature['geometria']) != rings:
+            raise ValueError(f"Ida y vuelta del feature {feature['id']}: "
+                             f"{decode_geometry(feature['geometria'])} != {rings}")
+
+    # Muestra determinista repartida por toda la tabla
+    con = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    n_tiles = con.execute("SELECT count(*) FROM tiles").fetchone()[0]
+    rows = con.execute("SELECT tile_data FROM tiles WHERE rowid % ? = 0 LIMIT ?",
+                       (max(1, n_tiles // sample), sample)).fetchall()
+    con.close()
+    stats = {'teselas': len(rows), 'features': 0, 'sin_geometria': 0, 'sin_closepath': 0, 'invalidos': 0}
+    for (data,) in rows:
+        for feature in decode_tile(data).get(LAYER_NAME, []):
+            stats['features'] += 1
+            if not feature['geometria']:
+                stats['sin_geometria'] += 1
+                continue
+            try:
+                rings = decode_geometry(feature['geometria'])
+            except ValueError:
+                stats['sin_closepath'] += 1
+                continue
+            polygons = _rings_to_polygons(rings)
+            if not polygons or not all(p.is_valid for p in polygons):
+                stats['invalidos'] += 1
+    return stats
+
+
+# --- Teselado ---
+
+def attribute_columns(zoom, available):
+    """Atributos presentes en las teselas de un zoom"""
+    prefixes = ()
+    for min_zoom, cols in ATTRIBUTE_ZOOMS:
+        if zoom >= min_zoom:
+            prefixes = cols
+    return [c for c in available if any(c == p or (p.endswith('_') and c.startswith(p)) for p in prefixes)]
+
+
+def _dataset(source):
+    """Geometría EPSG:3857, cajas, ids y atributos (una vez por proceso)"""
+    if source not in _DATA:
+        import shapely
+        meta = cache_meta(source)
+        available = [c for c in meta['columns'] if c.startswith(('idx_', 'pct_')) or c == 'COMUNA']
+        gdf = load_indicators([ID_COL] + available, geometry=True, source=source)
+        geoms = np.asarray(gdf.geometry.to_crs(TILE_CRS).values)
+        ids = np.asarray(gdf[ID_COL].astype(str).str.extract(r'^(\d+)$')[0].astype(float))
+        fallback = np.arange(1, len(gdf) + 1, dtype=float)
+        ids = np.where(np.isnan(ids), fallback, ids).astype(np.uint64)
+        # Arreglos NumPy (no columnas Arrow): se indexan una vez por tesela
+        attributes = {col: (gdf[col].to_numpy(dtype=object) if col == 'COMUNA'
+                            else gdf[col].to_numpy(dtype=float, na_value=np.nan).round(VALUE_DECIMALS))
+                      for col in available}
+        _DATA[source] = {
+            'geoms': geoms,
+            'bounds': shapely.bounds(geoms),
+            'ids': ids,
+            'attributes': attributes,
+        }
+    return _DATA[source]
+
+
+def _tile_span(bounds, zoom, margin=0.0):
+    """Rango de teselas (x0, y0, x1, y1 inclusivo, y hacia abajo) que toca cada caja"""
+    n = 1 << zoom
+    scale = n / (2 * HALF_WORLD)
+    x0 = np.floor((bounds[:, 0] - margin + HALF_WORLD) * scale)
+    x1 = np.floor((bounds[:, 2] + margin + HALF_WORLD) * scale)
+    y0 = np.floor((HALF_WORLD - bounds[:, 3] - margin) * scale)
+    y1 = np.floor((HALF_WORLD - bounds[:, 1] + margin) * scale)
+    return [np.clip(a, 0, n - 1).astype(np.int64) for a in (x0, y0, x1, y1)]
+
+
+def tile_range(zoom, x_start, x_stop, source=SOURCE_FILE):
+    """Teselas (z, x, y, MVT gzip) de las columnas x_start <= x < x_stop de un zoom"""
+    import shapely
+
+    data = _dataset(source)
+    size = 2 * HALF_WORLD / (1 << zoom)
+    unit = size / EXTENT
+    margin = BUFFER * unit
+    tx0, ty0, tx1, ty1 = _tile_span(data['bounds'], zoom, margin)
+    sel = np.flatnonzero((tx1 >= x_start) & (tx0 < x_stop))
+    if not len(sel):
+        return []
+    simplified = shapely.simplify(data['geoms'][sel], unit * SIMPLIFY_UNITS, preserve_topology=True)
+
+    # Pares (feature, tesela) dentro del rango, ordenados por tesela
+    lo = np.maximum(tx0[sel], x_start)
+    hi = np.minimum(tx1[sel], x_stop - 1)
+    ny = ty1[sel] - ty0[sel] + 1
+    count = (hi - lo + 1) * ny
+    f = np.repeat(np.arange(len(sel)), count)
+    k = np.arange(count.sum()) - np.repeat(np.cumsum(count) - count, count)
+    tx = lo[f] + k // ny[f]
+    ty = ty0[sel][f] + k % ny[f]
+    order = np.lexsort((ty, tx))
+    f, tx, ty = f[order], tx[order], ty[order]
+    breaks = np.flatnonzero((np.diff(tx) != 0) | (np.diff(ty) != 0)) + 1
+
+    columns = attribute_columns(zoom, list(data['attributes']))
+    attributes = {c: data['attributes'][c][sel] for c in columns}
+    ids = data['ids'][sel]
+    tiles = []
+    for group in np.split(np.arange(len(f)), breaks):
+        x, y = int(tx[group[0]]), int(ty[group[0]])
+        left = -HALF_WORLD + x * size
+        top = HALF_WORLD - y * size
+        feats = f[group]
+        clipped = shapely.clip_by_rect(simplified[feats], left - margin, top - size - margin,
+                                       left + size + margin, top + margin)
+        # Cuantización a la grilla de la tesela; solo lo que queda inválido pasa por set_precision
+        exact = shapely.transform(clipped, lambda c: (c - (left, top)) * (1 / unit, -1 / unit))
+        local = shapely.transform(exact, np.round)
+        invalid = ~shapely.is_valid(local)
+        local[invalid] = shapely.set_precision(exact[invalid], 1.0)
+        parts, part_idx = shapely.get_parts(local, return_index=True)
+        poly = (shapely.get_type_id(parts) == 3) & ~shapely.is_empty(parts)
+        if not poly.any():
+            continue
+        parts = shapely.orient_polygons(parts[poly], exterior_cw=False)
+        mvt = encode_tile(parts, feats[part_idx[poly]], ids, attributes)
+        if mvt is not None:
+            tiles.append((zoom, x, y, gzip.compress(mvt, compresslevel=6, mtime=0)))
+    return tiles
+
+
+def _tasks(zoom, n_parts, source):
+    """Rangos de columnas x con una cantidad parecida de manzanas"""
+    data = _dataset(source)
+    x0, _, x1, _ = _tile_span(data['bounds'], zoom)
+    first, last = int(x0.min()), int(x1.max()) + 1
+    counts = np.bincount(x0 - first, minlength=last - first).astype(float)
+    n_parts = max(1, min(n_parts, last - first))
+    cuts = np.searchsorted(np.cumsum(counts), counts.sum() * np.arange(1, n_parts) / n_parts) + first + 1
+    edges = np.unique(np.r_[first, np.clip(cuts, first, last), last])
+    return [(zoom, int(a), int(b)) for a, b in zip(edges[:-1], edges[1:])]
+
+
+def _lonlat(x, y):
+    lon = np.asarray(x) / HALF_WORLD * 180.0
+    lat = np.degrees(2 * np.arctan(np.exp(np.asarray(y) / EARTH_RADIUS)) - np.pi / 2)
+    return lon, lat
+
+
+def _metadata(zooms, source):
+    data = _dataset(source)
+    b = data['bounds']
+    (west, east), (south, north) = _lonlat([np.nanmin(b[:, 0]), np.nanmax(b[:, 2])],
+                                           [np.nanmin(b[:, 1]), np.nanmax(b[:, 3])])
+    available = list(data['attributes'])
+    fields = {c: ('String' if c == 'COMUNA' else 'Number') for c in available}
+    layers = [{'id': LAYER_NAME, 'fields': fields, 'minzoom': zooms[0], 'maxzoom': zooms[1]}]
+    return {
+        'name': 'Censo 2024 - Manzanas',
+        'format': 'pbf',
+        'type': 'overlay',
+        'minzoom': str(zooms[0]),
+        'maxzoom': str(zooms[1]),
+        'bounds': f"{west:.6f},{south:.6f},{east:.6f},{north:.6f}",
+        'center': f"{(west + east) / 2:.6f},{(south + north) / 2:.6f},{min(zooms[0] + 2, zooms[1])}",
+        'json': json.dumps({'vector_layers': layers,
+                            'attribute_zooms': {str(z): attribute_columns(z, available)
+                                                for z in range(zooms[0], zooms[1] + 1)}}),
+        'censo_cache_key': cache_meta(source)['key'],
+    }
+
+
+def export_tiles(output=TILES_FILE, zooms=(MIN_ZOOM, MAX_ZOOM), n_jobs=None, source=SOURCE_FILE, pmtiles=False):
+    """Escribe la pirámide MVT de zooms[0]..zooms[1] en un MBTiles (y PMTiles opcional). Retorna la ruta"""
+    import sqlite3
+
+    n_jobs = n_jobs or os.cpu_count() or 1
+    t0 = time.perf_counter()
+    tasks = [t for z in range(zooms[0], zooms[1] + 1) for t in _tasks(z, n_jobs * TASKS_PER_JOB, source)]
+
+    tmp = output + '.tmp'
+    if os.path.exists(tmp): os.remove(tmp)
+    con = sqlite3.connect(tmp)
+    con.executescript("""
+        CREATE TABLE metadata (name text, value text);
+        CREATE TABLE tiles (zoom_level integer, tile_column integer, tile_row integer, tile_data blob);
+        CREATE UNIQUE INDEX tile_index ON tiles (zoom_level, tile_column, tile_row);
+    """)
+
+    def store(tiles):
+        # MBTiles usa filas TMS (y hacia arriba)
+        con.executemany("INSERT INTO tiles VALUES (?, ?, ?, ?)",
+                        [(z, x, (1 << z) - 1 - y, data) for z, x, y, data in tiles])
+        return len(tiles), sum(len(t[3]) for t in tiles)
+
+    n_tiles = n_bytes = 0
+    if n_jobs <= 1:
+        for task in tasks:
+            n, b = store(tile_range(*task, source=source))
+            n_tiles += n; n_bytes += b
+    else:
+        from concurrent.futures import ProcessPoolExecutor, as_completed
+        import multiprocessing
+        ctx = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=n_jobs, mp_context=ctx) as pool:
+            futures = [pool.submit(tile_range, *task, source=source) for task in tasks]
+            for future in as_completed(futures):
+                n, b = store(future.result())
+                n_tiles += n; n_bytes += b
+
+    con.executemany("INSERT INTO metadata VALUES (?, ?)", list(_metadata(zooms, source).items()))
+    con.commit()
+    con.close()
+    os.replace(tmp, output)
+    print(f"  Teselas vectoriales: {n_tiles:,} teselas z{zooms[0]}-{zooms[1]} ({n_bytes / 1e6:.1f} MB gzip, "
+          f"{len(tasks)} rangos, {n_jobs} procesos) en {time.perf_counter() - t0:.1f}s -> {output}")
+
+    if pmtiles:
+        try:
+            from pmtiles.convert import mbtiles_to_pmtiles
+        except ImportError:
+            print("  PMTiles omitido: requiere 'pip install pmtiles'")
+        else:
+            target = os.path.splitext(output)[0] + '.pmtiles'
+            mbtiles_to_pmtiles(output, target, zooms[1])
+            print(f"  PMTiles: {target}")
+    return output
+
+
+# --- Servidor local (solo pruebas) ---
+
+VIEWER_HTML = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Censo 2024 - Manzanas</title>
+<script src="https://unpkg.com/maplibre-gl@4/dist/maplibre-gl.js"></script>
+<link href="https://unpkg.com/maplibre-gl@4/dist/maplibre-gl.css" rel="stylesheet">
+<style>body{margin:0;background:#050510}#map{position:absolute;inset:0}
+#ui{position:absolute;top:10px;left:10px;z-index:1;font:14px sans-serif}</style></head>
+<body><div id="ui"><select id="indicador"></select></div><div id="map"></div><script>
+fetch('/tiles.json').then(r => r.json()).then(tj => {
+  const fields = Object.keys(tj.vector_layers[0].fields).filter(f => f !== 'COMUNA');
+  const sel = document.getElementById('indicador');
+  fields.forEach(f => sel.add(new Option(f, f)));
+  const color = f => ['interpolate', ['linear'], ['to-number', ['get', f], 0],
+                      0, '#440154', 25, '#3b528b', 50, '#21918c', 75, '#5ec962', 100, '#fde725'];
+  const map = new maplibregl.Map({container: 'map', center: tj.center.slice(0, 2), zoom: tj.center[2],
+    style: {version: 8, sources: {}, layers: [{id: 'fondo', type: 'background', paint: {'background-color': '#050510'}}]}});
+  map.on('load', () => {
+    map.addSource('censo', {type: 'vector', url: location.origin + '/tiles.json'});
+    map.addLayer({id: 'manzanas', type: 'fill', source: 'censo', 'source-layer': tj.vector_layers[0].id,
+                  paint: {'fill-color': color(fields[0]), 'fill-opacity': 0.8}});
+    sel.onchange = () => map.setPaintProperty('manzanas', 'fill-color', color(sel.value));
+    map.on('click', 'manzanas', e => new maplibregl.Popup().setLngLat(e.lngLat)
+      .setHTML('<pre>' + JSON.stringify({id: e.features[0].id, ...e.features[0].properties}, null, 1) + '</pre>').addTo(map));
+  });
+});
+</script></body></html>
+"""
+
+
+def serve(path=TILES_FILE, port=8000):
+    """Servidor HTTP mínimo: /{z}/{x}/{y}.pbf, /tiles.json (TileJSON) y un visor MapLibre en /"""
+    import sqlite3
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No existe {path}. Ejecuta primero: python vector_tiles.py")
+
+    def query(sql, args=()):
+        con = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            return con.execute(sql, args).fetchall()
+        finally:
+            con.close()
+
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, status, body, content_type, gzipped=False):
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Access-Control-Allow-Origin', '*')
+            if gzipped:
+                self.send_header('Content-Encoding', 'gzip')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            parts = self.path.split('?')[0].strip('/').split('/')
+            if parts == ['']:
+                self._send(200, VIEWER_HTML.encode('utf-8'), 'text/html; charset=utf-8')
+            elif parts == ['tiles.json']:
+                meta = dict(query("SELECT name, value FROM metadata"))
+                host = f"http://{self.headers.get('Host', f'localhost:{port}')}"
+                tilejson = {
+                    'tilejson': '3.0.0',
+                    'name': meta.get('name'),
+                    'tiles': [host + '/{z}/{x}/{y}.pbf'],
+                    'minzoom': int(meta['minzoom']),
+                    'maxzoom': int(meta['maxzoom']),
+                    'bounds': [float(v) for v in meta['bounds'].split(',')],
+                    'center': [float(v) for v in meta['center'].split(',')],
+                    'vector_layers': json.loads(meta['json'])['vector_layers'],
+                }
+                self._send(200, json.dumps(tilejson).encode('utf-8'), 'application/json')
+            elif len(parts) == 3 and parts[2].endswith('.pbf'):
+                try:
+                    z, x, y = int(parts[0]), int(parts[1]), int(parts[2][:-4])
+                except ValueError:
+                    return self._send(400, b'', 'text/plain')
+                rows = query("SELECT tile_data FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+                             (z, x, (1 << z) - 1 - y))
+                if rows:
+                    self._send(200, rows[0][0], 'application/x-protobuf', gzipped=True)
+                else:
+                    self._send(204, b'', 'application/x-protobuf')
+            else:
+                self._send(404, b'', 'text/plain')
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+    print(f"Sirviendo {path} en http://localhost:{port}/ (Ctrl+C para salir)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Teselas vectoriales (MVT) de manzanas con indicadores")
+    parser.add_argument('--zoom', nargs=2, type=int, default=[MIN_ZOOM, MAX_ZOOM], metavar=('MIN', 'MAX'))
+    parser.add_argument('--jobs', type=int, default=None, help="Procesos (default: todos los núcleos)")
+    parser.add_argument('--salida', default=TILES_FILE)
+    parser.add_argument('--pmtiles', action='store_true', help="Convertir también a PMTiles (requiere pmtiles)")
+    parser.add_argument('--servir', action='store_true', help="Servir el MBTiles con un visor local")
+    parser.add_argument('--puerto', type=int, default=8000)
+    parser.add_argument('--fuente', default=SOURCE_FILE)
+    parser.add_argument('--verificar', type=int, nargs='?', const=200, default=None, metavar='N',
+                        help="Decodificar N teselas del MBTiles (ida y vuelta del codificador)")
+    args = parser.parse_args()
+
+    if args.servir:
+        serve(args.salida, args.puerto)
+    elif args.verificar:
+        stats = verify_tiles(args.salida, args.verificar)
+        print(f"Ida y vuelta del codificador: OK. Muestra de {args.salida}: {stats}")
+        if stats['sin_geometria'] or stats['sin_closepath'] or stats['invalidos']:
+            raise SystemExit(1)
+    else:
+        export_tiles(args.salida, tuple(args.zoom), n_jobs=args.jobs, source=args.fuente, pmtiles=args.pmtiles)